@@ -1202,6 +1202,29 @@ def task():
                            rheader = s3db.s3_scheduler_rheader,
                            )
 
+# =============================================================================
+@auth.s3_requires_membership(1)
+def profile():
+    """
+        Request profiles (if enabled in deployment settings)
+        - recent requests of the current process (JSON)
+        - aggregated statistics of all processes (Prometheus text format,
+          with .txt extension)
+    """
+
+    if not settings.get_base_profile():
+        raise HTTP(404, "Request profiling not enabled")
+
+    RequestProfile = s3base.RequestProfile
+
+    if request.extension == "txt":
+        response.headers["Content-Type"] = "text/plain; version=0.0.4"
+        output = RequestProfile.metrics()
+    else:
+        response.headers["Content-Type"] = "application/json"
+        output = json.dumps(RequestProfile.report())
+    return output
+
 # =============================================================================
 def result():
     """
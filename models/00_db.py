@@ -84,6 +84,9 @@ import core as s3base
 import s3log
 s3log.S3Log.setup()
 
+# Request profiling (if enabled)
+s3base.RequestProfile.setup(db)
+
 # AAA
 current.auth = auth = s3base.AuthS3()
 
@@ -307,11 +307,11 @@ if has_module("stats"):
                                             user_id = None,
                                             ):
         """
-            Update the stats_demographic_aggregate table for the given
-            stats_demographic_data record(s)
+            Update the stats_demographic_aggregate table for all queued
+            changes in stats_demographic_data (scheduled)
 
             @param records: JSON of Rows of stats_demographic_data records to
-                            update aggregates for
+                            queue before updating (optional)
             @param user_id: calling request's auth.user.id or None
         """
         if user_id:
@@ -325,41 +325,6 @@ if has_module("stats"):
 
     tasks["stats_demographic_update_aggregates"] = stats_demographic_update_aggregates
 
-    # -------------------------------------------------------------------------
-    def stats_demographic_update_location_aggregate(location_level,
-                                                    root_location_id,
-                                                    parameter_id,
-                                                    start_date,
-                                                    end_date,
-                                                    user_id = None,
-                                                    ):
-        """
-            Update the stats_demographic_aggregate table for the given location and parameter
-            - called from within stats_demographic_update_aggregates
-
-            @param location_level: gis level at which the data needs to be accumulated
-            @param root_location_id: id of the location
-            @param parameter_id: parameter for which the stats are being updated
-            @param start_date: start date of the period in question
-            @param end_date: end date of the period in question
-            @param user_id: calling request's auth.user.id or None
-        """
-        if user_id:
-            # Authenticate
-            auth.s3_impersonate(user_id)
-
-        # Run the Task & return the result
-        result = s3db.stats_demographic_update_location_aggregate(location_level,
-                                                                  root_location_id,
-                                                                  parameter_id,
-                                                                  start_date,
-                                                                  end_date,
-                                                                  )
-        db.commit()
-        return result
-
-    tasks["stats_demographic_update_location_aggregate"] = stats_demographic_update_location_aggregate
-
     # --------------------e----------------------------------------------------
     # Disease: Depends on Stats
     # --------------------e----------------------------------------------------
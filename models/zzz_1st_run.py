@@ -161,6 +161,16 @@ if len(pop_list) > 0:
                              repeats = 0    # unlimited
                              )
 
+    if has_module("stats"):
+
+        # Update demographic aggregates for changed data
+        s3task.schedule_task("stats_demographic_update_aggregates",
+                             vars = {},
+                             period = 300,  # seconds
+                             timeout = 3600, # seconds
+                             repeats = 0    # unlimited
+                             )
+
     # Daily maintenance
     s3task.schedule_task("maintenance",
                          vars = {"period": "daily"},
@@ -317,7 +327,7 @@ if len(pop_list) > 0:
     else:
         # Update Location Tree (disabled during prepop)
         start = datetime.datetime.now()
-        gis.update_location_tree()
+        gis.rebuild_location_tree()
         duration("Location Tree update completed", start)
 
     # Countries are only editable by MapAdmin
@@ -357,6 +367,27 @@ if len(pop_list) > 0:
     field = "last_name"
     db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
 
+    # Hierarchy closure table
+    tablename = "s3_hierarchy_closure"
+    s3db.table(tablename)
+    db.executesql("CREATE INDEX %s_ancestor__idx on %s(tablename,ancestor);" % (tablename, tablename))
+    db.executesql("CREATE INDEX %s_descendant__idx on %s(tablename,descendant);" % (tablename, tablename))
+
+    # Change journal
+    if settings.get_base_change_journal():
+        tablename = "s3_change"
+        s3db.table(tablename)
+        db.executesql("CREATE INDEX %s_table__idx on %s(tablename,timestmp);" % (tablename, tablename))
+        db.executesql("CREATE INDEX %s_timestmp__idx on %s(timestmp);" % (tablename, tablename))
+
+    # Checkpoints
+    if has_module("dvr") and settings.get_dvr_event_registration_preload():
+        # Index for incremental updates of the in-memory event rules index
+        tablename = "dvr_case_event"
+        s3db.table(tablename)
+        field = "modified_on"
+        db.executesql("CREATE INDEX %s_%s__idx on %s(%s);" % (tablename, field, tablename, field))
+
     # GIS
     # Add extra index on search field
     # Should work for our 3 supported databases: sqlite, MySQL & PostgreSQL
@@ -370,6 +401,10 @@ if len(pop_list) > 0:
         # Vacuum cannot run in a transaction block
         # autovacuum should be on anyway so will run ANALYZE after 50 rows inserted/updated/deleted
         #db.executesql("VACUUM ANALYZE;")
+    else:
+        # Index for incremental updates of the in-memory spatial index
+        field = "modified_on"
+        db.executesql("CREATE INDEX %s_%s__idx on %s(%s);" % (tablename, field, tablename, field))
 
     # =========================================================================
     info("\n*** FIRST RUN COMPLETE ***\n")
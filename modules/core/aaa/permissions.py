@@ -25,9 +25,14 @@
     OTHER DEALINGS IN THE SOFTWARE.
 """
 
-__all__ = ("S3Permission",
+__all__ = ("ACLCache",
+           "S3Permission",
            )
 
+import hashlib
+import threading
+import time
+
 from collections import OrderedDict
 
 from gluon import current, redirect, HTTP, URL
@@ -37,7 +42,7 @@ from s3dal import Field, Row, Table, original_tablename
 
 from ..model import MetaFields
 from ..errors import S3PermissionError
-from ..tools import s3_get_extension
+from ..tools import ChangeJournal, JournalCursor, RequestProfile, s3_get_extension
 
 # =============================================================================
 class S3Permission:
@@ -149,6 +154,11 @@ class S3Permission:
         self.permission_cache = {}
         self.query_cache = {}
 
+        # Request-spanning ACL cache
+        self.acl_cache = acl_cache = ACLCache.get_cache()
+        if acl_cache and self.table:
+            acl_cache.watch(self.table)
+
         # Pages which never require permission:
         # Make sure that any data access via these pages uses
         # accessible_query explicitly!
@@ -230,6 +240,16 @@ class S3Permission:
                             )
             self.table = db[self.tablename]
 
+            acl_cache = self.acl_cache
+            if acl_cache:
+                acl_cache.watch(self.table)
+
+            # Record changes in the change journal (so that ACL caches
+            # in other processes can follow them)
+            journal = ChangeJournal.get_journal()
+            if journal:
+                journal.watch(self.table)
+
     # -------------------------------------------------------------------------
     def create_indexes(self):
         """
@@ -1066,6 +1086,8 @@ class S3Permission:
         return permitted
 
     # -------------------------------------------------------------------------
+    @RequestProfile.timed("acl", lambda self, method, table, *args, **kwargs: \
+                                 getattr(table, "_tablename", table))
     def accessible_query(self, method, table, c=None, f=None, deny=True):
         """
             Returns a query to select the accessible records for method
@@ -1390,118 +1412,60 @@ class S3Permission:
         else:
             acls = {}
 
-        # Get all roles
-        if realms:
-            roles = set(realms.keys())
-        else:
+        if not realms:
             # No roles available (deny all)
             return acls
 
-        db = current.db
-        table = self.table
-
         c = c or self.controller
         f = f or self.function
         page_restricted = self.page_restricted(c=c, f=f)
 
-        # Base query
-        query = (table.group_id.belongs(roles)) & \
-                (table.deleted == False)
-
-        # Page ACLs
-        if page_restricted:
-            q = (table.function == None)
-            if f and self.use_facls:
-                q |= (table.function == f)
-            q = (table.controller == c) & q
-        else:
-            q = None
-
-        # Table ACLs
+        # Be sure to use the original table name
+        if t and hasattr(t, "_tablename"):
+            t = original_tablename(t)
         if t and self.use_tacls:
-            # Be sure to use the original table name
-            if hasattr(t, "_tablename"):
-                t = original_tablename(t)
-            tq = (table.tablename == t) & \
-                 (table.controller == None) & \
-                 (table.function == None)
-            q = tq if q is None else q | tq
             table_restricted = self.table_restricted(t)
         else:
             table_restricted = False
 
-        # Retrieve the ACLs
-        if q is not None:
-            query = q & query
-            rows = db(query).select(table.group_id,
-                                    table.controller,
-                                    table.function,
-                                    table.tablename,
-                                    table.unrestricted,
-                                    table.entity,
-                                    table.uacl,
-                                    table.oacl,
-                                    cacheable = True,
-                                    )
+        # Look up the merged rules in the request-spanning cache
+        acl_cache = self.acl_cache
+        if acl_cache:
+            cache_key = ("acls",
+                         self.policy,
+                         tuple(sorted(((group_id, None if entities is None else tuple(entities))
+                                       for group_id, entities in realms.items()),
+                                      key = lambda item: item[0],
+                                      )),
+                         c,
+                         f if self.use_facls else None,
+                         t if self.use_tacls else None,
+                         page_restricted,
+                         table_restricted,
+                         )
+            acls = acl_cache.get(cache_key)
         else:
-            rows = []
+            cache_key = acls = None
+
+        if acls is None:
+            acls = self.merge_acls(realms,
+                                   c = c,
+                                   f = f,
+                                   t = t,
+                                   page_restricted = page_restricted,
+                                   table_restricted = table_restricted,
+                                   )
+            if acl_cache:
+                acl_cache.set(cache_key, acls)
 
-        # Cascade ACLs
         ANY = "ANY"
 
         ALL = (self.ALL, self.ALL)
         NONE = (self.NONE, self.NONE)
 
-        use_facls = self.use_facls
-        def rule_type(r):
-            if r.controller is not None:
-                if r.function is None:
-                    return "c"
-                elif use_facls:
-                    return "f"
-            elif r.tablename is not None:
-                return "t"
-            return None
-
         most_permissive = lambda x, y: (x[0] | y[0], x[1] | y[1])
         most_restrictive = lambda x, y: (x[0] & y[0], x[1] & y[1])
 
-        # Realms
-        use_realms = self.entity_realm
-        for row in rows:
-
-            # Get the assigning entities
-            group_id = row.group_id
-            if group_id not in realms:
-                continue
-            rtype = rule_type(row)
-            if rtype is None:
-                continue
-
-            if use_realms:
-                if row.unrestricted:
-                    entities = [ANY]
-                elif row.entity is not None:
-                    entities = [row.entity]
-                else:
-                    entities = realms[group_id]
-                if entities is None:
-                    entities = [ANY]
-            else:
-                entities = [ANY]
-
-            # Merge the ACL
-            acl = (row["uacl"], row["oacl"])
-            for e in entities:
-                if e in acls:
-                    eacls = acls[e]
-                    if rtype in eacls:
-                        eacls[rtype] = most_permissive(eacls[rtype], acl)
-                    else:
-                        eacls[rtype] = acl
-                else:
-                    acls[e] = {rtype: acl}
-
         acl = acls.get(ANY, {})
 
         # Default page ACL
@@ -1530,6 +1494,7 @@ class S3Permission:
         # so for unrestricted pages or tables, we must create a default ACL
         # here in order to have the default apply:
         if not acls:
+            acls = {}
             if t and self.use_tacls:
                 if not table_restricted:
                     acls[ANY] = {"t": default_table_acl}
@@ -1594,6 +1559,135 @@ class S3Permission:
 
         return result
 
+    # -------------------------------------------------------------------------
+    def merge_acls(self, realms,
+                   c = None,
+                   f = None,
+                   t = None,
+                   page_restricted = True,
+                   table_restricted = False,
+                   ):
+        """
+            Retrieves the page and table rules for the specified realms
+            from the database, and merges them per realm entity; helper
+            for applicable_acls
+
+            Args:
+                realms: the realms {group_id: [entity, ...]}
+                c: the controller name
+                f: the function name
+                t: the tablename
+                page_restricted: whether the page is restricted
+                table_restricted: whether the table is restricted
+
+            Returns:
+                dict {entity: {rule_type: (uacl, oacl)}}, with rule types
+                "c" (controller), "f" (function) and "t" (table), and
+                entity "ANY" for rules applying regardless of realm
+
+            Note:
+                The result only depends on the arguments and the contents
+                of the permission table, and can thus be cached across
+                requests (see ACLCache)
+        """
+
+        acls = {}
+
+        db = current.db
+        table = self.table
+
+        roles = set(realms.keys())
+
+        # Base query
+        query = (table.group_id.belongs(roles)) & \
+                (table.deleted == False)
+
+        # Page ACLs
+        if page_restricted:
+            q = (table.function == None)
+            if f and self.use_facls:
+                q |= (table.function == f)
+            q = (table.controller == c) & q
+        else:
+            q = None
+
+        # Table ACLs
+        if t and self.use_tacls:
+            tq = (table.tablename == t) & \
+                 (table.controller == None) & \
+                 (table.function == None)
+            q = tq if q is None else q | tq
+
+        # Retrieve the ACLs
+        if q is not None:
+            query = q & query
+            rows = db(query).select(table.group_id,
+                                    table.controller,
+                                    table.function,
+                                    table.tablename,
+                                    table.unrestricted,
+                                    table.entity,
+                                    table.uacl,
+                                    table.oacl,
+                                    cacheable = True,
+                                    )
+        else:
+            rows = []
+
+        # Cascade ACLs
+        ANY = "ANY"
+
+        use_facls = self.use_facls
+        def rule_type(r):
+            if r.controller is not None:
+                if r.function is None:
+                    return "c"
+                elif use_facls:
+                    return "f"
+            elif r.tablename is not None:
+                return "t"
+            return None
+
+        most_permissive = lambda x, y: (x[0] | y[0], x[1] | y[1])
+
+        # Realms
+        use_realms = self.entity_realm
+        for row in rows:
+
+            # Get the assigning entities
+            group_id = row.group_id
+            if group_id not in realms:
+                continue
+            rtype = rule_type(row)
+            if rtype is None:
+                continue
+
+            if use_realms:
+                if row.unrestricted:
+                    entities = [ANY]
+                elif row.entity is not None:
+                    entities = [row.entity]
+                else:
+                    entities = realms[group_id]
+                if entities is None:
+                    entities = [ANY]
+            else:
+                entities = [ANY]
+
+            # Merge the ACL
+            acl = (row["uacl"], row["oacl"])
+            for e in entities:
+                if e in acls:
+                    eacls = acls[e]
+                    if rtype in eacls:
+                        eacls[rtype] = most_permissive(eacls[rtype], acl)
+                    else:
+                        eacls[rtype] = acl
+                else:
+                    acls[e] = {rtype: acl}
+
+        return acls
+
     # -------------------------------------------------------------------------
     # Utilities
     # -------------------------------------------------------------------------
@@ -1630,14 +1724,20 @@ class S3Permission:
         s3 = current.response.s3
 
         if not "restricted_tables" in s3:
-            table = self.table
-            query = (table.controller == None) & \
-                    (table.function == None) & \
-                    (table.deleted == False)
-            rows = current.db(query).select(table.tablename,
-                                            groupby = table.tablename,
-                                            )
-            s3.restricted_tables = {row.tablename for row in rows}
+            acl_cache = self.acl_cache
+            restricted_tables = acl_cache.get(("restricted_tables",)) if acl_cache else None
+            if restricted_tables is None:
+                table = self.table
+                query = (table.controller == None) & \
+                        (table.function == None) & \
+                        (table.deleted == False)
+                rows = current.db(query).select(table.tablename,
+                                                groupby = table.tablename,
+                                                )
+                restricted_tables = {row.tablename for row in rows}
+                if acl_cache:
+                    acl_cache.set(("restricted_tables",), restricted_tables)
+            s3.restricted_tables = restricted_tables
 
         return str(t) in s3.restricted_tables
 
@@ -1785,4 +1885,267 @@ class S3Permission:
                    record_id is not None and r[-1] == str(record_id):
                     del permissions[key]
 
+# =============================================================================
+class ACLCache:
+    """
+        Request-spanning cache for merged permission rules (as retrieved
+        by S3Permission.applicable_acls for a set of roles and realms, and
+        a page/table); either a size-bounded, process-local LRU cache with
+        expiry, or a web2py cache backend (e.g. cache.memcache) to share
+        the rules across processes
+
+        - all cached rules are invalidated (versioned) whenever a record in
+          the permission table is inserted, updated or deleted (DAL-level
+          callbacks registered by S3Permission)
+        - role assignments do not require invalidation, because the roles
+          and realms of the user are part of the cache key
+
+        Note:
+            Invalidation is process-local unless a shared backend is
+            configured or the change journal is enabled, so multi-process
+            deployments should otherwise use a short TTL
+    """
+
+    instances = {}
+    instances_lock = threading.Lock()
+
+    def __init__(self, size=5000, ttl=600, backend=None):
+        """
+            Args:
+                size: the maximum number of entries (process-local cache)
+                ttl: the maximum lifetime of entries (seconds)
+                backend: name of a web2py cache backend (e.g. "memcache")
+                         to use instead of the process-local cache
+        """
+
+        self.size = size
+        self.ttl = ttl
+        self.backend = backend
+
+        self.entries = OrderedDict()
+        self.current_version = 0
+        self.lock = threading.Lock()
+
+        self.cursor = JournalCursor()
+
+        self.hits = 0
+        self.misses = 0
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_cache(cls):
+        """
+            Returns the ACLCache instance as configured in deployment
+            settings (shared across requests)
+
+            Returns:
+                the ACLCache, or None if disabled
+        """
+
+        setting = current.deployment_settings.get_security_acl_cache()
+        if not setting:
+            return None
+
+        config = setting if isinstance(setting, dict) else {}
+        size = config.get("size", 5000)
+        ttl = config.get("ttl", 600)
+        backend = config.get("backend")
+
+        key = (size, ttl, backend)
+        instances = cls.instances
+        cache = instances.get(key)
+        if cache is None:
+            with cls.instances_lock:
+                cache = instances.get(key)
+                if cache is None:
+                    cache = instances[key] = cls(size=size,
+                                                 ttl=ttl,
+                                                 backend=backend,
+                                                 )
+        return cache
+
+    # -------------------------------------------------------------------------
+    @property
+    def model(self):
+        """
+            The web2py cache backend, if configured and available
+        """
+
+        backend = self.backend
+        return getattr(current.cache, backend, None) if backend else None
+
+    # -------------------------------------------------------------------------
+    def version(self):
+        """
+            Returns the current version of the permission rules
+
+            Returns:
+                the version
+        """
+
+        model = self.model
+        if model:
+            version = model("acl_version",
+                            lambda: "%.6f" % time.time(),
+                            time_expire = self.ttl,
+                            )
+        else:
+            tablenames = self.cursor.poll()
+            if tablenames is None or "s3_permission" in tablenames:
+                # Permission rules changed in another process
+                self.invalidate()
+            version = self.current_version
+        return version
+
+    # -------------------------------------------------------------------------
+    def get(self, key):
+        """
+            Looks up an entry
+
+            Args:
+                key: the cache key (a tuple)
+
+            Returns:
+                the cached value, or None if not found
+        """
+
+        version = self.version()
+
+        model = self.model
+        if model:
+            value = model(self.backend_key(key, version),
+                          lambda: None,
+                          time_expire = self.ttl,
+                          )
+        else:
+            entries = self.entries
+            with self.lock:
+                entry = entries.get(key)
+                if entry is None:
+                    value = None
+                elif entry[0] != version or entry[1] < time.time():
+                    del entries[key]
+                    value = None
+                else:
+                    entries.move_to_end(key)
+                    value = entry[2]
+
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    # -------------------------------------------------------------------------
+    def set(self, key, value):
+        """
+            Adds an entry
+
+            Args:
+                key: the cache key (a tuple)
+                value: the value to cache (must not be modified afterwards)
+        """
+
+        version = self.version()
+
+        model = self.model
+        if model:
+            model(self.backend_key(key, version), lambda: value, time_expire=0)
+        else:
+            entries = self.entries
+            with self.lock:
+                entries[key] = (version, time.time() + self.ttl, value)
+                entries.move_to_end(key)
+                while len(entries) > self.size:
+                    entries.popitem(last=False)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def backend_key(key, version):
+        """
+            Converts a cache key into a string for the cache backend
+
+            Args:
+                key: the cache key (a tuple)
+                version: the current version
+
+            Returns:
+                the key string
+        """
+
+        digest = hashlib.md5(repr(key).encode("utf-8")).hexdigest()
+        return "acl_%s_%s" % (version, digest)
+
+    # -------------------------------------------------------------------------
+    def invalidate(self):
+        """
+            Invalidates all cached permission rules
+        """
+
+        model = self.model
+        if model:
+            model("acl_version",
+                  lambda: "%.6f" % time.time(),
+                  time_expire = 0,
+                  )
+        else:
+            with self.lock:
+                self.current_version += 1
+
+    # -------------------------------------------------------------------------
+    def watch(self, table):
+        """
+            Registers DAL callbacks to invalidate the cache whenever
+            records in the permission table are written
+
+            Args:
+                table: the permission Table
+        """
+
+        after_insert = table._after_insert
+        if any(getattr(hook, "acl_cache", False) for hook in after_insert):
+            return
+
+        def invalidate(*args):
+            self.invalidate()
+        invalidate.acl_cache = True
+
+        after_insert.append(invalidate)
+        table._after_update.append(invalidate)
+        table._after_delete.append(invalidate)
+
+    # -------------------------------------------------------------------------
+    def clear(self):
+        """
+            Removes all entries from the process-local cache, and resets
+            the counters
+        """
+
+        with self.lock:
+            self.entries.clear()
+            self.current_version += 1
+            self.hits = self.misses = 0
+
+    # -------------------------------------------------------------------------
+    def stats(self):
+        """
+            Returns cache statistics
+
+            Returns:
+                dict {"backend", "size", "entries", "hits", "misses", "ratio"}
+        """
+
+        with self.lock:
+            hits, misses = self.hits, self.misses
+            total = hits + misses
+            return {"backend": self.backend or "local",
+                    "size": self.size,
+                    "entries": len(self.entries),
+                    "hits": hits,
+                    "misses": misses,
+                    "ratio": float(hits) / total if total else None,
+                    }
+
 # END =========================================================================
@@ -426,7 +426,7 @@ class CRUDRequest:
             from .methods import RESTful, S3Filter, S3GroupedItemsReport, \
                                  S3HierarchyCRUD, S3Map, S3Merge, S3MobileCRUD, \
                                  S3Organizer, S3Profile, S3Report, S3Summary, \
-                                 TimePlot, S3XForms, SpreadsheetImporter
+                                 TimePlot, S3XForms, SpreadsheetImporter, MapTiles
 
             methods = {"deduplicate": S3Merge,
                        "fields": RESTful,
@@ -442,6 +442,7 @@ class CRUDRequest:
                        "report": S3Report,
                        "summary": S3Summary,
                        "sync": current.sync,
+                       "tile": MapTiles,
                        "timeplot": TimePlot,
                        "xform": S3XForms,
                        }
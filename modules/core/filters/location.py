@@ -712,6 +712,7 @@ class LocationFilter(FilterWidget):
 class MapFilter(FilterWidget):
     """
         Map filter widget, normally configured for "~.location_id$the_geom"
+        (or "~.location_id$wkt" without spatial DB, using the spatial index)
 
         Keyword Args:
             label: label for the widget
@@ -736,8 +737,10 @@ class MapFilter(FilterWidget):
         settings = current.deployment_settings
 
         if not settings.get_gis_spatialdb():
-            current.log.warning("No Spatial DB => Cannot do Intersects Query yet => Disabling MapFilter")
-            return ""
+            from ..gis.spatialindex import SpatialIndex
+            if not SpatialIndex.get_index():
+                current.log.warning("No Spatial DB => Cannot do Intersects Query yet => Disabling MapFilter")
+                return ""
 
         attr_get = self.attr.get
         opts_get = self.opts.get
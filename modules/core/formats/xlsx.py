@@ -68,13 +68,25 @@ class XLSXWriter(FormatWriter):
                 use_color: use background colors in cells (boolean, default False)
                 even_odd: when using colors, render different background colors
                           for even/odd rows (boolean, default True)
-                as_stream: return BytesIO rather than bytes
+                as_stream: return a file-like object rather than bytes
+                           (BytesIO, or a temporary file if streaming)
+                stream: extract and write the data in chunks, using
+                        a write-only workbook (bounded memory use,
+                        for large tables - CRUDResource only, and
+                        not with a callable xls_title_row)
+                chunk_size: the number of records per chunk
         """
 
         T = current.T
         request = current.request
         settings = current.deployment_settings
 
+        # Callable title rows require cell access, which is not
+        # supported by write-only worksheets => export non-streaming
+        if attr.get("stream") and not isinstance(resource, dict) and \
+           not callable(settings.get_xls_title_row()):
+            return cls.encode_stream(resource, **attr)
+
         # Import libraries
         try:
             from openpyxl import Workbook
@@ -222,6 +234,169 @@ class XLSXWriter(FormatWriter):
 
         return output
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def encode_stream(cls, resource, **attr):
+        """
+            Export a CRUDResource as Microsoft Excel spreadsheet, extracting
+            and writing the data in chunks into a write-only workbook,
+            so that memory use remains bounded regardless of the number
+            of records
+
+            Args:
+                resource: the CRUDResource
+
+            Keyword Args:
+                see encode
+
+            Note:
+                - the write-only workbook does not allow to adjust column
+                  widths to the data, or to merge cells in title rows
+                - not usable with a callable xls_title_row (requires
+                  cell access, which write-only worksheets do not support)
+                - the workbook is spooled into a temporary file, which is
+                  then streamed to the client
+        """
+
+        T = current.T
+        request = current.request
+        settings = current.deployment_settings
+
+        # Import libraries
+        try:
+            from openpyxl import Workbook
+            from openpyxl.cell import Cell
+            from openpyxl.utils import get_column_letter
+        except ImportError:
+            error = T("Export failed: OpenPyXL library not installed on server")
+            current.log.error(error)
+            raise HTTP(503, body=error)
+
+        attr_get = attr.get
+
+        list_fields = attr_get("list_fields")
+        if not list_fields:
+            list_fields = resource.list_fields()
+
+        title = get_crud_string(resource.tablename, "title_list")
+        left, orderby, expand_hierarchy = cls.prepare(resource, list_fields)
+
+        # Create the workbook
+        wb = Workbook(write_only=True, iso_dates=True)
+
+        # Add named styles
+        use_color = attr_get("use_color", False)
+        even_odd = attr_get("even_odd", True)
+        cls.add_styles(wb, use_color=use_color, even_odd=even_odd)
+
+        # Determine title row length and batch size
+        title_row = settings.get_xls_title_row()
+        title_row_length = 2 if title_row else 0
+        batch_size = ROWS_PER_SHEET - title_row_length - 1
+
+        # Characters /\?*[] not allowed in sheet names
+        sheet_name = " ".join(re.sub(r"[\\\/\?\*\[\]:]", " ", s3_str(title)).split())
+
+        chunks = resource.select_chunks(list_fields,
+                                        chunk_size = attr_get("chunk_size", 1000),
+                                        left = left,
+                                        orderby = orderby,
+                                        represent = True,
+                                        show_links = False,
+                                        raw_data = True if expand_hierarchy else False,
+                                        )
+
+        ws = labels = None
+        sheet_number = written = 0
+        for data in chunks:
+
+            rows = data.rows
+            types, lfields, headers = cls.columns(data.rfields, rows, expand_hierarchy)
+
+            if labels is None:
+                # Generate columns labels
+                labels = []
+                for selector in lfields:
+                    label = headers[selector]
+                    if label in ("Id", "Sort"):
+                        continue
+                    labels.append(s3_str(label))
+                num_columns = len(labels)
+
+            while rows:
+                if ws is None or written >= batch_size:
+
+                    # Create work sheet
+                    sheet_number += 1
+                    if sheet_number == 1:
+                        # Only number the sheets if there is more than one
+                        ws = wb.create_sheet(title=sheet_name[:31])
+                    else:
+                        if sheet_number == 2:
+                            ws.title = "%s-1" % sheet_name[:28]
+                        ws = wb.create_sheet(title="%s-%s" % (sheet_name[:28], sheet_number))
+                    written = 0
+
+                    # Column widths and frozen panes must be set before
+                    # writing any rows => adjust to labels only
+                    column_widths = [max(len(label), 10) for label in labels]
+                    for i in range(1, num_columns + 1):
+                        ws.column_dimensions[get_column_letter(i)].width = column_widths[i-1] * 1.23
+                    ws.freeze_panes = "A%d" % (title_row_length + 2)
+
+                    # Add title row(s)
+                    if title_row:
+                        top = Cell(ws, value=s3_str(title))
+                        top.style = "large_header"
+                        ws.append([top])
+
+                        now = current.calendar.format_datetime(request.now, local=True)
+                        sub = Cell(ws, value="%s: %s" % (T("Date Exported"), now))
+                        sub.style = "header"
+                        ws.append([sub])
+
+                    # Add column labels
+                    label_row = []
+                    for l in labels:
+                        cell = Cell(ws, value=l)
+                        cell.style = "label"
+                        label_row.append(cell)
+                    ws.append(label_row)
+
+                # Add the data
+                batch, rows = rows[:batch_size - written], rows[batch_size - written:]
+                cls.write_rows(ws, batch, lfields, types, column_widths)
+                written += len(batch)
+
+        if ws is None:
+            # No data => add an empty sheet with just the title
+            ws = wb.create_sheet(title=sheet_name[:31])
+            ws.append([s3_str(title)])
+
+        # Save workbook
+        from tempfile import NamedTemporaryFile
+        tmp = NamedTemporaryFile()
+        wb.save(tmp.name)
+        tmp.seek(0, 2)
+        size = tmp.tell()
+        tmp.seek(0)
+
+        if not attr_get("as_stream", False):
+            # Set response headers
+            filename = "%s_%s.xlsx" % (request.env.server_name, title)
+            disposition = "attachment; filename=\"%s\"" % filename
+            response = current.response
+            response.headers["Content-Type"] = contenttype(".xlsx")
+            response.headers["Content-disposition"] = disposition
+            response.headers["Content-Length"] = size
+
+            from gluon.streamer import DEFAULT_CHUNK_SIZE, streamer
+            output = streamer(tmp, chunk_size=DEFAULT_CHUNK_SIZE)
+        else:
+            output = tmp
+
+        return output
+
     # -------------------------------------------------------------------------
     @classmethod
     def write_rows(cls, ws, batch, lfields, types, column_widths):
@@ -312,6 +487,39 @@ class XLSXWriter(FormatWriter):
 
         title = get_crud_string(resource.tablename, "title_list")
 
+        left, orderby, expand_hierarchy = cls.prepare(resource, list_fields)
+
+        data = resource.select(list_fields,
+                               left = left,
+                               limit = None,
+                               count = True,
+                               getids = True,
+                               orderby = orderby,
+                               represent = True,
+                               show_links = False,
+                               raw_data = True if expand_hierarchy else False,
+                               )
+
+        rows = data.rows
+        types, lfields, heading = cls.columns(data.rfields, rows, expand_hierarchy)
+
+        return (title, types, lfields, heading, rows)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def prepare(resource, list_fields):
+        """
+            Apply the datatable filter and ordering from the request to
+            the resource
+
+            Args:
+                resource: the resource
+                list_fields: fields to include in list views
+
+            Returns:
+                tuple (left, orderby, expand_hierarchy)
+        """
+
         get_vars = dict(current.request.vars)
         get_vars["iColumns"] = len(list_fields)
         query, orderby, left = resource.datatable_filter(list_fields,
@@ -326,19 +534,23 @@ class XLSXWriter(FormatWriter):
         # setting = {field_selector: [LevelLabel, LevelLabel, ...]}
         expand_hierarchy = resource.get_config("xls_expand_hierarchy")
 
-        data = resource.select(list_fields,
-                               left = left,
-                               limit = None,
-                               count = True,
-                               getids = True,
-                               orderby = orderby,
-                               represent = True,
-                               show_links = False,
-                               raw_data = True if expand_hierarchy else False,
-                               )
+        return left, orderby, expand_hierarchy
 
-        rfields = data.rfields
-        rows = data.rows
+    # -------------------------------------------------------------------------
+    @classmethod
+    def columns(cls, rfields, rows, expand_hierarchy=None):
+        """
+            Determine the column types, keys and headers for the
+            extracted data; expands hierarchical foreign keys in rows
+
+            Args:
+                rfields: the extracted fields (S3ResourceFields)
+                rows: the extracted rows
+                expand_hierarchy: the xls_expand_hierarchy setting
+
+            Returns:
+                tuple (types, lfields, heading)
+        """
 
         types = []
         lfields = []
@@ -366,7 +578,7 @@ class XLSXWriter(FormatWriter):
                     else:
                         types.append(rfield.ftype)
 
-        return (title, types, lfields, heading, rows)
+        return types, lfields, heading
 
     # -------------------------------------------------------------------------
     @staticmethod
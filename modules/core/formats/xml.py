@@ -29,7 +29,9 @@ import json
 import os
 import re
 import sys
+import threading
 
+from collections import OrderedDict
 from lxml import etree
 from urllib import parse as urlparse
 from urllib.request import urlopen
@@ -40,7 +42,8 @@ from gluon.storage import Storage
 
 from ..tools import s3_decode_iso_datetime, s3_encode_iso_datetime, s3_utc, \
                     s3_get_foreign_key, s3_represent_value, s3_str, \
-                    s3_strip_markup, s3_validate, S3RepresentLazy, JSONSEPARATORS
+                    s3_strip_markup, s3_validate, S3RepresentLazy, JSONSEPARATORS, \
+                    RequestProfile
 
 ogetattr = object.__getattribute__
 
@@ -231,13 +234,18 @@ class S3XML:
             return None
 
     # -------------------------------------------------------------------------
+    @RequestProfile.timed("xslt", lambda self, tree, stylesheet_path, **args: \
+                                  os.path.basename(stylesheet_path) \
+                                  if isinstance(stylesheet_path, str) else "-")
     def transform(self, tree, stylesheet_path, **args):
         """
             Transform an element tree with XSLT
 
             Args:
                 tree: the element tree
-                stylesheet_path: pathname of the XSLT stylesheet
+                stylesheet_path: pathname of the XSLT stylesheet, or the
+                                 pre-parsed stylesheet, or a compiled
+                                 XSLT transformer
                 args: dict of arguments to pass to the stylesheet
         """
 
@@ -248,16 +256,14 @@ class S3XML:
         else:
             _args = None
 
-        if isinstance(stylesheet_path, (etree._ElementTree, etree._Element)):
-            # Pre-parsed stylesheet
-            stylesheet = stylesheet_path
+        if isinstance(stylesheet_path, etree.XSLT):
+            # Pre-compiled stylesheet
+            transformer = stylesheet_path
         else:
-            stylesheet = self.parse(stylesheet_path)
+            transformer = self.load_stylesheet(stylesheet_path)[1]
 
-        if stylesheet is not None:
+        if transformer is not None:
             try:
-                ac = etree.XSLTAccessControl(read_file=True, read_network=True)
-                transformer = etree.XSLT(stylesheet, access_control=ac)
                 if _args:
                     result = transformer(tree, **_args)
                 else:
@@ -273,9 +279,76 @@ class S3XML:
                 #outputFile.close()
                 return None
         else:
-            # Error parsing the XSL stylesheet
+            # Error parsing or compiling the XSL stylesheet
             return None
 
+    # -------------------------------------------------------------------------
+    def load_stylesheet(self, stylesheet):
+        """
+            Parse and compile an XSLT stylesheet; compiled stylesheets
+            loaded from files are re-used from the XSLTCache (if enabled)
+
+            Args:
+                stylesheet: the stylesheet (pathname or stream), or the
+                            pre-parsed stylesheet
+
+            Returns:
+                tuple (tree, transformer), transformer being None if the
+                stylesheet could not be parsed or compiled
+        """
+
+        if isinstance(stylesheet, (etree._ElementTree, etree._Element)):
+            # Pre-parsed stylesheet
+            return stylesheet, self.compile(stylesheet)
+
+        cache = XSLTCache.get_cache() if isinstance(stylesheet, str) else None
+        if cache:
+            return cache.get(stylesheet, self.parse_and_compile)
+        else:
+            return self.parse_and_compile(stylesheet)
+
+    # -------------------------------------------------------------------------
+    def parse_and_compile(self, stylesheet):
+        """
+            Parse and compile an XSLT stylesheet
+
+            Args:
+                stylesheet: the stylesheet (pathname or stream)
+
+            Returns:
+                tuple (tree, transformer), see load_stylesheet
+        """
+
+        tree = self.parse(stylesheet)
+        if tree is None:
+            # Error parsing the XSL stylesheet
+            return None, None
+
+        return tree, self.compile(tree)
+
+    # -------------------------------------------------------------------------
+    def compile(self, stylesheet):
+        """
+            Compile a parsed XSLT stylesheet
+
+            Args:
+                stylesheet: the stylesheet (element tree)
+
+            Returns:
+                the XSLT transformer, or None if compilation failed
+        """
+
+        try:
+            ac = etree.XSLTAccessControl(read_file=True, read_network=True)
+            transformer = etree.XSLT(stylesheet, access_control=ac)
+        except:
+            e = sys.exc_info()[1]
+            self.error = e
+            current.log.error(e)
+            transformer = None
+
+        return transformer
+
     # -------------------------------------------------------------------------
     def envelope(self, tree, stylesheet_path, **args):
         """
@@ -2499,15 +2572,61 @@ class S3XML:
                 current.log.error(error)
                 raise HTTP(500, body=cls.json_message(False, 500, "ERROR: %s" % error))
 
+        # Root element
+        root = etree.Element(cls.TAG.table)
+        if resourcename is not None:
+            root.set(cls.ATTRIBUTE.name, resourcename)
+
+        append = root.append
+        for row in cls.xlsx2rows(source,
+                                 extra_data = extra_data,
+                                 hashtags = hashtags,
+                                 sheet = sheet,
+                                 rows = rows,
+                                 cols = cols,
+                                 fields = fields,
+                                 header_row = header_row,
+                                 ):
+            append(row)
+
+        # Use this to debug the source tree if needed:
+        #sys.stderr.write(cls.tostring(root, pretty_print=True))
+
+        return etree.ElementTree(root)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def xlsx2rows(cls, source,
+                  extra_data = None,
+                  hashtags = None,
+                  sheet = None,
+                  rows = None,
+                  cols = None,
+                  fields = None,
+                  header_row = True):
+        """
+            Read the rows of a table in an XLSX (MS Excel) sheet one by one,
+            and convert them into <row> elements (see: L{xlsx2tree}).
+
+            Args:
+                see xlsx2tree
+
+            Yields:
+                a <row> element for each row in the table
+        """
+
+        try:
+            import openpyxl
+        except ImportError:
+            error = "OpenPyXL module is needed for importing XLSX files"
+            current.log.error(error)
+            raise HTTP(500, body=cls.json_message(False, 500, "ERROR: %s" % error))
+
         # Shortcuts
         ATTRIBUTE = cls.ATTRIBUTE
         TAG = cls.TAG
 
-        # Root element
-        root = etree.Element(TAG.table)
-        if resourcename is not None:
-            root.set(ATTRIBUTE.name, resourcename)
-
+        wb = None
         if isinstance(sheet, openpyxl.worksheet.worksheet.Worksheet):
             # Open worksheet passed as argument => use this
             ws = sheet
@@ -2549,6 +2668,7 @@ class S3XML:
             HASHTAG = ATTRIBUTE.hashtag
             COL = TAG.col
             ROW = TAG.row
+            Element = etree.Element
             SubElement = etree.SubElement
 
             # Lambda to decode XLS dates into a datetime.datetime
@@ -2695,7 +2815,7 @@ class S3XML:
                         continue
 
                 # Add output row
-                orow = SubElement(root, ROW)
+                orow = Element(ROW)
                 for cidx, name in headers.items():
                     if check_headers:
                         extra_fields.discard(name)
@@ -2712,13 +2832,11 @@ class S3XML:
                     for key in extra_fields:
                         add_col(orow, key, extra_data[key], hashtags=hashtags)
 
-        # OpenPyXL read_only mode requires explicit close
-        wb.close()
+                yield orow
 
-        # Use this to debug the source tree if needed:
-        #sys.stderr.write(cls.tostring(root, pretty_print=True))
-
-        return etree.ElementTree(root)
+        # OpenPyXL read_only mode requires explicit close
+        if wb is not None:
+            wb.close()
 
     # -------------------------------------------------------------------------
     @classmethod
@@ -2739,6 +2857,47 @@ class S3XML:
                 hashtags: dict of hashtags for extra cols {key:hashtag}
                 delimiter: delimiter for values
                 quotechar: quotation character
+        """
+
+        root = etree.Element(cls.TAG.table)
+        if resourcename is not None:
+            root.set(cls.ATTRIBUTE.name, resourcename)
+
+        append = root.append
+        for row in cls.csv2rows(source,
+                                extra_data = extra_data,
+                                hashtags = hashtags,
+                                delimiter = delimiter,
+                                quotechar = quotechar,
+                                ):
+            append(row)
+
+        # Use this to debug the source tree if needed:
+        #if source.name[-16:] == "organisation.csv":
+        #sys.stderr.write(cls.tostring(root, pretty_print=True).decode("utf-8"))
+
+        return  etree.ElementTree(root)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def csv2rows(cls, source,
+                 extra_data = None,
+                 hashtags = None,
+                 delimiter = ",",
+                 quotechar = '"'):
+        """
+            Read a table-form CSV source row by row, and convert the
+            rows into <row> elements (see: L{csv2tree}).
+
+            Args:
+                source: the source (file-like object)
+                extra_data: dict of extra cols {key:value} to add to each row
+                hashtags: dict of hashtags for extra cols {key:hashtag}
+                delimiter: delimiter for values
+                quotechar: quotation character
+
+            Yields:
+                a <row> element for each (non-empty) row in the source
 
             TODO add a character encoding parameter to skip the guessing
         """
@@ -2754,12 +2913,10 @@ class S3XML:
         HASHTAG = ATTRIBUTE.hashtag
         TAG = cls.TAG
         COL = TAG.col
+        ROW = TAG.row
+        Element = etree.Element
         SubElement = etree.SubElement
 
-        root = etree.Element(TAG.table)
-        if resourcename is not None:
-            root.set(ATTRIBUTE.name, resourcename)
-
         def add_col(row, key, value, hashtags=None):
             col = SubElement(row, COL)
             col.set(FIELD, s3_str(key))
@@ -2808,11 +2965,10 @@ class S3XML:
 
         hashtags = dict(hashtags) if hashtags else {}
 
-        def read_from_csv(source):
+        def read_from_csv(source, skip=0):
             try:
                 source = utf_8_encode(source)
                 reader = csv.DictReader(source, delimiter=delimiter, quotechar=quotechar)
-                ROW = TAG.row
                 for i, r in enumerate(reader):
                     # Skip empty rows
                     if not any(r.values()):
@@ -2824,7 +2980,11 @@ class S3XML:
                         if all(v[0] == "#" for v in items.values()):
                             hashtags.update(items)
                             continue
-                    row = SubElement(root, ROW)
+                    if skip:
+                        # Row has already been read
+                        skip -= 1
+                        continue
+                    row = Element(ROW)
                     for k in r:
                         if k:
                             add_col(row, k, r[k], hashtags=hashtags)
@@ -2832,15 +2992,18 @@ class S3XML:
                         for key in extra_data:
                             if key not in r:
                                 add_col(row, key, extra_data[key], hashtags=hashtags)
+                    yield row
             except csv.Error:
                 e = sys.exc_info()[1]
                 raise HTTP(400, body=cls.json_message(False, 400, e))
 
-
         from io import StringIO
         if not isinstance(source, StringIO):
+            count = 0
             try:
-                read_from_csv(source)
+                for row in read_from_csv(source):
+                    count += 1
+                    yield row
             except UnicodeDecodeError:
                 e = sys.exc_info()[1]
                 try:
@@ -2849,19 +3012,47 @@ class S3XML:
                     fname = fmode = None
                 if fname and fmode and "b" not in fmode:
                     # Perhaps a file opened in text mode with wrong encoding,
-                    # => try to reopen in binary mode
+                    # => try to reopen in binary mode, and continue after
+                    #    the rows that have already been read
                     with open(fname, "rb") as bsource:
-                        read_from_csv(bsource)
+                        yield from read_from_csv(bsource, skip=count)
                 else:
                     raise HTTP(400, body=cls.json_message(False, 400, e))
         else:
-            read_from_csv(source)
+            yield from read_from_csv(source)
 
-        # Use this to debug the source tree if needed:
-        #if source.name[-16:] == "organisation.csv":
-        #sys.stderr.write(cls.tostring(root, pretty_print=True).decode("utf-8"))
+    # -------------------------------------------------------------------------
+    @classmethod
+    def chunks(cls, rows, resourcename=None, chunk_size=1000):
+        """
+            Group <row> elements into table trees of limited size, to
+            process large spreadsheet sources in chunks
 
-        return  etree.ElementTree(root)
+            Args:
+                rows: iterable of <row> elements (e.g. from csv2rows)
+                resourcename: the resource name
+                chunk_size: the maximum number of rows per tree
+
+            Yields:
+                an etree.ElementTree with a <table> of up to chunk_size rows
+        """
+
+        ATTRIBUTE = cls.ATTRIBUTE
+        TAG = cls.TAG
+
+        root = None
+        for row in rows:
+            if root is None:
+                root = etree.Element(TAG.table)
+                if resourcename is not None:
+                    root.set(ATTRIBUTE.name, resourcename)
+            root.append(row)
+            if len(root) >= chunk_size:
+                yield etree.ElementTree(root)
+                root = None
+
+        if root is not None:
+            yield etree.ElementTree(root)
 
     # -------------------------------------------------------------------------
     # Utilities
@@ -3011,10 +3202,12 @@ class S3XMLFormat:
                 stylesheet: the stylesheet (pathname or stream)
         """
 
-        self.tree = current.xml.parse(stylesheet)
+        xml = current.xml
+
+        self.tree, self.transformer = xml.load_stylesheet(stylesheet)
         if not self.tree:
             current.log.error("%s parse error: %s" %
-                              (stylesheet, current.xml.error))
+                              (stylesheet, xml.error))
 
         self.select = None
         self.skip = None
@@ -3127,6 +3320,137 @@ class S3XMLFormat:
             current.log.error("XMLFormat: no stylesheet available")
             return tree
 
-        return current.xml.transform(tree, self.tree, **args)
+        return current.xml.transform(tree, self.transformer or self.tree, **args)
+
+# =============================================================================
+class XSLTCache:
+    """
+        Process-wide, size-bounded cache of compiled XSLT stylesheets,
+        shared across requests and threads
+
+        - keyed by the stylesheet path, and invalidated when the file
+          modification time or size changes
+        - changes in imported/included stylesheets are not detected,
+          clear() the cache (or restart) after changing them
+    """
+
+    instances = {}
+    instances_lock = threading.Lock()
+
+    def __init__(self, size=64):
+        """
+            Args:
+                size: the maximum number of compiled stylesheets
+        """
+
+        self.size = size
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.compiled = 0
+        self.reused = 0
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_cache(cls):
+        """
+            Returns the XSLTCache instance as configured in deployment
+            settings (shared across requests)
+
+            Returns:
+                the XSLTCache, or None if disabled
+        """
+
+        setting = current.deployment_settings.get_base_xslt_cache()
+        if not setting:
+            return None
+
+        size = setting if type(setting) is int else 64
+
+        instances = cls.instances
+        cache = instances.get(size)
+        if cache is None:
+            with cls.instances_lock:
+                cache = instances.get(size)
+                if cache is None:
+                    cache = instances[size] = cls(size=size)
+        return cache
+
+    # -------------------------------------------------------------------------
+    def get(self, path, load):
+        """
+            Get the compiled stylesheet for a path, loading it if it is
+            not yet cached or has changed since it was cached
+
+            Args:
+                path: the stylesheet path
+                load: function to parse and compile the stylesheet, taking
+                      the path as argument and returning a tuple
+                      (tree, transformer)
+
+            Returns:
+                tuple (tree, transformer)
+        """
+
+        try:
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            # Not a local file (e.g. URL) => do not cache
+            with self.lock:
+                self.compiled += 1
+            return load(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        entries = self.entries
+        with self.lock:
+            entry = entries.get(path)
+            if entry is not None and entry[0] == version:
+                entries.move_to_end(path)
+                self.reused += 1
+                return entry[1]
+            self.compiled += 1
+
+        # Load outside of the lock (may take a while)
+        item = load(path)
+        if item[1] is not None:
+            with self.lock:
+                entries[path] = (version, item)
+                entries.move_to_end(path)
+                while len(entries) > self.size:
+                    entries.popitem(last=False)
+
+        return item
+
+    # -------------------------------------------------------------------------
+    def clear(self):
+        """
+            Remove all compiled stylesheets from the cache
+        """
+
+        with self.lock:
+            self.entries.clear()
+
+    # -------------------------------------------------------------------------
+    def stats(self):
+        """
+            Statistics about the compile vs. reuse rates of this cache
+
+            Returns:
+                a dict {"size", "entries", "compiled", "reused", "ratio"},
+                ratio being the share of re-used stylesheets
+        """
+
+        with self.lock:
+            compiled, reused = self.compiled, self.reused
+            entries = len(self.entries)
+
+        total = compiled + reused
+        return {"size": self.size,
+                "entries": entries,
+                "compiled": compiled,
+                "reused": reused,
+                "ratio": float(reused) / total if total else 0.0,
+                }
 
 # End =========================================================================
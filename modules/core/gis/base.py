@@ -63,6 +63,9 @@ GEOM_TYPES = {"point": 1,
 # km
 RADIUS_EARTH = 6371.01
 
+# Maximum number of spatial index results to use in a query
+MAX_INDEX_IDS = 1000
+
 # Garmin GPS Symbols
 GPS_SYMBOLS = ("Airport",
                "Amusement Park"
@@ -2020,6 +2023,14 @@ class GIS:
             query &= (table.deleted == False)
         # @ToDo: Check AAA (do this as a resource filter?)
 
+        from .spatialindex import SpatialIndex
+        index = SpatialIndex.get_index()
+        if index:
+            # Pre-select the locations intersecting the polygon
+            location_ids = index.intersecting(polygon, limit=MAX_INDEX_IDS)
+            if location_ids is not None:
+                query &= locations.id.belongs(location_ids)
+
         features = db(query).select(locations.wkt,
                                     locations.lat,
                                     locations.lon,
@@ -4305,7 +4316,7 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
 
         current.log.debug("Updating Location Tree...")
         try:
-            self.update_location_tree()
+            self.rebuild_location_tree()
         except MemoryError:
             # If doing all L2s, it can break memory limits
             # @ToDo: Check now that we're doing by level
@@ -5903,6 +5914,341 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
 
         return _path
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def rebuild_location_tree(cls, location_ids=None, chunk_size=500):
+        """
+            Set-based rebuild of the Materialized path, Lx names and inherited
+            Lat/Lon of GIS Locations - much faster than update_location_tree
+            for large numbers of locations (e.g. after prepopulate or import
+            of admin areas):
+                - loads the hierarchy skeleton once (no WKT)
+                - computes path, L0-L5 and inherited Lat/Lon in memory, level
+                  by level from the roots
+                - writes back only changed locations, in batches
+
+            Args:
+                location_ids: IDs of changed locations, to only rebuild the
+                              subtrees below them (incremental mode); default
+                              is to rebuild the whole tree
+                chunk_size: max number of locations per query/update
+
+            Returns:
+                the number of updated locations
+
+            Note:
+                Unlike update_location_tree, this does not re-validate
+                existing WKT (nor re-calculate centroids/bounds from it),
+                but only creates Point WKT where needed
+        """
+
+        if GIS.disable_update_location_tree:
+            return 0
+
+        db = current.db
+        table = current.s3db.gis_location
+
+        LEVELS = ("L0", "L1", "L2", "L3", "L4", "L5")
+        BOUNDS = ("lat_min", "lat_max", "lon_min", "lon_max")
+
+        wkt_length = table.wkt.len()
+        fields = [table.id,
+                  table.parent,
+                  table.level,
+                  table.name,
+                  table.path,
+                  table.inherited,
+                  table.lat,
+                  table.lon,
+                  table.gis_feature_type,
+                  wkt_length,
+                  ] + [table[fn] for fn in LEVELS + BOUNDS]
+
+        def load(query):
+            """ Load location skeletons as dict {id: Storage} """
+            nodes = {}
+            for row in db(query).select(*fields):
+                node = Storage(row.gis_location.as_dict())
+                node.wkt = bool(row[wkt_length])
+                nodes[node.id] = node
+            return nodes
+
+        active = (table.deleted == False)
+
+        context = {}
+        if location_ids is None:
+            # Rebuild the whole tree
+            nodes = load(active)
+        else:
+            # Load the changed locations and all their descendants
+            if not isinstance(location_ids, (list, tuple, set)):
+                location_ids = [location_ids]
+            nodes = {}
+            frontier = list(set(location_ids))
+            parent = False
+            while frontier:
+                found = {}
+                for i in range(0, len(frontier), chunk_size):
+                    ids = frontier[i:i + chunk_size]
+                    if parent:
+                        query = table.parent.belongs(ids)
+                    else:
+                        query = table.id.belongs(ids)
+                    found.update(load(query & active))
+                frontier = [node_id for node_id in found if node_id not in nodes]
+                nodes.update(found)
+                parent = True
+
+            # Load the parents of the subtree roots (not to be updated)
+            parents = list(set(node.parent for node in nodes.values()
+                                           if node.parent and node.parent not in nodes))
+            for i in range(0, len(parents), chunk_size):
+                context.update(load(table.id.belongs(parents[i:i + chunk_size])))
+
+        # Calculate centroids for locations with own geometry but
+        # without Lat/Lon (e.g. imported admin areas)
+        centroids = {}
+        missing = [node.id for node in nodes.values()
+                           if node.wkt and (node.lat is None or node.lon is None)]
+        for i in range(0, len(missing), chunk_size):
+            rows = db(table.id.belongs(missing[i:i + chunk_size])).select(table.id,
+                                                                          table.wkt,
+                                                                          )
+            for row in rows:
+                form = Storage(vars = Storage(wkt = row.wkt),
+                               errors = Storage(),
+                               )
+                cls.wkt_centroid(form)
+                if form.errors:
+                    current.log.error("S3GIS: %s" % form.errors)
+                    continue
+                form_vars = form.vars
+                centroid = {fn: form_vars[fn] for fn in ("wkt", "gis_feature_type",
+                                                         "lat", "lon") + BOUNDS
+                                              if form_vars.get(fn) is not None}
+                centroid["inherited"] = False
+                node = nodes[row.id]
+                node.update(centroid)
+                node.wkt = True
+                centroids[row.id] = centroid
+
+        # Build the tree
+        children = {}
+        roots = []
+        for node in nodes.values():
+            parent = node.parent
+            if parent in nodes and node.level != "L0":
+                if parent in children:
+                    children[parent].append(node.id)
+                else:
+                    children[parent] = [node.id]
+            else:
+                roots.append(node.id)
+
+        # Compute the new values, level by level
+        updates = []
+        visited = set()
+        level_nodes = sorted(roots)
+        while level_nodes:
+            next_level = []
+            for node_id in level_nodes:
+                if node_id in visited:
+                    continue
+                visited.add(node_id)
+
+                node = nodes[node_id]
+                parent = nodes.get(node.parent) or context.get(node.parent)
+                values = cls._location_tree_values(node, parent, LEVELS)
+                if node_id in centroids:
+                    values = dict(centroids[node_id], **(values or {}))
+                if values:
+                    updates.append((node_id, values))
+                    node.update(values)
+                    if "wkt" in values:
+                        node.wkt = bool(values["wkt"])
+
+                next_level.extend(children.get(node_id, ()))
+            level_nodes = next_level
+
+        unreachable = len(nodes) - len(visited)
+        if unreachable:
+            current.log.error("S3GIS: %s locations not updated (circular hierarchy)" % unreachable)
+
+        # Write back
+        cls._update_locations(table, updates, chunk_size=chunk_size)
+
+        return len(updates)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _location_tree_values(node, parent, levels):
+        """
+            Computes the path, Lx and inherited Lat/Lon for a location
+            from its parent (helper for rebuild_location_tree)
+
+            Args:
+                node: the location skeleton (Storage)
+                parent: the parent location skeleton (already updated)
+                levels: the hierarchy levels, ordered
+
+            Returns:
+                dict with the changed values, or None if nothing to update
+        """
+
+        node_id = node.id
+        level = node.level
+
+        if level == "L0":
+            parent = None
+
+        lx = dict((l, None) for l in levels)
+        if parent is not None:
+            if level:
+                plevel = parent.level
+                if plevel not in levels or levels.index(plevel) >= levels.index(level):
+                    current.log.error("Parent of %s Location ID %s has invalid level: %s is %s" % \
+                                      (level, node_id, parent.id, plevel))
+                    return None
+            path = "%s/%s" % (parent.path or parent.id, node_id)
+            for l in levels:
+                lx[l] = parent[l]
+        else:
+            path = str(node_id)
+
+        if level:
+            index = levels.index(level)
+            for l in levels[index:]:
+                lx[l] = None
+            lx[level] = node.name
+
+        values = {"path": path}
+        values.update(lx)
+
+        # Inherited Lat/Lon
+        lat, lon = node.lat, node.lon
+        inherited = False
+        if level == "L0":
+            values["inherited"] = False
+        elif node.inherited or lat is None or lon is None:
+            values["inherited"] = inherited = True
+            if parent is not None:
+                lat, lon = parent.lat, parent.lon
+            else:
+                lat = lon = None
+            values["lat"] = lat
+            values["lon"] = lon
+
+        # Point WKT for locations without own geometry
+        if lat is None or lon is None:
+            if inherited and node.wkt:
+                values["wkt"] = None
+        elif not node.wkt or \
+             inherited and (lat != node.lat or lon != node.lon):
+            values["wkt"] = "POINT (%s %s)" % (lon, lat)
+            values["gis_feature_type"] = 1
+            for fn, v in (("lat_min", lat), ("lat_max", lat),
+                          ("lon_min", lon), ("lon_max", lon)):
+                if inherited or node[fn] is None:
+                    values[fn] = v
+
+        # Only changed values
+        changed = {fn: v for fn, v in values.items()
+                         if fn == "wkt" or node[fn] != v}
+
+        return changed or None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _update_locations(table, updates, chunk_size=500):
+        """
+            Writes back location tree updates in batches (helper for
+            rebuild_location_tree)
+
+            Args:
+                table: the gis_location Table
+                updates: list of tuples (location_id, values)
+                chunk_size: max number of locations per UPDATE
+
+            Note:
+                Does not update modified_on since these are only derived
+                (local) values
+        """
+
+        if not updates:
+            return
+
+        db = current.db
+        spatialdb = current.deployment_settings.get_gis_spatialdb()
+
+        # Group updates by the updated columns
+        groups = {}
+        for location_id, values in updates:
+            if spatialdb and "wkt" in values:
+                values["the_geom"] = values["wkt"]
+            key = tuple(sorted(values))
+            if key in groups:
+                groups[key].append((location_id, values))
+            else:
+                groups[key] = [(location_id, values)]
+
+        if db._dbname == "postgres":
+            # UPDATE ... FROM (VALUES ...), one statement per chunk
+            represent = db._adapter.represent
+            TYPES = {"string": "text",
+                     "text": "text",
+                     "double": "double precision",
+                     "integer": "integer",
+                     }
+            for columns, group in groups.items():
+                casts = []
+                assignments = []
+                for fn in columns:
+                    field = table[fn]
+                    ftype = str(field.type)
+                    if fn == "the_geom":
+                        casts.append("::text")
+                        assignments.append("%s=ST_GeomFromText(v.%s, 4326)" % (fn, fn))
+                    else:
+                        casts.append("::%s" % TYPES[ftype] if ftype in TYPES else "")
+                        assignments.append("%s=v.%s" % (fn, fn))
+                for i in range(0, len(group), chunk_size):
+                    rows = []
+                    for location_id, values in group[i:i + chunk_size]:
+                        items = ["%s" % int(location_id)]
+                        for fn, cast in zip(columns, casts):
+                            ftype = "text" if fn == "the_geom" else table[fn].type
+                            items.append("%s%s" % (represent(values[fn], ftype), cast))
+                        rows.append("(%s)" % ",".join(items))
+                    sql = "UPDATE %s AS t SET %s FROM (VALUES %s) AS v(id,%s) WHERE t.id=v.id;" % \
+                          (table._tablename,
+                           ",".join(assignments),
+                           ",".join(rows),
+                           ",".join(columns),
+                           )
+                    db.executesql(sql)
+
+            # Raw SQL bypasses DAL callbacks => invalidate represent cache
+            # and tile cache
+            from ..tools import RepresentCache
+            rcache = RepresentCache.get_cache()
+            if rcache:
+                rcache.invalidate(table._tablename)
+            from .tiles import TileCache
+            tcache = TileCache.get_cache()
+            if tcache:
+                tcache.invalidate(table._tablename)
+        else:
+            modified_on = table.modified_on
+            for group in groups.values():
+                for location_id, values in group:
+                    db(table.id == location_id).update(modified_on = modified_on,
+                                                       **values)
+
+        # Changes do not update modified_on => invalidate spatial index
+        from .spatialindex import SpatialIndex
+        if SpatialIndex.get_index():
+            SpatialIndex.invalidate()
+
     # -------------------------------------------------------------------------
     @staticmethod
     def wkt_centroid(form):
@@ -6069,6 +6415,14 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
         """
 
         table = current.s3db.gis_location
+
+        from .spatialindex import SpatialIndex
+        index = SpatialIndex.get_index()
+        if index:
+            location_ids = index.candidates(lon_min, lat_min, lon_max, lat_max)
+            if len(location_ids) <= MAX_INDEX_IDS:
+                return table.id.belongs(location_ids)
+
         query = (table.lat_min <= lat_max) & \
                 (table.lat_max >= lat_min) & \
                 (table.lon_min <= lon_max) & \
@@ -6110,9 +6464,21 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
                              "Upgrade Shapely for Performance enhancements")
 
         table = current.s3db.gis_location
-        in_bbox = current.gis.query_features_by_bbox(*shape.bounds)
         has_wkt = (table.wkt != None) & (table.wkt != "")
 
+        from .spatialindex import SpatialIndex
+        index = SpatialIndex.get_index()
+        if index:
+            # Exact intersection tests done by the index
+            location_ids = index.intersecting(shape, limit=MAX_INDEX_IDS)
+            if location_ids is not None:
+                query = table.id.belongs(location_ids) & has_wkt
+                for loc in current.db(query).select():
+                    yield loc
+                return
+
+        in_bbox = current.gis.query_features_by_bbox(*shape.bounds)
+
         for loc in current.db(in_bbox & has_wkt).select():
             try:
                 location_shape = wkt_loads(loc.wkt)
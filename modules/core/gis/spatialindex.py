@@ -0,0 +1,528 @@
+"""
+    Spatial Index
+
+    In-memory spatial index for location lookups on databases without
+    spatial extensions
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("SpatialIndex",
+           )
+
+import datetime
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from gluon import current
+
+# =============================================================================
+class SpatialIndex:
+    """
+        Process-local, in-memory spatial index over the bounding boxes of
+        all gis_location records (Shapely STRtree), with lazily loaded,
+        prepared geometries for exact intersection tests
+
+        - built lazily on first lookup
+        - kept up to date incrementally: locations modified since the
+          last synchronization (also by other processes) are looked up
+          by modified_on (at most every CHECK_INTERVAL seconds, or
+          immediately via update()), and applied as a delta on top of
+          the tree; the tree is rebuilt when the delta grows too large
+        - the lookup re-reads changes within OVERLAP before the last
+          synchronization, so as to also pick up transactions which
+          have committed after that synchronization
+        - changes which keep modified_on (location tree rebuilds) are
+          applied by invalidating the index (all processes on the same
+          host), and the tree is rebuilt after TTL in any case
+    """
+
+    instance = None
+    instance_lock = threading.Lock()
+
+    # Minimum interval between checks for modified locations (seconds)
+    CHECK_INTERVAL = 1.0
+
+    # Maximum number of changed locations before rebuilding the tree
+    MAX_DELTA = 1000
+
+    # Maximum number of prepared geometries to keep in memory
+    MAX_SHAPES = 10000
+
+    # Overlap of incremental updates (seconds)
+    OVERLAP = 300
+
+    # Maximum lifetime of the tree (seconds)
+    TTL = 3600
+
+    # Invalidation takes effect this far (seconds) into the future, so
+    # that the tree is rebuilt after the changes have been committed
+    MARGIN = 60
+
+    def __init__(self):
+
+        self.lock = threading.RLock()
+
+        # The tree, and the location IDs for its entries
+        self.tree = None
+        self.ids = None
+        self.geoms = None
+
+        # Changes since the tree was built
+        self.delta = {}
+        self.removed = set()
+
+        # Prepared geometries, LRU {location_id: geometry}
+        self.shapes = OrderedDict()
+
+        # Time when the tree was built, and when last synchronized
+        self.built = 0
+        self.synced = None
+        self.checked = 0
+
+        # Changes applied within the overlap {location_id: (modified_on, bounds)}
+        self.recent = {}
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_index(cls):
+        """
+            Returns the spatial index of this process
+
+            Returns:
+                the SpatialIndex, or None if disabled or Shapely
+                is not installed
+        """
+
+        if not current.deployment_settings.get_gis_spatial_index():
+            return None
+
+        index = cls.instance
+        if index is None:
+            try:
+                from shapely.strtree import STRtree
+            except ImportError:
+                return None
+            with cls.instance_lock:
+                index = cls.instance
+                if index is None:
+                    index = cls.instance = cls()
+        return index
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+    def candidates(self, lon_min, lat_min, lon_max, lat_max):
+        """
+            Look up all locations with a bounding box intersecting
+            the given bounding box
+
+            Args:
+                lon_min: the western boundary
+                lat_min: the southern boundary
+                lon_max: the eastern boundary
+                lat_max: the northern boundary
+
+            Returns:
+                set of location IDs
+        """
+
+        from shapely.geometry import box
+
+        self.sync()
+
+        with self.lock:
+            tree, ids, geoms = self.tree, self.ids, self.geoms
+            delta, removed = dict(self.delta), set(self.removed)
+
+        found = set()
+
+        if tree is not None:
+            for item in tree.query(box(lon_min, lat_min, lon_max, lat_max)):
+                if geoms is not None:
+                    # Shapely < 2.0 returns geometries
+                    location_id = geoms[id(item)]
+                else:
+                    location_id = ids[item]
+                if location_id not in removed:
+                    found.add(location_id)
+
+        for location_id, bounds in delta.items():
+            if bounds[0] <= lon_max and bounds[2] >= lon_min and \
+               bounds[1] <= lat_max and bounds[3] >= lat_min:
+                found.add(location_id)
+
+        return found
+
+    # -------------------------------------------------------------------------
+    def intersecting(self, shape, limit=None):
+        """
+            Look up all locations with a geometry intersecting the
+            given shape
+
+            Args:
+                shape: the shape (Shapely geometry)
+                limit: the maximum number of candidates to test
+
+            Returns:
+                list of location IDs, or None if there are more
+                candidates than limit
+        """
+
+        candidates = self.candidates(*shape.bounds)
+        if not candidates:
+            return []
+        if limit is not None and len(candidates) > limit:
+            return None
+
+        shapes = self.load_shapes(candidates)
+        return [location_id for location_id in candidates
+                if location_id in shapes and shapes[location_id].intersects(shape)]
+
+    # -------------------------------------------------------------------------
+    def containing(self, lat, lon):
+        """
+            Look up all locations with a geometry containing the given
+            point, e.g. to find the admin areas a point is located in
+
+            Args:
+                lat: the latitude
+                lon: the longitude
+
+            Returns:
+                list of location IDs
+        """
+
+        from shapely.geometry import Point
+
+        return self.intersecting(Point(lon, lat))
+
+    # -------------------------------------------------------------------------
+    def load_shapes(self, location_ids):
+        """
+            Get the prepared geometries for locations, loading them
+            from the database as needed
+
+            Args:
+                location_ids: the location IDs
+
+            Returns:
+                dict {location_id: prepared geometry}
+        """
+
+        from shapely.geometry import Point
+        from shapely.prepared import prep
+        from shapely.wkt import loads as wkt_loads
+
+        found = {}
+
+        shapes = self.shapes
+        with self.lock:
+            for location_id in location_ids:
+                shape = shapes.get(location_id)
+                if shape is not None:
+                    shapes.move_to_end(location_id)
+                    found[location_id] = shape
+
+        missing = [location_id for location_id in location_ids
+                   if location_id not in found]
+        if missing:
+            table = current.s3db.gis_location
+            rows = current.db(table.id.belongs(missing)).select(table.id,
+                                                                 table.wkt,
+                                                                 table.lat,
+                                                                 table.lon,
+                                                                 )
+            loaded = {}
+            for row in rows:
+                shape = None
+                if row.wkt:
+                    try:
+                        shape = wkt_loads(row.wkt)
+                    except Exception:
+                        current.log.error("Error reading wkt of location with id %s" % row.id)
+                if shape is None and row.lat is not None and row.lon is not None:
+                    shape = Point(row.lon, row.lat)
+                if shape is not None:
+                    loaded[row.id] = prep(shape)
+            found.update(loaded)
+
+            with self.lock:
+                shapes.update(loaded)
+                while len(shapes) > self.MAX_SHAPES:
+                    shapes.popitem(last=False)
+
+        return found
+
+    # -------------------------------------------------------------------------
+    # Maintenance
+    # -------------------------------------------------------------------------
+    def build(self):
+        """
+            (Re-)build the tree from all current locations
+        """
+
+        from shapely.strtree import STRtree
+        from shapely.geometry import box
+
+        db = current.db
+        table = current.s3db.gis_location
+
+        # Note the times before reading the locations, so that
+        # concurrent changes will be applied by the next sync
+        built = time.time()
+        synced = datetime.datetime.utcnow()
+
+        query = (table.deleted == False)
+        rows = db(query).select(table.id,
+                                table.lon_min,
+                                table.lat_min,
+                                table.lon_max,
+                                table.lat_max,
+                                table.lon,
+                                table.lat,
+                                )
+        ids, boxes = [], []
+        for row in rows:
+            bounds = self.bounds(row)
+            if bounds:
+                ids.append(row.id)
+                boxes.append(box(*bounds))
+
+        tree = STRtree(boxes) if boxes else None
+
+        # Shapely < 2.0 returns geometries rather than indices
+        # from queries => map geometries to location IDs
+        import shapely
+        if int(shapely.__version__.split(".")[0]) < 2:
+            geoms = {id(geom): location_id for geom, location_id in zip(boxes, ids)}
+        else:
+            geoms = None
+
+        with self.lock:
+            self.tree = tree
+            self.ids = ids
+            self.geoms = geoms
+            self.delta = {}
+            self.removed = set()
+            self.shapes.clear()
+            self.recent = {}
+            self.built = built
+            self.synced = synced
+            self.checked = time.time()
+
+    # -------------------------------------------------------------------------
+    def sync(self, force=False):
+        """
+            Apply all changes since the last synchronization, or build
+            the tree if not built yet (or expired)
+
+            Args:
+                force: check for changes even if checked recently
+        """
+
+        if self.ids is None:
+            with self.lock:
+                if self.ids is None:
+                    self.build()
+            return
+
+        now = time.time()
+        if not force and now - self.checked < self.CHECK_INTERVAL:
+            return
+
+        with self.lock:
+            self.checked = now
+
+            if self.expired(now):
+                self.build()
+                return
+
+            synced = datetime.datetime.utcnow()
+            since = self.synced - datetime.timedelta(seconds=self.OVERLAP)
+
+            table = current.s3db.gis_location
+            query = (table.modified_on >= since)
+            rows = current.db(query).select(table.id,
+                                            table.deleted,
+                                            table.lon_min,
+                                            table.lat_min,
+                                            table.lon_max,
+                                            table.lat_max,
+                                            table.lon,
+                                            table.lat,
+                                            table.modified_on,
+                                            )
+
+            # Apply each change only once, even though re-read
+            # as long as within the overlap
+            recent = self.recent
+            for row in rows:
+                key = (row.modified_on, None if row.deleted else self.bounds(row))
+                if recent.get(row.id) != key:
+                    recent[row.id] = key
+                    self.apply(row)
+            for location_id, key in list(recent.items()):
+                if key[0] is None or key[0] < since:
+                    del recent[location_id]
+
+            self.synced = synced
+
+            if len(self.delta) > self.MAX_DELTA:
+                self.build()
+
+    # -------------------------------------------------------------------------
+    def expired(self, now):
+        """
+            Check whether the tree must be rebuilt, i.e. if it is older
+            than TTL, or has been invalidated since it was built
+
+            Args:
+                now: the current time (time.time())
+
+            Returns:
+                boolean
+        """
+
+        if now - self.built > self.TTL:
+            return True
+        try:
+            invalidated = os.stat(self.stamp()).st_mtime
+        except OSError:
+            return False
+        return self.built <= invalidated <= now
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def stamp():
+        """
+            The path of the invalidation time stamp (shared by all
+            processes on the same host)
+        """
+
+        return os.path.join(current.request.folder, "cache", "spatial_index")
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls):
+        """
+            Invalidate the spatial indexes of all processes, e.g. after
+            updating locations without changing modified_on, or bypassing
+            the DAL
+        """
+
+        index = cls.instance
+        if index is not None:
+            with index.lock:
+                index.built = 0
+
+        path = cls.stamp()
+        try:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, "a").close()
+            stamp = time.time() + cls.MARGIN
+            os.utime(path, (stamp, stamp))
+        except OSError as e:
+            current.log.error("Could not invalidate spatial index: %s" % e)
+
+    # -------------------------------------------------------------------------
+    def update(self, location_id):
+        """
+            Update the index for a location (e.g. onaccept)
+
+            Args:
+                location_id: the location ID
+        """
+
+        if self.ids is None:
+            # Not built yet
+            return
+
+        table = current.s3db.gis_location
+        row = current.db(table.id == location_id).select(table.id,
+                                                         table.deleted,
+                                                         table.lon_min,
+                                                         table.lat_min,
+                                                         table.lon_max,
+                                                         table.lat_max,
+                                                         table.lon,
+                                                         table.lat,
+                                                         limitby = (0, 1),
+                                                         ).first()
+        with self.lock:
+            if row:
+                self.apply(row)
+            else:
+                self.delta.pop(location_id, None)
+                self.removed.add(location_id)
+                self.shapes.pop(location_id, None)
+
+    # -------------------------------------------------------------------------
+    def apply(self, row):
+        """
+            Apply a changed location to the delta
+
+            Args:
+                row: the gis_location Row
+        """
+
+        location_id = row.id
+
+        # Tree entries for this location are outdated
+        self.removed.add(location_id)
+        self.shapes.pop(location_id, None)
+
+        bounds = None if row.deleted else self.bounds(row)
+        if bounds:
+            self.delta[location_id] = bounds
+        else:
+            self.delta.pop(location_id, None)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def bounds(row):
+        """
+            Get the bounding box of a location
+
+            Args:
+                row: the gis_location Row
+
+            Returns:
+                tuple (lon_min, lat_min, lon_max, lat_max), or None
+                if the location has neither bounds nor coordinates
+        """
+
+        if row.lon_min is not None and row.lat_min is not None and \
+           row.lon_max is not None and row.lat_max is not None:
+            return (row.lon_min, row.lat_min, row.lon_max, row.lat_max)
+        elif row.lon is not None and row.lat is not None:
+            return (row.lon, row.lat, row.lon, row.lat)
+        else:
+            return None
+
+# END =========================================================================
@@ -0,0 +1,427 @@
+"""
+    Map Tiles
+
+    Tile geometry, point clustering and disk cache for serving feature
+    layers per z/x/y tile (see MapTiles method)
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("MapTile",
+           "TileCache",
+           )
+
+import math
+import os
+import threading
+import time
+
+from gluon import current
+
+# Tile size (pixels)
+TILE_SIZE = 256
+
+# Grid cell size for point clustering (pixels)
+CLUSTER_SIZE = 64
+
+# Maximum zoom level for point clustering
+MAX_CLUSTER_ZOOM = 16
+
+# Maximum zoom level for tile requests
+MAX_ZOOM = 22
+
+# Maximum latitude of the Web Mercator projection
+MAX_LAT = 85.0511287798
+
+# =============================================================================
+class MapTile:
+    """
+        A map tile in the Web Mercator tiling scheme (as used by
+        OpenStreetMap), in z/x/y notation
+    """
+
+    def __init__(self, z, x, y):
+        """
+            Args:
+                z: the zoom level
+                x: the tile column (west to east)
+                y: the tile row (north to south)
+
+            Raises:
+                ValueError: for invalid tile coordinates
+        """
+
+        z, x, y = int(z), int(x), int(y)
+
+        n = 2 ** z if 0 <= z <= MAX_ZOOM else 0
+        if not (0 <= x < n and 0 <= y < n):
+            raise ValueError("Invalid tile %s/%s/%s" % (z, x, y))
+
+        self.z = z
+        self.x = x
+        self.y = y
+
+        # Map size at this zoom level (pixels)
+        self.scale = TILE_SIZE * n
+
+    # -------------------------------------------------------------------------
+    @property
+    def bounds(self):
+        """
+            The bounding box of this tile
+
+            Returns:
+                tuple (lon_min, lat_min, lon_max, lat_max)
+        """
+
+        n = 2 ** self.z
+        x, y = self.x, self.y
+
+        def lat(row):
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2.0 * row / n))))
+
+        lon_min = x * 360.0 / n - 180
+        lon_max = (x + 1) * 360.0 / n - 180
+
+        # Tiles at the poles extend beyond the projection
+        lat_max = lat(y) if y > 0 else 90.0
+        lat_min = lat(y + 1) if y < n - 1 else -90.0
+
+        return lon_min, lat_min, lon_max, lat_max
+
+    # -------------------------------------------------------------------------
+    @property
+    def resolution(self):
+        """
+            The size of a pixel in degrees (longitude) at this zoom level,
+            to use as simplification tolerance
+        """
+
+        return 360.0 / self.scale
+
+    # -------------------------------------------------------------------------
+    @property
+    def precision(self):
+        """
+            The number of decimal places needed for pixel-accurate
+            coordinates at this zoom level
+        """
+
+        return max(0, int(math.ceil(math.log10(self.scale / 360.0)))) + 1
+
+    # -------------------------------------------------------------------------
+    def pixel(self, lat, lon):
+        """
+            Project a point to pixel coordinates at this zoom level
+
+            Args:
+                lat: the latitude
+                lon: the longitude
+
+            Returns:
+                tuple (px, py)
+        """
+
+        scale = self.scale
+
+        lat = max(-MAX_LAT, min(MAX_LAT, lat))
+        sin = math.sin(math.radians(lat))
+
+        px = (lon + 180) / 360.0 * scale
+        py = (0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * scale
+
+        return px, py
+
+    # -------------------------------------------------------------------------
+    def cluster(self, points, size=CLUSTER_SIZE):
+        """
+            Group points by grid cells of this tile
+
+            Args:
+                points: iterable of tuples (record_id, lat, lon)
+                size: the grid cell size (pixels)
+
+            Returns:
+                list of tuples (lat, lon, record_ids), with lat/lon
+                being the mean position of the points in the cluster
+        """
+
+        if self.z > MAX_CLUSTER_ZOOM:
+            return [(lat, lon, [record_id]) for record_id, lat, lon in points]
+
+        pixel = self.pixel
+
+        cells = {}
+        for record_id, lat, lon in points:
+            px, py = pixel(lat, lon)
+            cell = (int(px // size), int(py // size))
+            if cell in cells:
+                cells[cell].append((record_id, lat, lon))
+            else:
+                cells[cell] = [(record_id, lat, lon)]
+
+        clusters = []
+        for items in cells.values():
+            num = len(items)
+            clusters.append((sum(item[1] for item in items) / num,
+                             sum(item[2] for item in items) / num,
+                             [item[0] for item in items],
+                             ))
+        return clusters
+
+# =============================================================================
+class TileCache:
+    """
+        Disk cache for map tiles
+
+        - tiles are cached per layer (i.e. per table and filter), and
+          invalidated whenever a record in any of the tables the tile
+          has been built from is inserted, updated or deleted (DAL-level
+          callbacks registered by DataModel.define_table)
+        - invalidation time stamps are stored as files next to the tiles,
+          so that all processes on the same host share them
+    """
+
+    instances = {}
+    instances_lock = threading.Lock()
+
+    # Invalidation time stamps are set this far (seconds) into the
+    # future, so that tiles built concurrently with a (not yet committed)
+    # update are not cached
+    MARGIN = 60
+
+    # Tables which tiles are built from in addition to the layer table
+    LOCATION_TABLES = ("gis_location", "org_site")
+
+    def __init__(self, path, ttl=86400):
+        """
+            Args:
+                path: the cache directory
+                ttl: the maximum lifetime of cached tiles (seconds)
+        """
+
+        self.path = path
+        self.ttl = ttl
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_cache(cls):
+        """
+            Returns the TileCache instance as configured in deployment
+            settings (shared across requests)
+
+            Returns:
+                the TileCache, or None if disabled
+        """
+
+        setting = current.deployment_settings.get_gis_tile_cache()
+        if not setting:
+            return None
+
+        config = setting if isinstance(setting, dict) else {}
+        path = config.get("path")
+        if not path:
+            path = os.path.join(current.request.folder, "uploads", "tiles")
+        ttl = config.get("ttl", 86400)
+
+        key = (path, ttl)
+        instances = cls.instances
+        cache = instances.get(key)
+        if cache is None:
+            with cls.instances_lock:
+                cache = instances.get(key)
+                if cache is None:
+                    cache = instances[key] = cls(path, ttl=ttl)
+        return cache
+
+    # -------------------------------------------------------------------------
+    def stamp(self, tablename):
+        """
+            The path of the invalidation time stamp of a table
+
+            Args:
+                tablename: the table name
+        """
+
+        return os.path.join(self.path, "stamps", tablename)
+
+    # -------------------------------------------------------------------------
+    def version(self, tablename):
+        """
+            Returns the time of the last invalidation for a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                the time stamp, or 0 if never invalidated
+        """
+
+        try:
+            return os.stat(self.stamp(tablename)).st_mtime
+        except OSError:
+            return 0
+
+    # -------------------------------------------------------------------------
+    def invalidate(self, tablename):
+        """
+            Invalidates all cached tiles built from a table
+
+            Args:
+                tablename: the table name
+        """
+
+        # Always push the stamp forward, so that tiles built before
+        # this write has been committed are not cached either
+        stamp = time.time() + self.MARGIN
+        if self.version(tablename) >= stamp:
+            return
+
+        path = self.stamp(tablename)
+        try:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, "a").close()
+            os.utime(path, (stamp, stamp))
+        except OSError as e:
+            current.log.error("Could not invalidate tile cache for %s: %s" % (tablename, e))
+
+    # -------------------------------------------------------------------------
+    def watch(self, table):
+        """
+            Registers DAL callbacks to invalidate the cache whenever records
+            in a table are inserted, updated or deleted
+
+            Args:
+                table: the Table
+
+            Note:
+                - only tables that tiles can be built from (see
+                  MapTiles.location_query) are watched, so that writes
+                  to other tables do not touch any time stamps
+        """
+
+        tablename = table._tablename
+        if tablename not in self.LOCATION_TABLES and \
+           "location_id" not in table.fields and \
+           "site_id" not in table.fields:
+            return
+
+        after_insert = table._after_insert
+        if any(getattr(hook, "tile_cache", None) == tablename
+               for hook in after_insert):
+            return
+
+        def invalidate(*args):
+            self.invalidate(tablename)
+        invalidate.tile_cache = tablename
+
+        after_insert.append(invalidate)
+        table._after_update.append(invalidate)
+        table._after_delete.append(invalidate)
+
+    # -------------------------------------------------------------------------
+    def tile_path(self, layer, tile):
+        """
+            The path of a cached tile
+
+            Args:
+                layer: the layer key (tablename, filter hash)
+                tile: the MapTile
+        """
+
+        tablename, key = layer
+        return os.path.join(self.path,
+                            tablename,
+                            key,
+                            str(tile.z),
+                            str(tile.x),
+                            "%s.geojson" % tile.y,
+                            )
+
+    # -------------------------------------------------------------------------
+    def get(self, layer, tile, tablenames):
+        """
+            Looks up a cached tile
+
+            Args:
+                layer: the layer key (tablename, filter hash)
+                tile: the MapTile
+                tablenames: the names of all tables the tile is built from
+
+            Returns:
+                the tile contents (str), or None if not cached or outdated
+        """
+
+        path = self.tile_path(layer, tile)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+
+        ttl = self.ttl
+        if ttl and mtime < time.time() - ttl:
+            return None
+
+        version = self.version
+        if any(mtime <= version(tablename) for tablename in tablenames):
+            return None
+
+        try:
+            with open(path, "r") as f:
+                contents = f.read()
+        except OSError:
+            contents = None
+
+        return contents
+
+    # -------------------------------------------------------------------------
+    def put(self, layer, tile, contents, timestamp):
+        """
+            Stores a tile in the cache
+
+            Args:
+                layer: the layer key (tablename, filter hash)
+                tile: the MapTile
+                contents: the tile contents (str)
+                timestamp: the time when building the tile started
+                           (becomes the modification time of the file)
+        """
+
+        path = self.tile_path(layer, tile)
+        tmp = "%s.%s.%s" % (path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w") as f:
+                f.write(contents)
+            os.utime(tmp, (timestamp, timestamp))
+            os.replace(tmp, path)
+        except OSError as e:
+            current.log.error("Could not cache map tile %s: %s" % (path, e))
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+# END =========================================================================
@@ -3,11 +3,12 @@ from .account import *
 from .anonymize import *
 from .cico import *
 from .crud import *
-from .checkpoint import Checkpoint
+from .checkpoint import Checkpoint, CheckpointRules
 from .filtermgr import *
 from .grouped import *
 from .hcrud import *
 from .mapview import *
+from .maptiles import *
 from .merge import S3Merge, S3RecordMerger
 from .mobile import *
 from .organizer import *
@@ -26,10 +26,13 @@
 """
 
 __all__ = ("Checkpoint",
+           "CheckpointRules",
            )
 
 import datetime
 import json
+import threading
+import time
 
 from gluon import current, URL, \
                   A, DIV, H4, INPUT, SPAN, \
@@ -39,7 +42,8 @@ from s3dal import Field
 
 from .base import CRUDMethod
 from .presence import SitePresence
-from ..tools import s3_fullname, s3_str, S3DateTime, FormKey
+from ..tools import ChangeJournal, JournalCursor, \
+                    s3_fullname, s3_str, S3DateTime, FormKey
 from ..resource import FS
 from ..ui import S3QRInput, ICON
 
@@ -430,8 +434,16 @@ class Checkpoint(CRUDMethod):
                                                  organisation_id = organisation_id,
                                                  )
 
+            # Event types and rules (shared by all family members)
+            event_types = self.get_event_types(organisation_id)
+            rules = self.get_event_rules(organisation_id)
+
             # Family members
-            family = self.get_family_members(person.id, organisation_id)
+            family = self.get_family_members(person.id,
+                                             organisation_id,
+                                             event_types = event_types,
+                                             rules = rules,
+                                             )
             if family:
                 output["x"] = family
 
@@ -440,6 +452,8 @@ class Checkpoint(CRUDMethod):
                                               organisation_id,
                                               is_resident = is_resident,
                                               serializable = True,
+                                              event_types = event_types,
+                                              rules = rules,
                                               )
             if blocked:
                 # TODO format as r: {event_code: {m: message, e: earliest}}
@@ -496,31 +510,44 @@ class Checkpoint(CRUDMethod):
                 error = T("Multiple-registration not permitted")
 
             validate = current.deployment_settings.get_org_site_presence_validate_id()
+            valid = []
             for i, label in enumerate(labels):
                 if i > 1:
                     validate = None
                 if callable(validate):
                     label, advice, error = validate(label)
-                    person = self.get_person(label, organisation_id) if label else None
                     #if advice:
                         #output["e"] = s3_str(advice)
                 else:
                     advice, error = None, None
-                    person = self.get_person(label, organisation_id)
-                if person:
-                    persons.append(person)
-                else:
-                    # TODO Error: person not found
-                    break
+                valid.append(label)
+
+            # Look up all persons at once
+            found = self.get_persons(valid, organisation_id)
+            missing = [label for label, person in zip(valid, found) if not person]
+            if not missing:
+                persons = found
+            elif not error:
+                missing = [s3_str(label) for label in missing if label]
+                if missing:
+                    error = T("Person not found: %(label)s") % \
+                                {"label": ", ".join(missing)}
 
         if persons and event_type:
-            for person in persons:
-                # TODO Check event type not blocked for that person
-                #      - GUI should prevent this, but need to catch forged requests
-                success = self.register_bare(person, event_type.id)
+            # Check event type not blocked for any of the persons
+            # - GUI should prevent this, but need to catch forged requests
+            # - only with preloaded rules (which require no extra queries)
+            rules = self.get_event_rules(organisation_id)
+            if rules and not error:
+                error = self.check_registration(persons,
+                                                organisation_id,
+                                                event_type.id,
+                                                rules,
+                                                )
+            if not error:
+                success = self.register_batch(persons, event_type.id)
                 if not success:
                     error = T("Event registration failed")
-                    break
         elif not event_type:
             if not error:
                 error = T("Invalid event type")
@@ -535,8 +562,53 @@ class Checkpoint(CRUDMethod):
         return output
 
     # -------------------------------------------------------------------------
-    @staticmethod
-    def register_bare(person, event_type_id):
+    def check_registration(self, persons, organisation_id, event_type_id, rules):
+        """
+            Checks whether an event type is blocked for any of the persons
+            an event shall be registered for
+
+            Args:
+                persons: the pr_person Rows
+                organisation_id: the organisation record ID
+                event_type_id: the event type record ID
+                rules: the CheckpointRules of the organisation
+
+            Returns:
+                the error message if blocked for any person, otherwise None
+        """
+
+        event_types = self.get_event_types(organisation_id)
+        event_type = event_types.get(event_type_id)
+        if not event_type:
+            return current.T("Invalid event type")
+
+        # Residents (only needed for residents-only event types)
+        if event_type.residents_only:
+            residents = self.get_residents([p.id for p in persons], organisation_id)
+        else:
+            residents = None
+
+        for person in persons:
+            is_resident = residents is None or person.id in residents
+            blocked = self.get_blocked_events(person.id,
+                                              organisation_id,
+                                              is_resident = is_resident,
+                                              event_type_id = event_type_id,
+                                              serializable = False,
+                                              event_types = event_types,
+                                              rules = rules,
+                                              )
+            if event_type_id in blocked:
+                msg = blocked[event_type_id][0]
+                if len(persons) > 1:
+                    msg = "%s: %s" % (s3_fullname(person), s3_str(msg))
+                return msg
+
+        return None
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def register_bare(cls, person, event_type_id):
         """
             Registers an event for a person (low-level method)
 
@@ -548,6 +620,24 @@ class Checkpoint(CRUDMethod):
                 True if successful, otherwise False
         """
 
+        return cls.register_batch([person], event_type_id)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def register_batch(persons, event_type_id):
+        """
+            Registers an event for multiple persons, e.g. all members of
+            a family (low-level method)
+
+            Args:
+                persons: the pr_person Rows
+                event_type_id: the event type record ID
+
+            Returns:
+                True if successful for all persons, otherwise False
+        """
+
+        auth = current.auth
         s3db = current.s3db
 
         etable = s3db.dvr_case_event
@@ -557,21 +647,25 @@ class Checkpoint(CRUDMethod):
         r = CRUDRequest("dvr", "case_event", current.request, args=[], get_vars={})
         r.customise_resource("dvr_case_event")
 
-        data = {"person_id": person.id,
-                "type_id": event_type_id,
-                "date": current.request.utcnow,
-                }
-        record_id = etable.insert(**data)
-        if record_id:
+        now = current.request.utcnow
+        for person in persons:
+            data = {"person_id": person.id,
+                    "type_id": event_type_id,
+                    "date": now,
+                    }
+            record_id = etable.insert(**data)
+            if not record_id:
+                return False
+
             # Set record owner
-            auth = current.auth
             auth.s3_set_record_owner(etable, record_id)
             auth.s3_make_session_owner(etable, record_id)
+
             # Execute onaccept
             data["id"] = record_id
             s3db.onaccept(etable, data, method="create")
 
-        return bool(record_id)
+        return bool(persons)
 
     # -------------------------------------------------------------------------
     # UI Widgets
@@ -841,6 +935,57 @@ class Checkpoint(CRUDMethod):
 
         return rows[0] if rows else None
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_persons(labels, organisation_id=None):
+        """
+            Returns the person records for multiple labels (e.g. for all
+            members of a family) with a single query
+
+            Args:
+                labels: list of PE labels
+                organisation_id: the organisation ID
+
+            Returns:
+                list of person records (pr_person Row), in the order of
+                the labels, with None for labels not found
+        """
+
+        keys = [label.upper() if label else None for label in labels]
+        search = {key for key in keys if key}
+        if not search or not organisation_id:
+            return [None] * len(keys)
+
+        # Fields to extract
+        fields = ["id",
+                  "pe_id",
+                  "pe_label",
+                  "first_name",
+                  "middle_name",
+                  "last_name",
+                  "date_of_birth",
+                  "gender",
+                  ]
+
+        query = (FS("pe_label").upper().belongs(search)) & \
+                (FS("dvr_case.organisation_id") == organisation_id) & \
+                (FS("dvr_case.archived") == False) & \
+                (FS("dvr_case.status_id$is_closed") == False)
+
+        presource = current.s3db.resource("pr_person",
+                                          components = [],
+                                          filter = query,
+                                          )
+        rows = presource.select(fields, as_rows=True)
+
+        persons = {}
+        for row in rows:
+            key = row.pe_label.upper()
+            if key not in persons:
+                persons[key] = row
+
+        return [persons.get(key) if key else None for key in keys]
+
     # -------------------------------------------------------------------------
     @staticmethod
     def person_details(person):
@@ -931,6 +1076,42 @@ class Checkpoint(CRUDMethod):
 
         return is_resident, site_id
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_residents(person_ids, organisation_id):
+        """
+            Finds out which of a number of persons are current residents
+            of a shelter of the organisation, with a single query
+
+            Args:
+                person_ids: the person record IDs
+                organisation_id: the organisation ID
+
+            Returns:
+                set of person IDs
+        """
+
+        if not person_ids:
+            return set()
+
+        s3db = current.s3db
+
+        stable = s3db.cr_shelter
+        rtable = s3db.cr_shelter_registration
+
+        join = stable.on((stable.id == rtable.shelter_id) & \
+                         (stable.organisation_id == organisation_id) & \
+                         (stable.deleted == False))
+        query = (rtable.person_id.belongs(set(person_ids))) & \
+                (rtable.registration_status == 2) & \
+                (rtable.deleted == False)
+        rows = current.db(query).select(rtable.person_id,
+                                        join = join,
+                                        distinct = True,
+                                        )
+
+        return {row.person_id for row in rows}
+
     # -------------------------------------------------------------------------
     @staticmethod
     def flag_instructions(person_id, organisation_id=None):
@@ -961,13 +1142,22 @@ class Checkpoint(CRUDMethod):
         return flags
 
     # -------------------------------------------------------------------------
-    def get_family_members(self, person_id, organisation_id):
+    def get_family_members(self,
+                           person_id,
+                           organisation_id,
+                           event_types = None,
+                           rules = None,
+                           ):
         """
             Extracts and formats family details for a client
 
             Args:
                 person_id: the client person record ID
                 organisation_id: the organisation record ID
+                event_types: the event types of the organisation (as
+                             returned from get_event_types), if known
+                rules: the CheckpointRules of the organisation, to evaluate
+                       the blocking rules without further queries
 
             Returns:
                 array with family member infos, format:
@@ -1032,6 +1222,12 @@ class Checkpoint(CRUDMethod):
             if member_id not in members:
                 members[member_id] = row
 
+        if event_types is None:
+            event_types = self.get_event_types(organisation_id)
+
+        # Current residents among the family members
+        residents = self.get_residents(list(members), organisation_id)
+
         output = []
         for member_id, row in members.items():
             # Person data
@@ -1049,11 +1245,12 @@ class Checkpoint(CRUDMethod):
                                 args = picture.image,
                                 )
             # Blocking rules
-            is_resident = self.is_resident(member_id, organisation_id)[0]
             event_rules = self.get_blocked_events(member_id,
                                                   organisation_id,
-                                                  is_resident = is_resident,
+                                                  is_resident = member_id in residents,
                                                   serializable = True,
+                                                  event_types = event_types,
+                                                  rules = rules,
                                                   )
             if event_rules:
                 data["r"] = event_rules
@@ -1070,6 +1267,8 @@ class Checkpoint(CRUDMethod):
                            is_resident = True,
                            event_type_id = None,
                            serializable = True,
+                           event_types = None,
+                           rules = None,
                            ):
         """
             Returns currently excluded events for a person including reasons
@@ -1083,6 +1282,11 @@ class Checkpoint(CRUDMethod):
                 event_type_id: check only this event type (rather than all
                                event types defined by the organisation)
                 serializable: return JSON-serializable data
+                event_types: the event types of the organisation (as
+                             returned from get_event_types), if known
+                rules: the CheckpointRules of the organisation, to evaluate
+                       the rules against its index rather than querying
+                       the registrations of the person
 
             Returns:
                 a dict with exclusion details
@@ -1098,7 +1302,8 @@ class Checkpoint(CRUDMethod):
         day_start = now.replace(hour=0, minute=0, second=0)
 
         # Get event types for organisation
-        event_types = cls.get_event_types(organisation_id)
+        if event_types is None:
+            event_types = cls.get_event_types(organisation_id)
 
         # Get event types to check
         event_type_ids = set(event_types.keys())
@@ -1117,23 +1322,27 @@ class Checkpoint(CRUDMethod):
             excluded.update(not_applicable)
             check -= set(not_applicable.keys())
 
-        # Exclude event types that are not combinable with other events
-        # registered today
-        non_combinable = cls.check_non_combinable(person_id, check, day_start, event_types)
-        excluded.update(non_combinable)
-        check -= set(non_combinable.keys())
-
-        # Exclude event types for which maximum number of occurences per
-        # day have been reached
-        max_per_day = cls.check_max_per_day(person_id, check, day_start, event_types)
-        excluded.update(max_per_day)
-        check -= set(max_per_day.keys())
-
-        # Exclude event types for which minimum interval between consecutive
-        # occurences has not yet been reached
-        min_interval = cls.check_min_interval(person_id, check, now, event_types)
-        excluded.update(min_interval)
-        check -= set(min_interval.keys())
+        if rules:
+            # Evaluate the remaining rules against the preloaded index
+            excluded.update(rules.check(person_id, check, now, event_types))
+        else:
+            # Exclude event types that are not combinable with other events
+            # registered today
+            non_combinable = cls.check_non_combinable(person_id, check, day_start, event_types)
+            excluded.update(non_combinable)
+            check -= set(non_combinable.keys())
+
+            # Exclude event types for which maximum number of occurences per
+            # day have been reached
+            max_per_day = cls.check_max_per_day(person_id, check, day_start, event_types)
+            excluded.update(max_per_day)
+            check -= set(max_per_day.keys())
+
+            # Exclude event types for which minimum interval between consecutive
+            # occurences has not yet been reached
+            min_interval = cls.check_min_interval(person_id, check, now, event_types)
+            excluded.update(min_interval)
+            check -= set(min_interval.keys())
 
         if serializable:
             formatted = {}
@@ -1148,6 +1357,25 @@ class Checkpoint(CRUDMethod):
 
     # -------------------------------------------------------------------------
     # Helper functions
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_event_rules(cls, organisation_id):
+        """
+            Returns the preloaded event rules for the organisation, updated
+            with the latest registrations
+
+            Args:
+                organisation_id: the organisation record ID
+
+            Returns:
+                CheckpointRules, or None if disabled
+        """
+
+        rules = CheckpointRules.get_rules(organisation_id, cls.EVENT_CLASS)
+        if rules:
+            rules.refresh()
+        return rules
+
     # -------------------------------------------------------------------------
     @classmethod
     def get_organisations(cls):
@@ -1620,5 +1848,380 @@ class Checkpoint(CRUDMethod):
         if script not in scripts:
             scripts.append(script)
 
-# END =========================================================================
+# =============================================================================
+class CheckpointRules:
+    """
+        In-memory index of the event types, exclusions and recent event
+        registrations of an organisation (shared across requests), to
+        evaluate the blocking rules for checkpoint scans without querying
+        the registrations of each person (and each family member)
+
+        - the index holds all registrations of the event types of an event
+          class since the start of the day, or since the longest minimum
+          interval of the event types (whichever is earlier)
+        - registrations are updated incrementally by modified_on, with a
+          single query per scan, so that the index follows registrations
+          made by other processes; the overlap of the incremental updates
+          also picks up registrations committed late
+        - event types and exclusions are reloaded when changed according
+          to the change journal, or otherwise after RULES_TTL
+    """
+
+    # Tables to reload the rules for
+    RULES = {"dvr_case_event_type", "dvr_case_event_exclusion"}
+
+    # Maximum time for reloading rules without change journal (seconds)
+    RULES_TTL = 60
+
+    # Overlap of incremental updates (seconds)
+    OVERLAP = 300
+
+    instances = {}
+    instances_lock = threading.Lock()
+
+    def __init__(self, organisation_id, event_class):
+        """
+            Args:
+                organisation_id: the organisation record ID
+                event_class: the event class
+        """
+
+        self.organisation_id = organisation_id
+        self.event_class = event_class
+
+        # Event types {type_id: Row} and exclusions {type_id: {type_id}}
+        self.types = None
+        self.exclusions = None
+        self.loaded = 0
+
+        # Registrations {event_id: (person_id, type_id, date)},
+        # and their IDs by person {person_id: {event_id}}
+        self.events = {}
+        self.persons = {}
+
+        # Earliest date of indexed registrations, and time of last update
+        self.start = None
+        self.synced = None
+
+        self.lock = threading.Lock()
+        self.cursor = JournalCursor()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_rules(cls, organisation_id, event_class):
+        """
+            Returns the CheckpointRules for an organisation and event class
+
+            Args:
+                organisation_id: the organisation record ID
+                event_class: the event class
+
+            Returns:
+                the CheckpointRules, or None if disabled
+        """
+
+        if not current.deployment_settings.get_dvr_event_registration_preload():
+            return None
+
+        try:
+            organisation_id = int(organisation_id)
+        except (ValueError, TypeError):
+            return None
+
+        key = (organisation_id, event_class)
+        instances = cls.instances
+        rules = instances.get(key)
+        if rules is None:
+            with cls.instances_lock:
+                rules = instances.get(key)
+                if rules is None:
+                    rules = instances[key] = cls(organisation_id, event_class)
+        return rules
+
+    # -------------------------------------------------------------------------
+    def refresh(self):
+        """
+            Updates the index with all registrations since the last update,
+            and reloads the rules if they have been changed
+        """
+
+        now = current.request.utcnow.replace(microsecond=0)
+
+        with self.lock:
+            reload = self.load_rules()
+
+            # Earliest registration relevant for the rules
+            start = now.replace(hour=0, minute=0, second=0)
+            hours = [t.min_interval for t in self.types.values() if t.min_interval]
+            if hours:
+                start = min(start, now - datetime.timedelta(hours=max(hours)))
+
+            if reload or self.start is None or start < self.start:
+                self.load_events(start)
+            else:
+                self.update_events()
+                self.prune(start)
+
+    # -------------------------------------------------------------------------
+    def load_rules(self):
+        """
+            Loads the event types and exclusions, if not loaded yet or
+            changed since loaded
+
+            Returns:
+                True if the event types have been changed, otherwise False
+        """
+
+        tablenames = self.cursor.poll()
+        if self.types is not None:
+            if tablenames is not None and not tablenames & self.RULES:
+                if ChangeJournal.get_journal() or \
+                   time.time() - self.loaded < self.RULES_TTL:
+                    return False
+
+        db = current.db
+        s3db = current.s3db
+
+        ttable = s3db.dvr_case_event_type
+        query = (ttable.organisation_id == self.organisation_id) & \
+                (ttable.event_class == self.event_class) & \
+                (ttable.deleted == False)
+        rows = db(query).select(ttable.id,
+                                ttable.min_interval,
+                                ttable.max_per_day,
+                                )
+        types = {row.id: row for row in rows}
+
+        exclusions = {}
+        if types:
+            xtable = s3db.dvr_case_event_exclusion
+            query = (xtable.type_id.belongs(set(types))) & \
+                    (xtable.deleted == False)
+            rows = db(query).select(xtable.type_id,
+                                    xtable.excluded_by_id,
+                                    )
+            for row in rows:
+                exclusions.setdefault(row.type_id, set()).add(row.excluded_by_id)
+
+        changed = self.types is None or set(types) != set(self.types)
+
+        self.types = types
+        self.exclusions = exclusions
+        self.loaded = time.time()
+
+        return changed
+
+    # -------------------------------------------------------------------------
+    def load_events(self, start):
+        """
+            Loads all registrations since a date (replacing the index)
+
+            Args:
+                start: the date
+        """
+
+        table = current.s3db.dvr_case_event
+
+        synced = datetime.datetime.utcnow()
+
+        self.events = {}
+        self.persons = {}
+
+        if self.types:
+            query = (table.type_id.belongs(set(self.types))) & \
+                    (table.date >= start) & \
+                    (table.deleted == False)
+            rows = current.db(query).select(table.id,
+                                            table.person_id,
+                                            table.type_id,
+                                            table.date,
+                                            )
+            for row in rows:
+                self.add(row.id, row.person_id, row.type_id, row.date)
+
+        self.start = start
+        self.synced = synced
+
+    # -------------------------------------------------------------------------
+    def update_events(self):
+        """
+            Updates the index with all registrations created, modified or
+            deleted since the last update
+        """
+
+        table = current.s3db.dvr_case_event
+
+        synced = datetime.datetime.utcnow()
+        since = self.synced - datetime.timedelta(seconds=self.OVERLAP)
+
+        # Not filtering by type, so as to catch type changes too
+        query = (table.modified_on >= since)
+        rows = current.db(query).select(table.id,
+                                        table.person_id,
+                                        table.type_id,
+                                        table.date,
+                                        table.deleted,
+                                        )
+
+        types, start = self.types, self.start
+        for row in rows:
+            event_id = row.id
+            self.remove(event_id)
+            if not row.deleted and row.type_id in types and \
+               row.date and row.date >= start:
+                self.add(event_id, row.person_id, row.type_id, row.date)
+
+        self.synced = synced
+
+    # -------------------------------------------------------------------------
+    def prune(self, start):
+        """
+            Removes all registrations before a date from the index
+
+            Args:
+                start: the date
+        """
+
+        if start <= self.start:
+            return
+
+        expired = [event_id for event_id, event in self.events.items()
+                   if event[2] < start]
+        for event_id in expired:
+            self.remove(event_id)
+
+        self.start = start
+
+    # -------------------------------------------------------------------------
+    def add(self, event_id, person_id, type_id, date):
+        """
+            Adds a registration to the index
+
+            Args:
+                event_id: the dvr_case_event record ID
+                person_id: the person record ID
+                type_id: the event type record ID
+                date: the date/time of the event
+        """
+
+        self.events[event_id] = (person_id, type_id, date)
+        self.persons.setdefault(person_id, set()).add(event_id)
+
+    # -------------------------------------------------------------------------
+    def remove(self, event_id):
+        """
+            Removes a registration from the index
+
+            Args:
+                event_id: the dvr_case_event record ID
+        """
+
+        event = self.events.pop(event_id, None)
+        if event:
+            person_id = event[0]
+            event_ids = self.persons.get(person_id)
+            if event_ids:
+                event_ids.discard(event_id)
+                if not event_ids:
+                    del self.persons[person_id]
+
+    # -------------------------------------------------------------------------
+    def registrations(self, person_id):
+        """
+            Returns the indexed registrations for a person
+
+            Args:
+                person_id: the person record ID
+
+            Returns:
+                list of tuples (type_id, date)
+        """
+
+        with self.lock:
+            events = self.events
+            return [events[event_id][1:] for event_id in self.persons.get(person_id, ())]
+
+    # -------------------------------------------------------------------------
+    def check(self, person_id, check, now, event_types):
+        """
+            Returns exclusion details for event types that are not combinable
+            with events registered today, for which the maximum number of
+            registrations per day has been reached, or for which the minimum
+            interval between consecutive registrations has not been reached
+            yet (same as Checkpoint.check_non_combinable, check_max_per_day
+            and check_min_interval, but without querying the database)
 
+            Args:
+                person_id: the person record ID
+                check: the event types to check
+                now: the current date/time
+                event_types: all event types to consider
+
+            Returns: a dict with exclusion details
+                     {event_type_id: (error_message, blocked_until_datetime, permit_others)}
+        """
+
+        T = current.T
+
+        day_start = now.replace(hour=0, minute=0, second=0)
+        next_day = day_start + datetime.timedelta(days=1)
+
+        # Number of registrations today, and latest registration per type
+        count, latest = {}, {}
+        for type_id, date in self.registrations(person_id):
+            if date >= day_start:
+                count[type_id] = count.get(type_id, 0) + 1
+            if type_id not in latest or date > latest[type_id]:
+                latest[type_id] = date
+
+        exclude = {}
+
+        # Event types that are not combinable with events registered today
+        registered_today = {t for t in count if t in event_types}
+        exclusions = self.exclusions
+        for type_id in check:
+            excluded_by = exclusions.get(type_id)
+            if excluded_by:
+                excluded_by = excluded_by & registered_today
+            if excluded_by:
+                names = ", ".join(s3_str(T(event_types[i].name)) for i in excluded_by)
+                msg = T("%(event)s already registered today, not combinable") % \
+                       {"event": names}
+                exclude[type_id] = (msg, next_day, True)
+
+        # Event types for which the maximum number per day has been reached
+        for type_id in check:
+            if type_id in exclude:
+                continue
+            event_type = event_types[type_id]
+            number = count.get(type_id)
+            if number and event_type.max_per_day is not None and \
+               number >= event_type.max_per_day:
+                if number > 1:
+                    msg = T("%(event)s already registered %(number)s times today") % \
+                           {"event": T(event_type.name), "number": number}
+                else:
+                    msg = T("%(event)s already registered today") % \
+                           {"event": T(event_type.name)}
+                exclude[type_id] = (msg, next_day, True)
+
+        # Event types for which the minimum interval has not been reached
+        represent = current.s3db.dvr_case_event.date.represent
+        for type_id in check:
+            if type_id in exclude:
+                continue
+            event_type = event_types[type_id]
+            if event_type.max_per_day is None:
+                # Same as check_min_interval
+                continue
+            last, hours = latest.get(type_id), event_type.min_interval
+            if last and hours:
+                earliest = last + datetime.timedelta(hours=hours)
+                if earliest > now:
+                    msg = T("%(event)s already registered on %(timestamp)s") % \
+                          {"event": T(event_type.name), "timestamp": represent(last)}
+                    exclude[type_id] = (msg, earliest, True)
+
+        return exclude
+
+# END =========================================================================
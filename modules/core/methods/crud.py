@@ -1349,7 +1349,9 @@ class S3CRUD(CRUDMethod):
             output = {"item": items}
 
         elif representation == "csv":
-            output = DataExporter.csv(resource)
+            output = DataExporter.csv(resource,
+                                      stream = self._stream_export(),
+                                      )
 
         elif representation == "json":
 
@@ -1371,6 +1373,7 @@ class S3CRUD(CRUDMethod):
                                        limit = limit,
                                        represent = represent,
                                        tooltip = tooltip,
+                                       stream = self._stream_export(),
                                        )
 
         elif representation == "pdf":
@@ -1406,6 +1409,7 @@ class S3CRUD(CRUDMethod):
         elif representation == "xlsx":
             output = DataExporter.xlsx(resource,
                                        list_fields = list_fields,
+                                       stream = self._stream_export(),
                                        **attr)
 
         elif representation == "card":
@@ -1428,6 +1432,176 @@ class S3CRUD(CRUDMethod):
 
         return output
 
+    # -------------------------------------------------------------------------
+    def _stream_export(self):
+        """
+            Whether to export CSV/JSON/XLSX in chunks (bounded memory
+            use), configurable per resource (setting "stream_export")
+
+            Returns:
+                boolean
+        """
+
+        default = current.deployment_settings.get_base_stream_export()
+        return bool(self.resource.get_config("stream_export", default))
+
+    # -------------------------------------------------------------------------
+    def _keyset_signature(self, r):
+        """
+            Generate a signature for the result set of a data table
+            request, to key cached row counts and verify keyset tokens
+
+            Args:
+                r: the CRUDRequest
+
+            Returns:
+                the signature (string)
+
+            Note:
+                - includes the effective resource query (e.g. s3.filter,
+                  default filters, component join), so must be called
+                  before adding the datatable search filter
+        """
+
+        skip = ("start", "limit", "draw", "seek", "iColumns", "iSortingCols", "_")
+        skip_prefix = ("iSortCol_", "sSortDir_", "bSortable_")
+
+        items = sorted((k, s3_str(v)) for k, v in r.get_vars.items()
+                       if k not in skip and not k.startswith(skip_prefix))
+
+        # Fingerprint of the effective query
+        resource = self.resource
+        vfltr = resource.get_filter()
+        query = [str(resource.get_query()),
+                 vfltr.represent(resource) if vfltr else None,
+                 ]
+
+        component = r.component
+        items[0:0] = [r.controller,
+                      r.function,
+                      r.tablename,
+                      s3_str(r.id) if r.id else None,
+                      component.alias if component else None,
+                      query,
+                      ]
+
+        from hashlib import md5
+        return md5(json.dumps(items).encode("utf-8")).hexdigest()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _keyset_position(signature, orderby, start):
+        """
+            Extend a request signature with the ORDERBY and the page
+            position, so that a keyset token is only valid for the
+            page it has been issued for
+
+            Args:
+                signature: the request signature
+                orderby: the ORDERBY expression
+                start: the index of the first record in the page
+
+            Returns:
+                the signature (string)
+        """
+
+        if isinstance(orderby, (list, tuple)):
+            orderby = ", ".join(str(item) for item in orderby)
+
+        return "%s:%s:%s" % (signature, orderby, start or 0)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _keyset_seek(cls, get_vars, signature, orderby, start):
+        """
+            Get the keyset values for a data table Ajax request
+
+            Args:
+                get_vars: the GET vars
+                signature: the request signature
+                orderby: the ORDERBY expression
+                start: the index of the first record in the requested page
+
+            Returns:
+                - the keyset values from the request (list),
+                - an empty tuple if the request has no (valid) keyset token,
+                - None if keyset pagination is disabled
+        """
+
+        if not current.deployment_settings.get_ui_datatables_keyset():
+            return None
+
+        seek = None
+
+        token = get_vars.get("seek")
+        if token and start:
+            from ..resource.data import ResourceData
+            seek = ResourceData.decode_seek(token,
+                                            cls._keyset_position(signature, orderby, start),
+                                            )
+
+        return seek if seek else ()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _keyset_token(cls, seek, signature, orderby, start):
+        """
+            Generate the keyset token for the next data table page
+
+            Args:
+                seek: the keyset values of the last record in the
+                      current page
+                signature: the request signature
+                orderby: the ORDERBY expression
+                start: the index of the first record of the next page
+
+            Returns:
+                a dict {start: index, key: token}, to be sent back by
+                the client when requesting the page starting at index,
+                or None if keyset pagination is not available
+        """
+
+        if not seek:
+            return None
+
+        from ..resource.data import ResourceData
+        token = ResourceData.encode_seek(seek,
+                                         cls._keyset_position(signature, orderby, start),
+                                         )
+        return {"start": start, "key": token}
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _cached_counts(signature, counts=None):
+        """
+            Look up or store the total/filtered row counts of a data table
+            in the cache (if enabled by settings.ui.datatables_count_cache)
+
+            Args:
+                signature: the request signature
+                counts: tuple (totalrows, filteredrows) to store
+
+            Returns:
+                the cached counts as tuple (totalrows, filteredrows), or
+                None if no counts were cached
+        """
+
+        expire = current.deployment_settings.get_ui_datatables_count_cache()
+        if not expire:
+            return counts
+
+        # Counts depend on the user's permissions
+        key = "dt_counts_%s_%s" % (current.auth.user_id, signature)
+
+        cache = current.cache.ram
+        if counts is None:
+            counts = cache(key, lambda: None, time_expire=expire)
+        else:
+            # time_expire=0 enforces the update
+            cache(key, lambda: counts, time_expire=0)
+
+        return counts
+
     # -------------------------------------------------------------------------
     def _datatable(self, r, **attr):
         """
@@ -1485,8 +1659,10 @@ class S3CRUD(CRUDMethod):
             display_length = settings.get_ui_datatables_pagelength()
 
             # Server-side pagination?
+            keyset = False
             if not s3.no_sspag:
                 dt_pagination = True
+                keyset = settings.get_ui_datatables_keyset()
                 if not limit:
                     limit = 2 * display_length if display_length >= 0 else None
                 current.session.s3.filter = get_vars
@@ -1516,6 +1692,7 @@ class S3CRUD(CRUDMethod):
                                                orderby = orderby,
                                                distinct = False,
                                                list_id = list_id,
+                                               seek = () if keyset else None,
                                                )
             displayrows = totalrows
 
@@ -1548,6 +1725,13 @@ class S3CRUD(CRUDMethod):
             dtargs["dt_pageLength"] = display_length
             dtargs["dt_base_url"] = r.url(method="", vars={})
             dtargs["dt_permalink"] = r.url()
+            if keyset:
+                # Keyset for the first Ajax-request
+                dtargs["dt_seek"] = self._keyset_token(dt.seek,
+                                                       self._keyset_signature(r),
+                                                       orderby,
+                                                       len(dt.data),
+                                                       )
             datatable = dt.html(totalrows, displayrows, **dtargs)
 
             # View + data
@@ -1559,16 +1743,22 @@ class S3CRUD(CRUDMethod):
             # Apply datatable filters
             searchq, orderby, left = resource.datatable_filter(list_fields,
                                                                get_vars)
-            if searchq is not None:
-                totalrows = resource.count()
-                resource.add_filter(searchq)
-            else:
-                totalrows = None
 
             # Orderby fallbacks
             if orderby is None:
                 orderby = get_config("orderby", None)
 
+            # Keyset pagination and cached row counts
+            signature = self._keyset_signature(r)
+            seek = self._keyset_seek(get_vars, signature, orderby, start)
+            counts = self._cached_counts(signature)
+
+            if searchq is not None:
+                totalrows = counts[0] if counts else resource.count()
+                resource.add_filter(searchq)
+            else:
+                totalrows = None
+
             # Get a data table
             if totalrows != 0:
                 dt, displayrows = resource.datatable(fields = list_fields,
@@ -1578,17 +1768,30 @@ class S3CRUD(CRUDMethod):
                                                      orderby = orderby,
                                                      distinct = False,
                                                      list_id = list_id,
+                                                     seek = seek,
+                                                     count = not counts and not seek,
                                                      )
+                if displayrows is None:
+                    # Not counted with the data
+                    displayrows = counts[1] if counts else resource.count()
             else:
                 dt, displayrows = None, 0
             if totalrows is None:
                 totalrows = displayrows
 
+            if not counts:
+                self._cached_counts(signature, (totalrows, displayrows))
+
             # Echo
             draw = int(get_vars.get("draw", 0))
 
             # Representation
             if dt is not None:
+                dtargs["dt_seek"] = self._keyset_token(dt.seek,
+                                                       signature,
+                                                       orderby,
+                                                       (start or 0) + len(dt.data),
+                                                       )
                 output = dt.json(totalrows, displayrows, draw, **dtargs)
             else:
                 output = '{"recordsTotal":%s,' \
@@ -1703,13 +1906,28 @@ class S3CRUD(CRUDMethod):
             if not orderby:
                 orderby = default_orderby
 
+            # Keyset pagination and cached row counts
+            signature = self._keyset_signature(r)
+            seek = self._keyset_seek(get_vars, signature, orderby, start)
+            counts = self._cached_counts(signature)
+
             datalist, numrows = resource.datalist(fields = list_fields,
                                                   start = start,
                                                   limit = initial_limit,
                                                   orderby = orderby,
                                                   list_id = list_id,
                                                   layout = layout,
+                                                  seek = seek,
+                                                  count = not counts and not seek,
                                                   )
+            if numrows is None:
+                # Not counted with the data
+                numrows = counts[1] if counts else resource.count()
+                datalist.total = numrows
+            if not counts:
+                self._cached_counts(signature, (numrows, numrows))
+            next_start = (start or 0) + len(datalist.records)
+            seek = self._keyset_token(datalist.seek, signature, orderby, next_start)
 
             if numrows == 0:
                 s3.no_formats = True
@@ -1735,7 +1953,9 @@ class S3CRUD(CRUDMethod):
                                limit = limit,
                                pagesize = pagelength,
                                rowsize = rowsize,
-                               ajaxurl = ajax_url)
+                               ajaxurl = ajax_url,
+                               seek = seek,
+                               )
             data = dl
         else:
             r.error(415, current.ERROR.BAD_FORMAT)
@@ -0,0 +1,261 @@
+"""
+    Map Tiles
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("MapTiles",
+           )
+
+import hashlib
+import json
+import time
+
+from gluon import current
+
+from ..gis import GIS
+from ..gis.tiles import MapTile, TileCache
+from ..resource import S3Joins
+from ..tools import JSONSEPARATORS
+
+from .base import CRUDMethod
+
+# =============================================================================
+class MapTiles(CRUDMethod):
+    """
+        RESTful method to serve the features of a resource per map tile,
+        as GeoJSON with server-side point clustering and per-zoom
+        geometry simplification, e.g.:
+
+            /org/facility/tile.geojson?z=5&x=17&y=10
+
+        - point features within the same grid cell are returned as a
+          single cluster feature with a "count" property
+        - unlike full GeoJSON exports, not limited by gis.max_features
+        - tiles are cached on disk if gis.tile_cache is enabled
+    """
+
+    # -------------------------------------------------------------------------
+    def apply_method(self, r, **attr):
+        """
+            Entry point for REST interface
+
+            Args:
+                r: the CRUDRequest instance
+                attr: controller attributes for the request
+        """
+
+        if r.http != "GET":
+            r.error(405, current.ERROR.BAD_METHOD)
+        if r.representation not in ("geojson", "json"):
+            r.error(415, current.ERROR.BAD_FORMAT)
+        if not self._permitted("read"):
+            r.unauthorised()
+
+        get_vars = r.get_vars
+        try:
+            tile = MapTile(get_vars.get("z"), get_vars.get("x"), get_vars.get("y"))
+        except (TypeError, ValueError):
+            r.error(400, "Invalid tile coordinates")
+
+        resource = self.resource
+
+        # Location lookup
+        location = self.location_query(resource)
+        if location is None:
+            r.error(400, "Resource has no location")
+        query, tablenames = location
+
+        response = current.response
+        response.headers["Content-Type"] = response.s3.content_type.get("geojson",
+                                                                        "application/json")
+
+        cache = TileCache.get_cache()
+        if cache:
+            layer = self.layer_key(resource, query)
+            output = cache.get(layer, tile, tablenames)
+            if output is not None:
+                return output
+
+        start = time.time()
+        output = self.tile(resource, query, tile)
+
+        if cache:
+            cache.put(layer, tile, output, start)
+
+        return output
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def location_query(resource):
+        """
+            Construct a query for the locations of all records in the
+            resource (respecting its filters)
+
+            Args:
+                resource: the CRUDResource
+
+            Returns:
+                tuple (query, tablenames) with the names of all tables
+                involved in the query, or None if the resource has no
+                directly linked locations
+        """
+
+        db = current.db
+        s3db = current.s3db
+
+        table = resource.table
+        tablename = resource.tablename
+
+        query = resource.get_query()
+
+        rfilter = resource.rfilter
+        if resource.get_filter() is not None:
+            # Virtual filter => must extract the record IDs
+            rows = resource.select([table._id.name], limit=None, as_rows=True)
+            query = table._id.belongs([row[table._id] for row in rows])
+        else:
+            ijoins = S3Joins(tablename, rfilter.get_joins(left=False))
+            ljoins = S3Joins(tablename, rfilter.get_joins(left=True))
+            if ijoins or ljoins:
+                # Filter joins => use a subselect for the record IDs
+                subselect = db(query)._select(table._id,
+                                              join = ijoins.as_list(prefer=ljoins),
+                                              left = ljoins.as_list(),
+                                              distinct = True,
+                                              )
+                query = table._id.belongs(subselect)
+
+        gtable = s3db.gis_location
+        if tablename == "gis_location":
+            tablenames = [tablename]
+        elif "location_id" in table.fields:
+            query &= (table.location_id == gtable.id)
+            tablenames = [tablename, "gis_location"]
+        elif "site_id" in table.fields:
+            stable = s3db.org_site
+            query &= (table.site_id == stable.site_id) & \
+                     (stable.location_id == gtable.id)
+            tablenames = [tablename, "org_site", "gis_location"]
+        else:
+            return None
+
+        return query, tablenames
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def layer_key(resource, query):
+        """
+            Produce the cache key for the layer, i.e. the resource
+            with its current filters (including any access restrictions)
+
+            Args:
+                resource: the CRUDResource
+                query: the location query
+
+            Returns:
+                tuple (tablename, hash)
+        """
+
+        key = hashlib.md5(str(query).encode("utf-8")).hexdigest()
+        return resource.tablename, key
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def tile(resource, query, tile):
+        """
+            Build the GeoJSON of a tile
+
+            Args:
+                resource: the CRUDResource
+                query: the location query
+                tile: the MapTile
+
+            Returns:
+                the GeoJSON FeatureCollection (str)
+        """
+
+        db = current.db
+        gtable = current.s3db.gis_location
+
+        table = resource.table
+        pkey = table._id
+
+        lon_min, lat_min, lon_max, lat_max = tile.bounds
+        precision = tile.precision
+
+        features = []
+
+        # Points within the tile
+        # - lower/left bounds inclusive, upper/right exclusive, so
+        #   that every point appears in exactly one tile
+        pquery = query & (gtable.gis_feature_type == 1) & \
+                 (gtable.lat >= lat_min) & (gtable.lat < lat_max) & \
+                 (gtable.lon >= lon_min) & (gtable.lon < lon_max)
+        rows = db(pquery).select(pkey, gtable.lat, gtable.lon)
+        points = [(row[pkey], row[gtable.lat], row[gtable.lon]) for row in rows]
+
+        point = '{"type":"Feature","geometry":{"type":"Point","coordinates":[%%.%sf,%%.%sf]},"properties":%%s}' % \
+                (precision, precision)
+        for lat, lon, record_ids in tile.cluster(points):
+            if len(record_ids) == 1:
+                properties = {"id": record_ids[0]}
+            else:
+                properties = {"cluster": True,
+                              "count": len(record_ids),
+                              }
+            properties = json.dumps(properties, separators=JSONSEPARATORS)
+            features.append(point % (lon, lat, properties))
+
+        # Lines and polygons overlapping the tile,
+        # simplified to the pixel resolution of the zoom level
+        squery = query & (gtable.gis_feature_type != 1) & \
+                 (gtable.lon_min <= lon_max) & (gtable.lon_max >= lon_min) & \
+                 (gtable.lat_min <= lat_max) & (gtable.lat_max >= lat_min)
+        tolerance = tile.resolution
+
+        if current.deployment_settings.get_gis_spatialdb():
+            geojson = gtable.the_geom.st_simplifypreservetopology(tolerance) \
+                                     .st_asgeojson(precision=precision) \
+                                     .with_alias("geojson")
+            rows = db(squery).select(pkey, geojson)
+            shapes = ((row[pkey], row.geojson) for row in rows)
+        else:
+            rows = db(squery).select(pkey, gtable.wkt)
+            simplify = GIS.simplify
+            shapes = ((row[pkey], simplify(row[gtable.wkt],
+                                           tolerance = tolerance,
+                                           output = "geojson",
+                                           precision = precision,
+                                           ))
+                      for row in rows)
+
+        shape = '{"type":"Feature","geometry":%s,"properties":{"id":%s}}'
+        for record_id, geometry in shapes:
+            if geometry:
+                features.append(shape % (geometry, record_id))
+
+        return '{"type":"FeatureCollection","features":[%s]}' % ",".join(features)
+
+# END =========================================================================
@@ -945,14 +945,11 @@ class S3RecordMerger:
         if not permitted:
             self.raise_error("Operation not permitted", auth.permission.error)
 
-        # Load all models
+        # Load all referencing models
+        # - for every merged table (not only the main table) as the model
+        #   index may have loaded only the references of the main table
         s3db = current.s3db
-        if main:
-            s3db.load_all_models()
-        if db._lazy_tables:
-            # Must roll out all lazy tables to detect dependencies
-            for tn in list(db._LAZY_TABLES.keys()):
-                db[tn]
+        s3db.load_references(tablename)
 
         # Get the records
         original = None
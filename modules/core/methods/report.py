@@ -56,6 +56,7 @@ from .base import CRUDMethod
 
 # Compact JSON encoding
 DEFAULT = lambda: None
+osetattr = object.__setattr__
 
 LAYER = re.compile(r"([a-zA-Z]+)\((.*)\)\Z")
 FACT = re.compile(r"([a-zA-Z]+)\(([a-zA-Z0-9_.$:\,~]+)\),*(.*)\Z")
@@ -1827,6 +1828,11 @@ class S3PivotTable:
 
         self.values = {}
 
+        self.numrecords = None
+        """ The number of records in the report if aggregated in the
+            database (records are not extracted in this case)
+        """
+
         # Get the fields ------------------------------------------------------
         #
         tablename = resource.tablename
@@ -1855,6 +1861,12 @@ class S3PivotTable:
                 if axis in exclude_empty:
                     resource.add_filter(FS(axis) != None)
 
+        # Aggregate in the database if possible -------------------------------
+        #
+        if self._aggregable():
+            self._aggregate()
+            return
+
         # Retrieve the records ------------------------------------------------
         #
         data = resource.select(list(self.rfields.keys()), limit=None)
@@ -1935,6 +1947,9 @@ class S3PivotTable:
     def __len__(self):
         """ Total number of records in the report """
 
+        if self.numrecords is not None:
+            return self.numrecords
+
         items = self.records
         if items is None:
             return 0
@@ -2770,6 +2785,215 @@ class S3PivotTable:
                                           )
         self.values[layer] = all_values
 
+    # -------------------------------------------------------------------------
+    def _aggregable(self):
+        """
+            Check whether the pivot table can be computed by aggregation in
+            the database rather than by extracting all records, i.e.:
+                - enabled in deployment settings (and the number of records
+                  exceeding the configured threshold, if any)
+                - no virtual or extra filters
+                - all axes and facts are real, non-list fields either in the
+                  master table or in tables referenced by foreign keys (i.e.
+                  no joins which could produce multiple rows per record)
+                - no "list" facts, and only numeric facts for methods other
+                  than "count"
+
+            Returns:
+                True|False
+        """
+
+        setting = current.deployment_settings.get_ui_report_db_aggregation()
+        if not setting:
+            return False
+
+        resource = self.resource
+        rfilter = resource.rfilter
+        if rfilter is None:
+            resource.build_query()
+            rfilter = resource.rfilter
+        if rfilter.get_filter() is not None or rfilter.get_extra_filters():
+            return False
+
+        rfields = self.rfields
+        alias = resource.alias
+
+        def simple(selector):
+            rfield = rfields.get(selector)
+            if not rfield or rfield.field is None or rfield.ftype[:5] == "list:":
+                return False
+            head, path = selector.split(".", 1)
+            return head == alias and "." not in path and "(" not in path
+
+        for axis in (self.rows, self.cols):
+            if axis and not simple(axis):
+                return False
+
+        for fact in self.facts:
+            selector, method = fact.layer
+            if method == "list" or not simple(selector):
+                return False
+            if method != "count" and \
+               rfields[selector].ftype not in ("id", "integer", "double"):
+                return False
+
+        if setting is not True and resource.count() <= setting:
+            # Small enough for in-memory pivoting (with record details)
+            return False
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def _aggregate(self):
+        """
+            Compute the pivot table by GROUP BY queries in the database,
+            produces the same cells/row/col/totals structures as the
+            in-memory pivoting, except that the records lists are empty
+            (record details are not available in aggregated reports)
+        """
+
+        db = current.db
+
+        resource = self.resource
+        table = resource.table
+        tablename = table._tablename
+        rfields = self.rfields
+
+        # Filter by subselect, so that joins required by the filter
+        # can not multiply the aggregated rows
+        query = resource.get_query()
+        rfilter = resource.rfilter
+        ijoins = S3Joins(tablename, rfilter.get_joins(left=False))
+        ljoins = S3Joins(tablename, rfilter.get_joins(left=True))
+        if ijoins or ljoins:
+            subselect = db(query)._select(table._id,
+                                          join = ijoins.as_list(prefer=ljoins),
+                                          left = ljoins.as_list(),
+                                          )
+            query = table._id.belongs(subselect)
+
+        # Joins for axes and facts (many-to-one only, see _aggregable)
+        left = S3Joins(tablename)
+
+        # Group by the axes
+        axes = []
+        for selector in (self.rows, self.cols):
+            if selector:
+                rfield = rfields[selector]
+                left.extend(rfield.left)
+                axes.append(rfield.field)
+            else:
+                axes.append(None)
+        groupby = [field for field in axes if field is not None]
+
+        # Aggregate expressions per fact
+        count = table._id.count()
+        expressions = [count]
+        aggregates = []
+        for fact in self.facts:
+            rfield = rfields[fact.selector]
+            left.extend(rfield.left)
+            field = rfield.field
+            method = fact.method
+            if method == "count":
+                aggregate = (field.count(distinct=True),)
+            elif method == "avg":
+                aggregate = (field.sum(), field.count())
+            else:
+                aggregate = (getattr(field, method)(),)
+            aggregates.append(aggregate)
+            expressions.extend(aggregate)
+
+        # Suspend virtual fields (would fail with aggregates)
+        vf = table.virtualfields
+        osetattr(table, "virtualfields", [])
+        try:
+            rows = db(query).select(*(groupby + expressions),
+                                    left = left.as_list(),
+                                    groupby = groupby,
+                                    cacheable = True,
+                                    )
+        finally:
+            osetattr(table, "virtualfields", vf)
+
+        self.records = Storage()
+        if not rows:
+            self.numrecords = 0
+            self.empty = True
+            return
+
+        # Group the aggregates
+        rfield, cfield = axes
+        rindex, cindex = {}, {}
+        partials = {}
+        numrecords = 0
+        for row in rows:
+            rvalue = row[rfield] if rfield is not None else None
+            cvalue = row[cfield] if cfield is not None else None
+            r = rindex.setdefault(rvalue, len(rindex))
+            c = cindex.setdefault(cvalue, len(cindex))
+            partials[(r, c)] = [tuple(row[e] for e in aggregate)
+                                for aggregate in aggregates]
+            numrecords += row[count]
+        self.numrecords = numrecords
+
+        # Initialize columns and rows
+        self.col = [Storage({"value": v, "records": []}) for v in cindex]
+        self.numcols = len(self.col)
+        self.row = [Storage({"value": v, "records": []}) for v in rindex]
+        self.numrows = len(self.row)
+
+        numrows, numcols = self.numrows, self.numcols
+        cells = self.cell = [[Storage({"records": []})
+                              for c in range(numcols)]
+                             for r in range(numrows)]
+
+        # Add the layers
+        for index, fact in enumerate(self.facts):
+
+            layer = fact.layer
+            method = fact.method
+            precision = self.precision.get(fact.selector)
+
+            def total(items, method=method, precision=precision):
+                # Combine partial aggregates, and compute the final value
+                items = [item for item in items if item is not None]
+                if method == "avg":
+                    number = sum(item[1] or 0 for item in items)
+                    value = sum(item[0] or 0 for item in items) / float(number) \
+                            if number else 0.0
+                else:
+                    values = [item[0] for item in items if item[0] is not None]
+                    if method in ("count", "sum"):
+                        value = sum(values)
+                    elif values:
+                        value = min(values) if method == "min" else max(values)
+                    else:
+                        value = None
+                if type(value) is float and precision is not None:
+                    value = round(value, precision)
+                return value
+
+            row_items = [[] for r in range(numrows)]
+            col_items = [[] for c in range(numcols)]
+            all_items = []
+            for r in range(numrows):
+                for c in range(numcols):
+                    item = partials.get((r, c))
+                    if item is not None:
+                        item = item[index]
+                        row_items[r].append(item)
+                        col_items[c].append(item)
+                        all_items.append(item)
+                    cells[r][c][layer] = total([item])
+
+            for r in range(numrows):
+                self.row[r][layer] = total(row_items[r])
+            for c in range(numcols):
+                self.col[c][layer] = total(col_items[c])
+            self.totals[layer] = total(all_items)
+            self.values[layer] = []
+
     # -------------------------------------------------------------------------
     def _get_fields(self, fields=None):
         """
@@ -219,6 +219,9 @@ class RESTful(CRUDMethod):
         if target == resource.tablename:
             # Master resource targetted
             target = None
+        stream = resource.get_config("stream_export",
+                                     current.deployment_settings.get_base_stream_export(),
+                                     )
         output = resource.export_xml(start = start,
                                      limit = limit,
                                      msince = msince,
@@ -233,6 +236,7 @@ class RESTful(CRUDMethod):
                                      as_json = as_json,
                                      maxbounds = maxbounds,
                                      target = target,
+                                     stream = stream,
                                      **args)
         # Transformation error?
         if not output:
@@ -1,4 +1,5 @@
 from .datamodel import DEFAULT, DataModel
 from .dynamic import DYNAMIC_PREFIX, SERIALIZABLE_OPTS
 from .fields import *
+from .index import ModelIndex
 from .options import WorkflowOptions
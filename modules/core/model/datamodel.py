@@ -29,6 +29,7 @@ __all__ = ("DataModel",
            )
 
 import sys
+import time
 
 from gluon import current, IS_EMPTY_OR, TAG
 from gluon.storage import Storage
@@ -36,11 +37,13 @@ from gluon.tools import callback
 
 from s3dal import Table, Field, original_tablename
 
-from ..tools import IS_ONE_OF
+from ..tools import ChangeJournal, IS_ONE_OF, RepresentCache, RequestProfile, \
+                    S3Hierarchy
 from ..ui import S3ScriptItem
 
 from .dynamic import DynamicTableModel, DYNAMIC_PREFIX
 from .fields import MetaFields
+from .index import ModelIndex
 
 DEFAULT = lambda: None
 MODULE_TYPE = type(sys)
@@ -53,14 +56,22 @@ class DataModel:
 
     LOCK = "eden_model_lock"
     LOAD = "eden_model_load"
+    REPORT = "eden_model_report"
     DELETED = "deleted"
 
+    # Configuration keys affecting field selector resolution
+    RESOLUTION_CONFIG = ("context",
+                         "dynamic_components",
+                         "dynamic_components_loaded",
+                         )
+
     def __init__(self, module=None):
 
         self.cache = (current.cache.ram, 60)
 
         self.classes = {}
         self._module_map = None
+        self._model_index = None
 
         self._customised = {}
 
@@ -71,6 +82,7 @@ class DataModel:
                              "methods": {},
                              "cmethods": {},
                              "hierarchies": {},
+                             "fieldpaths": {},
                              }
 
         response = current.response
@@ -90,6 +102,7 @@ class DataModel:
         if module is not None:
             if self.__loaded():
                 return
+            start = time.perf_counter()
             self.__lock()
             try:
                 env = self.mandatory()
@@ -115,6 +128,7 @@ class DataModel:
             if isinstance(env, dict):
                 response.s3.update(env)
             self.__loaded(True)
+            self.__report(start)
             self.__unlock()
 
     # -------------------------------------------------------------------------
@@ -158,6 +172,36 @@ class DataModel:
                 del response[LOCK]
         return
 
+    # -------------------------------------------------------------------------
+    def __report(self, start):
+        """
+            Adds this model to the load report of the current request
+
+            Args:
+                start: the time when loading of the model started
+                       (time.perf_counter)
+        """
+
+        duration = time.perf_counter() - start
+
+        name = self.__class__.__name__
+        response = current.response
+
+        # Depth = number of models waiting for this one to load
+        depth = len(response.get(self.LOCK, ())) - 1
+
+        REPORT = self.REPORT
+        if REPORT not in response:
+            response[REPORT] = []
+        response[REPORT].append(Storage(name = name,
+                                        prefix = self.prefix,
+                                        duration = duration,
+                                        depth = depth,
+                                        ))
+
+        current.log.debug("DataModel: %s loaded in %.1fms" % (name, duration * 1000))
+        RequestProfile.record("model", name, duration)
+
     # -------------------------------------------------------------------------
     def __getattr__(self, name):
         """ Model auto-loader """
@@ -236,6 +280,18 @@ class DataModel:
                             mmap[k].append(v)
         return mmap
 
+    # -------------------------------------------------------------------------
+    @property
+    def model_index(self):
+        """
+            The ModelIndex, if enabled in deployment settings (lazy property)
+        """
+
+        index = self._model_index
+        if index is None:
+            index = self._model_index = ModelIndex.get_index(self.module_map) or False
+        return index or None
+
     # -------------------------------------------------------------------------
     @staticmethod
     def customised(tablename, update=None):
@@ -298,6 +354,18 @@ class DataModel:
                 found = DynamicTableModel(tablename).table
             except AttributeError:
                 pass
+        elif s3db.model_index:
+            # Load exactly the model that defines the name
+            located = s3db.model_index.locate(tablename, db_only=db_only)
+            if located:
+                prefix, module, name = located
+                if name is None:
+                    # A name defined at module level (e.g. a class)
+                    s3db.classes[tablename] = module
+                    found = module.__dict__[tablename]
+                else:
+                    # A name defined in a DataModel
+                    module.__dict__[name](prefix)
         else:
             modules = s3db.module_map.get(prefix, "")
             for module in modules:
@@ -365,6 +433,8 @@ class DataModel:
                 found = DynamicTableModel(name).table
             except AttributeError:
                 pass
+        elif s3db.model_index:
+            found = s3db.model_index.has(name)
         else:
             modules = s3db.module_map.get(prefix, "")
             for module in modules:
@@ -451,6 +521,57 @@ class DataModel:
         s3.load_all_models = False
         s3.all_models_loaded = True
 
+        # Complete the model index
+        index = current.s3db.model_index
+        if index and not index.complete:
+            index.update()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def load_references(cls, tablename):
+        """
+            Helper function to load all models that define tables which
+            reference a table (e.g. to detect dependencies before deleting
+            or merging records); loads all models unless the model index
+            can tell which are needed
+
+            Args:
+                tablename: the table name
+        """
+
+        s3db = current.s3db
+
+        index = s3db.model_index
+        references = index.referenced_by(tablename) if index else None
+
+        if references is None:
+            s3db.load_all_models()
+
+            db = current.db
+            if db._lazy_tables:
+                # Must roll out all lazy tables to detect dependencies
+                for tn in list(db._LAZY_TABLES.keys()):
+                    db[tn]
+        else:
+            for tn in references:
+                cls.table(tn, db_only=True)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def load_report():
+        """
+            Returns the models loaded during the current request, and how
+            long loading each of them took
+
+            Returns:
+                list of Storage {name, prefix, duration, depth}, in the
+                order of completion (i.e. models loaded by another model
+                come before it, with a greater depth); duration in seconds
+                including the loading of dependent models
+        """
+
+        return current.response.get(DataModel.REPORT) or []
+
     # -------------------------------------------------------------------------
     @staticmethod
     def define_table(tablename, *fields, meta=True, **args):
@@ -469,6 +590,24 @@ class DataModel:
             if meta:
                 fields = fields + MetaFields.all_meta_fields()
             table = db.define_table(tablename, *fields, **args)
+
+            # Invalidate cached representations when records change
+            rcache = RepresentCache.get_cache()
+            if rcache:
+                rcache.watch(table)
+
+            # Invalidate cached map tiles when records change
+            # (only for tables with locations, see TileCache.watch)
+            from ..gis.tiles import TileCache
+            tcache = TileCache.get_cache()
+            if tcache:
+                tcache.watch(table)
+
+            # Record changes in the change journal
+            if meta:
+                journal = ChangeJournal.get_journal()
+                if journal:
+                    journal.watch(table)
         return table
 
     # -------------------------------------------------------------------------
@@ -531,6 +670,13 @@ class DataModel:
         if tn not in config:
             config[tn] = {}
         config[tn].update(attr)
+
+        if any(key in attr for key in cls.RESOLUTION_CONFIG):
+            cls.clear_fieldpaths()
+
+        if attr.get("hierarchy"):
+            # Maintain the closure table (if used)
+            S3Hierarchy.watch(tn)
         return
 
     # -------------------------------------------------------------------------
@@ -574,6 +720,19 @@ class DataModel:
                 for k in keys:
                     table_config.pop(k, None)
 
+            if not keys or any(key in keys for key in cls.RESOLUTION_CONFIG):
+                cls.clear_fieldpaths()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def clear_fieldpaths():
+        """
+            Invalidates all cached field selector resolutions (S3FieldPath),
+            called whenever the configuration they depend on is changed
+        """
+
+        current.model["fieldpaths"] = {}
+
     # -------------------------------------------------------------------------
     @classmethod
     def add_custom_callback(cls, tablename, hook, cb, method=None):
@@ -862,6 +1021,8 @@ class DataModel:
 
         components[master] = hooks
 
+        cls.clear_fieldpaths()
+
     # -------------------------------------------------------------------------
     @classmethod
     def add_dynamic_components(cls, tablename, exclude=None):
@@ -1123,6 +1284,20 @@ class DataModel:
         if direct_components:
             names = get_hooks(hooks, direct_components, names=names)
 
+        if names:
+            # Load the models declaring the missing components, if known
+            index = current.s3db.model_index
+            if index:
+                loaded = False
+                for alias in names:
+                    ctablename = index.component(tablename, alias)
+                    if ctablename and load(ctablename, db_only=True) is not None:
+                        loaded = True
+                if loaded:
+                    direct_components = components.get(tablename)
+                    if direct_components:
+                        names = get_hooks(hooks, direct_components, names=names)
+
         if names is None or names:
             # Add hooks for super-components
             supertables = cls.get_config(tablename, "super_entity")
@@ -0,0 +1,390 @@
+"""
+    Model Index
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("ModelIndex",
+           )
+
+import hashlib
+import json
+import os
+import sys
+import threading
+
+from gluon import current
+
+# =============================================================================
+class ModelIndex:
+    """
+        Index of the names defined by models (tables, response.s3 names),
+        to load exactly the model that defines a name, and of the tables
+        referencing each table and the component aliases of each master
+        table, to load only the models needed to detect dependencies
+        (rather than all models)
+
+        - the name index is built from the DataModel classes without
+          loading them
+        - the reference and component maps require all models to be
+          loaded, so they are completed during the first load_all_models,
+          and then stored on disk for other processes
+        - the index is identified by a signature of the model sources,
+          the enabled modules and the template configuration, so it is
+          rebuilt whenever any of these change
+    """
+
+    instances = {}
+    instances_lock = threading.Lock()
+
+    def __init__(self, signature, module_map, path=None):
+        """
+            Args:
+                signature: the index signature
+                module_map: the module map of the DataModel
+                path: the path of the index file
+        """
+
+        self.signature = signature
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.models = None
+        self.objects = None
+        self.references = None
+        self.components = None
+
+        if not self.read():
+            self.index_names(module_map)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_index(cls, module_map):
+        """
+            Returns the ModelIndex for the current configuration (shared
+            across requests)
+
+            Args:
+                module_map: the module map of the DataModel
+
+            Returns:
+                the ModelIndex, or None if disabled
+        """
+
+        if not current.deployment_settings.get_base_model_index():
+            return None
+
+        signature = cls.get_signature(module_map)
+
+        instances = cls.instances
+        index = instances.get(signature)
+        if index is None:
+            with cls.instances_lock:
+                index = instances.get(signature)
+                if index is None:
+                    path = os.path.join(current.request.folder,
+                                        "cache",
+                                        "model_index.json",
+                                        )
+                    index = instances[signature] = cls(signature,
+                                                       module_map,
+                                                       path = path,
+                                                       )
+        return index
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_signature(module_map):
+        """
+            Computes the signature of the current model configuration
+
+            Args:
+                module_map: the module map of the DataModel
+
+            Returns:
+                the signature (str)
+        """
+
+        settings = current.deployment_settings
+        folder = current.request.folder
+
+        def mtime(path):
+            try:
+                return os.stat(path).st_mtime if path else None
+            except OSError:
+                return None
+
+        items = []
+
+        # Model sources
+        for prefix in sorted(module_map):
+            for module in module_map[prefix]:
+                items.append((module.__name__, mtime(getattr(module, "__file__", None))))
+
+        # Configuration
+        paths = [os.path.join(folder, "models", "000_config.py")]
+        templates = settings.get_template()
+        if isinstance(templates, str):
+            templates = [templates]
+        for template in templates:
+            paths.append(os.path.join(folder,
+                                      "modules",
+                                      "templates",
+                                      *template.split("."),
+                                      "config.py",
+                                      ))
+        for path in paths:
+            items.append((path, mtime(path)))
+
+        # Enabled modules
+        items.append(sorted(settings.modules))
+
+        return hashlib.md5(json.dumps(items).encode("utf-8")).hexdigest()
+
+    # -------------------------------------------------------------------------
+    def index_names(self, module_map):
+        """
+            Builds the name index from the module map
+
+            Args:
+                module_map: the module map of the DataModel
+        """
+
+        models = {}
+        objects = {}
+
+        for prefix, modules in module_map.items():
+            for module in modules:
+                names = module.__all__
+                module_name = module.__name__
+                s3models = module.__dict__
+                for n in names:
+                    model = s3models[n]
+                    if hasattr(model, "_edenmodel") and hasattr(model, "names"):
+                        for name in model.names:
+                            if name not in models:
+                                models[name] = (prefix, module_name, n)
+                    elif n.startswith("%s_" % prefix) and n not in objects:
+                        objects[n] = (prefix, module_name)
+
+        self.models = models
+        self.objects = objects
+
+    # -------------------------------------------------------------------------
+    def locate(self, name, db_only=False):
+        """
+            Finds the model, or the module, that defines a name
+
+            Args:
+                name: the name (e.g. a table name)
+                db_only: find only models, not module-level objects
+
+            Returns:
+                tuple (prefix, module, classname), with classname None
+                for a module-level object, or None if not found
+        """
+
+        if not db_only:
+            entry = self.objects.get(name)
+            if entry:
+                prefix, module_name = entry
+                module = sys.modules.get(module_name)
+                if module and name in module.__all__:
+                    return prefix, module, None
+
+        entry = self.models.get(name)
+        if entry:
+            prefix, module_name, classname = entry
+            module = sys.modules.get(module_name)
+            if module and classname in module.__all__:
+                return prefix, module, classname
+
+        return None
+
+    # -------------------------------------------------------------------------
+    def has(self, name):
+        """
+            Checks whether a name is defined by any model
+
+            Args:
+                name: the name
+
+            Returns:
+                boolean
+        """
+
+        return name in self.objects or name in self.models
+
+    # -------------------------------------------------------------------------
+    @property
+    def complete(self):
+        """
+            Whether the reference and component maps are available
+        """
+
+        return self.references is not None and self.components is not None
+
+    # -------------------------------------------------------------------------
+    def referenced_by(self, tablename):
+        """
+            Returns the tables referencing a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                list of table names, or None if not indexed yet
+        """
+
+        references = self.references
+        if references is None:
+            return None
+        return references.get(tablename, [])
+
+    # -------------------------------------------------------------------------
+    def component(self, tablename, alias):
+        """
+            Returns the component table for a component alias
+
+            Args:
+                tablename: the master table name
+                alias: the component alias
+
+            Returns:
+                the component table name, or None if not found
+        """
+
+        components = self.components
+        if not components:
+            return None
+        return components.get(tablename, {}).get(alias)
+
+    # -------------------------------------------------------------------------
+    def update(self):
+        """
+            Completes the reference and component maps from the current
+            table definitions and component hooks; to be called after
+            all models have been loaded
+        """
+
+        db = current.db
+        model = current.model
+
+        if db._lazy_tables:
+            # Roll out all lazy tables to detect references
+            for tn in list(db._LAZY_TABLES.keys()):
+                db[tn]
+
+        references = {}
+        def add(tablename, referee):
+            if referee != tablename:
+                references.setdefault(tablename, set()).add(referee)
+
+        for table in db:
+            tablename = table._tablename
+            for field in table._referenced_by:
+                add(tablename, field.tablename)
+            for field in table:
+                ftype = str(field.type)
+                if ftype[:15] == "list:reference ":
+                    add(ftype[15:].split(".", 1)[0], tablename)
+
+        # Virtual references
+        for tablename, config in model["config"].items():
+            virtual = config.get("referenced_by")
+            if virtual:
+                for tn, _ in virtual:
+                    add(tablename, tn)
+
+        components = {}
+        for tablename, hooks in model["components"].items():
+            components[tablename] = {alias: hook.tablename
+                                     for alias, hook in hooks.items()
+                                     }
+
+        with self.lock:
+            self.references = {tn: sorted(refs) for tn, refs in references.items()}
+            self.components = components
+        self.write()
+
+    # -------------------------------------------------------------------------
+    def read(self):
+        """
+            Reads the index from disk, if it matches the signature
+
+            Returns:
+                True if successful, otherwise False
+        """
+
+        path = self.path
+        if not path:
+            return False
+
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if not isinstance(data, dict) or data.get("signature") != self.signature:
+            return False
+
+        self.models = {k: tuple(v) for k, v in data["models"].items()}
+        self.objects = {k: tuple(v) for k, v in data["objects"].items()}
+        self.references = data.get("references")
+        self.components = data.get("components")
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def write(self):
+        """
+            Writes the index to disk
+        """
+
+        path = self.path
+        if not path:
+            return
+
+        data = {"signature": self.signature,
+                "models": self.models,
+                "objects": self.objects,
+                "references": self.references,
+                "components": self.components,
+                }
+
+        tmp = "%s.%s.%s" % (path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            current.log.error("Could not write model index %s: %s" % (path, e))
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+# END =========================================================================
@@ -52,12 +52,15 @@ from urllib.parse import urlencode
 
 from gluon import current, redirect, IS_IN_SET
 from gluon.html import *
+from gluon.storage import Storage
 
 from ..methods import S3CRUD
 from ..tools import IS_ONE_OF, get_crud_string, s3_decode_iso_datetime, \
                     s3_str
 from ..ui import S3SQLDefaultForm, S3PentityAutocompleteWidget
 
+from .dispatch import OutboxDispatcher
+
 PHONECHARS = string.digits
 TWITTERCHARS = "%s%s_" % (string.digits, string.ascii_letters)
 TWITTER_MAX_CHARS = 140
@@ -524,6 +527,37 @@ class S3Msg:
                 else:
                     return False
 
+        def get_channel(organisation_id):
+            """
+                Helper method to look up the outbound SMS channel
+
+                Args:
+                    organisation_id: the organisation_id of the message
+
+                Returns:
+                    tuple (outgoing_sms_handler, channel_id), or None
+                    if there is no suitable channel
+            """
+
+            if not lookup_org:
+                return outgoing_sms_handler, channel_id
+
+            channel = channels.get(organisation_id)
+            if not channel and \
+                org_branches:
+                orgs = org_parents(organisation_id)
+                for org in orgs:
+                    channel = channels.get(org)
+                    if channel:
+                        break
+            if not channel:
+                # Look for an unrestricted channel
+                channel = channels.get(None)
+            if not channel:
+                return None
+
+            return channel["outgoing_sms_handler"], channel["channel_id"]
+
         def dispatch_to_pe_id(pe_id,
                               subject,
                               message,
@@ -532,11 +566,7 @@ class S3Msg:
                               attachments = [],
                               organisation_id = None,
                               contact_method = contact_method,
-                              channel_id = channel_id,
-                              from_address = None,
-                              outgoing_sms_handler = outgoing_sms_handler,
-                              lookup_org = lookup_org,
-                              channels = channels):
+                              from_address = None):
             """
                 Helper method to send messages by pe_id
 
@@ -571,23 +601,11 @@ class S3Msg:
                                            )
 
                 elif contact_method == "SMS":
-                    if lookup_org:
-                        channel = channels.get(organisation_id)
-                        if not channel and \
-                            org_branches:
-                            orgs = org_parents(organisation_id)
-                            for org in orgs:
-                                channel = channels.get(org)
-                                if channel:
-                                    break
-                        if not channel:
-                            # Look for an unrestricted channel
-                            channel = channels.get(None)
-                        if not channel:
-                            # We can't send this message as there is no unrestricted channel & none which matches this Org
-                            return False
-                        outgoing_sms_handler = channel["outgoing_sms_handler"]
-                        channel_id = channel["channel_id"]
+                    channel = get_channel(organisation_id)
+                    if not channel:
+                        # We can't send this message as there is no unrestricted channel & none which matches this Org
+                        return False
+                    outgoing_sms_handler, channel_id = channel
 
                     if outgoing_sms_handler == "msg_sms_webapi_channel":
                         return self.send_sms_via_api(address,
@@ -712,6 +730,17 @@ class S3Msg:
         # when messages are sent to groups or organisations
         chainrun = False
 
+        # Send messages to persons concurrently?
+        settings = current.deployment_settings
+        workers = settings.get_msg_outbox_workers()
+        if workers > 1 and contact_method in ("EMAIL", "SMS"):
+            dispatcher = OutboxDispatcher(workers,
+                                          rate = settings.get_msg_outbox_rate_limit(),
+                                          )
+        else:
+            dispatcher = None
+        pending = []
+
         # Set a default for non-SMS
         organisation_id = None
         attachment_table = s3db.msg_attachment
@@ -769,6 +798,17 @@ class S3Msg:
             message_id = row.message_id
 
             if entity_type == "pr_person":
+                if dispatcher:
+                    # Send the message along with all others after the loop
+                    pending.append(Storage(row = row,
+                                           subject = subject,
+                                           message = message,
+                                           attachments = attachments,
+                                           organisation_id = organisation_id,
+                                           from_address = from_address,
+                                           ))
+                    continue
+
                 # Send the message to this person
                 try:
                     status = dispatch_to_pe_id(pe_id,
@@ -874,9 +914,194 @@ class S3Msg:
                 elif row.retries is not None:
                     row.update_record(status = 5) # Failed
 
+        if pending:
+            self.dispatch_outbox(dispatcher,
+                                 pending,
+                                 contact_method,
+                                 get_channel,
+                                 dispatch_to_pe_id,
+                                 )
+
         if chainrun:
             self.process_outbox(contact_method)
 
+    # -------------------------------------------------------------------------
+    def dispatch_outbox(self,
+                        dispatcher,
+                        items,
+                        contact_method,
+                        get_channel,
+                        dispatch_to_pe_id):
+        """
+            Send a batch of outbox messages to persons concurrently,
+            helper for process_outbox
+
+            Args:
+                dispatcher: the OutboxDispatcher
+                items: the pending messages, list of Storages with
+                       the outbox row, subject, message, attachments,
+                       organisation_id and from_address
+                contact_method: the contact method
+                get_channel: function to look up the outbound SMS
+                             channel for an organisation_id
+                dispatch_to_pe_id: function to send a message serially,
+                                   for channels the dispatcher does not
+                                   handle
+        """
+
+        db = current.db
+        s3db = current.s3db
+        settings = current.deployment_settings
+
+        # Look up the contact addresses of all recipients at once
+        ctable = s3db.pr_contact
+        query = (ctable.pe_id.belongs({item.row.pe_id for item in items})) & \
+                (ctable.contact_method == contact_method) & \
+                (ctable.deleted == False)
+        rows = db(query).select(ctable.pe_id,
+                                ctable.value,
+                                orderby = ctable.priority,
+                                )
+        addresses = {}
+        for row in rows:
+            if row.pe_id not in addresses:
+                addresses[row.pe_id] = row.value
+
+        # Email configuration
+        smtp = current.mail.settings.server not in ("logging", "gae")
+        default_sender = settings.get_mail_sender()
+        if not default_sender:
+            current.log.warning("Email sending disabled until the Sender address has been set in models/000_config.py")
+            smtp = False
+        else:
+            default_sender = self.sanitize_sender(default_sender)
+
+        limit = settings.get_mail_limit()
+        if limit:
+            # Remaining quota for the daily limit
+            day = datetime.timedelta(hours=24)
+            cutoff = current.request.utcnow - day
+            ltable = s3db.msg_channel_limit
+            # @ToDo: Include Channel Info
+            quota = limit - db(ltable.created_on > cutoff).count()
+        else:
+            quota = None
+
+        sms_smtp_domains = {}
+
+        sent, failed = [], []
+        for item in items:
+
+            row = item.row
+            outbox_id = row.id
+
+            address = addresses.get(row.pe_id)
+            if not address:
+                failed.append(outbox_id)
+                continue
+
+            email = None
+            if contact_method == "EMAIL":
+                if smtp:
+                    sender = item.from_address
+                    sender = self.sanitize_sender(sender) if sender else default_sender
+                    email = (address, item.subject, item.message, sender)
+
+            elif contact_method == "SMS":
+                channel = get_channel(item.organisation_id)
+                if not channel:
+                    failed.append(outbox_id)
+                    continue
+                outgoing_sms_handler, channel_id = channel
+
+                if outgoing_sms_handler == "msg_sms_webapi_channel":
+                    sms_request = self.sms_api_request(address,
+                                                       item.message,
+                                                       channel_id = channel_id,
+                                                       )
+                    if not sms_request:
+                        failed.append(outbox_id)
+                        continue
+                    url, post_data, headers = sms_request
+
+                    def callback(outbox_id, output, url=url, message_id=row.message_id):
+                        return self.sms_api_response(url, output, message_id=message_id)
+
+                    dispatcher.add_request(outbox_id,
+                                           url,
+                                           post_data,
+                                           headers = headers,
+                                           channel = channel_id,
+                                           callback = callback,
+                                           )
+                    continue
+
+                elif outgoing_sms_handler == "msg_sms_smtp_channel" and smtp:
+                    if channel_id not in sms_smtp_domains:
+                        table = s3db.msg_sms_smtp_channel
+                        channel = db(table.channel_id == channel_id).select(table.address,
+                                                                            limitby = (0, 1),
+                                                                            ).first()
+                        sms_smtp_domains[channel_id] = channel.address if channel else None
+                    domain = sms_smtp_domains[channel_id]
+                    if not domain:
+                        failed.append(outbox_id)
+                        continue
+                    mobile = self.sanitise_phone(address, channel_id)
+                    email = ("%s@%s" % (mobile, domain), "", item.message, default_sender)
+
+            if email:
+                if quota is not None:
+                    # Check whether we've reached our daily limit
+                    if quota <= 0:
+                        failed.append(outbox_id)
+                        continue
+                    quota -= 1
+                    # Log the sending
+                    ltable.insert()
+                to, subject, message, sender = email
+                dispatcher.add_email(outbox_id,
+                                     to,
+                                     subject,
+                                     message,
+                                     sender,
+                                     attachments = self.email_attachments(item.attachments),
+                                     channel = contact_method,
+                                     )
+            else:
+                # Send serially
+                try:
+                    status = dispatch_to_pe_id(row.pe_id,
+                                               item.subject,
+                                               item.message,
+                                               outbox_id,
+                                               row.message_id,
+                                               organisation_id = item.organisation_id,
+                                               from_address = item.from_address,
+                                               attachments = item.attachments,
+                                               )
+                except:
+                    status = False
+                if status:
+                    sent.append(outbox_id)
+                else:
+                    failed.append(outbox_id)
+
+        # Send concurrently
+        dispatched, undispatched = dispatcher()
+        sent.extend(dispatched)
+        failed.extend(undispatched)
+
+        # Update the outbox
+        outbox = s3db.msg_outbox
+        if sent:
+            db(outbox.id.belongs(sent)).update(status = 2) # Sent
+        if failed:
+            query = outbox.id.belongs(failed)
+            db(query & (outbox.retries == 0)).update(status = 5) # Failed
+            db(query & (outbox.retries > 0)).update(retries = outbox.retries - 1)
+        db.commit()
+
     # -------------------------------------------------------------------------
     # Google Cloud Messaging Push
     # -------------------------------------------------------------------------
@@ -980,17 +1205,7 @@ class S3Msg:
             # Log the sending
             table.insert()
 
-        # Workaround for incorrectly encoded Content-Disposition headers
-        if attachments:
-            if not isinstance(attachments, (list, tuple)):
-                attachments = [attachments]
-            from email.header import Header
-            for attachment in attachments:
-                filename = attachment.my_filename
-                if isinstance(filename, bytes):
-                    filename = filename.decode("utf-8")
-                header = Header('attachment; filename="%s"' % Header(filename, "utf-8").encode())
-                attachment.replace_header("Content-Disposition", header)
+        attachments = self.email_attachments(attachments)
 
         result = current.mail.send(to,
                                    subject = subject,
@@ -1012,6 +1227,35 @@ class S3Msg:
 
         return result
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def email_attachments(attachments):
+        """
+            Prepare email attachments, working around incorrectly
+            encoded Content-Disposition headers
+
+            Args:
+                attachments: a Mail.Attachment, or a list of Attachments
+
+            Returns:
+                list of Attachments, or None
+        """
+
+        if not attachments:
+            return None
+        if not isinstance(attachments, (list, tuple)):
+            attachments = [attachments]
+
+        from email.header import Header
+        for attachment in attachments:
+            filename = attachment.my_filename
+            if isinstance(filename, bytes):
+                filename = filename.decode("utf-8")
+            header = Header('attachment; filename="%s"' % Header(filename, "utf-8").encode())
+            attachment.replace_header("Content-Disposition", header)
+
+        return attachments
+
     # -------------------------------------------------------------------------
     @staticmethod
     def sanitize_sender(sender):
@@ -1161,6 +1405,38 @@ class S3Msg:
             Function to send SMS via Web API
         """
 
+        sms_request = self.sms_api_request(mobile, text, channel_id=channel_id)
+        if not sms_request:
+            return False
+        url, post_data, headers = sms_request
+
+        request = urllib2.Request(url, headers=headers)
+        query = urlencode(post_data).encode("ascii")
+        try:
+            result = urlopen(request, query)
+        except HTTPError as e:
+            current.log.error("SMS message send failed: %s" % e)
+            return False
+        else:
+            # Parse result
+            output = s3_str(result.read())
+            return self.sms_api_response(url, output, message_id=message_id)
+
+    # -------------------------------------------------------------------------
+    def sms_api_request(self, mobile, text="", channel_id=None):
+        """
+            Prepare the request to send an SMS via Web API
+
+            Args:
+                mobile: the recipient phone number
+                text: the message text
+                channel_id: the msg_sms_webapi_channel channel_id
+
+            Returns:
+                tuple (url, post_data, headers), or None if the
+                message cannot be sent
+        """
+
         db = current.db
         s3db = current.s3db
         table = s3db.msg_sms_webapi_channel
@@ -1173,7 +1449,7 @@ class S3Msg:
             # @ToDo: Check for Organisation-specific Gateway
             sms_api = db(table.enabled == True).select(limitby=(0, 1)).first()
         if not sms_api:
-            return False
+            return None
 
         post_data = {}
 
@@ -1197,48 +1473,58 @@ class S3Msg:
         post_data[sms_api.to_variable] = str(mobile)
 
         url = sms_api.url
-        clickatell = "clickatell" in url
-        if clickatell:
+        if "clickatell" in url:
             text_len = len(text)
             if text_len > 480:
                 current.log.error("Clickatell messages cannot exceed 480 chars")
-                return False
+                return None
             elif text_len > 320:
                 post_data["concat"] = 3
             elif text_len > 160:
                 post_data["concat"] = 2
 
-        request = urllib2.Request(url)
-        query = urlencode(post_data)
+        headers = {}
         if sms_api.username and sms_api.password:
             # e.g. Mobile Commons
-            base64string = base64.encodestring("%s:%s" % (sms_api.username, sms_api.password)).replace("\n", "")
-            request.add_header("Authorization", "Basic %s" % base64string)
-        try:
-            result = urlopen(request, query)
-        except HTTPError as e:
-            current.log.error("SMS message send failed: %s" % e)
-            return False
-        else:
-            # Parse result
-            output = result.read()
-            if clickatell:
-                if output.startswith("ERR"):
-                    current.log.error("Clickatell message send failed: %s" % output)
-                    return False
-                elif message_id and output.startswith("ID"):
-                    # Store ID from Clickatell to be able to followup
-                    remote_id = output[4:]
-                    db(s3db.msg_sms.message_id == message_id).update(remote_id=remote_id)
-            elif "mcommons" in url:
-                # http://www.mobilecommons.com/mobile-commons-api/rest/#errors
-                # Good = <response success="true"></response>
-                # Bad = <response success="false"><errror id="id" message="message"></response>
-                if "error" in output:
-                    current.log.error("Mobile Commons message send failed: %s" % output)
-                    return False
+            credentials = "%s:%s" % (sms_api.username, sms_api.password)
+            base64string = base64.b64encode(credentials.encode("utf-8"))
+            headers["Authorization"] = "Basic %s" % s3_str(base64string)
 
-            return True
+        return url, post_data, headers
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def sms_api_response(url, output, message_id=None):
+        """
+            Parse the response of a Web API to an SMS send request
+
+            Args:
+                url: the URL of the Web API
+                output: the response body
+                message_id: the message_id
+
+            Returns:
+                True if the message was sent, otherwise False
+        """
+
+        if "clickatell" in url:
+            if output.startswith("ERR"):
+                current.log.error("Clickatell message send failed: %s" % output)
+                return False
+            elif message_id and output.startswith("ID"):
+                # Store ID from Clickatell to be able to followup
+                remote_id = output[4:]
+                current.db(current.s3db.msg_sms.message_id == message_id) \
+                          .update(remote_id=remote_id)
+        elif "mcommons" in url:
+            # http://www.mobilecommons.com/mobile-commons-api/rest/#errors
+            # Good = <response success="true"></response>
+            # Bad = <response success="false"><errror id="id" message="message"></response>
+            if "error" in output:
+                current.log.error("Mobile Commons message send failed: %s" % output)
+                return False
+
+        return True
 
     # -------------------------------------------------------------------------
     def send_sms_via_modem(self, mobile, text="", channel_id=None):
@@ -0,0 +1,602 @@
+"""
+    Concurrent Outbox Dispatcher
+
+    Sends batches of outbound messages with bounded concurrency,
+    re-using SMTP/HTTP connections across messages
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("OutboxDispatcher",
+           )
+
+import smtplib
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid, parseaddr
+from queue import Empty, LifoQueue
+
+from gluon import current
+from gluon.storage import Storage
+
+from ..tools import s3_str
+
+# Default number of send attempts per message and dispatch
+ATTEMPTS = 3
+
+# Initial delay (seconds) before retrying a failed send, doubled
+# with every further attempt
+RETRY_DELAY = 1.0
+
+# Timeout (seconds) for SMTP/HTTP connections
+TIMEOUT = 30
+
+# =============================================================================
+class TransientError(Exception):
+    """ Send failure that may be resolved by retrying """
+    pass
+
+# =============================================================================
+class ConnectionPool:
+    """
+        Thread-safe pool of re-usable connections; the pool size is
+        implicitly limited by the number of concurrent workers
+    """
+
+    def __init__(self, connect, disconnect):
+        """
+            Args:
+                connect: function to open a new connection
+                disconnect: function to close a connection
+        """
+
+        self.connect = connect
+        self.disconnect = disconnect
+
+        self.idle = LifoQueue()
+
+    # -------------------------------------------------------------------------
+    def acquire(self):
+        """
+            Get an idle connection from the pool, or open a new one
+
+            Returns:
+                the connection
+        """
+
+        try:
+            connection = self.idle.get_nowait()
+        except Empty:
+            connection = self.connect()
+        return connection
+
+    # -------------------------------------------------------------------------
+    def release(self, connection, discard=False):
+        """
+            Return a connection to the pool
+
+            Args:
+                connection: the connection
+                discard: close the connection rather than re-using it
+                         (e.g. after a connection error)
+        """
+
+        if discard:
+            self.close_connection(connection)
+        else:
+            self.idle.put(connection)
+
+    # -------------------------------------------------------------------------
+    def close(self):
+        """
+            Close all idle connections
+        """
+
+        idle = self.idle
+        while True:
+            try:
+                connection = idle.get_nowait()
+            except Empty:
+                break
+            self.close_connection(connection)
+
+    # -------------------------------------------------------------------------
+    def close_connection(self, connection):
+        """
+            Close a connection, ignoring any errors
+
+            Args:
+                connection: the connection
+        """
+
+        try:
+            self.disconnect(connection)
+        except Exception:
+            pass
+
+# =============================================================================
+class RateLimiter:
+    """
+        Thread-safe limiter for the send rate of a channel
+    """
+
+    def __init__(self, rate):
+        """
+            Args:
+                rate: the maximum number of messages per second
+        """
+
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = 0
+
+        self.lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    def wait(self):
+        """
+            Block until the next send slot is available
+        """
+
+        interval = self.interval
+        if not interval:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+# =============================================================================
+class OutboxDispatcher:
+    """
+        Dispatcher to send a batch of outbox messages with bounded
+        concurrency, per-channel rate limits and retry backoff
+
+        - all database access (preparing the messages, processing the
+          results) happens in the calling thread, the workers do nothing
+          but network I/O over pooled connections
+    """
+
+    def __init__(self, workers, rate=None, attempts=ATTEMPTS):
+        """
+            Args:
+                workers: the maximum number of concurrent sends
+                rate: the maximum number of messages per second and
+                      channel, a number for all channels, or a dict
+                      {channel: rate}
+                attempts: the maximum number of send attempts per
+                          message before giving up (the outbox entry
+                          will then be retried in a later run)
+        """
+
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.attempts = max(1, attempts)
+
+        self.jobs = []
+        self.limiters = {}
+
+        self.smtp = None
+        self.http = None
+
+        # Throughput metrics of the last dispatch
+        self.metrics = None
+
+    # -------------------------------------------------------------------------
+    def add_email(self,
+                  outbox_id,
+                  to,
+                  subject,
+                  message,
+                  sender,
+                  attachments=None,
+                  channel="EMAIL",
+                  callback=None,
+                  ):
+        """
+            Add an email to the batch
+
+            Args:
+                outbox_id: the msg_outbox record ID
+                to: the recipient email address
+                subject: the message subject
+                message: the message body
+                sender: the sender ("Name <address>")
+                attachments: list of email attachments (MIME parts)
+                channel: the channel (for rate limits)
+                callback: function to call with the outbox_id and None
+                          after a successful send (in the calling thread),
+                          returning True|False to confirm the send
+        """
+
+        payload = self.compose_email(to,
+                                     subject,
+                                     message,
+                                     sender,
+                                     attachments = attachments,
+                                     )
+        args = (parseaddr(sender)[1], to, payload)
+
+        if self.smtp is None:
+            # Pool connections with the current mail settings
+            mail_settings = current.mail.settings
+            self.smtp = ConnectionPool(lambda: self.smtp_connect(mail_settings),
+                                       lambda server: server.quit(),
+                                       )
+        self.limiter(channel)
+
+        self.jobs.append((outbox_id, channel, self.send_email, args, callback))
+
+    # -------------------------------------------------------------------------
+    def add_request(self,
+                    outbox_id,
+                    url,
+                    data,
+                    headers=None,
+                    channel=None,
+                    callback=None,
+                    ):
+        """
+            Add an HTTP POST request to the batch
+
+            Args:
+                outbox_id: the msg_outbox record ID
+                url: the URL to post to
+                data: the request data, dict
+                headers: additional request headers, dict
+                channel: the channel (for rate limits)
+                callback: function to call with the outbox_id and the
+                          response body after a successful request (in
+                          the calling thread), returning True|False
+                          to indicate whether the message was sent
+        """
+
+        args = (url, data, headers)
+
+        if self.http is None:
+            import requests
+            self.http = ConnectionPool(requests.Session,
+                                       lambda session: session.close(),
+                                       )
+        self.limiter(channel)
+
+        self.jobs.append((outbox_id, channel, self.send_request, args, callback))
+
+    # -------------------------------------------------------------------------
+    def __call__(self):
+        """
+            Send all messages in the batch
+
+            Returns:
+                tuple (sent, failed) with lists of outbox IDs
+        """
+
+        jobs = self.jobs
+        if not jobs:
+            return [], []
+        self.jobs = []
+
+        start = time.time()
+
+        sent, failed = [], []
+        retries = 0
+
+        log = current.log
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+                futures = {executor.submit(self.perform, job): job for job in jobs}
+
+                for future in as_completed(futures):
+
+                    outbox_id, _, _, _, callback = futures[future]
+                    success, output, error, attempts = future.result()
+
+                    retries += attempts - 1
+                    if error:
+                        log.error("Outbox message %s send failed: %s" % (outbox_id, error))
+
+                    if success and callback:
+                        try:
+                            success = callback(outbox_id, output)
+                        except Exception as e:
+                            log.error("Outbox message %s postprocess failed: %s" % (outbox_id, e))
+                            success = False
+
+                    if success:
+                        sent.append(outbox_id)
+                    else:
+                        failed.append(outbox_id)
+        finally:
+            self.close()
+
+        # Throughput metrics
+        duration = time.time() - start
+        self.metrics = Storage(sent = len(sent),
+                               failed = len(failed),
+                               retries = retries,
+                               duration = duration,
+                               rate = len(jobs) / duration if duration else None,
+                               )
+        log.info("Outbox dispatch: %s sent, %s failed, %s retries in %.3f sec (%.1f messages/sec)" % \
+                 (len(sent), len(failed), retries, duration, self.metrics.rate or 0))
+
+        return sent, failed
+
+    # -------------------------------------------------------------------------
+    def perform(self, job):
+        """
+            Perform a send job, retrying transient failures with
+            exponential backoff (runs in a worker thread)
+
+            Args:
+                job: the job tuple
+
+            Returns:
+                tuple (success, output, error, attempts)
+        """
+
+        _, channel, send, args, _ = job
+        limiter = self.limiter(channel)
+
+        attempts = self.attempts
+        error = None
+
+        attempt = 0
+        while attempt < attempts:
+            if attempt:
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            attempt += 1
+
+            limiter.wait()
+            try:
+                success, output = send(*args)
+            except TransientError as e:
+                error = e
+                continue
+            except Exception as e:
+                return False, None, e, attempt
+
+            if success:
+                return True, output, None, attempt
+            else:
+                return False, None, output, attempt
+
+        return False, None, error, attempt
+
+    # -------------------------------------------------------------------------
+    def limiter(self, channel):
+        """
+            Get the rate limiter for a channel
+
+            Args:
+                channel: the channel
+
+            Returns:
+                RateLimiter
+        """
+
+        limiters = self.limiters
+
+        limiter = limiters.get(channel)
+        if limiter is None:
+            rate = self.rate
+            if isinstance(rate, dict):
+                rate = rate.get(channel)
+            limiter = limiters[channel] = RateLimiter(rate)
+
+        return limiter
+
+    # -------------------------------------------------------------------------
+    def close(self):
+        """
+            Close all pooled connections
+        """
+
+        for pool in (self.smtp, self.http):
+            if pool:
+                pool.close()
+
+    # -------------------------------------------------------------------------
+    # Email
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def compose_email(to, subject, message, sender, attachments=None, encoding="utf-8"):
+        """
+            Build the MIME payload of an email
+
+            Args:
+                to: the recipient email address
+                subject: the message subject
+                message: the message body (HTML if enclosed in <html> tags)
+                sender: the sender ("Name <address>")
+                attachments: list of email attachments (MIME parts)
+                encoding: the character encoding
+
+            Returns:
+                the payload as str
+        """
+
+        text = s3_str(message)
+        stripped = text.strip()
+        if stripped.startswith("<html") and stripped.endswith("</html>"):
+            subtype = "html"
+        else:
+            subtype = "plain"
+        body = MIMEText(text, subtype, encoding)
+
+        if attachments:
+            payload = MIMEMultipart()
+            payload.attach(body)
+            for attachment in attachments:
+                payload.attach(attachment)
+        else:
+            payload = body
+
+        payload["From"] = sender
+        payload["To"] = to
+        payload["Subject"] = Header(s3_str(subject), encoding)
+        payload["Date"] = formatdate()
+        payload["Message-Id"] = make_msgid()
+
+        return payload.as_string()
+
+    # -------------------------------------------------------------------------
+    def send_email(self, sender, to, payload):
+        """
+            Send an email over a pooled SMTP connection (runs in a
+            worker thread)
+
+            Args:
+                sender: the sender email address
+                to: the recipient email address
+                payload: the MIME payload (str)
+
+            Returns:
+                tuple (success, error)
+
+            Raises:
+                TransientError for connection failures and temporary
+                server errors (4xx)
+        """
+
+        pool = self.smtp
+        try:
+            server = pool.acquire()
+        except (smtplib.SMTPException, OSError) as e:
+            raise TransientError(e)
+
+        try:
+            server.sendmail(sender, [to], payload)
+        except smtplib.SMTPRecipientsRefused as e:
+            pool.release(server)
+            return False, e
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code == 421:
+                # Service not available, closing connection
+                pool.release(server, discard=True)
+                raise TransientError(e)
+            try:
+                server.rset()
+            except (smtplib.SMTPException, OSError):
+                pool.release(server, discard=True)
+            else:
+                pool.release(server)
+            if 400 <= e.smtp_code < 500:
+                raise TransientError(e)
+            return False, e
+        except (smtplib.SMTPException, OSError) as e:
+            pool.release(server, discard=True)
+            raise TransientError(e)
+
+        pool.release(server)
+        return True, None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def smtp_connect(settings):
+        """
+            Open and authenticate an SMTP connection
+
+            Args:
+                settings: the web2py Mail settings
+
+            Returns:
+                the SMTP connection
+        """
+
+        host, port = settings.server, 0
+        if ":" in host:
+            host, port = host.rsplit(":", 1)
+            port = int(port)
+
+        if settings.ssl:
+            server = smtplib.SMTP_SSL(host, port, timeout=TIMEOUT)
+        else:
+            server = smtplib.SMTP(host, port, timeout=TIMEOUT)
+            if settings.tls:
+                server.ehlo()
+                server.starttls()
+                server.ehlo()
+
+        login = settings.login
+        if login:
+            username, password = login.split(":", 1)
+            server.login(username, password)
+
+        return server
+
+    # -------------------------------------------------------------------------
+    # HTTP
+    # -------------------------------------------------------------------------
+    def send_request(self, url, data, headers):
+        """
+            Send an HTTP POST request over a pooled session (runs in a
+            worker thread)
+
+            Args:
+                url: the URL
+                data: the request data, dict
+                headers: additional request headers, dict
+
+            Returns:
+                tuple (success, response body or error)
+
+            Raises:
+                TransientError for connection failures and temporary
+                server errors (429, 5xx)
+        """
+
+        import requests
+
+        pool = self.http
+        session = pool.acquire()
+        try:
+            response = session.post(url,
+                                    data = data,
+                                    headers = headers,
+                                    timeout = TIMEOUT,
+                                    )
+        except requests.RequestException as e:
+            pool.release(session, discard=True)
+            raise TransientError(e)
+
+        pool.release(session)
+
+        status = response.status_code
+        if status == 429 or status >= 500:
+            raise TransientError("HTTP %s" % status)
+        elif status >= 400:
+            return False, "HTTP %s" % status
+
+        return True, response.text
@@ -25,6 +25,9 @@
     OTHER DEALINGS IN THE SOFTWARE.
 """
 
+import datetime
+import hashlib
+import hmac
 import json
 
 from itertools import chain
@@ -60,7 +63,8 @@ class ResourceData:
                  as_rows = False,
                  represent = False,
                  show_links = True,
-                 raw_data = False
+                 raw_data = False,
+                 seek = None,
                  ):
         """
             Constructor, extracts (and represents) data from a resource
@@ -80,6 +84,9 @@ class ResourceData:
                 as_rows: return the rows (don't extract/represent)
                 represent: render field value representations
                 raw_data: include raw data in the result
+                seek: keyset pagination, the ORDERBY values (incl. the
+                      record ID) of the last record of the previous page,
+                      or an empty tuple to start keyset pagination
 
             Notes:
                 - as_rows / groupby prevent automatic splitting of
@@ -87,6 +94,15 @@ class ResourceData:
                 - with groupby, only the groupby fields will be returned
                   (i.e. fields will be ignored), because aggregates are
                   not supported (yet)
+                - with seek values, start is ignored; in keyset pagination,
+                  the record ID is always appended to the ORDERBY as
+                  tie-breaker, and self.seek provides the ORDERBY values
+                  of the last extracted record; if the ORDERBY
+                  does not allow keyset pagination (e.g. fields in joined
+                  tables), then self.keyset is None and the caller must
+                  fall back to start/limit pagination
+                - with seek, numrows/ids only cover the records after the
+                  seek position
         """
 
         db = current.db
@@ -174,6 +190,25 @@ class ResourceData:
         if tables:
             filter_tables.update(tables)
 
+        # Keyset pagination
+        self.keyset = keyset = None
+        self.seek = None
+        if seek is not None and not groupby:
+            keyset = self.resolve_keyset(orderby)
+            if keyset:
+                self.keyset = keyset
+                orderby, orderby_aggr, orderby_fields = [], [], []
+                for f, desc in keyset:
+                    orderby.append(~f if desc else f)
+                    if str(f) == pkey:
+                        orderby_aggr.append(~f if desc else f)
+                    else:
+                        orderby_aggr.append(~(f.max()) if desc else f.min())
+                    orderby_fields.append(f)
+                if seek:
+                    master_query = query = query & self.keyset_query(keyset, seek)
+                    start = 0
+
         # Joins for filter query
         filter_ijoins = ijoins.as_list(tablenames = filter_tables,
                                        aqueries = aqueries,
@@ -324,6 +359,13 @@ class ResourceData:
                     qfields[pkey] = resource._id
                 has_id = True
 
+                # Keyset fields must appear in SELECT
+                if keyset:
+                    for keyset_field, _ in keyset:
+                        fn = str(keyset_field)
+                        if fn not in qfields:
+                            qfields[fn] = keyset_field
+
             # Execute master query
             db = current.db
 
@@ -542,6 +584,10 @@ class ResourceData:
 
             self.rows = [results[record_id] for record_id in page]
 
+        # Keyset values of the last record (=seek for the next page)
+        if keyset and page and rows:
+            self.seek = self.keyset_values(rows, keyset, pkey, page[-1])
+
         if rname:
             # Restore referee name
             db._referee_name = rname
@@ -721,6 +767,207 @@ class ResourceData:
 
         return expr, aggr, fields, tables
 
+    # -------------------------------------------------------------------------
+    def resolve_keyset(self, orderby):
+        """
+            Determine the keyset (seek) columns for an ORDERBY
+
+            Args:
+                orderby: the resolved ORDERBY expression (list)
+
+            Returns:
+                list of tuples (Field, descending), ending with the
+                primary key as tie-breaker, or None if the ORDERBY
+                does not allow keyset pagination
+        """
+
+        table = self.table
+        tablename = table._tablename
+        pkey = str(table._id)
+
+        adapter = S3DAL()
+
+        keyset = []
+        for item in orderby or []:
+
+            if isinstance(item, Field):
+                f, desc = item, False
+            elif type(item) is Expression and \
+                 item.op == adapter.INVERT and isinstance(item.first, Field):
+                f, desc = item.first, True
+            else:
+                # Aggregates or other expressions - not supported
+                return None
+
+            # Only real fields in the master table
+            if f.tablename != tablename or f.name not in table.fields:
+                return None
+
+            keyset.append((f, desc))
+            if str(f) == pkey:
+                # Unique => remaining ORDERBY fields are irrelevant
+                break
+        else:
+            keyset.append((table._id, False))
+
+        return keyset
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def keyset_query(keyset, seek):
+        """
+            Construct a query for all records after the seek position
+
+            Args:
+                keyset: the keyset, list of tuples (Field, descending)
+                seek: the ORDERBY values of the last record of the
+                      previous page (same order as keyset)
+
+            Returns:
+                a Query
+
+            Note:
+                NULL values sort first in ascending order with SQLite
+                and MySQL, but last with PostgreSQL - the query follows
+                the respective convention of the database backend
+        """
+
+        nulls_high = current.db._dbname == "postgres"
+
+        # Build the query from the innermost (=last) keyset field outwards
+        query = None
+        for (field, desc), value in reversed(list(zip(keyset, seek))):
+
+            # Convert temporal values from decoded seek tokens
+            ftype = field.type
+            if isinstance(value, str) and ftype in ("date", "datetime", "time"):
+                try:
+                    value = getattr(datetime, ftype).fromisoformat(value)
+                except ValueError:
+                    pass
+
+            nulls_after = nulls_high != desc
+
+            # Records strictly after value in this field
+            if value is None:
+                after = field != None if not nulls_after else None
+            else:
+                after = field < value if desc else field > value
+                if nulls_after and not field.notnull:
+                    after |= (field == None)
+
+            if query is None:
+                # Last keyset field (=primary key)
+                query = after
+            else:
+                # Same value in this field, and after in the following
+                same = (field == None) if value is None else (field == value)
+                same &= query
+                query = same if after is None else (after | same)
+
+        return query
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def encode_seek(seek, signature=None):
+        """
+            Encode keyset values as token to pass to the client
+
+            Args:
+                seek: the keyset values (ResourceData.seek)
+                signature: a signature of the request parameters (ORDERBY,
+                           filters) for which the keyset values are valid
+
+            Returns:
+                the token (JSON string), signed with the HMAC key
+        """
+
+        def serialize(value):
+            if isinstance(value, (datetime.date, datetime.time)):
+                return value.isoformat()
+            return s3_str(value)
+
+        values = json.dumps(seek,
+                            default = serialize,
+                            separators = (",", ":"),
+                            )
+        mac = ResourceData.sign_seek(values, signature)
+
+        return json.dumps([values, mac], separators=(",", ":"))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def decode_seek(token, signature=None):
+        """
+            Decode a keyset token from the client
+
+            Args:
+                token: the token (JSON string)
+                signature: the signature of the current request parameters
+
+            Returns:
+                the keyset values (list), or None if the token is invalid,
+                was not issued by this server or was issued for different
+                request parameters
+        """
+
+        try:
+            values, mac = json.loads(token)
+            if not isinstance(values, str) or not isinstance(mac, str):
+                return None
+            if not hmac.compare_digest(mac, ResourceData.sign_seek(values, signature)):
+                return None
+            seek = json.loads(values)
+        except (ValueError, TypeError):
+            return None
+
+        return seek if isinstance(seek, list) else None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def sign_seek(values, signature):
+        """
+            Compute the message authentication code for a keyset token
+
+            Args:
+                values: the keyset values (JSON string)
+                signature: the signature of the request parameters
+
+            Returns:
+                the MAC (hex string)
+        """
+
+        key = current.deployment_settings.get_auth_hmac_key()
+        message = "%s|%s" % (signature, values)
+
+        return hmac.new(s3_str(key).encode("utf-8"),
+                        message.encode("utf-8"),
+                        hashlib.sha256,
+                        ).hexdigest()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def keyset_values(rows, keyset, pkey, record_id):
+        """
+            Extract the keyset values of a record from the master rows
+
+            Args:
+                rows: the master rows
+                keyset: the keyset, list of tuples (Field, descending)
+                pkey: the primary key column name
+                record_id: the record ID
+
+            Returns:
+                list of ORDERBY values of the record (=seek for the next
+                page), or None if the record was not found in rows
+        """
+
+        # Usually the last row, so search backwards
+        for row in reversed(rows):
+            if row[pkey] == record_id:
+                return [row[str(field)] for field, _ in keyset]
+        return None
+
     # -------------------------------------------------------------------------
     def filter_query(self,
                      query,
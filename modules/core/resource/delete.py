@@ -41,19 +41,24 @@ __all__ = ("DeleteProcess",
 
 DELETED = "deleted"
 
+BATCH_SIZE = 500
+
 # =============================================================================
 class DeleteProcess:
     """
         Process to delete/archive records
     """
 
-    def __init__(self, resource, archive=None, representation=None):
+    def __init__(self, resource, archive=None, representation=None, bulk=None):
         """
             Args:
                 resource: the resource to delete records from (CRUDResource)
                 archive: True|False to override global
                          security.archive_not_delete setting
                 representation: the request format (for audit, optional), str
+                bulk: process the records set-wise in batches of this
+                      size (True for default batch size), to override
+                      global base.bulk_delete setting
         """
 
         self.resource = resource
@@ -72,6 +77,13 @@ class DeleteProcess:
                 archive = False
         self.archive = archive
 
+        # Bulk mode?
+        if bulk is None:
+            bulk = current.deployment_settings.get_base_bulk_delete()
+        if bulk is True:
+            bulk = BATCH_SIZE
+        self.bulk = bulk if bulk and bulk > 1 else None
+
         # Callbacks
         get_config = resource.get_config
         self.prepare = get_config("ondelete_cascade")
@@ -137,7 +149,16 @@ class DeleteProcess:
         add_error = self.add_error
 
         # Check permissions and prepare records
-        has_permission = current.auth.s3_has_permission
+        if self.bulk:
+            accessible = self.accessible([(getattr(row, tablename) if joined else row)[pkey]
+                                          for row in rows])
+            permitted = lambda record_id: record_id in accessible
+        else:
+            has_permission = current.auth.s3_has_permission
+            permitted = lambda record_id: has_permission("delete",
+                                                         table,
+                                                         record_id = record_id,
+                                                         )
         prepare = self.prepare
 
         records = []
@@ -147,7 +168,7 @@ class DeleteProcess:
             record_id = record[pkey]
 
             # Check permissions
-            if not has_permission("delete", table, record_id=record_id):
+            if not permitted(record_id):
                 self.permission_error = True
                 add_error(record_id, "not permitted")
                 continue
@@ -174,17 +195,52 @@ class DeleteProcess:
             return 0
 
         # Delete the records
+        if self.bulk and len(deletable) > 1:
+            delete = self.delete_bulk
+        else:
+            delete = self.delete_rows
+        num_deleted = delete(deletable,
+                             cascade = cascade,
+                             replaced_by = replaced_by,
+                             skip_undeletable = skip_undeletable,
+                             check_all = check_all,
+                             )
+
+        self.set_resource_error()
+        return num_deleted
+
+    # -------------------------------------------------------------------------
+    def delete_rows(self,
+                    rows,
+                    cascade=False,
+                    replaced_by=None,
+                    skip_undeletable=False,
+                    check_all=False):
+        """
+            Delete/archive deletable rows one by one
+
+            Args:
+                rows: the deletable Rows
+                cascade: this is called as a cascade-action
+                replaced_by: dict of {replaced_id: replacement_id}
+                skip_undeletable: delete whatever is possible, skip
+                                  undeletable rows
+                check_all: process the entire cascade to reveal all errors
+
+            Returns:
+                the number of rows deleted
+        """
+
         db = current.db
 
-        audit = current.audit
-        resource = self.resource
-        prefix, name = resource.prefix, resource.name
+        table = self.table
+        pkey = table._id.name
 
-        ondelete = self.ondelete
+        add_error = self.add_error
         delete_super = current.s3db.delete_super
 
         num_deleted = 0
-        for row in deletable:
+        for row in rows:
 
             record_id = row[pkey]
             success = True
@@ -211,20 +267,7 @@ class DeleteProcess:
 
             if success:
                 # Postprocess delete
-
-                # Clear session
-                if get_last_record_id(tablename) == record_id:
-                    remove_last_record_id(tablename)
-
-                # Audit
-                audit("delete", prefix, name,
-                      record = record_id,
-                      representation = self.representation,
-                      )
-
-                # On-delete hook
-                if ondelete:
-                    callback(ondelete, row)
+                self.postprocess(row)
 
                 # Subsequent cascade errors would roll back successful
                 # deletions too => we want to prevent that when skipping
@@ -251,9 +294,179 @@ class DeleteProcess:
                 # - will be rolled back by master process
                 break
 
-        self.set_resource_error()
         return num_deleted
 
+    # -------------------------------------------------------------------------
+    def delete_bulk(self,
+                    rows,
+                    cascade=False,
+                    replaced_by=None,
+                    skip_undeletable=False,
+                    check_all=False):
+        """
+            Delete/archive deletable rows set-wise in batches
+
+            Args:
+                rows: the deletable Rows
+                cascade: this is called as a cascade-action
+                replaced_by: dict of {replaced_id: replacement_id}
+                skip_undeletable: delete whatever is possible, skip
+                                  undeletable rows
+                check_all: process the entire cascade to reveal all errors
+
+            Returns:
+                the number of rows deleted
+
+            Note:
+                If a batch fails while skipping undeletable rows, it is
+                rolled back and retried row by row to isolate the
+                undeletable rows
+        """
+
+        db = current.db
+
+        tablename = self.tablename
+        pkey = self.table._id.name
+
+        size = self.bulk
+
+        num_deleted = 0
+        for index in range(0, len(rows), size):
+
+            batch = rows[index:index + size]
+
+            success = self.delete_batch(batch,
+                                        replaced_by = replaced_by,
+                                        check_all = check_all,
+                                        )
+            if success:
+                # Postprocess delete
+                for row in batch:
+                    self.postprocess(row)
+
+                if not cascade and skip_undeletable:
+                    db.commit()
+
+                num_deleted += len(batch)
+
+            elif not cascade:
+                # Master process failure
+                db.rollback()
+
+                if skip_undeletable:
+                    # Retry row by row
+                    errors = self.errors
+                    for row in batch:
+                        errors.pop((tablename, row[pkey]), None)
+                    num_deleted += self.delete_rows(batch,
+                                                    replaced_by = replaced_by,
+                                                    skip_undeletable = True,
+                                                    check_all = check_all,
+                                                    )
+                else:
+                    # Exit immediately
+                    self.log_errors()
+                    break
+            else:
+                # Cascade failure
+                # - will be rolled back by master process
+                break
+
+        return num_deleted
+
+    # -------------------------------------------------------------------------
+    def delete_batch(self, rows, replaced_by=None, check_all=False):
+        """
+            Delete/archive a batch of rows set-wise
+
+            Args:
+                rows: the Rows to delete
+                replaced_by: dict of {replaced_id: replacement_id}
+                check_all: process the entire cascade to reveal all errors
+
+            Returns:
+                True for success, False on error (caller must roll back)
+        """
+
+        success = True
+
+        if self.archive:
+            # Run automatic deletion cascade
+            success = self.cascade_bulk(rows, check_all=check_all)
+
+        if success:
+            # Unlink all super-records
+            success = self.delete_super_bulk(rows)
+
+        if success:
+            # Auto-delete linked records if appropriate
+            for row in rows:
+                self.auto_delete_linked(row)
+
+            # Archive/delete the rows themselves
+            if self.archive:
+                success = self.archive_records(rows, replaced_by=replaced_by)
+            else:
+                success = self.delete_records(rows)
+
+        return success
+
+    # -------------------------------------------------------------------------
+    def postprocess(self, row):
+        """
+            Post-process the deletion of a row: clear session, audit,
+            and run the ondelete-hook
+
+            Args:
+                row: the deleted Row
+        """
+
+        tablename = self.tablename
+        record_id = row[self.table._id.name]
+
+        # Clear session
+        if get_last_record_id(tablename) == record_id:
+            remove_last_record_id(tablename)
+
+        # Audit
+        resource = self.resource
+        current.audit("delete", resource.prefix, resource.name,
+                      record = record_id,
+                      representation = self.representation,
+                      )
+
+        # On-delete hook
+        ondelete = self.ondelete
+        if ondelete:
+            callback(ondelete, row)
+
+    # -------------------------------------------------------------------------
+    def accessible(self, record_ids):
+        """
+            Look up which records the current user is permitted to delete,
+            set-wise in batches (bulk mode)
+
+            Args:
+                record_ids: the record IDs
+
+            Returns:
+                set of permitted record IDs
+        """
+
+        table = self.table
+        query = current.auth.s3_accessible_query("delete", table)
+
+        accessible = set()
+
+        size = self.bulk
+        for index in range(0, len(record_ids), size):
+            batch = record_ids[index:index + size]
+            q = query & (table._id.belongs(batch))
+            rows = current.db(q).select(table._id)
+            accessible |= {row[table._id] for row in rows}
+
+        return accessible
+
     # -------------------------------------------------------------------------
     def extract(self):
         """
@@ -437,6 +650,187 @@ class DeleteProcess:
 
         return success
 
+    # -------------------------------------------------------------------------
+    def cascade_bulk(self, rows, check_all=False):
+        """
+            Run the automatic deletion cascade set-wise for a batch of
+            rows, with one query/process per reference
+
+            Args:
+                rows: the Rows to delete
+                check_all: process the entire cascade to reveal all
+                           errors (rather than breaking out of it after
+                           the first error)
+
+            Returns:
+                True for success, False on error
+        """
+
+        tablename = self.tablename
+        table = self.table
+        pkey = table._id.name
+        record_ids = [row[pkey] for row in rows]
+
+        success = True
+
+        db = current.db
+        define_resource = current.s3db.resource
+        add_error = self.add_error
+
+        references = self.references
+        for reference in references:
+
+            fn = reference.name
+            tn = reference.tablename
+            rtable = db[tn]
+
+            query = (reference.belongs(record_ids))
+            if tn == tablename:
+                query &= (reference != rtable._id)
+
+            ondelete = reference.ondelete
+            if ondelete == "CASCADE":
+                rresource = define_resource(tn,
+                                            filter = query,
+                                            unapproved = True,
+                                            )
+                delete = DeleteProcess(rresource,
+                                       archive = self.archive,
+                                       representation = self.representation,
+                                       bulk = self.bulk,
+                                       )
+                delete(cascade=True)
+                if delete.errors:
+                    success = False
+                    self.add_cascade_errors(reference, delete.errors, record_ids)
+                    if check_all:
+                        continue
+                    else:
+                        break
+            else:
+                if ondelete == "SET NULL":
+                    default = None
+                elif ondelete == "SET DEFAULT":
+                    default = reference.default
+                else:
+                    continue
+
+                if DELETED in rtable.fields:
+                    query &= rtable[DELETED] == False
+                try:
+                    db(query).update(**{fn: default})
+                except Exception:
+                    success = False
+                    error = sys.exc_info()[1]
+                    for record_id in record_ids:
+                        add_error(record_id, error)
+                    if check_all:
+                        continue
+                    else:
+                        break
+
+        return success
+
+    # -------------------------------------------------------------------------
+    def add_cascade_errors(self, reference, errors, record_ids):
+        """
+            Add the errors of a cascade process to the records the
+            failing records refer to
+
+            Args:
+                reference: the foreign key (Field) of the cascade
+                errors: the errors of the cascade process
+                record_ids: the IDs of the records deleted in this batch
+        """
+
+        rtable = reference.table
+        rtable_id = rtable._id
+
+        failed = [k[1] for k in errors]
+        rows = current.db(rtable_id.belongs(failed)).select(rtable_id,
+                                                            reference,
+                                                            )
+        referenced = {row[rtable_id]: row[reference] for row in rows}
+
+        add_error = self.add_error
+        for key, error in errors.items():
+            record_id = referenced.get(key[1])
+            if record_id in record_ids:
+                add_error(record_id, {key: error})
+            else:
+                # Cannot attribute the error to a particular record
+                for record_id in record_ids:
+                    add_error(record_id, {key: error})
+
+    # -------------------------------------------------------------------------
+    def delete_super_bulk(self, rows):
+        """
+            Remove the super-entity links of a batch of rows, and delete
+            the super-records set-wise
+
+            Args:
+                rows: the Rows to delete
+
+            Returns:
+                True for success, False on error
+        """
+
+        s3db = current.s3db
+
+        supertables = s3db.get_config(self.tablename, "super_entity")
+        if not supertables:
+            return True
+        if not isinstance(supertables, (list, tuple)):
+            supertables = [supertables]
+
+        db = current.db
+        table = self.table
+        pkey = table._id.name
+        record_ids = [row[pkey] for row in rows]
+
+        success = True
+        for sname in supertables:
+            stable = s3db.table(sname) if isinstance(sname, str) else sname
+            if stable is None:
+                continue
+            key = stable._id.name
+            if key not in table.fields:
+                continue
+
+            # Super-keys of the rows, as {super_id: record_id}
+            super_ids = {row[key]: row[pkey] for row in rows if row.get(key)}
+            if not super_ids:
+                continue
+
+            # Remove the super keys
+            db(table._id.belongs(record_ids)).update(**{key: None})
+
+            # Delete the super records
+            sresource = s3db.resource(stable,
+                                      filter = stable._id.belongs(list(super_ids)),
+                                      )
+            delete = DeleteProcess(sresource,
+                                   representation = self.representation,
+                                   bulk = self.bulk,
+                                   )
+            delete(cascade=True)
+            delete.log_errors()
+
+            # Identify the super records which have not been deleted
+            query = stable._id.belongs(list(super_ids))
+            if DELETED in stable.fields:
+                query &= (stable[DELETED] == False)
+            remaining = db(query).select(stable._id)
+            if remaining:
+                success = False
+                for row in remaining:
+                    self.add_error(super_ids[row[stable._id]],
+                                   "super-entity deletion failed",
+                                   )
+                break
+
+        return success
+
     # -------------------------------------------------------------------------
     def auto_delete_linked(self, row):
         """
@@ -498,6 +892,88 @@ class DeleteProcess:
                 True for success, False on error
         """
 
+        table = self.table
+
+        record_id = row[table._id.name]
+        data = self.archive_data(row, replaced_by=replaced_by)
+
+        try:
+            result = current.db(table._id == record_id).update(**data)
+        except Exception:
+            # Integrity Error
+            self.add_error(record_id, sys.exc_info()[1])
+            return False
+
+        if not result:
+            # Unknown Error
+            self.add_error(record_id, "archiving failed")
+            return False
+        else:
+            return True
+
+    # -------------------------------------------------------------------------
+    def archive_records(self, rows, replaced_by=None):
+        """
+            Archive ("soft-delete") a batch of records, with one update
+            per group of records with identical archive data
+
+            Args:
+                rows: the Rows to delete
+                replaced_by: dict of {replaced_id: replacement_id}, used \
+                             by record merger to log which record has replaced which
+
+            Returns:
+                True for success, False on error
+        """
+
+        table = self.table
+        pkey = table._id.name
+
+        # Group records by archive data
+        groups = {}
+        for row in rows:
+            data = self.archive_data(row, replaced_by=replaced_by)
+            key = tuple(sorted(data.items()))
+            if key in groups:
+                groups[key].append(row[pkey])
+            else:
+                groups[key] = [row[pkey]]
+
+        db = current.db
+        add_error = self.add_error
+
+        for data, record_ids in groups.items():
+            query = (table._id.belongs(record_ids))
+            try:
+                result = db(query).update(**dict(data))
+            except Exception:
+                # Integrity Error
+                error = sys.exc_info()[1]
+                for record_id in record_ids:
+                    add_error(record_id, error)
+                return False
+
+            if result != len(record_ids):
+                # Unknown Error
+                for record_id in record_ids:
+                    add_error(record_id, "archiving failed")
+                return False
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def archive_data(self, row, replaced_by=None):
+        """
+            Produce the update to archive a record
+
+            Args:
+                row: the Row to delete
+                replaced_by: dict of {replaced_id: replacement_id}
+
+            Returns:
+                the update data as dict
+        """
+
         table = self.table
         table_fields = table.fields
 
@@ -526,8 +1002,25 @@ class DeleteProcess:
             if rb:
                 data["deleted_rb"] = rb
 
+        return data
+
+    # -------------------------------------------------------------------------
+    def delete_record(self, row):
+        """
+            Delete a record
+
+            Args:
+                row: the Row to delete
+
+            Returns:
+                True for success, False on error
+        """
+
+        table = self.table
+        record_id = row[table._id.name]
+
         try:
-            result = current.db(table._id == record_id).update(**data)
+            result = current.db(table._id == record_id).delete()
         except Exception:
             # Integrity Error
             self.add_error(record_id, sys.exc_info()[1])
@@ -535,36 +1028,41 @@ class DeleteProcess:
 
         if not result:
             # Unknown Error
-            self.add_error(record_id, "archiving failed")
+            self.add_error(record_id, "deletion failed")
             return False
         else:
             return True
 
     # -------------------------------------------------------------------------
-    def delete_record(self, row):
+    def delete_records(self, rows):
         """
-            Delete a record
+            Delete a batch of records
 
             Args:
-                row: the Row to delete
+                rows: the Rows to delete
 
             Returns:
                 True for success, False on error
         """
 
         table = self.table
-        record_id = row[table._id.name]
+        record_ids = [row[table._id.name] for row in rows]
+
+        add_error = self.add_error
 
         try:
-            result = current.db(table._id == record_id).delete()
+            result = current.db(table._id.belongs(record_ids)).delete()
         except Exception:
             # Integrity Error
-            self.add_error(record_id, sys.exc_info()[1])
+            error = sys.exc_info()[1]
+            for record_id in record_ids:
+                add_error(record_id, error)
             return False
 
-        if not result:
+        if result != len(record_ids):
             # Unknown Error
-            self.add_error(record_id, "deletion failed")
+            for record_id in record_ids:
+                add_error(record_id, "deletion failed")
             return False
         else:
             return True
@@ -673,14 +1171,10 @@ class DeleteProcess:
             Introspect the resource to set process properties
         """
 
-        # Must load all models to detect dependencies
-        current.s3db.load_all_models()
+        # Must load all referencing models to detect dependencies
+        current.s3db.load_references(self.tablename)
 
         db = current.db
-        if db._lazy_tables:
-            # Must roll out all lazy tables to detect dependencies
-            for tn in list(db._LAZY_TABLES.keys()):
-                db[tn]
 
         references = self.table._referenced_by
         try:
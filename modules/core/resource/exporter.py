@@ -29,6 +29,13 @@ __all__ = ("DataExporter",)
 
 from gluon import current
 
+# Number of records per chunk in streaming exports
+CHUNK_SIZE = 1000
+
+# Maximum size of streaming export output kept in memory (before spooling
+# it to disk)
+SPOOL_SIZE = 4 * 1024 * 1024
+
 # =============================================================================
 class DataExporter:
     """
@@ -36,13 +43,16 @@ class DataExporter:
     """
 
     # -------------------------------------------------------------------------
-    @staticmethod
-    def csv(resource):
+    @classmethod
+    def csv(cls, resource, stream=False, chunk_size=CHUNK_SIZE):
         """
             Export resource as CSV
 
             Args:
                 resource: the resource to export
+                stream: extract and encode the data in chunks
+                        (bounded memory use, for large tables)
+                chunk_size: the number of records per chunk
 
             Note:
                 Export does not include components!
@@ -60,18 +70,50 @@ class DataExporter:
             response.headers["Content-Type"] = contenttype(".csv")
             response.headers["Content-disposition"] = "attachment; filename=%s" % filename
 
+        if stream:
+            return cls.stream(cls.csv_chunks(resource, chunk_size=chunk_size))
+
         rows = resource.select(None, as_rows=True)
         return str(rows)
 
     # -------------------------------------------------------------------------
     @staticmethod
-    def json(resource,
+    def csv_chunks(resource, chunk_size=CHUNK_SIZE):
+        """
+            Encode the resource data as CSV, chunk by chunk
+
+            Args:
+                resource: the resource to export
+                chunk_size: the number of records per chunk
+
+            Yields:
+                the CSV output, as bytes, per chunk of records
+        """
+
+        from io import StringIO
+
+        colnames = True
+        for rows in resource.select_chunks(None,
+                                           chunk_size = chunk_size,
+                                           as_rows = True,
+                                           ):
+            output = StringIO()
+            rows.export_to_csv_file(output, write_colnames=colnames)
+            colnames = False
+            yield output.getvalue().encode("utf-8")
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def json(cls,
+             resource,
              start=None,
              limit=None,
              fields=None,
              orderby=None,
              represent=False,
-             tooltip=None):
+             tooltip=None,
+             stream=False,
+             chunk_size=CHUNK_SIZE):
         """
             Export a resource as JSON
 
@@ -91,6 +133,10 @@ class DataExporter:
                          to return a dict {k:tooltip} => used by
                          filterOptionsS3 to extract onhover-tooltips for
                          Ajax-update of options
+                stream: extract and encode the data in chunks (bounded
+                        memory use, for large tables - only applies if
+                        neither start nor limit are specified)
+                chunk_size: the number of records per chunk
         """
 
         if fields is None:
@@ -105,24 +151,33 @@ class DataExporter:
         if orderby is None:
             orderby = resource.get_config("orderby", None)
 
-        tooltip_function = None
-        if tooltip:
-            if type(tooltip) is list:
-                tooltip = tooltip[-1]
-            import re
-            match = re.match(r"(\w+)\((\w+),(\w+)\)", tooltip)
-            if match:
-                function_name, kname, vname = match.groups()
-                # Try to resolve the function name
-                tooltip_function = current.s3db.get(function_name)
-                if tooltip_function:
-                    if kname not in fields:
-                        fields.append(kname)
-                    if vname not in fields:
-                        fields.append(vname)
-            else:
-                if tooltip not in fields:
-                    fields.append(tooltip)
+        tooltip = cls.json_tooltip(resource, fields, tooltip)
+
+        # Response headers
+        response = current.response
+        if response:
+            response.headers["Content-Type"] = "application/json"
+
+        from gluon.serializers import json as jsons
+
+        if stream and not start and limit is None:
+            # Extract, represent and encode chunk by chunk
+            def chunks():
+                yield b"["
+                separator = b""
+                for data in resource.select_chunks(fields,
+                                                   chunk_size = chunk_size,
+                                                   orderby = orderby,
+                                                   represent = represent,
+                                                   ):
+                    rows = cls.json_rows(resource, data.rows, tooltip)
+                    # Serialize the chunk, strip the list brackets
+                    output = jsons(rows)[1:-1]
+                    if output:
+                        yield separator + output.encode("utf-8")
+                        separator = b","
+                yield b"]"
+            return cls.stream(chunks())
 
         # Get the data
         _rows = resource.select(fields,
@@ -130,6 +185,68 @@ class DataExporter:
                                 limit=limit,
                                 orderby=orderby,
                                 represent=represent).rows
+        rows = cls.json_rows(resource, _rows, tooltip)
+
+        # Return as JSON
+        return jsons(rows)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def json_tooltip(resource, fields, tooltip):
+        """
+            Parse the tooltip parameter for JSON exports, and add the
+            fields required for the tooltip to the extraction fields
+
+            Args:
+                resource: the resource to export from
+                fields: the list of field selectors to extract (will
+                        be extended in-place as needed)
+                tooltip: the tooltip parameter (see json)
+
+            Returns:
+                tuple (tooltip, tooltip_function, kname, vname), or
+                None if no tooltip was requested
+        """
+
+        if not tooltip:
+            return None
+
+        tooltip_function = kname = vname = None
+
+        if type(tooltip) is list:
+            tooltip = tooltip[-1]
+        import re
+        match = re.match(r"(\w+)\((\w+),(\w+)\)", tooltip)
+        if match:
+            function_name, kname, vname = match.groups()
+            # Try to resolve the function name
+            tooltip_function = current.s3db.get(function_name)
+            if tooltip_function:
+                if kname not in fields:
+                    fields.append(kname)
+                if vname not in fields:
+                    fields.append(vname)
+        else:
+            if tooltip not in fields:
+                fields.append(tooltip)
+
+        return tooltip, tooltip_function, kname, vname
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def json_rows(resource, _rows, tooltip):
+        """
+            Simplify the extracted rows for JSON export, and add the
+            tooltips if requested
+
+            Args:
+                resource: the resource to export from
+                _rows: the extracted rows
+                tooltip: the parsed tooltip parameter (see json_tooltip)
+
+            Returns:
+                list of dicts {fieldname: value}
+        """
 
         # Simplify to plain fieldnames for fields in this table
         tn = "%s." % resource.tablename
@@ -145,6 +262,8 @@ class DataExporter:
             rappend(row)
 
         if tooltip:
+            tooltip, tooltip_function, kname, vname = tooltip
+
             if tooltip_function:
                 # Resolve key and value names against the resource
                 try:
@@ -202,13 +321,75 @@ class DataExporter:
                         if value:
                             row["_tooltip"] = s3_str(value)
 
-        # Return as JSON
+        return rows
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def stream(cls, chunks, max_size=SPOOL_SIZE):
+        """
+            Write the output chunks of a streaming export into a
+            temporary file, and return a streamer for the response body
+
+            Args:
+                chunks: iterable of output chunks (bytes)
+                max_size: the maximum output size to keep in memory,
+                          larger outputs get spooled to disk
+
+            Returns:
+                a generator streaming the output (as response body)
+
+            Note:
+                web2py commits and closes the database connections before
+                iterating over the response body, so the data must all
+                be extracted during the request - but since the chunks are
+                spooled rather than collected, memory use remains bounded
+        """
+
+        output = cls.spool(max_size=max_size)
+        for chunk in chunks:
+            output.write(chunk)
+
+        return cls.streamer(output)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def spool(max_size=SPOOL_SIZE):
+        """
+            Create a temporary file to write a streaming export into
+
+            Args:
+                max_size: the maximum output size to keep in memory,
+                          larger outputs get spooled to disk
+
+            Returns:
+                a SpooledTemporaryFile
+        """
+
+        from tempfile import SpooledTemporaryFile
+        return SpooledTemporaryFile(max_size=max_size)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def streamer(output):
+        """
+            Return a streamer for the response body from a temporary
+            file written by a streaming export
+
+            Args:
+                output: the temporary file (positioned at the end)
+
+            Returns:
+                a generator streaming the output (as response body)
+        """
+
+        from gluon.streamer import DEFAULT_CHUNK_SIZE, streamer
+
         response = current.response
         if response:
-            response.headers["Content-Type"] = "application/json"
+            response.headers["Content-Length"] = output.tell()
+        output.seek(0)
 
-        from gluon.serializers import json as jsons
-        return jsons(rows)
+        return streamer(output, chunk_size=DEFAULT_CHUNK_SIZE)
 
     # -------------------------------------------------------------------------
     @staticmethod
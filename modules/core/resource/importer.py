@@ -149,6 +149,7 @@ class XMLImporter:
                     select_items = None,
                     strategy = None,
                     sync_policy = None,
+                    resolved = None,
                     ):
         """
             Import data from an S3XML element tree.
@@ -169,6 +170,9 @@ class XMLImporter:
                                    (list of import item record IDs)
                 strategy: list of allowed import methods
                 sync_policy: the synchronization policy (SyncPolicy)
+                resolved: map of records imported from previous chunks
+                          of the same source, {(tablename, tuid): id}
+                          (see import_chunks)
         """
 
         db = current.db
@@ -203,6 +207,7 @@ class XMLImporter:
                                    files = files,
                                    strategy = strategy,
                                    sync_policy = sync_policy,
+                                   resolved = resolved,
                                    )
 
             # Add import items for matching elements
@@ -299,6 +304,101 @@ class XMLImporter:
 
         return result
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def import_chunks(cls,
+                      tablename,
+                      source,
+                      source_type = "csv",
+                      stylesheet = None,
+                      extra_data = None,
+                      chunk_size = 1000,
+                      components = None,
+                      ignore_errors = False,
+                      strategy = None,
+                      progress = None,
+                      **args):
+        """
+            Import a spreadsheet source (CSV/XLSX) in chunks of rows, i.e.
+            read, transform and import a limited number of rows at a time,
+            so that memory use does not grow with the size of the source
+
+            Args:
+                tablename: the name of the target table
+                source: the data source (file-like object)
+                source_type: the source type (csv|xlsx)
+                stylesheet: the transformation stylesheet
+                extra_data: dict of extra columns to add to each row
+                chunk_size: the number of rows per chunk
+                components: list of importable components
+                ignore_errors: ignore any errors, import what is possible
+                strategy: list of allowed import methods
+                progress: callback function to report progress after each
+                          chunk, progress(rows, result), receiving the number
+                          of rows processed so far and the ImportResult
+                args: parameters to pass to the transformation stylesheet
+
+            Returns:
+                ImportResult, combined over all chunks
+
+            Note:
+                - the chunks are imported within the same transaction,
+                  so a failing chunk rolls back the entire import
+                - records created by previous chunks are matched by uuid
+                  (database lookup) or by tuid (map of imported records),
+                  so references across chunk boundaries can be resolved
+        """
+
+        xml = current.xml
+
+        if source_type == "xlsx":
+            rows = xml.xlsx2rows(source, extra_data=extra_data)
+        else:
+            rows = xml.csv2rows(source, extra_data=extra_data)
+
+        resolved = {}
+        result = None
+        count = 0
+        for tree in xml.chunks(rows, chunk_size=chunk_size):
+
+            count += len(tree.getroot())
+
+            if stylesheet is not None:
+                prefix, name = tablename.split("_", 1)
+                args.update(domain = xml.domain,
+                            base_url = current.response.s3.base_url,
+                            prefix = prefix,
+                            name = name,
+                            utcnow = s3_format_datetime(),
+                            )
+                tree = xml.transform(tree, stylesheet, **args)
+                if not tree:
+                    raise SyntaxError(xml.error)
+
+            chunk_result = cls.import_tree(tablename,
+                                           tree,
+                                           components = components,
+                                           ignore_errors = ignore_errors,
+                                           strategy = strategy,
+                                           resolved = resolved,
+                                           )
+            if result is None:
+                result = chunk_result
+            else:
+                result.merge(chunk_result)
+
+            if progress:
+                progress(count, result)
+
+            if not chunk_result.success:
+                break
+
+        if result is None:
+            # Empty source
+            result = ImportResult(True)
+
+        return result
+
     # -------------------------------------------------------------------------
     @staticmethod
     def matching_elements(tree, tablename, record_id=None):
@@ -390,6 +490,37 @@ class ImportResult:
             self.mtime = None
             self.error_tree = None
 
+    # -------------------------------------------------------------------------
+    def merge(self, other):
+        """
+            Merge the result of another ImportJob into this result
+            (e.g. for chunked imports)
+
+            Args:
+                other: the other ImportResult
+        """
+
+        self.success = self.success and other.success
+        if other.error:
+            self.error = other.error
+
+        self.count += other.count
+        self.failed += other.failed
+        self.created.extend(other.created)
+        self.updated.extend(other.updated)
+        self.deleted.extend(other.deleted)
+
+        mtime = other.mtime
+        if mtime and (self.mtime is None or mtime > self.mtime):
+            self.mtime = mtime
+
+        error_tree = other.error_tree
+        if error_tree is not None and len(error_tree):
+            if self.error_tree is None:
+                self.error_tree = error_tree
+            else:
+                self.error_tree.extend(list(error_tree))
+
     # -------------------------------------------------------------------------
     def json_message(self):
         """
@@ -440,6 +571,7 @@ class ImportJob():
                  job_id = None,
                  strategy = None,
                  sync_policy = None,
+                 resolved = None,
                  ):
         """
             Args:
@@ -448,6 +580,10 @@ class ImportJob():
                 job_id: restore job from database (record ID or job_id)
                 strategy: the import strategy
                 sync_policy: the synchronization policy
+                resolved: map of records imported by previous jobs of
+                          the same import (chunked imports), to resolve
+                          tuid-references to them, {(tablename, tuid): id};
+                          will be extended with the records of this job
         """
 
         self.error = None # the last error
@@ -459,6 +595,7 @@ class ImportJob():
         self.directory = Storage()
 
         self._uidmap = None
+        self.resolved = resolved
 
         # Mandatory fields
         self.mandatory_fields = Storage()
@@ -857,6 +994,7 @@ class ImportJob():
         if tree is not None:
             root = tree if isinstance(tree, etree._Element) else tree.getroot()
         uidmap = self.uidmap
+        resolved = self.resolved
 
         references = [lookup] if lookup else element.findall("reference")
         for reference in references:
@@ -968,6 +1106,12 @@ class ImportJob():
                             _uid = import_uid(uid)
                             if _uid and _uid in id_map:
                                 _id = id_map[_uid]
+                            elif attr != UID and resolved:
+                                # Record imported by a previous job?
+                                _id = resolved.get((tablename, uid))
+                            else:
+                                _id = None
+                            if _id:
                                 entry = Storage(tablename = tablename,
                                                 element = None,
                                                 uid = uid,
@@ -1055,7 +1199,7 @@ class ImportJob():
         return True
 
     # -------------------------------------------------------------------------
-    def commit(self, ignore_errors=False, log_items=None):
+    def commit(self, ignore_errors=False, log_items=None, bulk=None):
         """
             Commit the import job to the DB
 
@@ -1064,17 +1208,27 @@ class ImportJob():
                                (does still report the errors)
                 log_items: callback function to log import items
                            before committing them
+                bulk: commit items in batches (see ImportBatch),
+                      defaults to deployment setting
         """
 
         ATTRIBUTE = current.xml.ATTRIBUTE
         METHOD = ImportItem.METHOD
 
+        if bulk is None:
+            bulk = current.deployment_settings.get_base_import_bulk_commit()
+
         # Resolve references
         import_list = []
         for item_id in self.items:
             self.resolve(item_id, import_list)
             if item_id not in import_list:
                 import_list.append(item_id)
+
+        # Batches of mutually independent items (bulk), otherwise
+        # all items in one batch
+        batches = self.batches(import_list) if bulk else [import_list]
+
         # Commit the items
         items = self.items
         count = 0
@@ -1088,49 +1242,94 @@ class ImportJob():
 
         self.log = log_items
         failed = False
-        for item_id in import_list:
-            item = items[item_id]
-            error = None
 
-            if item.accepted is not False:
-                logged = False
-                success = item.commit(ignore_errors=ignore_errors)
+        index = 0
+        while index < len(batches):
+            batch_items = batches[index]
+            index += 1
+
+            # Items that failed field validation
+            invalid = {item_id for item_id in batch_items
+                               if items[item_id].accepted is False}
+
+            if bulk:
+                batch = ImportBatch(self)
+                postponed = batch.prepare(batch_items)
+                if postponed:
+                    # Commit in-batch duplicates separately
+                    batch_items = [item_id for item_id in batch_items
+                                           if item_id not in postponed]
+                    batches.insert(index, postponed)
             else:
-                # Field validation failed
-                logged = True
-                success = ignore_errors
+                batch = None
 
-            if not success:
-                failed = True
+            results = []
+            for item_id in batch_items:
+                item = items[item_id]
 
-            error = item.error
-            if error:
-                current.log.error(error)
-                self.error = error
-                element = item.element
-                if element is not None:
-                    if not element.get(ATTRIBUTE.error, False):
-                        element.set(ATTRIBUTE.error, s3_str(error))
-                    if not logged:
-                        self.error_tree.append(deepcopy(element))
-                if item.tablename == tablename:
-                    errors += 1
-
-            elif item.tablename == tablename:
-                count += 1
-                if mtime is None or item.mtime > mtime:
-                    mtime = item.mtime
-                if item.id:
-                    if item.method == METHOD.CREATE:
-                        cappend(item.id)
-                    elif item.method == METHOD.UPDATE:
-                        updated.append(item.id)
-                    elif item.method in (METHOD.MERGE, METHOD.DELETE):
-                        deleted.append(item.id)
+                if item_id not in invalid:
+                    logged = False
+                    success = item.commit(ignore_errors = ignore_errors,
+                                          batch = batch,
+                                          )
+                else:
+                    # Field validation failed
+                    logged = True
+                    success = ignore_errors
+                results.append((item, logged, success))
+
+            if batch:
+                # Write deferred inserts, then run post-processing
+                batch.flush()
+
+            for item, logged, success in results:
+
+                if batch and item in batch.failed:
+                    # Deferred insert failed
+                    success = ignore_errors
+                if not success:
+                    failed = True
+
+                error = item.error
+                if error:
+                    current.log.error(error)
+                    self.error = error
+                    element = item.element
+                    if element is not None:
+                        if not element.get(ATTRIBUTE.error, False):
+                            element.set(ATTRIBUTE.error, s3_str(error))
+                        if not logged:
+                            self.error_tree.append(deepcopy(element))
+                    if item.tablename == tablename:
+                        errors += 1
+
+                elif item.tablename == tablename:
+                    count += 1
+                    if mtime is None or item.mtime > mtime:
+                        mtime = item.mtime
+                    if item.id:
+                        if item.method == METHOD.CREATE:
+                            cappend(item.id)
+                        elif item.method == METHOD.UPDATE:
+                            updated.append(item.id)
+                        elif item.method in (METHOD.MERGE, METHOD.DELETE):
+                            deleted.append(item.id)
 
         if failed:
             return False
 
+        # Remember the records with a tuid, so that subsequent jobs
+        # of the same import can resolve references to them
+        resolved = self.resolved
+        if resolved is not None:
+            TUID = ATTRIBUTE.tuid
+            for item in items.values():
+                element = item.element
+                if item.id and element is not None:
+                    tuid = element.get(TUID)
+                    if tuid:
+                        resolved[(item.tablename, tuid)] = item.id
+
         self.count = count
         self.errors = errors
         self.mtime = mtime
@@ -1139,6 +1338,39 @@ class ImportJob():
         self.deleted = deleted
         return True
 
+    # -------------------------------------------------------------------------
+    def batches(self, import_list):
+        """
+            Splits the (dependency-ordered) import list into batches of
+            items that do not reference each other, so that each batch
+            can be committed in bulk after all its predecessors
+
+            Args:
+                import_list: the ordered list of items (UIDs) to import
+
+            Returns:
+                list of lists of item UIDs, in commit order
+        """
+
+        items = self.items
+
+        levels = {}
+        batches = []
+        for item_id in import_list:
+            level = 0
+            for reference in items[item_id].references:
+                entry = reference.entry
+                ritem_id = entry.item_id if entry else None
+                if ritem_id in levels:
+                    level = max(level, levels[ritem_id] + 1)
+            levels[item_id] = level
+            if level == len(batches):
+                batches.append([item_id])
+            else:
+                batches[level].append(item_id)
+
+        return batches
+
     # -------------------------------------------------------------------------
     def store(self):
         """
@@ -1314,6 +1546,9 @@ class ImportItem:
         self.parent = None
         self.skip = False
 
+        # Deduplicated by batch lookup (ImportBatch)
+        self.deduplicated = False
+
         # Conflict handling
         self.mci = 2
         self.mtime = datetime.datetime.utcnow()
@@ -1519,7 +1754,7 @@ class ImportItem:
             else:
                 # Use the resource's deduplicator to identify the original
                 resolve = current.s3db.get_config(self.tablename, "deduplicate")
-                if data and resolve:
+                if data and resolve and not self.deduplicated:
                     resolve(self)
 
             if self.id and self.method in (UPDATE, DELETE, MERGE):
@@ -1735,12 +1970,13 @@ class ImportItem:
         return accepted
 
     # -------------------------------------------------------------------------
-    def commit(self, ignore_errors=False):
+    def commit(self, ignore_errors=False, batch=None):
         """
             Commit this item to the database
 
             Args:
                 ignore_errors: skip invalid components (still reports errors)
+                batch: the ImportBatch to defer inserts to (bulk commit)
         """
 
         if self.committed:
@@ -2005,6 +2241,10 @@ class ImportItem:
                 if MCI in table.fields:
                     data[MCI] = self.mci
 
+                # Defer the insert to the batch, if possible
+                if batch is not None and batch.defer(self, data):
+                    return True
+
                 # Insert the new record
                 try:
                     success = table.insert(**dict(data))
@@ -2098,6 +2338,31 @@ class ImportItem:
         else:
             raise RuntimeError("unknown import method: %s" % method)
 
+        self.postprocess(enforce_realm_update=enforce_realm_update)
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def postprocess(self, enforce_realm_update=False):
+        """
+            Post-process this item after it has been written to the
+            database: audit, super-entity links, ownership, onaccept,
+            and updates of referencing items
+
+            Args:
+                enforce_realm_update: force update of the realm entity
+        """
+
+        db = current.db
+        s3db = current.s3db
+
+        MTIME = current.xml.MTIME
+        METHOD = self.METHOD
+
+        method = self.method
+        table = self.table
+        tablename = self.tablename
+
         # Audit + onaccept on successful commits
         if self.committed:
 
@@ -2128,10 +2393,10 @@ class ImportItem:
 
             # Update super entity links
             s3db.update_super(table, form.vars)
-            if method == CREATE:
+            if method == METHOD.CREATE:
                 # Set record owner
                 current.auth.s3_set_record_owner(table, self.id)
-            elif method == UPDATE:
+            elif method == METHOD.UPDATE:
                 # Update realm
                 update_realm = enforce_realm_update or \
                                s3db.get_config(table, "update_realm")
@@ -2179,8 +2444,6 @@ class ImportItem:
                     # Target field is a reference or list:reference
                     item._update_reference(fkey, ref_id)
 
-        return True
-
     # -------------------------------------------------------------------------
     def _dynamic_defaults(self, data):
         """
@@ -2320,7 +2583,8 @@ class ImportItem:
                     update = {"item": self, "field": fkey}
                     if is_json:
                         update["refkey"] = refkey
-                    item.update.append(update)
+                    if update not in item.update:
+                        item.update.append(update)
 
     # -------------------------------------------------------------------------
     def _update_reference(self, field, value):
@@ -2552,6 +2816,217 @@ class ImportItem:
             return False
         return True
 
+# =============================================================================
+class ImportBatch:
+    """
+        Helper to commit a batch of mutually independent import items in
+        bulk (ImportJob.commit with bulk=True):
+
+            - deduplication with one query per table (S3Duplicate.bulk)
+              rather than one query per item
+            - inserts of new records deferred and written per table
+            - post-processing (audit, super-entities, ownership, onaccept)
+              of the inserted records after all inserts
+
+        Note:
+            - items with a UID (e.g. sync imports) are not passed to
+              the batch deduplication (unless synchronise_uuids), since
+              their original record is identified by UID during parsing
+              (one query per item), and a UID without a match always
+              means a new record; their inserts are still deferred
+    """
+
+    def __init__(self, job):
+        """
+            Args:
+                job: the ImportJob
+        """
+
+        self.job = job
+
+        self.tables = set()
+        self.inserts = {}
+        self.failed = set()
+
+    # -------------------------------------------------------------------------
+    def prepare(self, item_ids):
+        """
+            Resolves references and deduplicates the items in this batch,
+            grouped by table
+
+            Args:
+                item_ids: the item UIDs in this batch
+
+            Returns:
+                list of UIDs of items that must be postponed to a
+                subsequent batch since they could be duplicates of
+                other items in this batch
+        """
+
+        s3db = current.s3db
+        xml = current.xml
+
+        UID = xml.UID
+        DELETED = xml.DELETED
+
+        synchronise_uuids = current.response.s3.synchronise_uuids
+
+        items = self.job.items
+
+        # Group the items by table
+        groups = {}
+        for item_id in item_ids:
+            item = items[item_id]
+            if item.table is None or item.accepted is False or item.committed:
+                continue
+            tablename = item.tablename
+            if tablename in groups:
+                groups[tablename].append(item)
+            else:
+                groups[tablename] = [item]
+
+        postponed = []
+        for tablename, group in groups.items():
+
+            resolve = s3db.get_config(tablename, "deduplicate")
+            if resolve and not isinstance(resolve, S3Duplicate):
+                # Custom deduplicator may depend on previously
+                # written items => do not defer inserts
+                continue
+            self.tables.add(tablename)
+            if not resolve:
+                continue
+
+            table = group[0].table
+            pkeys = [fn for fn in table.fields if table[fn].unique and fn != UID]
+
+            candidates = []
+            for item in group:
+                # Only items that would be passed to the deduplicator
+                data = item.data
+                if item.id or item.original is not None or not data or \
+                   data.get(DELETED) or \
+                   UID in data and not synchronise_uuids or \
+                   any(data.get(fn) for fn in pkeys):
+                    continue
+                if item.parent is not None and item.parent.skip:
+                    continue
+                item._resolve_references()
+                candidates.append(item)
+
+            if candidates:
+                duplicates = resolve.bulk(candidates)
+                if duplicates:
+                    candidates = [item for item in candidates
+                                       if item not in duplicates]
+                    postponed.extend(item.item_id for item in duplicates)
+                self.originals(table, candidates)
+
+        return postponed
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def originals(table, items):
+        """
+            Loads the original records for items matched by the batch
+            deduplication, with one query
+
+            Args:
+                table: the Table
+                items: the ImportItems
+        """
+
+        from ..resource import CRUDResource
+
+        UID = current.xml.UID
+        synchronise_uuids = current.response.s3.synchronise_uuids
+
+        matched = {}
+        fnames = set()
+        mandatory = None
+        for item in items:
+            item.deduplicated = True
+            if item.id:
+                matched[item.id] = item
+                fnames |= set(item.data.keys())
+                if mandatory is None:
+                    mandatory = item._mandatory_fields()
+        if not matched:
+            return
+
+        fields = CRUDResource.import_fields(table, fnames, mandatory=mandatory)
+        rows = current.db(table._id.belongs(set(matched))).select(*fields)
+
+        for row in rows:
+            item = matched[row[table._id.name]]
+            item.original = row
+            # Retain the original UUID (except in synchronise_uuids mode)
+            if not synchronise_uuids and UID in row:
+                item.uid = item.data[UID] = row[UID]
+
+    # -------------------------------------------------------------------------
+    def defer(self, item, data):
+        """
+            Defers the insert of a new record to the end of the batch
+
+            Args:
+                item: the ImportItem
+                data: the record data
+
+            Returns:
+                True if the insert was deferred, False if the item must
+                be written immediately
+        """
+
+        tablename = item.tablename
+        if tablename not in self.tables:
+            return False
+
+        inserts = self.inserts
+        if tablename in inserts:
+            inserts[tablename].append((item, data))
+        else:
+            inserts[tablename] = [(item, data)]
+        return True
+
+    # -------------------------------------------------------------------------
+    def flush(self):
+        """
+            Writes all deferred inserts (grouped by table), and then
+            post-processes the inserted items in import order
+
+            Note:
+                - the records are inserted one by one (pydal's bulk_insert
+                  does the same on SQL backends, but would lose track of
+                  which records had been written if one of them fails)
+                - a failed insert is reported as error of the item, and
+                  all other inserted items are still post-processed; on
+                  backends which abort the transaction after an error
+                  (e.g. PostgreSQL) all subsequent inserts fail too, so
+                  that the job fails as with per-item commits
+        """
+
+        inserted = []
+        for entries in self.inserts.values():
+
+            table = entries[0][0].table
+            for item, data in entries:
+                try:
+                    record_id = table.insert(**dict(data))
+                except:
+                    item.error = sys.exc_info()[1]
+                    item.skip = True
+                    self.failed.add(item)
+                    continue
+                if record_id:
+                    item.id = record_id
+                    item.committed = True
+                    inserted.append(item)
+        self.inserts = {}
+
+        for item in inserted:
+            item.postprocess()
+
 # =============================================================================
 class SyncPolicy:
     """ Synchronization Policy """
@@ -2845,6 +3320,139 @@ class S3Duplicate:
         # For uses outside of imports:
         return duplicate
 
+    # -------------------------------------------------------------------------
+    def bulk(self, items, chunk_size=500):
+        """
+            Entry point for bulk import: deduplicates multiple items of
+            the same table with one query per chunk of items (rather than
+            one query per item), with the same effect as calling this
+            deduplicator for each item
+
+            Args:
+                items: list of ImportItems (same table)
+                chunk_size: max number of items per query
+
+            Returns:
+                list of items that could be duplicates of other items
+                in the list (and hence must be deduplicated again after
+                those have been written)
+
+            Raises:
+                SyntaxError: if any of the query fields doesn't exist in
+                             the item table
+        """
+
+        if not items:
+            return []
+
+        table = items[0].table
+        error = "Invalid field for duplicate detection: %s (%s)"
+
+        primary = sorted(self.primary)
+        secondary = sorted(self.secondary)
+        for fname in primary + secondary:
+            if fname not in table.fields:
+                raise SyntaxError(error % (fname, table))
+
+        # Items with the same primary values as a previous item without
+        # match in the database must wait until that item is written
+        seen = set()
+        duplicates = []
+
+        db = current.db
+        key = self.key
+        for index in range(0, len(items), chunk_size):
+            chunk = items[index:index + chunk_size]
+
+            # Query for candidates by the first primary field
+            field = table[primary[0]]
+            lower = self.ignore_case and str(field.type) in ("string", "text")
+            values = set()
+            query = None
+            for item in chunk:
+                value = item.data.get(field.name)
+                if value is None:
+                    query = (field == None)
+                elif lower and hasattr(value, "lower"):
+                    values.add(s3_str(value).lower())
+                else:
+                    values.add(value)
+            if values:
+                q = field.lower().belongs(values) if lower else field.belongs(values)
+                query = q if query is None else query | q
+            if self.ignore_deleted and "deleted" in table.fields:
+                query &= (table.deleted == False)
+
+            fields = [table._id] + [table[fn] for fn in primary + secondary]
+            rows = db(query).select(*fields, orderby=table._id)
+
+            # Index the candidates by their primary values
+            candidates = {}
+            for row in rows:
+                keys = tuple(key(table[fn], row[fn]) for fn in primary)
+                if keys in candidates:
+                    candidates[keys].append(row)
+                else:
+                    candidates[keys] = [row]
+
+            # Match the items
+            for item in chunk:
+                data = item.data
+
+                keys = tuple(key(table[fn], data.get(fn)) for fn in primary)
+                if keys in seen:
+                    duplicates.append(item)
+                    continue
+
+                duplicate = None
+                for row in candidates.get(keys, ()):
+                    if all(key(table[fn], row[fn]) == key(table[fn], data.get(fn))
+                           for fn in secondary if data.get(fn)):
+                        duplicate = row
+                        break
+
+                if duplicate:
+                    item.id = duplicate[table._id]
+                    if not data.deleted:
+                        item.method = item.METHOD.UPDATE
+                    if self.noupdate:
+                        item.skip = True
+                    continue
+
+                seen.add(keys)
+                if self.nomatch_require:
+                    if any(k not in data for k in self.nomatch_require):
+                        error = "Invalid reference"
+                        item.accepted = False
+                        item.error = error
+                        if item.element is not None:
+                            item.element.set(current.xml.ATTRIBUTE["error"], error)
+
+        return duplicates
+
+    # -------------------------------------------------------------------------
+    def key(self, field, value):
+        """
+            Helper function to normalize a value for matching in bulk(),
+            equivalent to match()
+
+            Args:
+                field: the Field
+                value: the value
+
+            Returns:
+                the normalized value
+        """
+
+        if value is None:
+            return None
+
+        if self.ignore_case and \
+           hasattr(value, "lower") and str(field.type) in ("string", "text"):
+            return s3_str(value).lower()
+
+        return s3_str(value)
+
     # -------------------------------------------------------------------------
     def match(self, field, value):
         """
@@ -324,10 +324,77 @@ class S3FieldPath:
         tokens = re.split(r"(\.|\$)", selector)
         if tail:
             tokens.extend(tail)
+
+        # Field paths which do not depend on the resource instance
+        # (i.e. not starting with a component or context) can be reused
+        table = resource.table
+        head = tokens[0]
+        if head and head[0] == "(" or \
+           len(tokens) > 1 and tokens[1] != "$" and head != "~":
+            key = None
+        else:
+            key = (table._tablename, selector, tuple(tail) if tail else None)
+            cached = cls.cached(table, key)
+            if cached:
+                return cached
+
         parser = cls(resource, None, tokens)
         parser.original = selector
+
+        if key:
+            cls.cache(table, key, parser)
         return parser
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def cached(table, key):
+        """
+            Looks up a previously resolved field path
+
+            Args:
+                table: the Table the path has been resolved against
+                key: the cache key
+
+            Returns:
+                the S3FieldPath, or None if not found
+        """
+
+        fieldpaths = current.model.get("fieldpaths")
+        if fieldpaths:
+            entry = fieldpaths.get(key)
+            if entry and entry[0] is table:
+                return entry[1]
+        return None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def cache(table, key, fieldpath):
+        """
+            Stores a resolved field path for reuse
+
+            Args:
+                table: the Table the path has been resolved against
+                key: the cache key
+                fieldpath: the S3FieldPath
+
+            Note:
+                - the cache lives in current.model, next to the model
+                  configuration it depends on, and is invalidated by
+                  DataModel whenever components or contexts are configured
+                - cached field paths are shared, and must therefore be
+                  treated as immutable
+                - virtual fields which are not yet defined are not cached
+        """
+
+        if fieldpath.virtual and fieldpath.method is None:
+            return
+
+        model = current.model
+        fieldpaths = model.get("fieldpaths")
+        if fieldpaths is None:
+            fieldpaths = model["fieldpaths"] = {}
+        fieldpaths[key] = (table, fieldpath)
+
     # -------------------------------------------------------------------------
     def __init__(self, resource, table, tokens):
         """
@@ -400,7 +467,7 @@ class S3FieldPath:
 
                 if join is not None:
                     self.joins[ktable._tablename] = join
-                tail = S3FieldPath(None, ktable, tokens)
+                tail = self.resolve_tail(ktable, tokens)
 
             else:
                 raise SyntaxError("trailing operator")
@@ -438,6 +505,29 @@ class S3FieldPath:
 
             self.joins.update(tail.joins)
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def resolve_tail(cls, table, tokens):
+        """
+            Resolve the remainder of a field path against a table that
+            has been joined by the preceding parts (independently of the
+            resource instance, and hence reusable)
+
+            Args:
+                table: the joined Table
+                tokens: the remaining tokens
+
+            Returns:
+                the S3FieldPath
+        """
+
+        key = (table._tablename, None, "".join(tokens))
+        tail = cls.cached(table, key)
+        if not tail:
+            tail = cls(None, table, tokens)
+            cls.cache(table, key, tail)
+        return tail
+
     # -------------------------------------------------------------------------
     @staticmethod
     def _resolve_field(table, fieldname):
@@ -653,7 +743,7 @@ class S3ResourceField:
         self.fname = lf.fname
         self.colname = lf.colname
 
-        self._joins = lf.joins
+        self._joins = dict(lf.joins)
 
         self.distinct = lf.distinct
         self.multiple = lf.multiple
@@ -1619,7 +1709,9 @@ class S3ResourceQuery:
                 r: the right operand
         """
 
-        hierarchy, field, nodeset, none = self._resolve_hierarchy(l, r)
+        hierarchy, field, nodeset, none = self._resolve_hierarchy(l, r,
+                                                                  subselect = True,
+                                                                  )
         if not hierarchy:
             # Not a hierarchical query => use simple belongs
             return self._query_belongs(l, r)
@@ -1632,6 +1724,9 @@ class S3ResourceQuery:
         if nodeset:
             if list_type:
                 q = (field.contains(list(nodeset)))
+            elif isinstance(nodeset, str):
+                # Nested SELECT from the closure table
+                q = (field.belongs(nodeset))
             elif len(nodeset) > 1:
                 q = (field.belongs(nodeset))
             else:
@@ -1654,13 +1749,15 @@ class S3ResourceQuery:
 
     # -------------------------------------------------------------------------
     @classmethod
-    def _resolve_hierarchy(cls, l, r):
+    def _resolve_hierarchy(cls, l, r, subselect=False):
         """
             Resolve the hierarchical lookup in a typeof-query
 
             Args:
                 l: the left operand
                 r: the right operand
+                subselect: return the node set as nested SELECT from
+                           the closure table if the hierarchy uses one
         """
 
         from ..tools import S3Hierarchy
@@ -1736,7 +1833,10 @@ class S3ResourceQuery:
                         continue
                     nodes.add(node_id)
             if hierarchy.config is not None:
-                nodeset = hierarchy.findall(nodes, inclusive=True)
+                if subselect and nodes and not list_type and hierarchy.closure:
+                    nodeset = hierarchy.subtree(nodes)
+                else:
+                    nodeset = hierarchy.findall(nodes, inclusive=True)
             else:
                 nodeset = nodes
 
@@ -1854,9 +1954,29 @@ class S3ResourceQuery:
                 return l.belongs(set())
 
         else:
-            # Ignore sub-query for non-spatial DB
             expr = False
 
+            # Use the in-memory spatial index, if available
+            from ..gis.spatialindex import SpatialIndex
+            index = SpatialIndex.get_index()
+            if index and l.tablename == "gis_location" and isinstance(r, str):
+                from shapely.wkt import loads as wkt_loads
+                try:
+                    shape = wkt_loads(r)
+                except Exception:
+                    current.log.error("INTERSECTS: %s" % sys.exc_info()[1])
+                    expr = l.belongs(set())
+                else:
+                    from ..gis.base import MAX_INDEX_IDS
+                    location_ids = index.intersecting(shape, limit=MAX_INDEX_IDS)
+                    if location_ids is not None:
+                        expr = l.table._id.belongs(location_ids)
+                    else:
+                        # Too many candidates => bounding box query
+                        expr = current.gis.query_features_by_bbox(*shape.bounds)
+
+            # Otherwise ignore sub-query for non-spatial DB
+
         return expr
 
     # -------------------------------------------------------------------------
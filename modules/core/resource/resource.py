@@ -463,6 +463,7 @@ class CRUDResource:
                represent = False,
                show_links = True,
                raw_data = False,
+               seek = None,
                ):
         """
             Extract data from this resource
@@ -481,6 +482,8 @@ class CRUDResource:
                 as_rows: return the rows (don't extract)
                 represent: render field value representations
                 raw_data: include raw data in the result
+                seek: keyset pagination, the ORDERBY values of the last
+                      record of the previous page (see ResourceData)
         """
 
         data = ResourceData(self,
@@ -498,12 +501,81 @@ class CRUDResource:
                             represent = represent,
                             show_links = show_links,
                             raw_data = raw_data,
+                            seek = seek,
                             )
         if as_rows:
             return data.rows
         else:
             return data
 
+    # -------------------------------------------------------------------------
+    def select_chunks(self,
+                      fields,
+                      chunk_size = 1000,
+                      left = None,
+                      orderby = None,
+                      distinct = False,
+                      virtual = True,
+                      as_rows = False,
+                      represent = False,
+                      show_links = True,
+                      raw_data = False,
+                      ):
+        """
+            Extract data from this resource in chunks of limited size,
+            e.g. to stream large exports with bounded memory use
+
+            Args:
+                fields: the fields to extract (selector strings)
+                chunk_size: the maximum number of records per chunk
+                (other parameters see select)
+
+            Yields:
+                ResourceData (or Rows if as_rows) for each chunk
+
+            Note:
+                Uses keyset pagination where the orderby allows it, so
+                that every chunk costs the same regardless of its position;
+                otherwise falls back to start/limit pagination
+        """
+
+        seek = ()
+        start = 0
+
+        while True:
+            data = ResourceData(self,
+                                fields,
+                                start = start,
+                                limit = chunk_size,
+                                left = left,
+                                orderby = orderby,
+                                distinct = distinct,
+                                virtual = virtual,
+                                as_rows = as_rows,
+                                represent = represent,
+                                show_links = show_links,
+                                raw_data = raw_data,
+                                seek = seek,
+                                )
+            rows = data.rows
+            if not rows:
+                break
+
+            yield rows if as_rows else data
+
+            if not as_rows and len(rows) < chunk_size:
+                # Last chunk
+                break
+
+            if data.keyset is None:
+                # Keyset pagination not possible with this orderby
+                seek = None
+                start += chunk_size
+            elif data.seek:
+                seek = data.seek
+            else:
+                break
+
     # -------------------------------------------------------------------------
     def insert(self, **fields):
         """
@@ -866,6 +938,8 @@ class CRUDResource:
                   orderby = None,
                   distinct = False,
                   list_id = None,
+                  seek = None,
+                  count = True,
                   ):
         """
             Generate a data table of this resource
@@ -878,10 +952,15 @@ class CRUDResource:
                 orderby: orderby for DB query
                 distinct: distinct-flag for DB query
                 list_id: the datatable ID
+                seek: keyset pagination (see ResourceData), the keyset
+                      values for the next page will be stored as
+                      DataTable.seek
+                count: count the number of matching rows
 
             Returns:
                 tuple (DataTable, numrows), where numrows represents
                 the total number of rows in the table that match the query
+                (None if count is False)
         """
 
         # Choose fields
@@ -909,9 +988,10 @@ class CRUDResource:
                            orderby = orderby,
                            left = left,
                            distinct = distinct,
-                           count = True,
+                           count = count,
                            getids = False,
                            represent = True,
+                           seek = seek,
                            )
 
         rows = data.rows
@@ -922,8 +1002,10 @@ class CRUDResource:
         # Generate the data table
         rfields = data.rfields
         dt = DataTable(rfields, rows, list_id, orderby=orderby)
+        if data.keyset:
+            dt.seek = data.seek
 
-        return dt, data.numrows
+        return dt, data.numrows if count else None
 
     # -------------------------------------------------------------------------
     def datalist(self,
@@ -935,6 +1017,8 @@ class CRUDResource:
                  distinct = False,
                  list_id = None,
                  layout = None,
+                 seek = None,
+                 count = True,
                  ):
         """
             Generate a data list of this resource
@@ -948,10 +1032,15 @@ class CRUDResource:
                 distinct: distinct-flag for DB query
                 list_id: the list identifier
                 layout: custom renderer function (see S3DataList.render)
+                seek: keyset pagination (see ResourceData), the keyset
+                      values for the next page will be stored as
+                      S3DataList.seek
+                count: count the number of matching rows
 
             Returns:
                 tuple (S3DataList, numrows, ids), where numrows represents
                 the total number of rows in the table that match the query
+                (None if count is False)
         """
 
         # Choose fields
@@ -974,14 +1063,15 @@ class CRUDResource:
                            orderby = orderby,
                            left = left,
                            distinct = distinct,
-                           count = True,
+                           count = count,
                            getids = False,
                            raw_data = True,
                            represent = True,
+                           seek = seek,
                            )
 
         # Generate the data list
-        numrows = data.numrows
+        numrows = data.numrows if count else None
         dl = S3DataList(self,
                         fields,
                         data.rows,
@@ -991,6 +1081,8 @@ class CRUDResource:
                         total = numrows,
                         layout = layout,
                         )
+        if data.keyset:
+            dl.seek = data.seek
 
         return dl, numrows
 
@@ -1474,6 +1566,7 @@ class CRUDResource:
                    location_data = None,
                    map_data = None,
                    target = None,
+                   stream = False,
                    **args):
         """
             Export this resource as S3XML
@@ -1511,6 +1604,11 @@ class CRUDResource:
                                looked-up in bulk ready for xml.gis_encode()
                 map_data: dictionary of options which can be read by the map
                 target: alias of component targetted (or None to target master resource)
+                stream: export the records in chunks (bounded memory use,
+                        for large exports), and return a streamer for the
+                        response body - only applies to plain S3XML (i.e.
+                        without stylesheet, as_tree or as_json), chunk size
+                        can be given as integer
                 args: dict of arguments to pass to the XSLT stylesheet
         """
 
@@ -1532,6 +1630,31 @@ class CRUDResource:
                                map_data = map_data,
                                )
 
+        if stream and xmlformat is None and not as_tree and not as_json:
+            # Write the elements incrementally
+            from .exporter import DataExporter
+            from .rtb import CHUNK_SIZE
+            output = DataExporter.spool()
+            chunk_size = stream if type(stream) is int else CHUNK_SIZE
+            rtree.stream(output,
+                         start = start,
+                         limit = limit,
+                         msince = msince,
+                         fields = fields,
+                         dereference = dereference,
+                         maxdepth = maxdepth,
+                         mcomponents = mcomponents,
+                         rcomponents = rcomponents,
+                         references = references,
+                         sync_filters = filters,
+                         mdata = mdata,
+                         maxbounds = maxbounds,
+                         target = target,
+                         pretty_print = pretty_print,
+                         chunk_size = chunk_size,
+                         )
+            return DataExporter.streamer(output)
+
         tree = rtree.build(start = start,
                            limit = limit,
                            msince = msince,
@@ -1588,6 +1711,8 @@ class CRUDResource:
                    select_items = None,
                    strategy = None,
                    sync_policy = None,
+                   chunk_size = None,
+                   progress = None,
                    **args):
         """
             Import data
@@ -1606,6 +1731,12 @@ class CRUDResource:
                 select_items: items of the previous import job to select
                 strategy: allowed import methods
                 SyncPolicy sync_policy: the synchronization policy
+                chunk_size: read, transform and import spreadsheet sources
+                            (csv|xlsx) in chunks of this number of rows
+                            (bounded memory use, for large sources; only
+                            for committed imports of single sources)
+                progress: callback to report the progress of chunked
+                          imports, see XMLImporter.import_chunks
                 args: arguments for the transformation stylesheet
         """
 
@@ -1620,6 +1751,21 @@ class CRUDResource:
         tablename = self.tablename
 
         from .importer import XMLImporter
+
+        if chunk_size and commit and source and not record_id and \
+           source_type in ("csv", "xlsx") and hasattr(source, "read"):
+            return XMLImporter.import_chunks(tablename,
+                                             source,
+                                             source_type = source_type,
+                                             stylesheet = stylesheet,
+                                             extra_data = extra_data,
+                                             chunk_size = chunk_size,
+                                             components = self.components.exposed_aliases,
+                                             ignore_errors = ignore_errors,
+                                             strategy = strategy,
+                                             progress = progress,
+                                             **args)
+
         tree = None
         if source:
             tree = XMLImporter.parse_source(tablename,
@@ -36,11 +36,14 @@ from gluon.storage import Storage
 
 from s3dal import original_tablename
 
-from ..tools import s3_get_foreign_key, s3_str, S3Represent, S3RepresentLazy
+from ..tools import ChangeJournal, s3_get_foreign_key, s3_str, S3Represent, S3RepresentLazy
 
 from .query import FS, S3URLQuery
 from .resource import DEFAULT, MAXDEPTH
 
+# Number of master records per chunk in streaming exports
+CHUNK_SIZE = 500
+
 # =============================================================================
 class S3ResourceTree:
     """ Resource Tree Builder """
@@ -137,10 +140,8 @@ class S3ResourceTree:
             mcomponents = []
 
         xml = current.xml
-        s3db = current.s3db
 
         # Use lazy representations
-        lazy = []
         current.auth_user_represent = S3Represent(lookup = "auth_user",
                                                   fields = ["email"],
                                                   )
@@ -152,6 +153,7 @@ class S3ResourceTree:
 
         # Export resource
         resource = self.resource
+        resource.muntil = None
         masters, nodes = self.export_resource(resource,
                                               start = start,
                                               limit = limit,
@@ -170,9 +172,327 @@ class S3ResourceTree:
             self.masters.extend(masters)
             self.nodes.extend(nodes)
 
+        # Export dependencies
+        self.export_dependencies(maxdepth if dereference else 0,
+                                 fields = fields,
+                                 references = references,
+                                 rcomponents = rcomponents,
+                                 sync_filters = sync_filters,
+                                 xmlformat = xmlformat,
+                                 mdata = mdata,
+                                 target = target,
+                                 )
+
+        # Create root element
+        root = self.root_element()
+
+        # Render all master nodes
+        self.render(root)
+
+        # Complete the tree
+        tree = xml.tree(None,
+                        root = root,
+                        domain = xml.domain,
+                        url = self.base_url,
+                        results = results,
+                        start = start,
+                        limit = limit,
+                        maxbounds = maxbounds,
+                        )
+
+        # Store number of results in resource
+        resource.results = results
+
+        return tree
+
+    # -------------------------------------------------------------------------
+    def stream(self,
+               output,
+               start = 0,
+               limit = None,
+               msince = None,
+               sync_filters = None,
+               xmlformat = None,
+               fields = None,
+               references = None,
+               mcomponents = DEFAULT,
+               target = None,
+               dereference = True,
+               maxdepth = MAXDEPTH,
+               rcomponents = None,
+               mdata = False,
+               maxbounds = False,
+               pretty_print = False,
+               chunk_size = CHUNK_SIZE,
+               ):
+        """
+            Export the resource tree incrementally, i.e. load the master
+            records in chunks and write their XML elements (including
+            dependencies) to the output as soon as a chunk is complete,
+            so that memory use does not grow with the number of records
+
+            Args:
+                output: a writable file-like object (binary)
+                start: index of the first record to export (slicing)
+                limit: maximum number of records to export (slicing)
+
+                msince: export only records which have been modified
+                        after this datetime
+                sync_filters: additional URL filters (Sync), as dict
+                              {tablename: {url_var: string}}
+
+                xmlformat: pre-parsed XSLT stylesheet wrapper
+
+                fields: data fields to include (default: all)
+                references: foreign keys to include (default: all)
+                mcomponents: components of the master resource to
+                             include (list of aliases), empty list
+                             for all available components
+                target: alias of component targeted
+                        (or None to target master resource)
+
+                dereference: include referenced resources
+                maxdepth: maximum depth for reference exports
+                rcomponents: components of referenced resources to
+                             include (list of "tablename:alias")
+
+                mdata: mobile data export
+                       (=>reduced field set, lookup-only option)
+                maxbounds: include lat/lon boundaries in the top
+                           level element (off by default)
+                pretty_print: insert newlines/indentation in the output
+                chunk_size: number of master records to process at a time
+
+            Returns:
+                the number of exported master records
+
+            Note:
+                - the output is the same S3XML as produced by build(),
+                  except that referenced records are written after the
+                  chunk of master records that refers to them
+                - identities of all master records are resolved up-front,
+                  so references to master records in later chunks do not
+                  export those records twice
+        """
+
+        if mcomponents is DEFAULT:
+            mcomponents = []
+
+        xml = current.xml
+
+        # Use lazy representations
+        current.auth_user_represent = S3Represent(lookup = "auth_user",
+                                                  fields = ["email"],
+                                                  )
+
+        resource = self.resource
+        resource.muntil = None
+        table = resource.table
+
+        # Add the export filters (once for all chunks)
+        self.add_filters(resource,
+                         msince = msince,
+                         sync_filters = sync_filters,
+                         )
+
+        # Look up the master record IDs, and register their identities
+        master_ids = self.master_identities(resource,
+                                            start = start,
+                                            limit = limit,
+                                            msince = msince,
+                                            )
+        results = len(master_ids)
+
+        # Create the root element (attributes only)
+        root = xml.tree([] if results else None,
+                        root = self.root_element(),
+                        domain = xml.domain,
+                        url = self.base_url,
+                        results = results,
+                        start = start,
+                        limit = limit,
+                        maxbounds = maxbounds,
+                        ).getroot()
+
         depth = maxdepth if dereference else 0
 
-        # Export dependencies
+        with etree.xmlfile(output, encoding="utf-8") as xf:
+
+            xf.write_declaration()
+            with xf.element(root.tag, dict(root.attrib)):
+
+                for index in range(0, results, chunk_size):
+
+                    self.masters = []
+                    self.nodes = []
+                    self.pending_dependencies = {}
+
+                    # Export the next chunk of master records
+                    chunk = master_ids[index:index + chunk_size]
+                    resource.add_filter(table._id.belongs(chunk))
+                    self.reset_components(resource)
+                    try:
+                        masters, nodes = self.export_resource(
+                                                resource,
+                                                fields = fields,
+                                                references = references,
+                                                components = mcomponents,
+                                                msince = msince,
+                                                sync_filters = sync_filters,
+                                                xmlformat = xmlformat,
+                                                mdata = mdata,
+                                                target = target,
+                                                location_data = self.location_data,
+                                                filtered = True,
+                                                )
+                    finally:
+                        # Remove the chunk filter
+                        rfilter = resource.rfilter
+                        rfilter.queries.pop()
+                        rfilter.query = None
+                        resource.clear()
+                        self.reset_components(resource)
+
+                    self.masters.extend(masters)
+                    self.nodes.extend(nodes)
+
+                    # Export the dependencies of this chunk
+                    self.export_dependencies(depth,
+                                             fields = fields,
+                                             references = references,
+                                             rcomponents = rcomponents,
+                                             sync_filters = sync_filters,
+                                             xmlformat = xmlformat,
+                                             mdata = mdata,
+                                             target = target,
+                                             )
+
+                    # Render the chunk and write it to the output
+                    container = etree.Element(root.tag)
+                    self.render(container)
+                    for element in container:
+                        xf.write(element, pretty_print=pretty_print)
+                    xf.flush()
+
+        self.masters = self.nodes = None
+        self.pending_dependencies = {}
+
+        # Store number of results in resource
+        resource.results = results
+
+        return results
+
+    # -------------------------------------------------------------------------
+    def master_identities(self, resource, start=0, limit=None, msince=None):
+        """
+            Look up the IDs of the master records to export, and add
+            their identities to the exported-map so that references to
+            them can be resolved before they are exported themselves
+
+            Args:
+                resource: the (filtered) master resource
+                start: index of the first record to export (slicing)
+                limit: maximum number of records to export (slicing)
+                msince: the msince-parameter of the export (ordering)
+
+            Returns:
+                the list of master record IDs, in export order
+        """
+
+        table = resource.table
+        pkey = table._id.name
+
+        UID = current.xml.UID
+        MTIME = current.xml.MTIME
+
+        uid = UID if UID in table.fields else None
+        superkeys = current.s3db.get_super_keys(table)
+
+        selectors = [pkey, uid] + superkeys if uid else [pkey] + superkeys
+        if msince and MTIME in table.fields:
+            # Order by ID within the same mtime, for stable paging
+            orderby = "%s ASC, %s ASC" % (table[MTIME], table._id)
+        else:
+            orderby = table._id
+        rows = resource.select(selectors,
+                               start = start,
+                               limit = limit,
+                               orderby = orderby,
+                               virtual = False,
+                               as_rows = True,
+                               )
+
+        tablename = original_tablename(table)
+        supertables = [(superkey, s3_get_foreign_key(table[superkey])[0])
+                       for superkey in superkeys
+                       ]
+
+        exported = self.exported
+        master_ids = []
+        for row in rows:
+            record_id = row[table._id]
+            if (tablename, record_id) in exported:
+                continue
+            master_ids.append(record_id)
+
+            identity = (tablename, record_id, row[table[uid]] if uid else None)
+            exported[(tablename, record_id)] = identity
+            for superkey, tn in supertables:
+                super_id = row[table[superkey]]
+                if tn and super_id:
+                    exported[(tn, super_id)] = identity
+
+        return master_ids
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def reset_components(resource):
+        """
+            Reset the filters of all loaded components of a resource,
+            so they are rebuilt from the current master filter
+
+            Args:
+                resource: the master resource
+        """
+
+        for component in resource.components.loaded.values():
+            for c in (component, component.link):
+                if c is not None:
+                    c.clear()
+                    c.rfilter = None
+
+    # -------------------------------------------------------------------------
+    def export_dependencies(self,
+                            depth,
+                            fields = None,
+                            references = None,
+                            rcomponents = None,
+                            sync_filters = None,
+                            xmlformat = None,
+                            mdata = False,
+                            target = None,
+                            ):
+        """
+            Export all pending dependencies (=referenced records), and
+            resolve the identities of the dependencies beyond maxdepth
+
+            Args:
+                depth: the maximum depth for reference exports
+                fields: data fields to include (default: all)
+                references: foreign keys to include (default: all)
+                rcomponents: components of referenced resources to
+                             include (list of "tablename:alias")
+                sync_filters: additional URL filters (Sync), as dict
+                              {tablename: {url_var: string}}
+                xmlformat: pre-parsed XSLT stylesheet wrapper
+                mdata: mobile data export
+                       (=>reduced field set, lookup-only option)
+                target: alias of component targeted
+                        (or None to target master resource)
+        """
+
+        s3db = current.s3db
+
         dependencies = self.pending_dependencies
         while dependencies and depth:
 
@@ -209,8 +529,16 @@ class S3ResourceTree:
         if dependencies:
             self.export_identities(dependencies)
 
-        # Create root element
-        root = etree.Element(xml.TAG.root)
+    # -------------------------------------------------------------------------
+    def root_element(self):
+        """
+            Create the root element of the tree
+
+            Returns:
+                the root Element
+        """
+
+        root = etree.Element(current.xml.TAG.root)
 
         # Add map data to root element
         map_data = self.map_data
@@ -222,6 +550,22 @@ class S3ResourceTree:
             #                           ensure_ascii=False))
             root.set("map", json.dumps(map_data))
 
+        return root
+
+    # -------------------------------------------------------------------------
+    def render(self, root):
+        """
+            Render the XML elements for all master nodes
+
+            Args:
+                root: the Element to append the elements to
+        """
+
+        xml = current.xml
+
+        # Use lazy representations
+        lazy = []
+
         # Render all master nodes
         location_references = []
         for node in self.masters:
@@ -238,22 +582,6 @@ class S3ResourceTree:
             for renderer, element, attr, f in lazy:
                 renderer.render_node(element, attr, f)
 
-        # Complete the tree
-        tree = xml.tree(None,
-                        root = root,
-                        domain = xml.domain,
-                        url = self.base_url,
-                        results = results,
-                        start = start,
-                        limit = limit,
-                        maxbounds = maxbounds,
-                        )
-
-        # Store number of results in resource
-        resource.results = results
-
-        return tree
-
     # -------------------------------------------------------------------------
     def export_resource(self,
                         resource,
@@ -268,6 +596,7 @@ class S3ResourceTree:
                         target = None,
                         mdata = None,
                         location_data = DEFAULT,
+                        filtered = False,
                         ):
         """
             Load the records in a resource and generate nodes for them
@@ -295,6 +624,8 @@ class S3ResourceTree:
                        (=>reduced field set, lookup-only option)
                 location_data: dictionary of location data which has been
                                looked-up in bulk ready for xml.gis_encode()
+                filtered: the export filters have already been added
+                          to the resource
         """
 
         s3db = current.s3db
@@ -315,6 +646,7 @@ class S3ResourceTree:
                           sync_filters = sync_filters,
                           xmlformat = xmlformat,
                           target = target,
+                          filtered = filtered,
                           )
 
         # Establish the base URL of the resource
@@ -351,6 +683,7 @@ class S3ResourceTree:
         superkeys = s3db.get_super_keys(table)
 
         crow_dict = {}
+        muntil = resource.muntil
         for record in resource._rows:
 
             # Preliminary msince decision
@@ -480,11 +813,18 @@ class S3ResourceTree:
                 nodes.append(master)
                 self.exported.update(master.identities)
 
+                # Track the latest mtime of the exported masters
+                mtime = record.get(MTIME)
+                if mtime and (muntil is None or mtime > muntil):
+                    muntil = mtime
+
                 if master.components:
                     nodes.extend(master.components)
                     for node in master.components:
                         self.exported.update(node.identities)
 
+        resource.muntil = muntil
+
         dependencies = self.pending_dependencies
         for node in nodes:
             for tn, ids in node.dependencies.items():
@@ -495,7 +835,59 @@ class S3ResourceTree:
 
     # -------------------------------------------------------------------------
     @staticmethod
-    def load_records(resource,
+    def add_filters(resource,
+                    msince = None,
+                    sync_filters = None,
+                    hierarchy_link = None,
+                    add = True,
+                    ):
+        """
+            Add the export filters to a resource
+
+            Args:
+                resource: the CRUDResource
+                msince: export only records which have been modified
+                        after this datetime
+                sync_filters: additional URL filters (Sync), as dict
+                              {tablename: {url_var: string}}
+                hierarchy_link: TODO
+                add: flag for the preliminary msince-decision (if component)
+        """
+
+        table = resource.table
+        tablename = resource.tablename
+
+        xml = current.xml
+        MCI = xml.MCI
+        MTIME = xml.MTIME
+
+        # MCI filter
+        if xml.filter_mci and MCI in table.fields:
+            resource.add_filter(FS(MCI) >= 0)
+
+        # Sync filters
+        if sync_filters and tablename in sync_filters:
+            parsed_filters = S3URLQuery.parse(resource, sync_filters[tablename])
+            for queries in parsed_filters.values():
+                for query in queries:
+                    resource.add_filter(query)
+
+        # Msince filter
+        if msince and (resource.alias != hierarchy_link or add) and MTIME in table.fields:
+            resource.add_filter(FS(MTIME) >= msince)
+
+            # Restrict to the records recorded in the change journal,
+            # so the master query need not scan the table by MTIME
+            if resource.parent is None:
+                journal = ChangeJournal.get_journal()
+                record_ids = journal.changed(tablename, msince) if journal else None
+                if record_ids is not None:
+                    resource.add_filter(table._id.belongs(record_ids))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def load_records(cls,
+                     resource,
                      start = 0,
                      limit = None,
                      msince = None,
@@ -505,6 +897,7 @@ class S3ResourceTree:
                      # TODO can these parameters be avoided?:
                      hierarchy_link = None,
                      add = True,
+                     filtered = False,
                      ):
         """
             Load records in a resource
@@ -525,33 +918,28 @@ class S3ResourceTree:
                            (or None to target master resource)
                 hierarchy_link: TODO
                 add: flag for the preliminary msince-decision (if component)
+                filtered: the export filters have already been added
+                          to the resource
         """
 
         table = resource.table
         tablename = resource.tablename
 
-        xml = current.xml
-        MCI = xml.MCI
-        MTIME = xml.MTIME
-
-        # MCI filter
-        if xml.filter_mci and MCI in table.fields:
-            resource.add_filter(FS(MCI) >= 0)
+        MTIME = current.xml.MTIME
 
-        # Sync filters
-        if sync_filters and tablename in sync_filters:
-            parsed_filters = S3URLQuery.parse(resource, sync_filters[tablename])
-            for queries in parsed_filters.values():
-                for query in queries:
-                    resource.add_filter(query)
-
-        # Msince filter
-        if msince and (resource.alias != hierarchy_link or add) and MTIME in table.fields:
-            resource.add_filter(FS(MTIME) >= msince)
+        # Add the export filters
+        if not filtered:
+            cls.add_filters(resource,
+                            msince = msince,
+                            sync_filters = sync_filters,
+                            hierarchy_link = hierarchy_link,
+                            add = add,
+                            )
 
         # Order by modified_on if msince is requested
         if msince and MTIME in table.fields:
-            orderby = "%s ASC" % table[MTIME]
+            # Order by ID within the same mtime, for stable paging
+            orderby = "%s ASC, %s ASC" % (table[MTIME], table._id)
         else:
             orderby = None
 
@@ -28,19 +28,24 @@
 import datetime
 import json
 import sys
+import time
 import traceback
 
+from io import BytesIO
 from lxml import etree
 from urllib import request as urllib2
 from urllib.error import HTTPError, URLError
 from urllib.parse import quote as urllib_quote
 
 from gluon import current
+from gluon.storage import Storage
 
 from ...resource import SyncPolicy
-from ...tools import s3_encode_iso_datetime, JSONERRORS
+from ...tools import s3_decode_iso_datetime, s3_encode_iso_datetime, s3_utc, \
+                     JSONERRORS
 
 from ..base import S3SyncBaseAdapter, S3SyncDataArchive
+from ..transport import SyncCompression
 
 # =============================================================================
 class S3SyncAdapter(S3SyncBaseAdapter):
@@ -48,6 +53,9 @@ class S3SyncAdapter(S3SyncBaseAdapter):
         Sahana Eden Synchronization Adapter (default sync adapter)
     """
 
+    # Content coding for request bodies, as accepted by the peer
+    peer_encoding = None
+
     # -------------------------------------------------------------------------
     def register(self):
         """
@@ -170,6 +178,25 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 of the youngest record sent
         """
 
+        return self.run_steps(self.pull_steps(task, onconflict=onconflict))
+
+    # -------------------------------------------------------------------------
+    def pull_steps(self, task, onconflict=None):
+        """
+            Active pull as sequence of steps, fetching the updates in
+            pages of up to sync.page_size records; incremental pulls
+            are paged in order of modification date, and checkpoint the
+            task after each page, so that an interrupted pull can resume
+            from there
+
+            Args:
+                task: the synchronization task (sync_task Row)
+                onconflict: callback for automatic conflict resolution
+
+            Returns:
+                the generator, returning a tuple (error, mtime) like pull()
+        """
+
         xml = current.xml
         debug = current.log.debug
 
@@ -189,12 +216,32 @@ class S3SyncAdapter(S3SyncBaseAdapter):
         last_pull = task.last_pull
         dataset_id = task.dataset_id
 
+        # Sync Policy
+        if onconflict:
+            onconflict_callback = lambda item: onconflict(item,
+                                                          repository,
+                                                          resource,
+                                                          )
+        else:
+            onconflict_callback = None
+        sync_policy = SyncPolicy(onupdate = task.update_policy,
+                                 onconflict = task.conflict_policy,
+                                 resolve = onconflict_callback,
+                                 last_sync = last_pull,
+                                 )
+
+        started = time.time()
+
         remote = False
         action = "fetch"
         output = None
-        response = None
         result = log.SUCCESS
+        message = ""
 
+        mtime = None
+        records = size = 0
+
+        response = None
         use_archived = False
 
         if not last_pull and dataset_id:
@@ -209,17 +256,22 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                     # @todo: should this be logged in the sync log?
                     current.log.error("S3Sync: %s" % sys.exc_info()[1])
                 else:
-                    use_archived = True
-
-        if response is None:
+                    use_archived = response is not None
 
+        if use_archived:
+            # Import from the archive
+            action = "import"
+            result, message, output, records, mtime = self._import(resource,
+                                                                   response,
+                                                                   task.strategy,
+                                                                   sync_policy,
+                                                                   )
+        else:
             debug("S3Sync: pull %s from %s" % (resource_name, repository.url))
 
             # Construct the URL
             url = "%s/sync/sync.xml?resource=%s&repository=%s" % \
                   (repository.url, resource_name, config.uuid)
-            if last_pull and task.update_policy not in (SyncPolicy.THIS, SyncPolicy.OTHER):
-                url += "&msince=%s" % s3_encode_iso_datetime(last_pull)
             if task.components is False: # Allow None to remain the old default of 'Include Components'
                 url += "&mcomponents=None"
             url += "&include_deleted=True"
@@ -235,151 +287,118 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                         urlfilter = "[%s]%s=%s" % (prefix, k, urllib_quote(value))
                         url += "&%s" % urlfilter
 
-            debug("...pull from URL %s" % url)
-
-            # Execute the request
-            remote = False
-            action = "fetch"
-            response = None
-            output = None
-
-            opener = self._http_opener(url)
-            try:
-                f = opener.open(url)
-
-            except HTTPError as e:
-                result = log.ERROR
-                remote = True # Peer error
-                code = e.code
-                message = e.read()
-                try:
-                    # Sahana-Eden would send a JSON message,
-                    # try to extract the actual error message:
-                    message_json = json.loads(message)
-                except JSONERRORS:
-                    pass
-                else:
-                    message = message_json.get("message", message)
-                # Prefix as peer error and strip XML markup from the message
-                # @todo: better method to do this?
-                message = "<message>%s</message>" % message
+            if last_pull and task.update_policy not in (SyncPolicy.THIS, SyncPolicy.OTHER):
+                msince = last_pull
+            else:
+                msince = None
+
+            page_size = current.deployment_settings.get_sync_page_size()
+            headers = self._accept_headers()
+
+            start = 0
+            warnings = []
+            while True:
+
+                # Add msince and paging parameters
+                page_url = url
+                if msince:
+                    page_url += "&msince=%s" % s3_encode_iso_datetime(msince)
+                if page_size:
+                    page_url += "&start=%s&limit=%s" % (start, page_size)
+
+                debug("...pull from URL %s" % page_url)
+
+                # Fetch the page (in worker thread)
+                action = "fetch"
+                opener = self._http_opener(page_url, headers=headers)
+                response = yield self._request(opener, page_url)
+
+                size += response.size
+                if response.error:
+                    result, remote, message, output = self._error(response)
+                    mtime = None
+                    break
+                self._update_peer_encoding(response.headers)
+
+                data = response.data
+                if not data:
+                    # No data received from peer
+                    result = log.ERROR
+                    remote = True
+                    message = "No data received from peer"
+                    output = xml.json_message(False, 400, message)
+                    mtime = None
+                    break
+
+                # Parse the page
+                action = "import"
+                tree = xml.parse(BytesIO(data))
+                if tree is None:
+                    result = log.FATAL
+                    remote = True
+                    message = "Invalid data received from peer: %s" % xml.error
+                    output = xml.json_message(False, 400, message)
+                    mtime = None
+                    break
+
+                # Import the page
+                page_result, page_message, output, count, page_mtime = \
+                                        self._import(resource,
+                                                     tree,
+                                                     task.strategy,
+                                                     sync_policy,
+                                                     )
+                records += count
+                if page_result == log.FATAL:
+                    result, message = page_result, page_message
+                    mtime = None
+                    break
+                elif page_result == log.WARNING:
+                    result = page_result
+                    warnings.append(page_message)
+                if page_mtime and (mtime is None or page_mtime > mtime):
+                    mtime = page_mtime
+
+                # Last page?
                 try:
-                    markup = etree.XML(message)
-                    message = markup.xpath(".//text()")
-                    if message:
-                        message = " ".join(message)
+                    results = int(tree.getroot().get("results"))
+                except (TypeError, ValueError):
+                    results = 0
+                if not page_size or results < page_size:
+                    break
+
+                # Next page
+                if msince:
+                    # Pages are ordered by the mtime of the master records
+                    # (not by that of components or dependencies)
+                    muntil = self._muntil(tree, resource.tablename)
+                    if muntil:
+                        # Checkpoint
+                        task.update_record(last_pull=muntil)
+                        current.db.commit()
+                    if muntil and muntil > msince:
+                        msince, start = muntil, 0
                     else:
-                        message = ""
-                except etree.XMLSyntaxError:
-                    pass
-                output = xml.json_message(False, code, message, tree=None)
-
-            except URLError as e:
-                # URL Error (network error)
-                result = log.ERROR
-                remote = True
-                message = "Peer repository unavailable (%s)" % e.reason
-                output = xml.json_message(False, 400, message)
-
-            except:
-                result = log.FATAL
-                message = sys.exc_info()[1]
-                output = xml.json_message(False, 400, message)
-
-            else:
-                result = log.SUCCESS
-                response = f
+                        # All records of the page had the same mtime
+                        start += page_size
+                else:
+                    # Pages are ordered by record ID, so can neither
+                    # checkpoint nor continue from an mtime
+                    start += page_size
 
-        # Process the response
-        mtime = None
-        if response:
-            message = ""
-            action = "import"
+            if warnings:
+                message = ", ".join(warnings)
 
-            # Sync Policy
-            if onconflict:
-                onconflict_callback = lambda item: onconflict(item,
-                                                              repository,
-                                                              resource,
-                                                              )
+        # Success message
+        if result == log.SUCCESS:
+            if not records:
+                message = "No data to import (already up-to-date)"
             else:
-                onconflict_callback = None
-            sync_policy = SyncPolicy(onupdate = task.update_policy,
-                                     onconflict = task.conflict_policy,
-                                     resolve = onconflict_callback,
-                                     last_sync = last_pull,
-                                     )
-
-            # Import the data
-            count = 0
-            try:
-                import_result = resource.import_xml(response,
-                                                    ignore_errors = True,
-                                                    strategy = task.strategy,
-                                                    sync_policy = sync_policy,
-                                                    )
-                count = import_result.count
-
-            except IOError as e:
-                result = log.FATAL
-                message = "%s" % e
-                output = xml.json_message(False, 400, message)
-
-            except:
-                # If we end up here, an uncaught error during import
-                # has occured which indicates a code defect! We log it
-                # and continue here, however - in order to maintain a
-                # valid sync status, so that developers can restart
-                # the process more easily after fixing the defect.
-                result = log.FATAL
-                message = "Uncaught Exception During Import: %s" % \
-                          traceback.format_exc()
-                output = xml.json_message(False, 500, sys.exc_info()[1])
-
-            mtime = import_result.mtime
-
-            # Log all validation errors
-            if import_result.error_tree is not None:
-                result = log.WARNING
-                message = "%s" % import_result.error
-                for element in import_result.error_tree.findall("resource"):
-                    for field in element.findall("data[@error]"):
-                        error_msg = field.get("error", None)
-                        if error_msg:
-                            msg = "(UID: %s) %s.%s=%s: %s" % \
-                                   (element.get("uuid", None),
-                                    element.get("name", None),
-                                    field.get("field", None),
-                                    field.get("value", field.text),
-                                    field.get("error", None))
-                            message = "%s, %s" % (message, msg)
-
-            # Check for failure
-            if not import_result.success:
-                result = log.FATAL
-                if not message:
-                    message = "%s" % import_result.error
-                output = xml.json_message(False, 400, message)
-                mtime = None
-
-            # ...or report success
-            elif not message:
-                if not count:
-                    message = "No data to import (already up-to-date)"
-                else:
-                    message = "Data imported successfully (%s records%%s)" % count
-                    if use_archived:
-                        message = message % ", from archive"
-                    else:
-                        message = message % ""
-
-        elif result == log.SUCCESS:
-            # No data received from peer
-            result = log.ERROR
-            remote = True
-            message = "No data received from peer"
+                message = "Data imported successfully (%s records%s)" % \
+                          (records, ", from archive" if use_archived else "")
 
         # Log the operation
+        duration = time.time() - started
         log.write(repository_id = repository.id,
                   resource_name = task.resource_name,
                   transmission = log.OUT,
@@ -388,6 +407,9 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                   remote = remote,
                   result = result,
                   message = message,
+                  records = records,
+                  size = size,
+                  duration = duration,
                   )
 
         debug("S3Sync: pull %s: %s" % (result, message))
@@ -408,11 +430,29 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 of the youngest record sent
         """
 
-        xml = current.xml
+        return self.run_steps(self.push_steps(task))
+
+    # -------------------------------------------------------------------------
+    def push_steps(self, task):
+        """
+            Active push as sequence of steps, sending the updates in
+            pages of up to sync.page_size records; incremental pushs
+            are paged in order of modification date, and checkpoint the
+            task after each page, so that an interrupted push can resume
+            from there
+
+            Args:
+                task: the synchronization task (sync_task Row)
+
+            Returns:
+                the generator, returning a tuple (error, mtime) like push()
+        """
+
         debug = current.log.debug
 
         repository = self.repository
         config = repository.config
+        log = repository.log
 
         resource_name = task.resource_name
         debug("S3SyncRepository.push(%s, %s)" % (repository.url, resource_name))
@@ -444,68 +484,97 @@ class S3SyncAdapter(S3SyncBaseAdapter):
             # Default
             components = None
 
-        # Define the resource
-        resource = current.s3db.resource(resource_name,
-                                         components = components,
-                                         include_deleted = True,
-                                         )
-
         # Apply sync filters for this task
         filters = current.sync.get_filters(task.id)
 
-        # Export the resource as S3XML
-        data = resource.export_xml(filters = filters,
-                                   msince = last_push,
-                                   )
-        count = resource.results or 0
-        mtime = resource.muntil
+        page_size = current.deployment_settings.get_sync_page_size()
+
+        started = time.time()
 
-        # Transmit the data via HTTP
         remote = False
         output = None
-        log = repository.log
-        if data and count:
-            # Execute the request
-            opener = self._http_opener(url,
-                                       headers = [("Content-Type", "text/xml"),
-                                                  ],
+        result = log.SUCCESS
+        message = ""
+
+        mtime = None
+        records = size = 0
+
+        msince = last_push
+        start = 0
+        while True:
+
+            # Define the resource
+            resource = current.s3db.resource(resource_name,
+                                             components = components,
+                                             include_deleted = True,
+                                             )
+
+            # Export the next page as S3XML
+            data = resource.export_xml(filters = filters,
+                                       msince = msince,
+                                       start = start if page_size else None,
+                                       limit = page_size if page_size else None,
                                        )
-            try:
-                opener.open(url, data)
-            except HTTPError as e:
-                result = log.FATAL
-                remote = True # Peer error
-                code = e.code
-                message = e.read()
-                try:
-                    # Sahana-Eden sends a JSON message,
-                    # try to extract the actual error message:
-                    message_json = json.loads(message)
-                except JSONERRORS:
-                    pass
+            count = resource.results or 0
+            page_mtime = resource.muntil
+            if not data or not count:
+                break
+
+            # Compress the data if supported by the peer
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            headers = self._accept_headers()
+            headers.append(("Content-Type", "text/xml"))
+            encoding = self.peer_encoding
+            if encoding:
+                data = SyncCompression.compress(data, encoding)
+                headers.append(("Content-Encoding", encoding))
+
+            # Send the page (in worker thread)
+            opener = self._http_opener(url, headers=headers)
+            response = yield self._request(opener, url, data)
+
+            size += len(data) + response.size
+            if response.error:
+                result, remote, message, output = self._error(response, fatal=True)
+                break
+            self._update_peer_encoding(response.headers)
+
+            records += count
+            if page_mtime and (mtime is None or page_mtime > mtime):
+                mtime = page_mtime
+
+            # Last page?
+            if not page_size or count < page_size:
+                break
+
+            # Next page
+            if msince:
+                # Pages are ordered by the mtime of the master records
+                if page_mtime:
+                    # Checkpoint
+                    task.update_record(last_push=page_mtime)
+                    current.db.commit()
+                if page_mtime and page_mtime > msince:
+                    msince, start = page_mtime, 0
                 else:
-                    message = message_json.get("message", message)
-                output = xml.json_message(False, code, message)
-            except URLError as e:
-                # URL Error (network error)
-                result = log.ERROR
-                remote = True
-                message = "Peer repository unavailable (%s)" % e.reason
-                output = xml.json_message(False, 400, message)
-            except:
-                result = log.FATAL
-                code = 400
-                message = sys.exc_info()[1]
-                output = xml.json_message(False, code, message)
+                    # All records of the page had the same mtime
+                    start += page_size
             else:
-                result = log.SUCCESS
-                message = "data sent successfully (%s records)" % count
-        else:
-            # No data to send
-            result = log.WARNING
-            message = "No data to send"
+                # Pages are ordered by record ID, so can neither
+                # checkpoint nor continue from an mtime
+                start += page_size
+
+        if output is None:
+            if records:
+                message = "data sent successfully (%s records)" % records
+            else:
+                # No data to send
+                result = log.WARNING
+                message = "No data to send"
 
         # Log the operation
+        duration = time.time() - started
         log.write(repository_id = repository.id,
                   resource_name = task.resource_name,
                   transmission = log.OUT,
@@ -514,6 +583,9 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                   remote = remote,
                   result = result,
                   message = message,
+                  records = records,
+                  size = size,
+                  duration = duration,
                   )
 
         if output is not None:
@@ -559,11 +631,15 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                     }
 
         # Export the data as S3XML
+        stream = resource.get_config("stream_export",
+                                     current.deployment_settings.get_base_stream_export(),
+                                     )
         output = resource.export_xml(start = start,
                                      limit = limit,
                                      filters = filters,
                                      msince = msince,
                                      pretty_print = pretty_print,
+                                     stream = stream,
                                      )
         count = resource.results
         msg = "Data sent to peer (%s records)" % count
@@ -698,6 +774,263 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 "response": import_result.json_message(),
                 }
 
+    # -------------------------------------------------------------------------
+    def _import(self, resource, source, strategy, sync_policy):
+        """
+            Import data received from the peer repository
+
+            Args:
+                resource: the target resource
+                source: the S3XML source (ElementTree or file-like object)
+                strategy: the import strategy
+                sync_policy: the SyncPolicy
+
+            Returns:
+                tuple (result, message, output, count, mtime), with
+                output=None if successful, else the error message,
+                and mtime=modification timestamp of the youngest
+                record imported
+        """
+
+        xml = current.xml
+        log = self.log
+
+        try:
+            import_result = resource.import_xml(source,
+                                                ignore_errors = True,
+                                                strategy = strategy,
+                                                sync_policy = sync_policy,
+                                                )
+        except IOError as e:
+            message = "%s" % e
+            return (log.FATAL, message, xml.json_message(False, 400, message), 0, None)
+
+        except:
+            # If we end up here, an uncaught error during import
+            # has occured which indicates a code defect! We log it
+            # and continue here, however - in order to maintain a
+            # valid sync status, so that developers can restart
+            # the process more easily after fixing the defect.
+            message = "Uncaught Exception During Import: %s" % \
+                      traceback.format_exc()
+            output = xml.json_message(False, 500, sys.exc_info()[1])
+            return (log.FATAL, message, output, 0, None)
+
+        result = log.SUCCESS
+        message = ""
+        output = None
+
+        count = import_result.count
+        mtime = import_result.mtime
+
+        # Log all validation errors
+        if import_result.error_tree is not None:
+            result = log.WARNING
+            message = "%s" % import_result.error
+            for element in import_result.error_tree.findall("resource"):
+                for field in element.findall("data[@error]"):
+                    error_msg = field.get("error", None)
+                    if error_msg:
+                        msg = "(UID: %s) %s.%s=%s: %s" % \
+                               (element.get("uuid", None),
+                                element.get("name", None),
+                                field.get("field", None),
+                                field.get("value", field.text),
+                                field.get("error", None))
+                        message = "%s, %s" % (message, msg)
+
+        # Check for failure
+        if not import_result.success:
+            result = log.FATAL
+            if not message:
+                message = "%s" % import_result.error
+            output = xml.json_message(False, 400, message)
+            mtime = None
+
+        return (result, message, output, count, mtime)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _request(opener, url, data=None):
+        """
+            Create a callable for a HTTP request to the peer repository;
+            the callable is run in a worker thread, and must therefore not
+            access current
+
+            Args:
+                opener: the HTTP opener
+                url: the URL
+                data: the request body (bytes), if any
+
+            Returns:
+                a function returning a Storage {data, headers, size,
+                error, code, message} with the (decompressed) response
+        """
+
+        def request():
+
+            response = Storage(data = None,
+                               headers = None,
+                               size = 0,
+                               error = None,
+                               code = None,
+                               message = None,
+                               )
+            try:
+                f = opener.open(url, data)
+            except HTTPError as e:
+                # Peer error
+                response.error = "http"
+                response.code = e.code
+                try:
+                    content = e.read()
+                    content = SyncCompression.decompress(content,
+                                                         e.headers.get("Content-Encoding"),
+                                                         )
+                except Exception:
+                    content = b""
+                response.message = content.decode("utf-8", "replace")
+            except URLError as e:
+                # URL Error (network error)
+                response.error = "network"
+                response.message = "Peer repository unavailable (%s)" % e.reason
+            except Exception as e:
+                # Local error
+                response.error = "local"
+                response.message = "%s" % e
+            else:
+                try:
+                    content = f.read()
+                except Exception as e:
+                    response.error = "network"
+                    response.message = "Error reading response from peer (%s)" % e
+                    return response
+                headers = f.headers
+                response.headers = headers
+                response.size = len(content)
+                try:
+                    response.data = SyncCompression.decompress(content,
+                                                               headers.get("Content-Encoding"),
+                                                               )
+                except ValueError as e:
+                    response.error = "local"
+                    response.message = "%s" % e
+            return response
+
+        return request
+
+    # -------------------------------------------------------------------------
+    def _error(self, response, fatal=False):
+        """
+            Get the log result and the error message for a failed request
+
+            Args:
+                response: the response Storage from the request callable
+                fatal: treat peer errors (HTTP status) as fatal
+
+            Returns:
+                tuple (result, remote, message, output)
+        """
+
+        xml = current.xml
+        log = self.log
+
+        message = response.message
+        if response.error == "http":
+            try:
+                # Sahana-Eden would send a JSON message,
+                # try to extract the actual error message:
+                message_json = json.loads(message)
+            except JSONERRORS:
+                pass
+            else:
+                message = message_json.get("message", message)
+            # Strip XML markup from the message
+            # @todo: better method to do this?
+            message = "<message>%s</message>" % message
+            try:
+                markup = etree.XML(message)
+                message = markup.xpath(".//text()")
+                if message:
+                    message = " ".join(message)
+                else:
+                    message = ""
+            except etree.XMLSyntaxError:
+                pass
+            result = log.FATAL if fatal else log.ERROR
+            output = xml.json_message(False, response.code, message, tree=None)
+            return (result, True, message, output)
+
+        elif response.error == "network":
+            return (log.ERROR, True, message, xml.json_message(False, 400, message))
+
+        else:
+            return (log.FATAL, False, message, xml.json_message(False, 400, message))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _muntil(tree, tablename):
+        """
+            Get the latest modification date/time of the master records
+            in a page received from the peer (i.e. the resource.muntil
+            of the peer's export)
+
+            Args:
+                tree: the S3XML element tree
+                tablename: the name of the master table
+
+            Returns:
+                the latest mtime (naive UTC datetime), or None
+        """
+
+        xml = current.xml
+
+        muntil = None
+        for element in xml.select_resources(tree, tablename):
+            value = element.get(xml.MTIME)
+            if not value:
+                continue
+            try:
+                mtime = s3_utc(s3_decode_iso_datetime(value)).replace(tzinfo=None)
+            except ValueError:
+                continue
+            if muntil is None or mtime > muntil:
+                muntil = mtime
+
+        return muntil
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _accept_headers():
+        """
+            Get the request headers to negotiate compressed responses
+
+            Returns:
+                list of tuples (header, value)
+        """
+
+        if current.deployment_settings.get_sync_compression():
+            return [("Accept-Encoding", SyncCompression.accept_encoding())]
+        else:
+            return []
+
+    # -------------------------------------------------------------------------
+    def _update_peer_encoding(self, headers):
+        """
+            Determine the content coding for request bodies sent to
+            the peer, from the Accept-Encoding header of its response
+
+            Args:
+                headers: the response headers
+        """
+
+        if headers is not None and \
+           current.deployment_settings.get_sync_compression():
+            encoding = SyncCompression.negotiate(headers.get("Accept-Encoding"))
+        else:
+            encoding = None
+        self.peer_encoding = encoding
+
     # -------------------------------------------------------------------------
     def _get_archive(self, dataset_id):
         """
@@ -327,8 +327,15 @@ class S3SyncAdapter(S3SyncBaseAdapter):
             if not error:
                 try:
                     action = "open %s" % outfile
-                    with open(outfile, "w") as target:
-                        target.write(response)
+                    with open(outfile, "wb") as target:
+                        if isinstance(response, str):
+                            target.write(response.encode("utf-8"))
+                        elif isinstance(response, bytes):
+                            target.write(response)
+                        else:
+                            # Streamed export (generator of chunks)
+                            for chunk in response:
+                                target.write(chunk)
                 except IOError:
                     result = log.FATAL
                     error = msg = sys.exc_info()[1]
@@ -38,6 +38,8 @@ from ..resource import S3URLQuery, SyncPolicy
 from ..methods import CRUDMethod, S3CRUD
 from ..tools import s3_parse_datetime, s3_utc, s3_str
 
+from .transport import SyncCompression
+
 # =============================================================================
 class S3Sync(CRUDMethod):
     """ Synchronization Handler """
@@ -303,7 +305,7 @@ class S3Sync(CRUDMethod):
                   message = result.get("message", ""),
                   )
 
-        return result.get("response")
+        return self.__compress(result.get("response"))
 
     # -------------------------------------------------------------------------
     def __receive(self, r, **attr):
@@ -392,6 +394,14 @@ class S3Sync(CRUDMethod):
         # Get the source
         source = r.read_body()
 
+        # Decompress the request body as necessary
+        encoding = r.env.http_content_encoding
+        if encoding and source and hasattr(source[0], "read"):
+            try:
+                source = [BytesIO(SyncCompression.decompress(source[0].read(), encoding))]
+            except ValueError:
+                r.error(415, "Unsupported or invalid content encoding")
+
         # Import resource
         resource = r.resource
 
@@ -424,7 +434,47 @@ class S3Sync(CRUDMethod):
                   message = result.get("message", ""),
                   )
 
-        return result.get("response")
+        return self.__compress(result.get("response"))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def __compress(output):
+        """
+            Compress the response to an incoming pull or push as
+            requested by the peer (Accept-Encoding)
+
+            Args:
+                output: the response (str, bytes or iterable of chunks)
+
+            Returns:
+                the (possibly compressed) response
+        """
+
+        if not current.deployment_settings.get_sync_compression():
+            return output
+
+        headers = current.response.headers
+
+        # Advertise the content codings accepted for incoming pushes
+        headers["Accept-Encoding"] = SyncCompression.accept_encoding()
+
+        encoding = SyncCompression.negotiate(current.request.env.http_accept_encoding)
+        if not encoding or output is None:
+            return output
+
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+
+        if isinstance(output, str):
+            output = output.encode("utf-8")
+        if isinstance(output, bytes):
+            output = SyncCompression.compress(output, encoding)
+        else:
+            # Streamed response => compressed length not known in advance
+            headers.pop("Content-Length", None)
+            output = SyncCompression.compress_stream(output, encoding)
+
+        return output
 
     # -------------------------------------------------------------------------
     # API Methods:
@@ -495,42 +545,14 @@ class S3Sync(CRUDMethod):
         s3 = current.response.s3
         s3.synchronise_uuids = connector.synchronise_uuids
 
-        # Delta for msince progress = 1 second after the mtime of
-        # the youngest item transmitted (without this, the youngest
-        # items would be re-transmitted until there is another update,
-        # because msince means greater-or-equal)
-        delta = datetime.timedelta(seconds=1)
-
-        success = True
-        for task in tasks:
-
-            # Pull
-            mtime = None
-            if task.mode in (1, 3):
-                error, mtime = connector.pull(task,
-                                              onconflict=self.onconflict,
-                                              )
-            if error:
-                success = False
-                current.log.debug("S3Sync: %s PULL error: %s" %
-                                  (task.resource_name, error))
-                continue
-            if mtime is not None:
-                task.update_record(last_pull=mtime+delta)
-
-            # Push
-            mtime = None
-            if task.mode in (2, 3):
-                error, mtime = connector.push(task)
-            if error:
-                success = False
-                current.log.debug("S3Sync: %s PUSH error: %s" %
-                                  (task.resource_name, error))
-                continue
-            if mtime is not None:
-                task.update_record(last_push=mtime+delta)
-
-            current.log.debug("S3Sync.synchronize: %s done" % task.resource_name)
+        # Run the tasks
+        from .runner import SyncTaskRunner
+        runner = SyncTaskRunner(connector,
+                                tasks,
+                                onconflict = self.onconflict,
+                                workers = current.deployment_settings.get_sync_workers(),
+                                )
+        success = runner()
 
         s3.synchronise_uuids = False
         db(s3db.sync_repository.id == repository_id).update(
@@ -894,7 +916,10 @@ class S3SyncLog(CRUDMethod):
               action=None,
               result=None,
               remote=False,
-              message=None):
+              message=None,
+              records=None,
+              size=None,
+              duration=None):
         """
             Writes a new entry to the log
 
@@ -908,6 +933,9 @@ class S3SyncLog(CRUDMethod):
                         ("SUCCESS", "WARNING", "ERROR" or "FATAL")
                 remote: boolean, True if this is a remote error
                 message: clear text message
+                records: number of records transferred
+                size: number of bytes transferred
+                duration: duration of the transfer (seconds)
         """
 
         if result not in (cls.SUCCESS, cls.WARNING, cls.ERROR, cls.FATAL):
@@ -934,6 +962,9 @@ class S3SyncLog(CRUDMethod):
                  "result": result,
                  "remote": remote,
                  "message": message,
+                 "records": records,
+                 "bytes": size,
+                 "duration": duration,
                  }
 
         current.s3db[cls.TABLENAME].insert(**entry)
@@ -1117,6 +1148,69 @@ class S3SyncBaseAdapter:
 
         raise NotImplementedError
 
+    # -------------------------------------------------------------------------
+    # Methods that can be implemented by subclasses to run network
+    # transfers concurrently (see SyncTaskRunner):
+    # -------------------------------------------------------------------------
+    def pull_steps(self, task, onconflict=None):
+        """
+            Active pull as sequence of steps: a generator that yields a
+            callable for each network transfer, and receives the result
+            of the call in turn; the callables run in worker threads and
+            must therefore not access current, while the generator itself
+            always runs in the calling thread
+
+            Args:
+                task: the synchronization task (sync_task Row)
+                onconflict: callback for automatic conflict resolution
+
+            Returns:
+                the generator, returning the same as pull() when exhausted
+        """
+
+        # Default: no separate network steps
+        result = self.pull(task, onconflict=onconflict)
+        yield from ()
+        return result
+
+    # -------------------------------------------------------------------------
+    def push_steps(self, task):
+        """
+            Active push as sequence of steps, see pull_steps
+
+            Args:
+                task: the synchronization task (sync_task Row)
+
+            Returns:
+                the generator, returning the same as push() when exhausted
+        """
+
+        # Default: no separate network steps
+        result = self.push(task)
+        yield from ()
+        return result
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def run_steps(steps):
+        """
+            Run a sequence of steps in the calling thread
+
+            Args:
+                steps: the generator (from pull_steps or push_steps)
+
+            Returns:
+                the return value of the generator
+        """
+
+        response = None
+        try:
+            while True:
+                request = steps.send(response)
+                response = request()
+        except StopIteration as e:
+            return e.value
+
     # -------------------------------------------------------------------------
     def send(self,
              resource,
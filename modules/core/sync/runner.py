@@ -0,0 +1,286 @@
+"""
+    Synchronization: Task Runner
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("SyncTaskRunner",
+           )
+
+import datetime
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from gluon import current
+from gluon.storage import Storage
+
+# =============================================================================
+class SyncTaskRunner:
+    """
+        Runs the synchronization tasks for a repository
+
+        - the network transfers of independent tasks run concurrently in
+          a thread pool, whereas all database access (import and export)
+          happens in the calling thread (current is thread-local)
+        - a task is pulled only after the tasks for all tables it
+          references have been pulled, and pushed only after it has been
+          pulled and the tasks it depends on have been pushed
+        - circular dependencies are broken in the original task order
+    """
+
+    PULL = "pull"
+    PUSH = "push"
+    DONE = "done"
+
+    # Delta for msince progress = 1 second after the mtime of
+    # the youngest item transmitted (without this, the youngest
+    # items would be re-transmitted until there is another update,
+    # because msince means greater-or-equal)
+    DELTA = datetime.timedelta(seconds=1)
+
+    def __init__(self, connector, tasks, onconflict=None, workers=1):
+        """
+            Args:
+                connector: the S3SyncRepository
+                tasks: the sync_task Rows
+                onconflict: callback for automatic conflict resolution
+                workers: the maximum number of concurrent transfers,
+                         1 to run all tasks sequentially
+        """
+
+        self.connector = connector
+        self.tasks = tasks
+        self.onconflict = onconflict
+        self.workers = workers
+
+        self.pool = None
+        self.running = {}
+
+        self.success = True
+
+    # -------------------------------------------------------------------------
+    def __call__(self):
+        """
+            Run all tasks
+
+            Returns:
+                True if successful, False if there was an error
+        """
+
+        jobs = []
+        for task in self.tasks:
+            if task.mode in (1, 3):
+                phase = self.PULL
+            elif task.mode in (2, 3):
+                phase = self.PUSH
+            else:
+                phase = self.DONE
+            jobs.append(Storage(task = task,
+                                phase = phase,
+                                steps = None,
+                                depends = [],
+                                ))
+
+        # Resolve dependencies
+        dependencies = self.dependencies([job.task.resource_name for job in jobs])
+        for index, job in enumerate(jobs):
+            job.depends = [jobs[i] for i in dependencies[index]]
+
+        workers = self.workers
+        if workers and workers > 1 and len(jobs) > 1:
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+
+        running = self.running
+        try:
+            while True:
+                started = False
+                for job in jobs:
+                    if job.phase != self.DONE and job.steps is None and \
+                       self.ready(job):
+                        self.start(job)
+                        started = True
+
+                if running:
+                    done = wait(running, return_when=FIRST_COMPLETED)[0]
+                    for future in done:
+                        job = running.pop(future)
+                        self.advance(job, future.result())
+
+                elif not started:
+                    pending = [job for job in jobs if job.phase != self.DONE]
+                    if not pending:
+                        break
+                    # Circular dependency => start the first pending job
+                    self.start(pending[0])
+        finally:
+            if self.pool:
+                self.pool.shutdown(wait=True)
+                self.pool = None
+
+        return self.success
+
+    # -------------------------------------------------------------------------
+    def ready(self, job):
+        """
+            Check whether the current phase of a job can be started
+
+            Args:
+                job: the job
+
+            Returns:
+                boolean
+        """
+
+        if job.phase == self.PULL:
+            return all(other.phase != self.PULL for other in job.depends)
+        else:
+            return all(other.phase == self.DONE for other in job.depends)
+
+    # -------------------------------------------------------------------------
+    def start(self, job):
+        """
+            Start the current phase of a job
+
+            Args:
+                job: the job
+        """
+
+        connector = self.connector
+        task = job.task
+
+        if job.phase == self.PULL:
+            job.steps = connector.pull_steps(task, onconflict=self.onconflict)
+        else:
+            job.steps = connector.push_steps(task)
+
+        self.advance(job)
+
+    # -------------------------------------------------------------------------
+    def advance(self, job, response=None):
+        """
+            Continue a job until its next network transfer (which is then
+            submitted to the thread pool), or until its current phase is
+            complete
+
+            Args:
+                job: the job
+                response: the result of the previous network transfer
+        """
+
+        pool = self.pool
+
+        steps = job.steps
+        while True:
+            try:
+                request = steps.send(response)
+            except StopIteration as e:
+                self.complete(job, e.value)
+                break
+            if pool:
+                self.running[pool.submit(request)] = job
+                break
+            else:
+                response = request()
+
+    # -------------------------------------------------------------------------
+    def complete(self, job, result):
+        """
+            Complete the current phase of a job, and update the task
+
+            Args:
+                job: the job
+                result: the result of the phase, tuple (error, mtime)
+        """
+
+        task = job.task
+        job.steps = None
+
+        error, mtime = result if result else (None, None)
+
+        if job.phase == self.PULL:
+            if error:
+                self.success = False
+                current.log.debug("S3Sync: %s PULL error: %s" %
+                                  (task.resource_name, error))
+                job.phase = self.DONE
+                return
+            if mtime is not None:
+                task.update_record(last_pull=mtime+self.DELTA)
+            job.phase = self.PUSH if task.mode in (2, 3) else self.DONE
+
+        else:
+            if error:
+                self.success = False
+                current.log.debug("S3Sync: %s PUSH error: %s" %
+                                  (task.resource_name, error))
+            elif mtime is not None:
+                task.update_record(last_push=mtime+self.DELTA)
+            job.phase = self.DONE
+
+        if job.phase == self.DONE and not error:
+            current.log.debug("S3Sync.synchronize: %s done" % task.resource_name)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def dependencies(tablenames):
+        """
+            Determine the dependencies between tasks from the foreign
+            keys between their tables
+
+            Args:
+                tablenames: the table names of the tasks
+
+            Returns:
+                list of lists with the indices of the tasks each task
+                depends on
+        """
+
+        s3db = current.s3db
+
+        indices = {}
+        for index, tablename in enumerate(tablenames):
+            indices.setdefault(tablename, []).append(index)
+
+        dependencies = []
+        for index, tablename in enumerate(tablenames):
+            depends = set()
+            table = s3db.table(tablename)
+            if table is not None:
+                for field in table:
+                    ftype = str(field.type)
+                    if ftype[:10] == "reference ":
+                        lookup = ftype[10:]
+                    elif ftype[:15] == "list:reference ":
+                        lookup = ftype[15:]
+                    else:
+                        continue
+                    lookup = lookup.split(".", 1)[0]
+                    if lookup != tablename and lookup in indices:
+                        depends.update(indices[lookup])
+            depends.discard(index)
+            dependencies.append(sorted(depends))
+
+        return dependencies
+
+# END =========================================================================
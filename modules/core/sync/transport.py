@@ -0,0 +1,207 @@
+"""
+    Synchronization: Transport Compression
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("SyncCompression",
+           )
+
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# =============================================================================
+class SyncCompression:
+    """
+        HTTP content coding (compression) of sync payloads
+
+        - responses are compressed as requested by the peer (Accept-Encoding)
+        - both sides advertise the content codings they accept for request
+          bodies by an Accept-Encoding response header (RFC 7694), so that
+          pushes are compressed only for peers which can decompress them
+        - zstd requires the zstandard module, gzip is always available
+    """
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def encodings():
+        """
+            The supported content codings, in order of preference
+
+            Returns:
+                list of content codings
+        """
+
+        return ["zstd", "gzip"] if zstandard else ["gzip"]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def accept_encoding(cls):
+        """
+            The value for the Accept-Encoding header
+
+            Returns:
+                the header value (str)
+        """
+
+        return ", ".join(cls.encodings())
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def negotiate(cls, accept_encoding):
+        """
+            Choose the content coding for a payload
+
+            Args:
+                accept_encoding: the Accept-Encoding header of the peer
+
+            Returns:
+                the content coding, or None to send uncompressed
+        """
+
+        if not accept_encoding:
+            return None
+
+        accepted = set()
+        for item in accept_encoding.split(","):
+            params = item.strip().split(";")
+            coding = params[0].strip().lower()
+            quality = 1.0
+            for param in params[1:]:
+                name, _, value = param.strip().partition("=")
+                if name.strip() == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            if quality > 0:
+                accepted.add(coding)
+
+        for coding in cls.encodings():
+            if coding in accepted:
+                return coding
+        return None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def compress(data, encoding):
+        """
+            Compress a payload
+
+            Args:
+                data: the payload (bytes)
+                encoding: the content coding
+
+            Returns:
+                the compressed payload (bytes)
+
+            Raises:
+                ValueError: for unsupported content codings
+        """
+
+        if encoding == "gzip":
+            return gzip.compress(data, compresslevel=6)
+        elif encoding == "zstd" and zstandard:
+            return zstandard.ZstdCompressor().compress(data)
+        else:
+            raise ValueError("Unsupported content coding: %s" % encoding)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def decompress(data, encoding):
+        """
+            Decompress a payload
+
+            Args:
+                data: the compressed payload (bytes)
+                encoding: the content coding
+
+            Returns:
+                the payload (bytes)
+
+            Raises:
+                ValueError: for unsupported content codings or
+                            invalid compressed data
+        """
+
+        encoding = encoding.strip().lower() if encoding else None
+
+        if not encoding or encoding == "identity":
+            return data
+        elif encoding == "gzip":
+            try:
+                return gzip.decompress(data)
+            except (OSError, EOFError, zlib.error) as e:
+                raise ValueError("Invalid gzip data: %s" % e)
+        elif encoding == "zstd" and zstandard:
+            # Streamed frames do not contain the content size
+            # => must use a decompressobj
+            try:
+                return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+            except zstandard.ZstdError as e:
+                raise ValueError("Invalid zstd data: %s" % e)
+        else:
+            raise ValueError("Unsupported content coding: %s" % encoding)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def compress_stream(chunks, encoding):
+        """
+            Compress a streamed payload
+
+            Args:
+                chunks: iterable of payload chunks (bytes)
+                encoding: the content coding
+
+            Returns:
+                a generator of compressed chunks
+
+            Raises:
+                ValueError: for unsupported content codings
+        """
+
+        if encoding == "gzip":
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif encoding == "zstd" and zstandard:
+            compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            raise ValueError("Unsupported content coding: %s" % encoding)
+
+        def stream():
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+
+        return stream()
+
+# END =========================================================================
@@ -3,7 +3,9 @@ from .calendar import *
 from .convert import *
 from .hierarchy import *
 from .includes import *
+from .journal import *
 from .multipath import *
+from .profiling import *
 from .represent import *
 from .tasks import *
 from .timeseries import *
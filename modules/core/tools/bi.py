@@ -31,8 +31,10 @@ __all__ = ("BulkImporter",
 import csv
 import datetime
 import json
+import multiprocessing
 import os
 
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from io import BytesIO
 from urllib.error import URLError
 from xml.sax.saxutils import unescape
@@ -45,6 +47,38 @@ from .validators import IS_JSONS3, JSONERRORS
 
 EMPTYLINE = [None, None, None, None, None]
 
+# =============================================================================
+def _init_worker():
+    """
+        Initializer for prepopulate worker processes: replaces the database
+        connection inherited from the parent process by a new one
+    """
+
+    adapter = current.db._adapter
+
+    # Discard (without closing) any pooled connections shared with the
+    # parent process - worker processes exit without running finalizers,
+    # so the parent connection remains intact; the current connection
+    # is thread-local by process ID, so the worker opens a new one
+    pools = getattr(adapter, "POOLS", None)
+    if pools and adapter.uri in pools:
+        pools[adapter.uri] = []
+    adapter.reconnect()
+
+# -----------------------------------------------------------------------------
+def _perform_task(task):
+    """
+        Runs a prepopulate task in a worker process
+
+        Args:
+            task: the task (tuple)
+
+        Returns:
+            tuple (errors, message, duration), see BulkImporter.perform_task
+    """
+
+    return BulkImporter().perform_task(task)
+
 # =============================================================================
 class BulkImporter:
     """
@@ -57,6 +91,7 @@ class BulkImporter:
     def __init__(self):
 
         self._handlers = None
+        self.timings = []
 
     # -------------------------------------------------------------------------
     # Task Runner
@@ -99,52 +134,300 @@ class BulkImporter:
 
             Returns:
                 a list of error messages (empty list if there were no errors)
+
+            Note:
+                - with settings.base.prepopulate_workers > 1, mutually
+                  independent tasks are run concurrently in a pool of
+                  worker processes (not for SQLite)
+                - the durations of the tasks are collected in self.timings
+                  as list of tuples (message, seconds)
         """
 
         errors = []
-        db = current.db
 
+        tasks = []
         for task in self.parse_task_config(path):
-            task_type = task[0]
-            if not task_type:
+            if not task[0]:
                 errors.append(task[1])
-                continue
+            else:
+                tasks.append(task)
+
+        self.timings = timings = []
+
+        workers = current.deployment_settings.get_base_prepopulate_workers()
+        if workers and workers > 1 and len(tasks) > 1:
+            if current.db._dbname == "sqlite":
+                current.log.debug("Parallel prepopulate not supported for SQLite, running tasks sequentially")
+                results = map(self.perform_task, tasks)
+            else:
+                results = self.perform_parallel(tasks, workers)
+        else:
+            results = map(self.perform_task, tasks)
+
+        for task_errors, msg, duration in results:
+            errors.extend(task_errors)
+            if msg:
+                timings.append((msg, duration))
 
-            start = datetime.datetime.now()
+        # Rebuild hierarchies of imported tables once all tasks are done
+        self.rebuild_hierarchies(tasks)
 
-            if task_type == 1:
-                error = self.import_csv(*(task[1:6]))
+        if timings:
+            report = ["%s (%s sec)" % (msg, "{:.2f}".format(duration))
+                      for msg, duration in sorted(timings, key=lambda t: -t[1])]
+            current.log.debug("Task timings:\n%s" % "\n".join(report))
+
+        return errors
+
+    # -------------------------------------------------------------------------
+    def perform_task(self, task):
+        """
+            Runs a single import task, and commits if successful
+
+            Args:
+                task: the task (tuple) as returned from parse_task_line
+
+            Returns:
+                tuple (errors, message, duration), with errors being a list
+                of error messages (empty if there were no errors), and
+                duration the time taken (in seconds)
+        """
+
+        errors = []
+        db = current.db
+
+        task_type = task[0]
+        start = datetime.datetime.now()
+
+        if task_type == 1:
+            error = self.import_csv(*(task[1:6]))
+            if isinstance(error, list):
+                errors.extend(error)
+            elif error:
+                errors.append(error)
+            else:
+                db.commit()
+            csv_name = os.path.split(task[3])[1]
+            msg = "%s imported" % csv_name
+
+        elif task_type == 2:
+            handler = self.handlers.get(task[1])
+            if not handler:
+                errors.append("Invalid task type %s" % task[1])
+                return errors, None, 0
+            try:
+                error = handler(*task[2:])
+            except TypeError as e:
+                errors.append(str(e))
+            else:
                 if isinstance(error, list):
                     errors.extend(error)
                 elif error:
                     errors.append(error)
                 else:
                     db.commit()
-                csv_name = os.path.split(task[3])[1]
-                msg = "%s imported (%%s sec)" % csv_name
+            msg = "%s completed" % task[1]
+
+        else:
+            return errors, None, 0
+
+        duration = (datetime.datetime.now() - start).total_seconds()
+        current.log.debug("%s (%s sec)" % (msg, '{:.2f}'.format(duration)))
+
+        return errors, msg, duration
+
+    # -------------------------------------------------------------------------
+    def perform_parallel(self, tasks, workers):
+        """
+            Runs import tasks concurrently in a pool of worker processes,
+            each task starting as soon as all tasks it depends on are
+            completed
+
+            Args:
+                tasks: the list of tasks
+                workers: the maximum number of worker processes
+
+            Returns:
+                a list of tuples (errors, message, duration), in task order
+
+            Note:
+                The workers are forked from the current process, so that
+                they inherit the current request environment, but each
+                opens its own database connection
+        """
+
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            current.log.debug("Process forking not supported, running tasks sequentially")
+            return [self.perform_task(task) for task in tasks]
+
+        dependencies = self.task_dependencies(tasks)
+
+        # Workers must not inherit an open transaction
+        current.db.commit()
+
+        results = [None] * len(tasks)
+        pending = dict(enumerate(dependencies))
+        completed = set()
+        running = {}
+
+        with ProcessPoolExecutor(max_workers = workers,
+                                 mp_context = context,
+                                 initializer = _init_worker,
+                                 ) as executor:
+            while pending or running:
+                # Start all tasks that have no more pending dependencies
+                for index in sorted(pending):
+                    if pending[index] <= completed:
+                        del pending[index]
+                        future = executor.submit(_perform_task, tasks[index])
+                        running[future] = index
+
+                done = wait(running, return_when=FIRST_COMPLETED)[0]
+                for future in done:
+                    index = running.pop(future)
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        results[index] = (["Task %s failed: %s" % (str(tasks[index][1:3]), e)], None, 0)
+                    completed.add(index)
+
+        return results
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def task_dependencies(cls, tasks):
+        """
+            Derives the dependencies between import tasks from the table
+            references between their target resources; tasks depend on
+            all earlier tasks that import into the same or referenced
+            tables (in either direction)
+
+            Args:
+                tasks: the list of tasks
+
+            Returns:
+                a list with the set of indexes of the tasks each task
+                depends on, in task order
+
+            Note:
+                Tasks with unknown targets (i.e. handler tasks other than
+                import_xml) depend on all earlier tasks, and all later
+                tasks depend on them
+        """
+
+        dependencies = []
+        footprints = []
+
+        for index, task in enumerate(tasks):
+
+            if task[0] == 1:
+                tablename = "%s_%s" % (task[1], task[2])
+            elif task[0] == 2 and task[1] == "import_xml" and len(task) > 4:
+                tablename = "%s_%s" % (task[3], task[4])
+            else:
+                tablename = None
+
+            footprint = cls.footprint(tablename) if tablename else None
+
+            if footprint is None:
+                depends = set(range(index))
+            else:
+                depends = set()
+                for i, other in enumerate(footprints):
+                    if other is None or other & footprint:
+                        depends.add(i)
+
+            dependencies.append(depends)
+            footprints.append(footprint)
+
+        return dependencies
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def footprint(tablename):
+        """
+            Determines the set of tables an import into a table can
+            read or write, i.e. the table itself, its super-entities, its
+            components, and the tables these reference
+
+            Args:
+                tablename: the target table name
 
-            elif task_type == 2:
-                handler = self.handlers.get(task[1])
-                if not handler:
-                    errors.append("Invalid task type %s" % task[1])
+            Returns:
+                a set of table names, or None if the table is not defined
+        """
+
+        s3db = current.s3db
+
+        table = s3db.table(tablename)
+        if not table:
+            return None
+
+        from ..model import s3_all_meta_field_names
+        from .utils import s3_get_foreign_key
+
+        meta_fields = set(s3_all_meta_field_names())
+
+        tables = {tablename: table}
+        supertables = s3db.get_config(tablename, "super_entity")
+        if supertables:
+            if not isinstance(supertables, (list, tuple)):
+                supertables = [supertables]
+            for supertable in supertables:
+                if not isinstance(supertable, str):
+                    supertable = supertable._tablename
+                tables[supertable] = None
+
+        for component in s3db.get_components(tablename).values():
+            tables[component.tablename] = component.table
+            link = component.linktable
+            if link:
+                tables[link._tablename] = link
+
+        footprint = set(tables)
+        for table in tables.values():
+            if table is None:
+                continue
+            for field in table:
+                if field.name in meta_fields:
                     continue
-                try:
-                    error = handler(*task[2:])
-                except TypeError as e:
-                    errors.append(str(e))
-                else:
-                    if isinstance(error, list):
-                        errors.extend(error)
-                    elif error:
-                        errors.append(error)
-                    else:
-                        db.commit()
-                msg = "%s completed (%%s sec)" % task[1]
+                ktablename = s3_get_foreign_key(field)[0]
+                if ktablename:
+                    footprint.add(ktablename)
 
-            duration = datetime.datetime.now() - start
-            current.log.debug(msg % '{:.2f}'.format(duration.total_seconds()))
+        return footprint
 
-        return errors
+    # -------------------------------------------------------------------------
+    @classmethod
+    def rebuild_hierarchies(cls, tasks):
+        """
+            Rebuilds the hierarchies of all tables imported by tasks
+
+            Args:
+                tasks: the list of tasks
+        """
+
+        s3db = current.s3db
+
+        tablenames = set()
+        for task in tasks:
+            if task[0] == 1:
+                tablenames.add("%s_%s" % (task[1], task[2]))
+            elif task[0] == 2 and task[1] == "import_xml" and len(task) > 4:
+                tablenames.add("%s_%s" % (task[3], task[4]))
+
+        from .hierarchy import S3Hierarchy
+
+        for tablename in sorted(tablenames):
+            if not s3db.table(tablename) or \
+               not s3db.get_config(tablename, "hierarchy"):
+                continue
+            S3Hierarchy.dirty(tablename)
+            S3Hierarchy(tablename).save()
+
+        current.db.commit()
 
     # -------------------------------------------------------------------------
     # Task Config Parser
@@ -282,6 +565,16 @@ class BulkImporter:
         sp = csv_path.rsplit(".", 1)
         zipped = len(sp) > 1 and sp[-1] == "zip"
 
+        # Import large files in chunks?
+        chunk_size = current.deployment_settings.get_base_import_chunk_size()
+        if chunk_size:
+            csv_name = os.path.split(csv_path)[1]
+            def progress(rows, result):
+                current.log.debug("%s: %s rows processed, %s records imported" % \
+                                  (csv_name, rows, result.count))
+        else:
+            progress = None
+
         # Import from source
         auth = current.auth
         auth.rollback = True
@@ -297,6 +590,8 @@ class BulkImporter:
                                              source_type = "csv",
                                              stylesheet = xslt_path,
                                              extra_data = extra_data,
+                                             chunk_size = chunk_size,
+                                             progress = progress,
                                              )
         except IOError as e:
             return str(e)
@@ -70,6 +70,7 @@ class S3Hierarchy:
 
         self.__theset = None
         self.__flags = None
+        self.__closure = None
 
         self.__nodes = None
         self.__roots = None
@@ -370,6 +371,319 @@ class S3Hierarchy:
             flags["dbstatus"] = False
         return
 
+    # -------------------------------------------------------------------------
+    # Closure Table
+    #
+    @staticmethod
+    def use_closure(tablename):
+        """
+            Check whether the closure table is to be used for a hierarchy
+
+            Args:
+                tablename: the tablename
+
+            Returns:
+                True|False
+        """
+
+        setting = current.deployment_settings.get_base_hierarchy_closure()
+        if isinstance(setting, (list, tuple, set)):
+            return tablename in setting
+        return bool(setting)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def parent_field(table):
+        """
+            Find the parent field of a self-referencing hierarchy
+
+            Args:
+                table: the hierarchical table
+
+            Returns:
+                the parent Field, or None if the hierarchy is not
+                self-referencing (e.g. uses a link table)
+        """
+
+        tablename = table._tablename
+
+        config = current.s3db.get_config(tablename, "hierarchy")
+        if not config:
+            return None
+        parent = config[0] if isinstance(config, tuple) else config
+
+        if parent is None:
+            fields = [f for f in table]
+        elif "." not in parent and parent in table.fields:
+            fields = [table[parent]]
+        else:
+            return None
+
+        pkey = table._id.name
+        for field in fields:
+            ftype = str(field.type)
+            if ftype[:9] == "reference":
+                key = ftype[10:].split(".")
+                if key[0] == tablename and \
+                   (len(key) == 1 or key[1] == pkey):
+                    return field
+        return None
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def watch(cls, tablename):
+        """
+            Register DAL callbacks to maintain the closure table of a
+            self-referencing hierarchy when nodes are added, moved or
+            removed (does nothing if the closure table is not used
+            for this hierarchy)
+
+            Args:
+                tablename: the tablename
+        """
+
+        db = current.db
+
+        if tablename not in db or not cls.use_closure(tablename):
+            return
+        table = db[tablename]
+
+        after_insert = table._after_insert
+        if any(getattr(hook, "hierarchy_closure", None) == tablename
+               for hook in after_insert):
+            return
+
+        fkey = cls.parent_field(table)
+        if fkey is None:
+            return
+        fname = fkey.name
+        pkey = table._id
+
+        DELETED = current.xml.DELETED
+        move_node = cls.move_node
+
+        def inserted(fields, node_id):
+            move_node(tablename, node_id, fields.get(fname))
+        inserted.hierarchy_closure = tablename
+
+        # Updates can change the set they are selecting from, so need
+        # to look up the node IDs before the update
+        pending = []
+        def before_update(dbset, fields):
+            if fields.get(fname, DEFAULT) is not DEFAULT or \
+               fields.get(DELETED, DEFAULT) is not DEFAULT:
+                node_ids = [row[pkey] for row in dbset.select(pkey)]
+            else:
+                node_ids = None
+            pending.append(node_ids)
+
+        def updated(dbset, fields):
+            node_ids = pending.pop() if pending else None
+            if not node_ids:
+                return
+            fields = [pkey, fkey]
+            if DELETED in table.fields:
+                fields.append(table[DELETED])
+            rows = db(pkey.belongs(node_ids)).select(*fields)
+            for row in rows:
+                if row.get(DELETED):
+                    parent_id = None
+                else:
+                    parent_id = row[fkey]
+                move_node(tablename, row[pkey], parent_id)
+
+        def before_delete(dbset):
+            for row in dbset.select(pkey):
+                move_node(tablename, row[pkey], None)
+
+        after_insert.append(inserted)
+        table._before_update.append(before_update)
+        table._after_update.append(updated)
+        table._before_delete.append(before_delete)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def move_node(tablename, node_id, parent_id):
+        """
+            Add or move a node (including its subtree) in the closure
+            table; removes the subtree from its previous ancestors
+
+            Args:
+                tablename: the tablename
+                node_id: the node ID
+                parent_id: the new parent node ID, None to make the
+                           node a root node (or to remove it)
+        """
+
+        if not node_id:
+            return
+
+        db = current.db
+        ctable = current.s3db.s3_hierarchy_closure
+
+        # Current subtree of the node
+        query = (ctable.tablename == tablename) & \
+                (ctable.ancestor == node_id)
+        rows = db(query).select(ctable.descendant, ctable.depth)
+        subtree = {row.descendant: row.depth for row in rows}
+        if not subtree:
+            ctable.insert(tablename = tablename,
+                          ancestor = node_id,
+                          descendant = node_id,
+                          depth = 0,
+                          )
+            subtree = {node_id: 0}
+        elif parent_id in subtree:
+            # Would create a cycle
+            return
+
+        # Detach the subtree from its previous ancestors
+        descendants = list(subtree)
+        query = (ctable.tablename == tablename) & \
+                (ctable.descendant.belongs(descendants)) & \
+                (~(ctable.ancestor.belongs(descendants)))
+        db(query).delete()
+
+        if not parent_id:
+            return
+
+        # Attach the subtree to the ancestors of the new parent
+        query = (ctable.tablename == tablename) & \
+                (ctable.descendant == parent_id)
+        ancestors = db(query).select(ctable.ancestor, ctable.depth)
+        if not ancestors:
+            # Parent not in the closure yet
+            ctable.insert(tablename = tablename,
+                          ancestor = parent_id,
+                          descendant = parent_id,
+                          depth = 0,
+                          )
+            ancestors = [Storage(ancestor=parent_id, depth=0)]
+
+        items = [{"tablename": tablename,
+                  "ancestor": ancestor.ancestor,
+                  "descendant": descendant,
+                  "depth": ancestor.depth + depth + 1,
+                  }
+                 for ancestor in ancestors
+                 for descendant, depth in subtree.items()
+                 ]
+        ctable.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    def rebuild_closure(self):
+        """
+            Rebuild the closure table for this hierarchy from the node set
+        """
+
+        tablename = self.tablename
+        if not tablename or not self.config:
+            return
+
+        theset = self.theset
+
+        items = []
+        append = items.append
+        for node_id, node in theset.items():
+            depth = 0
+            ancestor_id = node_id
+            seen = set()
+            while ancestor_id and ancestor_id not in seen:
+                seen.add(ancestor_id)
+                append({"tablename": tablename,
+                        "ancestor": ancestor_id,
+                        "descendant": node_id,
+                        "depth": depth,
+                        })
+                ancestor = theset.get(ancestor_id)
+                ancestor_id = ancestor["p"] if ancestor else None
+                depth += 1
+
+        db = current.db
+        s3db = current.s3db
+
+        ctable = s3db.s3_hierarchy_closure
+        db(ctable.tablename == tablename).delete()
+        if items:
+            ctable.bulk_insert(items)
+
+        # Mark the closure table as valid
+        htable = s3db.s3_hierarchy
+        query = (htable.tablename == tablename)
+        row = db(query).select(htable.id, limitby=(0, 1)).first()
+        if row:
+            row.update_record(closure=True)
+        else:
+            # No stored hierarchy yet => insert as dirty
+            htable.insert(tablename=tablename, dirty=True, closure=True)
+
+        self.__closure = True
+
+    # -------------------------------------------------------------------------
+    @property
+    def closure(self):
+        """
+            Whether subtree lookups for this hierarchy can use the closure
+            table; builds the closure table if it does not exist yet
+
+            Returns:
+                True|False
+        """
+
+        tablename = self.tablename
+        if not tablename or not self.config or \
+           not self.use_closure(tablename):
+            return False
+
+        table = current.s3db.table(tablename)
+        if not table or self.parent_field(table) is None:
+            return False
+
+        # Make sure the closure table is maintained
+        self.watch(tablename)
+
+        if not self.__closure:
+            # Check whether the closure table has been built
+            htable = current.s3db.s3_hierarchy
+            query = (htable.tablename == tablename)
+            row = current.db(query).select(htable.closure,
+                                           limitby = (0, 1),
+                                           ).first()
+            if row and row.closure:
+                self.__closure = True
+            else:
+                self.rebuild_closure()
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def subtree(self, node_ids):
+        """
+            Nested SELECT of all descendants of nodes from the closure
+            table, to be used with belongs()
+
+            Args:
+                node_ids: the node IDs (iterable)
+
+            Returns:
+                the nested SELECT (including the nodes themselves)
+
+            Note:
+                Other than findall, this does not restrict the result to
+                the subset of accessible nodes
+        """
+
+        ctable = current.s3db.s3_hierarchy_closure
+
+        node_ids = list(node_ids)
+        if len(node_ids) == 1:
+            query = (ctable.ancestor == node_ids[0])
+        else:
+            query = (ctable.ancestor.belongs(node_ids))
+        query = (ctable.tablename == self.tablename) & query
+
+        return current.db(query)._select(ctable.descendant, distinct=True)
+
     # -------------------------------------------------------------------------
     def read(self):
         """ Rebuild this hierarchy from the target table """
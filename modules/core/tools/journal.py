@@ -0,0 +1,389 @@
+"""
+    Change Journal
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("ChangeJournal",
+           "JournalCursor",
+           )
+
+import datetime
+import threading
+import time
+
+from gluon import current
+from gluon.storage import Storage
+
+# =============================================================================
+class ChangeJournal:
+    """
+        Append-only journal of record changes (change data capture), to
+        find out what has changed since a point in time without scanning
+        whole tables by modified_on
+
+        - entries are written by DAL-level callbacks registered for all
+          tables with meta-fields (DataModel.define_table), so they cover
+          all writes through the DAL (CRUDResource, ImportItem.commit,
+          DeleteProcess, forms, onaccept-callbacks etc.), including hard
+          deletes
+        - entries are numbered by a sequence (the record ID of the entry)
+
+        Note:
+            Writes bypassing the DAL callbacks (executesql, update_naive,
+            delete_naive) are not recorded; the journal must therefore
+            also not be disabled temporarily once consumers rely on it
+    """
+
+    TABLENAME = "s3_change"
+
+    # Operations
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+    # Maximum time for a transaction to commit (seconds): a gap in the
+    # sequence which is older than this is assumed to come from a rolled
+    # back transaction rather than from one which has not committed yet
+    COMMIT_TIMEOUT = 300
+
+    # Maximum number of record IDs returned by changed()
+    MAX_IDS = 10000
+
+    instance = None
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_journal(cls):
+        """
+            Returns the change journal, if enabled in deployment settings
+
+            Returns:
+                the ChangeJournal, or None if disabled
+        """
+
+        if not current.deployment_settings.get_base_change_journal():
+            return None
+
+        journal = cls.instance
+        if journal is None:
+            journal = cls.instance = cls()
+        return journal
+
+    # -------------------------------------------------------------------------
+    @property
+    def table(self):
+        """
+            The journal table
+        """
+
+        return current.s3db[self.TABLENAME]
+
+    # -------------------------------------------------------------------------
+    def watch(self, table):
+        """
+            Registers DAL callbacks to record all changes of records in
+            a table
+
+            Args:
+                table: the Table
+        """
+
+        if "uuid" not in table.fields:
+            return
+
+        tablename = table._tablename
+        after_insert = table._after_insert
+        if any(getattr(hook, "change_journal", False) for hook in after_insert):
+            return
+
+        def inserted(fields, record_id):
+            self.record(tablename,
+                        self.CREATE,
+                        [(record_id, fields.get("uuid"))],
+                        mtime = fields.get("modified_on"),
+                        )
+
+        def updating(dbset, fields):
+            operation = self.DELETE if fields.get("deleted") else self.UPDATE
+            self.record(tablename,
+                        operation,
+                        self.identities(table, dbset),
+                        mtime = fields.get("modified_on"),
+                        )
+
+        def deleting(dbset):
+            self.record(tablename, self.DELETE, self.identities(table, dbset))
+
+        for hook in (inserted, updating, deleting):
+            hook.change_journal = True
+
+        # NB before-callbacks must not return True (would cancel the write)
+        after_insert.append(inserted)
+        table._before_update.append(updating)
+        table._before_delete.append(deleting)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def identities(table, dbset):
+        """
+            Looks up the records affected by an update or delete
+
+            Args:
+                table: the Table
+                dbset: the Set to update or delete
+
+            Returns:
+                list of tuples (record_id, uuid)
+        """
+
+        rows = dbset.select(table._id, table.uuid)
+        return [(row[table._id], row.uuid) for row in rows]
+
+    # -------------------------------------------------------------------------
+    def record(self, tablename, operation, identities, mtime=None):
+        """
+            Writes entries to the journal
+
+            Args:
+                tablename: the table name
+                operation: the operation (CREATE, UPDATE or DELETE)
+                identities: list of tuples (record_id, uuid)
+                mtime: the modified_on written to the records
+        """
+
+        if not identities:
+            return
+
+        # Use the actual time rather than request.utcnow, and never
+        # earlier than the modified_on of the record (which can be in
+        # the future when imported from a peer with a different clock)
+        now = datetime.datetime.utcnow()
+        if isinstance(mtime, datetime.datetime) and mtime > now:
+            now = mtime
+
+        table = self.table
+        for record_id, uuid in identities:
+            table.insert(tablename = tablename,
+                         record_id = record_id,
+                         uuid = uuid,
+                         operation = operation,
+                         timestmp = now,
+                         )
+
+    # -------------------------------------------------------------------------
+    def latest(self):
+        """
+            Returns the sequence number of the latest entry
+
+            Returns:
+                the sequence number (0 if the journal is empty)
+        """
+
+        table = self.table
+        latest = table.id.max()
+
+        row = current.db(table.id > 0).select(latest).first()
+        return row[latest] or 0 if row else 0
+
+    # -------------------------------------------------------------------------
+    def changes(self, since=0, tablenames=None, limit=1000):
+        """
+            Reads the changes since a sequence number
+
+            Args:
+                since: the sequence number of the last change seen
+                tablenames: read only changes of these tables
+                limit: the maximum number of entries to read
+
+            Returns:
+                tuple (changes, sequence), with changes being a list of
+                entries {sequence, tablename, record_id, uuid, operation,
+                timestmp}, and sequence being the number to continue from
+
+            Note:
+                Reading stops before any gap in the sequence that may yet
+                be filled by a pending transaction, so that no change is
+                skipped when continuing from the returned sequence
+        """
+
+        table = self.table
+
+        query = (table.id > since)
+        rows = current.db(query).select(table.id,
+                                        table.tablename,
+                                        table.record_id,
+                                        table.uuid,
+                                        table.operation,
+                                        table.timestmp,
+                                        orderby = table.id,
+                                        limitby = (0, limit) if limit else None,
+                                        )
+
+        cutoff = datetime.datetime.utcnow() - \
+                 datetime.timedelta(seconds=self.COMMIT_TIMEOUT)
+
+        changes = []
+        sequence = since
+        for row in rows:
+            if row.id != sequence + 1 and row.timestmp > cutoff:
+                # Recent gap => stop here
+                break
+            sequence = row.id
+            if tablenames and row.tablename not in tablenames:
+                continue
+            changes.append(Storage(sequence = row.id,
+                                   tablename = row.tablename,
+                                   record_id = row.record_id,
+                                   uuid = row.uuid,
+                                   operation = row.operation,
+                                   timestmp = row.timestmp,
+                                   ))
+
+        return changes, sequence
+
+    # -------------------------------------------------------------------------
+    def changed_tables(self, since, limit=1000):
+        """
+            Determines which tables have changed since a sequence number
+
+            Args:
+                since: the sequence number of the last change seen
+                limit: the maximum number of entries to read
+
+            Returns:
+                tuple (tablenames, sequence), with tablenames=None if
+                there were too many changes to read
+        """
+
+        changes, sequence = self.changes(since, limit=limit)
+        if len(changes) >= limit:
+            return None, self.latest()
+        return {change.tablename for change in changes}, sequence
+
+    # -------------------------------------------------------------------------
+    def changed(self, tablename, msince):
+        """
+            Looks up the records in a table that have changed since a
+            point in time
+
+            Args:
+                tablename: the table name
+                msince: the point in time (datetime)
+
+            Returns:
+                set of record IDs, or None if the journal does not cover
+                the whole period or there are too many changed records
+        """
+
+        db = current.db
+        table = self.table
+
+        # The journal must go back to msince
+        first = db(table.id > 0).select(table.timestmp,
+                                        orderby = table.id,
+                                        limitby = (0, 1),
+                                        ).first()
+        if not first or first.timestmp > msince:
+            return None
+
+        query = (table.tablename == tablename) & \
+                (table.timestmp >= msince)
+        rows = db(query).select(table.record_id,
+                                distinct = True,
+                                limitby = (0, self.MAX_IDS + 1),
+                                )
+        if len(rows) > self.MAX_IDS:
+            return None
+
+        return {row.record_id for row in rows}
+
+    # -------------------------------------------------------------------------
+    def prune(self, before):
+        """
+            Removes old entries from the journal
+
+            Args:
+                before: remove entries written before this datetime
+
+            Returns:
+                the number of entries removed
+        """
+
+        table = self.table
+        return current.db(table.timestmp < before).delete()
+
+# =============================================================================
+class JournalCursor:
+    """
+        Position of a process-local consumer (e.g. a cache) in the change
+        journal, to find out which tables have been changed (by any process)
+        since the consumer has last checked
+    """
+
+    def __init__(self, interval=1):
+        """
+            Args:
+                interval: the minimum time between two polls (seconds)
+        """
+
+        self.interval = interval
+
+        self.sequence = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    def poll(self):
+        """
+            Reads the journal since the last poll, unless polled within
+            the interval (or concurrently by another thread)
+
+            Returns:
+                set of names of the tables changed since the last poll,
+                or None if there were too many changes to tell
+        """
+
+        journal = ChangeJournal.get_journal()
+        if not journal:
+            return set()
+
+        now = time.time()
+        if now - self.checked < self.interval or \
+           not self.lock.acquire(blocking=False):
+            return set()
+        try:
+            self.checked = now
+            if self.sequence is None:
+                # First poll => start from here
+                self.sequence = journal.latest()
+                tablenames = set()
+            else:
+                tablenames, self.sequence = journal.changed_tables(self.sequence)
+        finally:
+            self.lock.release()
+
+        return tablenames
+
+# END =========================================================================
@@ -0,0 +1,582 @@
+"""
+    Request Profiling
+
+    Copyright: 2022 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("RequestProfile",
+           )
+
+import datetime
+import functools
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+from collections import deque
+
+from gluon import current
+
+try:
+    from pydal.contrib import portalocker
+except ImportError:
+    # older web2py
+    from gluon import portalocker
+
+# =============================================================================
+class RequestProfile:
+    """
+        Per-request instrumentation of hot paths (opt-in), recording the
+        number and total time of:
+
+        - db: SQL statements, by (first) table
+        - represent: S3Represent lookups, by lookup table
+        - acl: accessible_query builds, by table
+        - model: DataModel loads, by model (including dependent models)
+        - xslt: XSLT transformations, by stylesheet
+        - render: view rendering (from the end of the controller to the
+          commit of the request)
+        - task: scheduler tasks, by task name
+
+        The results are exposed as:
+
+        - a Server-Timing response header (at the end of the controller,
+          i.e. without render time)
+        - a JSON report of the recent requests of the current process
+        - a Prometheus text dump of the aggregated statistics of all
+          web and scheduler processes, written to a shared folder
+    """
+
+    CATEGORIES = ("db", "represent", "acl", "model", "xslt", "render", "task")
+
+    # Number of recent request profiles to keep per process
+    RECENT = 50
+
+    # Minimum interval between flushes of the aggregated statistics
+    # to disk (seconds)
+    FLUSH_INTERVAL = 10
+
+    # Process-wide statistics (guarded by lock)
+    recent = deque(maxlen=RECENT)
+    pending = {}
+    pending_requests = [0, 0.0]
+    last_flush = 0
+    lock = threading.Lock()
+
+    def __init__(self):
+
+        self.started = time.perf_counter()
+        self.controller_done = None
+        self.finished = False
+
+        self.stats = {}
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setup(cls, db):
+        """
+            Starts profiling the current request, if enabled in deployment
+            settings; to be called from models after connecting the database
+
+            Args:
+                db: the DAL instance
+
+            Returns:
+                the RequestProfile, or None if disabled
+        """
+
+        if not current.deployment_settings.get_base_profile():
+            current.profile = None
+            return None
+
+        profile = current.profile = cls()
+
+        # Record all SQL statements
+        handlers = getattr(db._adapter, "execution_handlers", None)
+        if handlers is not None and ProfileHandler not in handlers:
+            handlers.append(ProfileHandler)
+
+        response = current.response
+        response.postprocessing.append(profile.controller_complete)
+        response.custom_commit = profile.commit
+
+        return profile
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def record(category, key, duration, count=1):
+        """
+            Records an operation in the profile of the current request,
+            if profiling is enabled
+
+            Args:
+                category: the category (see CATEGORIES)
+                key: the key within the category (e.g. a table name)
+                duration: the duration of the operation (seconds)
+                count: the number of operations
+        """
+
+        profile = getattr(current, "profile", None)
+        if profile is not None:
+            profile.add(category, key, duration, count=count)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def timed(category, key):
+        """
+            Decorator to record all calls of a function in the profile of
+            the current request
+
+            Args:
+                category: the category (see CATEGORIES)
+                key: a function to determine the key, called with the
+                     same arguments as the decorated function
+
+            Returns:
+                the decorator
+        """
+
+        def decorator(func):
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+
+                profile = getattr(current, "profile", None)
+                if profile is None:
+                    return func(*args, **kwargs)
+
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profile.add(category,
+                                key(*args, **kwargs),
+                                time.perf_counter() - start,
+                                )
+            return wrapper
+
+        return decorator
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def wrap_tasks(cls, tasks):
+        """
+            Wraps scheduler task functions to record their execution, and
+            to complete the profile when running in a scheduler worker
+
+            Args:
+                tasks: the tasks dict {name: function}, modified in-place
+        """
+
+        for name, function in list(tasks.items()):
+            if not callable(function) or getattr(function, "profiled", False):
+                continue
+
+            def wrapper(*args, name=name, function=function, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    cls.record("task", name, time.perf_counter() - start)
+                    profile = getattr(current, "profile", None)
+                    if profile is not None and current.request.is_scheduler:
+                        profile.finish()
+            wrapper.profiled = True
+
+            tasks[name] = functools.wraps(function)(wrapper)
+
+    # -------------------------------------------------------------------------
+    def add(self, category, key, duration, count=1):
+        """
+            Adds an operation to this profile
+
+            Args:
+                category: the category (see CATEGORIES)
+                key: the key within the category (e.g. a table name)
+                duration: the duration of the operation (seconds)
+                count: the number of operations
+        """
+
+        stats = self.stats.get(category)
+        if stats is None:
+            stats = self.stats[category] = {}
+        entry = stats.get(key)
+        if entry is None:
+            stats[key] = [count, duration]
+        else:
+            entry[0] += count
+            entry[1] += duration
+
+    # -------------------------------------------------------------------------
+    def totals(self):
+        """
+            Returns the totals per category
+
+            Returns:
+                dict {category: (count, seconds)}
+        """
+
+        totals = {}
+        for category, stats in self.stats.items():
+            count = seconds = 0
+            for c, s in stats.values():
+                count += c
+                seconds += s
+            totals[category] = (count, seconds)
+        return totals
+
+    # -------------------------------------------------------------------------
+    def server_timing(self):
+        """
+            Returns the current totals as Server-Timing header value
+
+            Returns:
+                the header value (str)
+        """
+
+        totals = self.totals()
+
+        items = []
+        for category in self.CATEGORIES:
+            if category in totals:
+                count, seconds = totals[category]
+                items.append('%s;dur=%.1f;desc="%s"' % (category, seconds * 1000, count))
+
+        elapsed = time.perf_counter() - self.started
+        items.append("total;dur=%.1f" % (elapsed * 1000))
+
+        return ", ".join(items)
+
+    # -------------------------------------------------------------------------
+    def controller_complete(self, output):
+        """
+            Marks the end of the controller, and adds the Server-Timing
+            header (web2py response.postprocessing)
+
+            Args:
+                output: the controller output
+
+            Returns:
+                the controller output (unchanged)
+        """
+
+        self.controller_done = time.perf_counter()
+        current.response.headers["Server-Timing"] = self.server_timing()
+
+        return output
+
+    # -------------------------------------------------------------------------
+    def commit(self, adapter):
+        """
+            Commits the request transaction, and completes the profile
+            (web2py response.custom_commit, called after rendering the
+            view, but not if the request failed)
+
+            Args:
+                adapter: the DB adapter, or None for the final call
+                         after all adapters have been committed
+
+            Note:
+                web2py passes this to close_all_instances, which calls
+                it for each adapter, and then once more with None
+        """
+
+        if adapter is not None:
+            adapter.commit()
+        else:
+            self.finish()
+
+    # -------------------------------------------------------------------------
+    def summary(self):
+        """
+            Returns a JSON-serializable summary of this profile
+
+            Returns:
+                dict
+        """
+
+        request = current.request
+
+        path = "%s/%s" % (request.controller, request.function)
+        if request.args:
+            path = "%s/%s" % (path, "/".join(request.args))
+
+        stats = {}
+        for category, entries in self.stats.items():
+            stats[category] = {key: {"count": count,
+                                     "ms": round(seconds * 1000, 3),
+                                     }
+                               for key, (count, seconds) in entries.items()
+                               }
+
+        return {"path": path,
+                "method": request.env.request_method,
+                "utc": request.utcnow.isoformat() if request.utcnow else None,
+                "ms": round((time.perf_counter() - self.started) * 1000, 3),
+                "stats": stats,
+                }
+
+    # -------------------------------------------------------------------------
+    def finish(self):
+        """
+            Completes this profile, and adds it to the process statistics
+        """
+
+        if self.finished:
+            return
+        self.finished = True
+
+        now = time.perf_counter()
+        if self.controller_done is not None:
+            self.add("render", "view", now - self.controller_done)
+        duration = now - self.started
+
+        cls = self.__class__
+        summary = self.summary()
+        with cls.lock:
+            cls.recent.append(summary)
+            pending = cls.pending
+            for category, stats in self.stats.items():
+                for key, (count, seconds) in stats.items():
+                    entry = pending.get((category, key))
+                    if entry is None:
+                        pending[(category, key)] = [count, seconds]
+                    else:
+                        entry[0] += count
+                        entry[1] += seconds
+            cls.pending_requests[0] += 1
+            cls.pending_requests[1] += duration
+
+        # Scheduler workers may exit after the task, so flush immediately
+        if current.request.is_scheduler or \
+           time.time() - cls.last_flush >= cls.FLUSH_INTERVAL:
+            cls.flush()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def folder():
+        """
+            The folder for the aggregated statistics of all processes
+        """
+
+        return os.path.join(current.request.folder, "cache", "profile")
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def process():
+        """
+            The label of the current process (group) in the aggregated
+            statistics
+
+            Returns:
+                the label (str)
+        """
+
+        kind = "scheduler" if current.request.is_scheduler else "web"
+        return "%s-%s" % (kind, socket.gethostname())
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def flush(cls):
+        """
+            Adds the pending process statistics to the aggregated
+            statistics on disk (shared by all processes of the same
+            kind on the same host)
+        """
+
+        with cls.lock:
+            pending, cls.pending = cls.pending, {}
+            requests, cls.pending_requests = cls.pending_requests, [0, 0.0]
+            cls.last_flush = time.time()
+
+        if not requests[0] and not pending:
+            return
+
+        process = cls.process()
+        path = os.path.join(cls.folder(), "%s.json" % process)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "a").close()
+            with open(path, "r+") as f:
+                portalocker.lock(f, portalocker.LOCK_EX)
+                try:
+                    contents = f.read()
+                    try:
+                        data = json.loads(contents) if contents else {}
+                    except ValueError:
+                        data = {}
+
+                    data["process"] = process
+                    data["requests"] = data.get("requests", 0) + requests[0]
+                    data["seconds"] = data.get("seconds", 0) + requests[1]
+
+                    stats = data.get("stats") or {}
+                    for (category, key), (count, seconds) in pending.items():
+                        entries = stats.get(category)
+                        if entries is None:
+                            entries = stats[category] = {}
+                        entry = entries.get(key)
+                        if entry is None:
+                            entries[key] = [count, seconds]
+                        else:
+                            entries[key] = [entry[0] + count, entry[1] + seconds]
+                    data["stats"] = stats
+
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(data, f)
+                finally:
+                    portalocker.unlock(f)
+        except OSError as e:
+            current.log.error("Could not write profile statistics %s: %s" % (path, e))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def report(cls):
+        """
+            Returns the recent request profiles of the current process
+
+            Returns:
+                JSON-serializable dict
+        """
+
+        with cls.lock:
+            recent = list(cls.recent)
+
+        return {"process": cls.process(),
+                "pid": os.getpid(),
+                "utc": datetime.datetime.utcnow().isoformat(),
+                "recent": recent,
+                }
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def metrics(cls):
+        """
+            Returns the aggregated statistics of all processes in the
+            Prometheus text exposition format
+
+            Returns:
+                the metrics (str)
+        """
+
+        cls.flush()
+
+        data = []
+        folder = cls.folder()
+        try:
+            filenames = sorted(os.listdir(folder))
+        except OSError:
+            filenames = []
+        for filename in filenames:
+            if filename[-5:] != ".json":
+                continue
+            try:
+                with open(os.path.join(folder, filename), "r") as f:
+                    data.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+        escape = lambda v: str(v).replace("\\", "\\\\") \
+                                 .replace("\"", "\\\"") \
+                                 .replace("\n", "\\n")
+
+        lines = []
+        def metric(name, mtype, description, values):
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s %s" % (name, mtype))
+            for labels, value in values:
+                labels = ",".join('%s="%s"' % (k, escape(v)) for k, v in labels)
+                lines.append("%s{%s} %s" % (name, labels, value))
+
+        metric("eden_requests_total", "counter",
+               "Number of profiled requests",
+               [((("process", item.get("process")),), item.get("requests", 0))
+                for item in data],
+               )
+        metric("eden_request_seconds_total", "counter",
+               "Total time of profiled requests",
+               [((("process", item.get("process")),), "%.6f" % item.get("seconds", 0))
+                for item in data],
+               )
+
+        counts, seconds = [], []
+        for item in data:
+            process = item.get("process")
+            for category, entries in sorted((item.get("stats") or {}).items()):
+                for key, (count, secs) in sorted(entries.items()):
+                    labels = (("process", process),
+                              ("category", category),
+                              ("key", key),
+                              )
+                    counts.append((labels, count))
+                    seconds.append((labels, "%.6f" % secs))
+
+        metric("eden_operations_total", "counter",
+               "Number of profiled operations",
+               counts,
+               )
+        metric("eden_operation_seconds_total", "counter",
+               "Total time of profiled operations",
+               seconds,
+               )
+
+        return "\n".join(lines) + "\n"
+
+# =============================================================================
+class ProfileHandler:
+    """
+        DAL execution handler recording SQL statements in the profile of
+        the current request (see RequestProfile.setup)
+    """
+
+    TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+[\"`]?(\w+)", re.IGNORECASE)
+
+    def __init__(self, adapter):
+
+        self.start = None
+
+    # -------------------------------------------------------------------------
+    def before_execute(self, command):
+
+        self.start = time.perf_counter()
+
+    # -------------------------------------------------------------------------
+    def after_execute(self, command):
+
+        profile = getattr(current, "profile", None)
+        if profile is None or self.start is None:
+            return
+
+        match = self.TABLE.search(command)
+        profile.add("db",
+                    match.group(1) if match else "-",
+                    time.perf_counter() - self.start,
+                    )
+
+# END =========================================================================
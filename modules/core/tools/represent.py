@@ -29,6 +29,7 @@ __all__ = ("BooleanRepresent",
            "S3Represent",
            "S3RepresentLazy",
            "S3PriorityRepresent",
+           "RepresentCache",
            "s3_URLise",
            "s3_avatar_represent",
            "s3_comments_represent",
@@ -47,10 +48,15 @@ __all__ = ("BooleanRepresent",
            "represent_option",
            )
 
+import hashlib
+import json
 import os
 import re
 import sys
+import threading
+import time
 
+from collections import OrderedDict
 from itertools import chain
 
 from gluon import current, A, DIV, I, IMG, IS_URL, SPAN, TAG, URL, XML
@@ -58,6 +64,8 @@ from gluon.storage import Storage
 from gluon.languages import lazyT
 
 from .convert import s3_str
+from .journal import JournalCursor
+from .profiling import RequestProfile
 from .utils import MarkupStripper
 
 URLSCHEMA = re.compile(r"((?:(())(www\.([^/?#\s]*))|((http(s)?|ftp):)"
@@ -80,8 +88,16 @@ class S3Represent:
                                                     link
         @group Internal Methods: _setup,
                                  _lookup
+
+        Note:
+            Subclasses must opt in to the cross-request cache (cacheable=True),
+            and extend cache_signature() if their representation depends on
+            further parameters
     """
 
+    # Whether this class can use the cross-request cache (not inherited)
+    cacheable = True
+
     def __init__(self,
                  lookup = None,
                  key = None,
@@ -142,6 +158,9 @@ class S3Represent:
 
         self.rows = {}
 
+        self.rcache = None
+        self.signature = None
+
         self.clabels = None
         self.slabels = None
         self.htemplate = None
@@ -264,6 +283,51 @@ class S3Represent:
         else:
             return v
 
+    # -------------------------------------------------------------------------
+    def cache_signature(self):
+        """
+            Produces a signature of the representation parameters, to key
+            representations in the cross-request cache (RepresentCache)
+
+            Returns:
+                the signature (str), or None if this instance can not use
+                the cache (e.g. with custom lookups, or callable labels
+                that are not module-level functions)
+        """
+
+        if not type(self).__dict__.get("cacheable") or \
+           self.custom_lookup or \
+           self.options is not None or \
+           self.table is None:
+            return None
+
+        labels = self.labels
+        if self.clabels:
+            name = getattr(labels, "__qualname__", None)
+            module = getattr(labels, "__module__", None)
+            if type(labels).__name__ != "function" or \
+               not name or not module or "<" in name:
+                # Lambda, closure, bound method or callable instance
+                return None
+            labels = "%s.%s" % (module, name)
+        elif isinstance(labels, lazyT):
+            labels = labels.m
+
+        signature = [type(self).__module__,
+                     type(self).__qualname__,
+                     self.key,
+                     self.fields,
+                     labels,
+                     bool(self.translate),
+                     self.hierarchy,
+                     self.field_sep,
+                     s3_str(self.none),
+                     current.T.accepted_language,
+                     ]
+        signature = json.dumps(signature, default=str)
+
+        return hashlib.md5(signature.encode("utf-8")).hexdigest()
+
     # -------------------------------------------------------------------------
     def __call__(self, value, row=None, show_link=True):
         """
@@ -501,9 +565,18 @@ class S3Represent:
         else:
             self.htemplate = "%s > %s"
 
+        # Cross-request cache
+        rcache = RepresentCache.get_cache()
+        if rcache:
+            signature = self.cache_signature()
+            if signature:
+                self.rcache = rcache
+                self.signature = signature
+
         self.setup = True
 
     # -------------------------------------------------------------------------
+    @RequestProfile.timed("represent", lambda self, *args, **kwargs: self.tablename)
     def _lookup(self, values, rows=None):
         """
             Lazy lookup values.
@@ -540,6 +613,19 @@ class S3Represent:
         if table is None or not lookup:
             return items
 
+        # Check the cross-request cache
+        rcache = self.rcache
+        if rcache:
+            tablename = table._tablename
+            signature = self.signature
+            cached = rcache.get_multi(tablename, signature, list(lookup.keys()))
+            for k, v in cached.items():
+                del lookup[k]
+                items[keys.get(k, k)] = theset[k] = v
+            if not lookup:
+                return items
+            requested = list(lookup.keys())
+
         if table and self.hierarchy:
             # Does the lookup table have a hierarchy?
             from ..tools import S3Hierarchy
@@ -618,6 +704,14 @@ class S3Represent:
                     lookup.pop(k, None)
                     items[keys.get(k, k)] = theset[k] = represent_row(row)
 
+        # Update the cross-request cache
+        if rcache:
+            found = {}
+            for k in requested:
+                if k not in lookup:
+                    found[k] = items[keys.get(k, k)]
+            rcache.set_multi(tablename, signature, found)
+
         # Anything left gets set to default
         if lookup:
             for k in lookup:
@@ -662,6 +756,292 @@ class S3Represent:
         theset[value] = result
         return result
 
+# =============================================================================
+class RepresentCache:
+    """
+        Request-spanning cache for S3Represent lookups; either a size-bounded,
+        process-local LRU cache with expiry, or a web2py cache backend (e.g.
+        cache.memcache) to share representations across processes
+
+        - keyed by lookup table, representation parameters (incl. the
+          current language) and the key value
+        - all cached representations for a lookup table are invalidated
+          whenever a record in that table is updated or deleted (DAL-level
+          callbacks registered by DataModel.define_table)
+        - with the change journal enabled, the process-local cache also
+          follows changes made by other processes
+    """
+
+    instances = {}
+    instances_lock = threading.Lock()
+
+    def __init__(self, size=10000, ttl=3600, backend=None):
+        """
+            Args:
+                size: the maximum number of entries (process-local cache)
+                ttl: the maximum lifetime of entries (seconds)
+                backend: name of a web2py cache backend (e.g. "memcache")
+                         to use instead of the process-local cache
+        """
+
+        self.size = size
+        self.ttl = ttl
+        self.backend = backend
+
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+        self.cursor = JournalCursor()
+
+        self.hits = 0
+        self.misses = 0
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_cache(cls):
+        """
+            Returns the RepresentCache instance as configured in deployment
+            settings (shared across requests)
+
+            Returns:
+                the RepresentCache, or None if disabled
+        """
+
+        setting = current.deployment_settings.get_base_represent_cache()
+        if not setting:
+            return None
+
+        config = setting if isinstance(setting, dict) else {}
+        size = config.get("size", 10000)
+        ttl = config.get("ttl", 3600)
+        backend = config.get("backend")
+
+        key = (size, ttl, backend)
+        instances = cls.instances
+        cache = instances.get(key)
+        if cache is None:
+            with cls.instances_lock:
+                cache = instances.get(key)
+                if cache is None:
+                    cache = instances[key] = cls(size=size,
+                                                 ttl=ttl,
+                                                 backend=backend,
+                                                 )
+        return cache
+
+    # -------------------------------------------------------------------------
+    @property
+    def model(self):
+        """
+            The web2py cache backend, if configured and available
+        """
+
+        backend = self.backend
+        return getattr(current.cache, backend, None) if backend else None
+
+    # -------------------------------------------------------------------------
+    def version(self, tablename):
+        """
+            Returns the current cache version for a lookup table
+
+            Args:
+                tablename: the lookup table name
+
+            Returns:
+                the version
+        """
+
+        model = self.model
+        if model:
+            version = model("represent_version_%s" % tablename,
+                            lambda: "%.6f" % time.time(),
+                            time_expire = self.ttl,
+                            )
+        else:
+            self.refresh()
+            version = self.versions.get(tablename, 0)
+        return version
+
+    # -------------------------------------------------------------------------
+    def refresh(self):
+        """
+            Invalidates the process-local cache for all tables changed
+            by other processes, as recorded in the change journal
+        """
+
+        tablenames = self.cursor.poll()
+        if tablenames is None:
+            with self.lock:
+                self.entries.clear()
+        else:
+            for tablename in tablenames:
+                self.invalidate(tablename)
+
+    # -------------------------------------------------------------------------
+    def get_multi(self, tablename, signature, keys):
+        """
+            Looks up cached representations
+
+            Args:
+                tablename: the lookup table name
+                signature: the representation signature (S3Represent.cache_signature)
+                keys: the key values to look up
+
+            Returns:
+                dict {key: representation} for all keys found in the cache
+        """
+
+        found = {}
+        version = self.version(tablename)
+
+        model = self.model
+        if model:
+            prefix = "represent_%s_%s_%s_" % (tablename, version, signature)
+            for k in keys:
+                value = model("%s%s" % (prefix, k), lambda: None, time_expire=self.ttl)
+                if value is not None:
+                    found[k] = value
+        else:
+            now = time.time()
+            entries = self.entries
+            with self.lock:
+                for k in keys:
+                    key = (tablename, signature, k)
+                    entry = entries.get(key)
+                    if entry is None:
+                        continue
+                    if entry[0] != version or entry[1] < now:
+                        del entries[key]
+                        continue
+                    entries.move_to_end(key)
+                    found[k] = entry[2]
+
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    # -------------------------------------------------------------------------
+    def set_multi(self, tablename, signature, items):
+        """
+            Adds representations to the cache
+
+            Args:
+                tablename: the lookup table name
+                signature: the representation signature (S3Represent.cache_signature)
+                items: dict {key: representation}
+
+            Note:
+                Only string representations are cached (lazyT are rendered
+                in the current language), others are skipped
+        """
+
+        strings = {}
+        for k, v in items.items():
+            if isinstance(v, lazyT):
+                v = s3_str(v)
+            if isinstance(v, str):
+                strings[k] = v
+        if not strings:
+            return
+
+        version = self.version(tablename)
+
+        model = self.model
+        if model:
+            prefix = "represent_%s_%s_%s_" % (tablename, version, signature)
+            for k, v in strings.items():
+                model("%s%s" % (prefix, k), lambda v=v: v, time_expire=0)
+        else:
+            expires = time.time() + self.ttl
+            entries = self.entries
+            size = self.size
+            with self.lock:
+                for k, v in strings.items():
+                    key = (tablename, signature, k)
+                    entries[key] = (version, expires, v)
+                    entries.move_to_end(key)
+                while len(entries) > size:
+                    entries.popitem(last=False)
+
+    # -------------------------------------------------------------------------
+    def invalidate(self, tablename):
+        """
+            Invalidates all cached representations for a lookup table
+
+            Args:
+                tablename: the lookup table name
+        """
+
+        model = self.model
+        if model:
+            model("represent_version_%s" % tablename,
+                  lambda: "%.6f" % time.time(),
+                  time_expire = 0,
+                  )
+        else:
+            with self.lock:
+                versions = self.versions
+                versions[tablename] = versions.get(tablename, 0) + 1
+
+    # -------------------------------------------------------------------------
+    def watch(self, table):
+        """
+            Registers DAL callbacks to invalidate the cache whenever records
+            in a table are updated or deleted (inserts do not affect cached
+            representations)
+
+            Args:
+                table: the Table
+        """
+
+        tablename = table._tablename
+        after_update = table._after_update
+        if any(getattr(hook, "represent_cache", None) == tablename
+               for hook in after_update):
+            return
+
+        def invalidate(*args):
+            self.invalidate(tablename)
+        invalidate.represent_cache = tablename
+
+        after_update.append(invalidate)
+        table._after_delete.append(invalidate)
+
+    # -------------------------------------------------------------------------
+    def clear(self):
+        """
+            Removes all entries from the process-local cache, and resets
+            the counters
+        """
+
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+            self.hits = self.misses = 0
+
+    # -------------------------------------------------------------------------
+    def stats(self):
+        """
+            Returns cache statistics
+
+            Returns:
+                dict {"backend", "size", "entries", "hits", "misses", "ratio"}
+        """
+
+        with self.lock:
+            hits, misses = self.hits, self.misses
+            total = hits + misses
+            return {"backend": self.backend or "local",
+                    "size": self.size,
+                    "entries": len(self.entries),
+                    "hits": hits,
+                    "misses": misses,
+                    "ratio": float(hits) / total if total else None,
+                    }
+
 # =============================================================================
 class S3RepresentLazy:
     """
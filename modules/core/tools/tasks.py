@@ -46,6 +46,7 @@ from gluon import current, IS_EMPTY_OR, IS_INT_IN_RANGE
 from gluon.storage import Storage
 
 from .calendar import S3DateTime
+from .profiling import RequestProfile
 from .validators import IS_UTC_DATETIME
 
 # -----------------------------------------------------------------------------
@@ -57,9 +58,15 @@ class S3Task:
     # -------------------------------------------------------------------------
     def __init__(self):
 
-        migrate = current.deployment_settings.get_base_migrate()
+        settings = current.deployment_settings
+
+        migrate = settings.get_base_migrate()
         tasks = current.response.s3.tasks
 
+        # Record task execution in the request profile
+        if tasks and settings.get_base_profile():
+            RequestProfile.wrap_tasks(tasks)
+
         # Instantiate Scheduler
         try:
             from gluon.scheduler import Scheduler
@@ -35,10 +35,14 @@ __all__ = ("TimeSeries",
 
 import datetime
 import dateutil.tz
+import math
 import re
 
+from bisect import bisect_left, bisect_right
 from dateutil.relativedelta import relativedelta
 from dateutil.rrule import DAILY, HOURLY, MONTHLY, WEEKLY, YEARLY, rrule
+from heapq import heappop, heappush
+from itertools import accumulate, product
 
 from gluon import current
 from gluon.storage import Storage
@@ -180,10 +184,7 @@ class TimeSeries:
         event_frame = self.event_frame
         periods_data = []
         append = periods_data.append
-        #fact = self.facts[0]
-        for period in event_frame:
-            # Aggregate
-            period.aggregate(self.facts)
+        for period in event_frame.aggregate(self.facts):
             # Extract
             item = period.as_dict(rows = rows_keys,
                                   cols = cols_keys,
@@ -985,45 +986,16 @@ class TimeSeriesFact:
 
         if method == "cumulate":
 
-            slope = self.slope_column
             duration = period.duration
+            interval = self.interval
 
             for event in events:
 
-                if event.start == None:
+                params = self.cumulate_values(event)
+                if params is None:
                     continue
+                base_value, slope_value = params
 
-                if base:
-                    base_value = event[base]
-                else:
-                    base_value = None
-
-                if slope:
-                    slope_value = event[slope]
-                else:
-                    slope_value = None
-
-                if base_value is None:
-                    if not slope or slope_value is None:
-                        continue
-                    base_value = 0
-                elif type(base_value) is list:
-                    try:
-                        base_value = sum(base_value)
-                    except (TypeError, ValueError):
-                        continue
-
-                if slope_value is None:
-                    if not base or base_value is None:
-                        continue
-                    slope_value = 0
-                elif type(slope_value) is list:
-                    try:
-                        slope_value = sum(slope_value)
-                    except (TypeError, ValueError):
-                        continue
-
-                interval = self.interval
                 if slope_value and interval:
                     event_duration = duration(event, interval)
                 else:
@@ -1036,13 +1008,7 @@ class TimeSeriesFact:
         elif base:
 
             for event in events:
-                value = event[base]
-                if value is None:
-                    continue
-                if type(value) is list:
-                    values.extend([v for v in value if v is not None])
-                else:
-                    values.append(value)
+                values.extend(self.event_values(event))
 
             if method == "count":
                 result = len(values)
@@ -1054,6 +1020,71 @@ class TimeSeriesFact:
 
         return result
 
+    # -------------------------------------------------------------------------
+    def event_values(self, event):
+        """
+            Extract the base values from an event
+
+            Args:
+                event: the TimeSeriesEvent
+
+            Returns:
+                list of values (excluding None)
+        """
+
+        value = event[self.base_column]
+        if value is None:
+            values = []
+        elif type(value) is list:
+            values = [v for v in value if v is not None]
+        else:
+            values = [value]
+        return values
+
+    # -------------------------------------------------------------------------
+    def cumulate_values(self, event):
+        """
+            Extract the base and slope values from an event for
+            cumulative aggregation
+
+            Args:
+                event: the TimeSeriesEvent
+
+            Returns:
+                tuple (base, slope), or None if the event is to be skipped
+        """
+
+        if event.start == None:
+            return None
+
+        base = self.base_column
+        slope = self.slope_column
+
+        base_value = event[base] if base else None
+        slope_value = event[slope] if slope else None
+
+        if base_value is None:
+            if not slope or slope_value is None:
+                return None
+            base_value = 0
+        elif type(base_value) is list:
+            try:
+                base_value = sum(base_value)
+            except (TypeError, ValueError):
+                return None
+
+        if slope_value is None:
+            if not base or base_value is None:
+                return None
+            slope_value = 0
+        elif type(slope_value) is list:
+            try:
+                slope_value = sum(slope_value)
+            except (TypeError, ValueError):
+                return None
+
+        return base_value, slope_value
+
     # -------------------------------------------------------------------------
     def compute(self, values):
         """
@@ -1084,25 +1115,52 @@ class TimeSeriesFact:
                 result = None
         elif method == "sum":
             try:
-                result = sum(values)
+                result = self.total(values)
             except (TypeError, ValueError):
                 result = None
         elif method == "avg":
             try:
                 num = len(values)
                 if num:
-                    result = sum(values) / float(num)
+                    result = self.total(values) / float(num)
             except (TypeError, ValueError):
                 result = None
         elif method == "cumulate":
             try:
-                result = sum(base + slope * duration
-                             for base, slope, duration in values)
+                result = self.total([base + slope * duration
+                                     for base, slope, duration in values])
             except (TypeError, ValueError):
                 result = None
 
         return result
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def total(values):
+        """
+            Sum up a list of values, independently of their order (so
+            that per-period and frame-wide aggregation give identical
+            results)
+
+            Args:
+                values: list of values
+
+            Returns:
+                the sum; an integer if all values are integers (including
+                an empty list), otherwise the correctly rounded float sum
+                (or the plain sum of other types, e.g. Decimal)
+
+            Raises:
+                TypeError if the values cannot be summed up
+        """
+
+        if all(type(v) is int for v in values):
+            return sum(values)
+        elif all(type(v) in (int, float) for v in values):
+            return math.fsum(values)
+        else:
+            return sum(values)
+
     # -------------------------------------------------------------------------
     @classmethod
     def parse(cls, fact):
@@ -1352,6 +1410,13 @@ class TimeSeriesEventFrame:
         self.periods = {}
 
         self.rule = self.get_rule()
+        self._boundaries = None
+
+        # Event store (column-wise)
+        self._events = []
+        self._first = []
+        self._last = []
+        self._positions = {}
 
     # -------------------------------------------------------------------------
     def get_rule(self):
@@ -1365,6 +1430,34 @@ class TimeSeriesEventFrame:
 
         return TimeSeriesPeriod.get_rule(self.start, self.end, slots)
 
+    # -------------------------------------------------------------------------
+    @property
+    def boundaries(self):
+        """
+            The start and end datetimes of all periods in this frame
+
+            Returns:
+                tuple (starts, ends), each a list of datetimes in
+                chronological order
+        """
+
+        boundaries = self._boundaries
+        if boundaries is None:
+
+            starts = []
+            rule = self.rule
+            if rule:
+                end = self.end
+                for dt in rule:
+                    if dt >= end:
+                        break
+                    starts.append(dt)
+            ends = starts[1:] + [self.end] if starts else []
+
+            boundaries = self._boundaries = (starts, ends)
+
+        return boundaries
+
     # -------------------------------------------------------------------------
     def extend(self, events):
         """
@@ -1373,127 +1466,511 @@ class TimeSeriesEventFrame:
             Args:
                 events: iterable of events
 
+            Note:
+                Events are not added to the individual periods, but
+                stored column-wise together with the index range of
+                the periods in which they are current, which is found
+                by bisecting the period boundaries; events are previous
+                events in all periods after that range
+
             TODO integrate in constructor
             TODO handle self.rule == None
         """
 
         if not events:
             return
-        empty = self.empty
 
-        # Order events by start datetime
-        events = sorted(events)
+        starts, ends = self.boundaries
+        num = len(starts)
+        if not num:
+            return
 
-        rule = self.rule
-        periods = self.periods
+        store = self._events
+        first_index = self._first
+        last_index = self._last
+        positions = self._positions
+
+        for event in events:
+
+            start, end = event.start, event.end
+
+            # First period ending after the event start
+            first = 0 if start is None else bisect_right(ends, start)
+            if first == num:
+                # Event starts only after the end of the frame
+                continue
+
+            # First period after the last period the event is current in
+            if end is None:
+                last = num
+            elif end < starts[first]:
+                # Event ended before the first period
+                last = first
+            else:
+                last = min(max(first, bisect_left(ends, end)) + 1, num)
+
+            event_id = event.event_id
+            position = positions.get(event_id)
+            if position is None:
+                positions[event_id] = len(store)
+                store.append(event)
+                first_index.append(first)
+                last_index.append(last)
+            else:
+                store[position] = event
+                first_index[position] = first
+                last_index[position] = last
+
+        # Periods will be re-instantiated with the new event sets
+        self.periods = {}
+        self.empty = False
+
+    # -------------------------------------------------------------------------
+    def current_events(self, index):
+        """
+            Get the current events of a period
+
+            Args:
+                index: the index of the period within this frame
+
+            Returns:
+                dict {event_id: TimeSeriesEvent}
+        """
+
+        return {event.event_id: event
+                for event, first, last in zip(self._events, self._first, self._last)
+                if first <= index < last
+                }
+
+    # -------------------------------------------------------------------------
+    def previous_events(self, index):
+        """
+            Get the previous events of a period
+
+            Args:
+                index: the index of the period within this frame
+
+            Returns:
+                dict {event_id: TimeSeriesEvent}
+        """
 
-        # No point to loop over periods before the first event:
-        start = events[0].start
-        if start is None or start <= self.start:
-            first = rule[0]
+        return {event.event_id: event
+                for event, last in zip(self._events, self._last)
+                if last <= index
+                }
+
+    # -------------------------------------------------------------------------
+    def aggregate(self, facts):
+        """
+            Group and aggregate the events in all periods of this frame;
+            rather than aggregating period by period, this computes each
+            fact for each group over all periods at once
+
+            Args:
+                facts: list of facts to aggregate
+
+            Returns:
+                the list of periods in this frame
+        """
+
+        if not isinstance(facts, (list, tuple)):
+            facts = [facts]
+
+        periods = list(self)
+        num = len(periods)
+
+        events = self._events
+        first = self._first
+        last = self._last
+
+        # Group event positions by axis keys
+        rows = {}
+        cols = {}
+        matrix = {}
+        for position, event in enumerate(events):
+            for key in event.rows:
+                rows.setdefault(key, []).append(position)
+            for key in event.cols:
+                cols.setdefault(key, []).append(position)
+            for key in product(event.rows, event.cols):
+                matrix.setdefault(key, []).append(position)
+
+        # Extract the event data for all facts
+        columns = [self._columns(fact, periods) for fact in facts]
+
+        def aggregate(positions):
+            return [self._series(fact, column, positions, num)
+                    for fact, column in zip(facts, columns)
+                    ]
+
+        # A group is included in a period if any of its events is current
+        # in that period - or, if cumulating, has started before its end
+        if any(fact.method == "cumulate" for fact in facts):
+            until = [num] * len(events)
         else:
-            first = rule.before(start, inc=True)
+            until = last
+        ones = [1] * len(events)
+
+        # Aggregate totals
+        totals = aggregate(range(len(events)))
+        for index, period in enumerate(periods):
+            period._reset()
+            period.rows = {}
+            period.cols = {}
+            period.matrix = {}
+            period.totals = [series[index] for series in totals]
+
+        # Aggregate rows, columns and matrix
+        for name, groups in (("rows", rows), ("cols", cols), ("matrix", matrix)):
+            for key, positions in groups.items():
+                included = self._accumulate(positions, first, until, ones, num)
+                results = aggregate(positions)
+                for index, period in enumerate(periods):
+                    if included[index]:
+                        getattr(period, name)[key] = [series[index] for series in results]
+
+        return periods
 
-        current_events = {}
-        previous_events = {}
-        for start in rule.between(first, self.end, inc=True):
+    # -------------------------------------------------------------------------
+    def _columns(self, fact, periods):
+        """
+            Extract the data of all events for a fact
 
-            # Compute end of this period
-            end = rule.after(start)
-            if not end:
-                if start < self.end:
-                    end = self.end
-                else:
-                    # Period start is at the end of the event frame
-                    break
+            Args:
+                fact: the TimeSeriesFact
+                periods: the list of periods in this frame
 
-            # Find all current events
-            last_index = None
-            for index, event in enumerate(events):
-                last_index = index
-                if event.end and event.end < start:
-                    # Event ended before this period
-                    previous_events[event.event_id] = event
-                elif event.start is None or event.start < end:
-                    # Event starts before or during this period
-                    current_events[event.event_id] = event
-                else:
-                    # Event starts only after this period
-                    break
+            Returns:
+                list with one item per event, the item type depending
+                on the aggregation method, or None if the fact has no
+                base values to aggregate
+        """
 
-            # Add current events to current period
-            period = periods.get(start)
-            if period is None:
-                period = periods[start] = TimeSeriesPeriod(start, end=end)
-            for event in current_events.values():
-                period.add_current(event)
-            for event in previous_events.values():
-                period.add_previous(event)
-
-            empty = False
-
-            # Remaining events
-            events = events[last_index:] if last_index is not None else None
-            if not events:
-                # No more events
-                break
+        method = fact.method
+        events = self._events
 
-            # Remove events which end during this period
-            remaining = {}
-            for event_id, event in current_events.items():
-                if not event.end or event.end > end:
-                    remaining[event_id] = event
-                else:
-                    previous_events[event_id] = event
-            current_events = remaining
+        if method == "cumulate":
 
-        self.empty = empty
-        return
+            interval = fact.interval
+            num = len(periods)
+
+            column = []
+            append = column.append
+            for position, event in enumerate(events):
+                params = fact.cumulate_values(event)
+                if params is None:
+                    append(None)
+                    continue
+                base, slope = params
+
+                first = self._first[position]
+                try:
+                    if slope and interval:
+                        # Value varies with the period while the event is
+                        # current, and is constant after its end
+                        last = self._last[position]
+                        current = [(index, base + slope * periods[index].duration(event, interval))
+                                   for index in range(first, last)
+                                   ]
+                        if last < num:
+                            value = base + slope * periods[last].duration(event, interval)
+                        else:
+                            value = None
+                        append((last, value, current))
+                    else:
+                        append((first, base + slope, None))
+                except (TypeError, ValueError):
+                    # Non-numeric values
+                    append(False)
+
+        elif fact.base_column:
+
+            values = [fact.event_values(event) for event in events]
+
+            if method == "count":
+                column = [len(v) for v in values]
+            elif method == "avg":
+                column = (values, [len(v) for v in values])
+            else:
+                column = values
+
+        else:
+            column = None
+
+        return column
 
     # -------------------------------------------------------------------------
-    def __iter__(self):
+    def _series(self, fact, column, positions, num):
         """
-            Iterate over all periods within this event frame
+            Aggregate event data for a fact over all periods
+
+            Args:
+                fact: the TimeSeriesFact
+                column: the event data for the fact (from _columns)
+                positions: the positions of the events to include
+                num: the number of periods
+
+            Returns:
+                list of aggregates, one per period
         """
 
-        periods = self.periods
+        if column is None:
+            return [None] * num
+
+        method = fact.method
+        first = self._first
+        last = self._last
+        running_totals = self._accumulate
+
+        if method in ("count", "sum"):
+            result = running_totals(positions, first, last, column, num)
+
+        elif method == "avg":
+            totals = running_totals(positions, first, last, column[0], num)
+            numbers = running_totals(positions, first, last, column[1], num)
+            result = []
+            for total, number in zip(totals, numbers):
+                try:
+                    result.append(total / float(number) if number else None)
+                except TypeError:
+                    result.append(None)
+
+        elif method in ("min", "max"):
+            result = self._extremes(positions, first, last, column, num, method)
+
+        else:
+            result = self._cumulate(positions, first, column, num)
+
+        return result
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _accumulate(positions, first, last, values, num):
+        """
+            Sum up event values per period; integers by difference array
+            and running total, other values per period (TimeSeriesFact.total,
+            avoiding the rounding errors of running float totals)
 
-        rule = self.rule
-        if rule:
-            for dt in rule:
-                if dt >= self.end:
+            Args:
+                positions: the positions of the events to include
+                first: list of the first period index per event
+                last: list of the period index after the last period
+                      per event
+                values: list of values per event, either numbers or
+                        lists of values
+                num: the number of periods
+
+            Returns:
+                list of sums, one per period (None if the values
+                in that period could not be summed up)
+        """
+
+        delta = [0] * (num + 1)
+        for position in positions:
+            value = values[position]
+            if type(value) is list:
+                if any(type(v) is not int for v in value):
                     break
-                if dt in periods:
-                    yield periods[dt]
-                else:
-                    end = rule.after(dt)
-                    if not end:
-                        end = self.end
-                    yield TimeSeriesPeriod(dt, end=end)
+                value = sum(value)
+            elif type(value) is not int:
+                break
+            if value:
+                delta[first[position]] += value
+                delta[last[position]] -= value
+        else:
+            return list(accumulate(delta[:num]))
+
+        items = [[] for _ in range(num)]
+        for position in positions:
+            value = values[position]
+            if type(value) is not list:
+                value = [value]
+            for index in range(first[position], last[position]):
+                items[index].extend(value)
+
+        total = TimeSeriesFact.total
+
+        result = []
+        for item in items:
+            try:
+                result.append(total(item))
+            except (TypeError, ValueError):
+                result.append(None)
+        return result
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _extremes(positions, first, last, values, num, method):
+        """
+            Determine the minimum (or maximum) event value per period;
+            for numbers by sweeping over the periods with a heap of
+            current events, otherwise per period
+
+            Args:
+                positions: the positions of the events to include
+                first: list of the first period index per event
+                last: list of the period index after the last period
+                      per event
+                values: list of values per event (lists)
+                num: the number of periods
+                method: "min" or "max"
+
+            Returns:
+                list of minimum (maximum) values, one per period (None
+                if the values in that period are not comparable)
+        """
+
+        extreme = min if method == "min" else max
+
+        if all(type(v) in (int, float) for position in positions for v in values[position]):
+
+            sign = 1 if method == "min" else -1
+            items = sorted((first[position], position)
+                           for position in positions if values[position])
+            size = len(items)
+
+            heap = []
+            result = []
+            pointer = 0
+            for index in range(num):
+                while pointer < size and items[pointer][0] <= index:
+                    position = items[pointer][1]
+                    heappush(heap, (sign * extreme(values[position]), last[position]))
+                    pointer += 1
+                while heap and heap[0][1] <= index:
+                    heappop(heap)
+                result.append(sign * heap[0][0] if heap else None)
+
         else:
+            items = [[] for _ in range(num)]
+            for position in positions:
+                value = values[position]
+                for index in range(first[position], last[position]):
+                    items[index].extend(value)
+
+            result = []
+            for item in items:
+                try:
+                    result.append(extreme(item) if item else None)
+                except (TypeError, ValueError):
+                    result.append(None)
+
+        return result
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _cumulate(positions, first, column, num):
+        """
+            Cumulate event values over all periods; integers by difference
+            array and running total, other values per period (TimeSeriesFact.total,
+            avoiding the rounding errors of running float totals)
+
+            Args:
+                positions: the positions of the events to include
+                first: list of the first period index per event
+                column: list of (start, value, current) per event, where
+                        value is added to all periods from start, and
+                        current are (index, value) for individual periods,
+                        None for skipped events and False for events with
+                        non-numeric values
+                num: the number of periods
+
+            Returns:
+                list of cumulated values, one per period (None from the
+                first period of an event with non-numeric values)
+        """
+
+        items = []
+        invalid = num
+        integers = True
+        for position in positions:
+            item = column[position]
+            if item is None:
+                continue
+            if item is False:
+                invalid = min(invalid, first[position])
+                continue
+            start, value, current = item
+            if integers and (value is not None and type(value) is not int or
+                             current and any(type(v) is not int for _, v in current)):
+                integers = False
+            items.append(item)
+
+        if integers:
+            delta = [0] * (num + 1)
+            points = [0] * num
+            for start, value, current in items:
+                if value is not None:
+                    delta[start] += value
+                if current:
+                    for index, v in current:
+                        points[index] += v
+            result = [a + b for a, b in zip(accumulate(delta[:num]), points)]
+        else:
+            sums = [[] for _ in range(num)]
+            for start, value, current in items:
+                if current:
+                    for index, v in current:
+                        sums[index].append(v)
+                if value is not None:
+                    for index in range(start, num):
+                        sums[index].append(value)
+            total = TimeSeriesFact.total
+
+            result = []
+            for values in sums:
+                try:
+                    result.append(total(values))
+                except (TypeError, ValueError):
+                    result.append(None)
+
+        return result[:invalid] + [None] * (num - invalid)
+
+    # -------------------------------------------------------------------------
+    def __iter__(self):
+        """
+            Iterate over all periods within this event frame
+        """
+
+        if not self.rule:
             # @todo: continuous periods
             # sort actual periods and iterate over them
             raise NotImplementedError
 
-        return
+        periods = self.periods
+        starts, ends = self.boundaries
+        for index, start in enumerate(starts):
+            period = periods.get(start)
+            if period is None:
+                period = periods[start] = TimeSeriesPeriod(start,
+                                                           end = ends[index],
+                                                           frame = self,
+                                                           index = index,
+                                                           )
+            yield period
 
 # =============================================================================
 class TimeSeriesPeriod:
     """ A time period (slot) within an event frame """
 
-    def __init__(self, start, end=None):
+    def __init__(self, start, end=None, frame=None, index=None):
         """
             Args:
                 start: the start of the time period (datetime)
                 end: the end of the time period (datetime)
+                frame: the event frame this period belongs to
+                index: the index of this period within the event frame
         """
 
         self.start = tp_tzsafe(start)
         self.end = tp_tzsafe(end)
 
-        # Event sets
-        self.pevents = {}
-        self.cevents = {}
+        self.frame = frame
+        self.index = index
+
+        # Event sets (looked up from the event frame when needed)
+        self._pevents = None
+        self._cevents = None
 
         self._matrix = None
         self._rows = None
@@ -1517,6 +1994,46 @@ class TimeSeriesPeriod:
         self.cols = None
         self.totals = None
 
+    # -------------------------------------------------------------------------
+    @property
+    def cevents(self):
+        """
+            The current events in this period
+
+            Returns:
+                dict {event_id: TimeSeriesEvent}
+        """
+
+        events = self._cevents
+        if events is None:
+            frame = self.frame
+            if frame is not None:
+                events = frame.current_events(self.index)
+            else:
+                events = {}
+            self._cevents = events
+        return events
+
+    # -------------------------------------------------------------------------
+    @property
+    def pevents(self):
+        """
+            The previous events in this period
+
+            Returns:
+                dict {event_id: TimeSeriesEvent}
+        """
+
+        events = self._pevents
+        if events is None:
+            frame = self.frame
+            if frame is not None:
+                events = frame.previous_events(self.index)
+            else:
+                events = {}
+            self._pevents = events
+        return events
+
     # -------------------------------------------------------------------------
     def add_current(self, event):
         """
@@ -1605,7 +2122,6 @@ class TimeSeriesPeriod:
         rows = {}
         cols = {}
         matrix = {}
-        from itertools import product
         for index, events in enumerate(event_sets):
             for event_id, event in events.items():
                 for key in event.rows:
@@ -1721,16 +2237,69 @@ class TimeSeriesPeriod:
             end_date = self.end
         else:
             end_date = event.end
-        if event.start is None or event.start >= end_date:
-            result = 0
+
+        return self.intervals(event.start, end_date, interval)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def intervals(cls, start, end, interval):
+        """
+            Count the recurrences of an interval from start to end
+            (inclusive)
+
+            Args:
+                start: the start date/time (datetime)
+                end: the end date/time (datetime)
+                interval: the interval expression (string)
+
+            Returns:
+                the number of recurrences
+        """
+
+        if start is None or start >= end:
+            return 0
+
+        step = cls.get_step(interval)
+        if step:
+            # Fixed-length interval => compute arithmetically
+            # (the recurrence rule would ignore microseconds, too)
+            result = (end - start.replace(microsecond=0)) // step + 1
         else:
-            rule = self.get_rule(event.start, end_date, interval)
+            rule = cls.get_rule(start, end, interval)
             if rule:
                 result = rule.count()
             else:
                 result = 1
         return result
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_step(interval):
+        """
+            Get the length of a fixed-length interval
+
+            Args:
+                interval: time interval expression, like "days" or "2 weeks"
+
+            Returns:
+                datetime.timedelta, or None if the interval is not of
+                fixed length (e.g. months or years)
+        """
+
+        match = re.match(r"\s*(\d*)\s*([hdw]{1}).*", interval)
+        if match:
+            num, delta = match.groups()
+            num = int(num) if num else 1
+            if delta == "h":
+                step = datetime.timedelta(hours=num)
+            elif delta == "d":
+                step = datetime.timedelta(days=num)
+            else:
+                step = datetime.timedelta(weeks=num)
+        else:
+            step = None
+        return step
+
     # -------------------------------------------------------------------------
     @staticmethod
     def get_rule(start, end, interval):
@@ -493,6 +493,16 @@ def s3_dev_toolbar():
                    get_vars=current.request.get_vars,
                    post_vars=current.request.post_vars)
 
+    # Request profile so far (if enabled)
+    profile = getattr(current, "profile", None)
+    if profile is not None:
+        profile_button = BUTTON("profile",
+                                _onclick="$('#profile-%s').slideToggle().removeClass('hide')" % u)
+        profile_stats = DIV(BEAUTIFY(profile.summary()["stats"]), backtotop,
+                            _class="hide", _id="profile-%s" % u)
+    else:
+        profile_button = profile_stats = ""
+
     # Filter out sensitive session details
     def no_sensitives(key):
         if key in ("hmac_key", "password") or \
@@ -514,6 +524,7 @@ def s3_dev_toolbar():
                _onclick="$('#db-tables-%s').slideToggle().removeClass('hide')" % u),
         BUTTON("db stats",
                _onclick="$('#db-stats-%s').slideToggle().removeClass('hide')" % u),
+        profile_button,
         DIV(BEAUTIFY(request), backtotop,
             _class="hide", _id="request-%s" % u),
         #DIV(BEAUTIFY(current.response), backtotop,
@@ -524,6 +535,7 @@ def s3_dev_toolbar():
             _class="hide", _id="db-tables-%s" % u),
         DIV(BEAUTIFY(dbstats), backtotop,
             _class="hide", _id="db-stats-%s" % u),
+        profile_stats,
         _id="totop-%s" % u
     )
 
@@ -91,6 +91,9 @@ class S3DataList:
         self.limit = limit if limit else 0
         self.total = total if total else 0
 
+        # Keyset values of the last item (set by CRUDResource.datalist)
+        self.seek = None
+
     # ---------------------------------------------------------------------
     def html(self,
              start=None,
@@ -101,6 +104,7 @@ class S3DataList:
              empty=None,
              popup_url=None,
              popup_title=None,
+             seek=None,
              ):
         """
             Render list data as HTML (nested DIVs)
@@ -115,6 +119,8 @@ class S3DataList:
                 popup_url: the URL for the modal used for the 'more'
                            button (=> we deactivate InfiniteScroll)
                 popup_title: the title for the modal
+                seek: keyset pagination token for the next page,
+                      a dict {start: index, key: token}
         """
 
         T = current.T
@@ -207,6 +213,8 @@ class S3DataList:
                    "rowsize": rowsize,
                    "ajaxurl": ajaxurl,
                    }
+        if seek:
+            dl_data["seek"] = seek
         if popup_url:
             input_class = "dl-pagination"
             a_class = "s3_modal dl-more"
@@ -76,6 +76,9 @@ class DataTable:
         self._orderby = orderby
         self.dt_ordering = None
 
+        # Keyset values of the last row (set by CRUDResource.datatable)
+        self.seek = None
+
     # -------------------------------------------------------------------------
     @property
     def orderby(self):
@@ -207,6 +210,7 @@ class DataTable:
                                    colnames = colnames,
                                    action_col = action_col,
                                    stringify = False,
+                                   dt_seek = attr.get("dt_seek"),
                                    )
             cache = {"cacheLower": 0,
                      "cacheUpper": numrows if filteredrows > numrows else filteredrows,
@@ -581,6 +585,8 @@ class DataTable:
                 dt_action_col: see config()
                 dt_bulk_actions: see config()
                 dt_bulk_col: see config()
+                dt_seek: keyset pagination token for the next page,
+                         a dict {start: index, key: token}
         """
 
         if not colnames:
@@ -607,6 +613,10 @@ class DataTable:
                   "draw": draw,
                   }
 
+        seek = attr.get("dt_seek")
+        if seek:
+            output["seek"] = seek
+
         if stringify:
             output = jsons(output)
 
@@ -1013,6 +1013,20 @@ class S3Config(Storage):
     def get_security_map(self):
         return self.security.get("map", False)
 
+    def get_security_acl_cache(self):
+        """
+            Cache permission rules across requests (for the same roles
+            and realms), invalidated whenever the rules are changed
+            - False to disable (default)
+            - True to use a process-local LRU cache with default limits
+            - a dict to configure the cache, e.g.:
+                {"size": 5000,          # max number of entries (local cache)
+                 "ttl": 600,            # max lifetime of entries (seconds)
+                 "backend": "memcache", # web2py cache backend to use instead
+                 }
+        """
+        return self.security.get("acl_cache", False)
+
     # -------------------------------------------------------------------------
     # Base settings
     def get_system_name(self):
@@ -1045,6 +1059,23 @@ class S3Config(Storage):
         """
         return self.base.get("models")
 
+    def get_base_model_index(self):
+        """
+            Use an index of model names, table references and component
+            aliases (cached on disk) to load only the models needed for
+            a lookup or for dependency checks, rather than all models
+        """
+        return self.base.get("model_index", False)
+
+    def get_base_profile(self):
+        """
+            Record per-request statistics of database queries, representation
+            lookups, permission queries, model loads, XSLT transformations and
+            view rendering (RequestProfile); exposed as Server-Timing header
+            and via admin/profile (JSON, or Prometheus text format with .txt)
+        """
+        return self.base.get("profile", False)
+
     def get_base_rest_controllers(self):
         """
             Re-routed RESTful CRUD controllers
@@ -1106,6 +1137,89 @@ class S3Config(Storage):
       """
         return self.base.get("bigtable", False)
 
+    def get_base_stream_export(self):
+        """
+            Export CSV/JSON/XLSX/S3XML in chunks with bounded memory use
+            (recommendable for very large tables)
+            - resource-specific override possible (setting "stream_export")
+        """
+        return self.base.get("stream_export", False)
+
+    def get_base_import_bulk_commit(self):
+        """
+            Commit imports in batches of mutually independent items, with
+            batch deduplication, bulk inserts and deferred post-processing
+            (recommendable for large prepopulate and sync imports)
+        """
+        return self.base.get("import_bulk_commit", False)
+
+    def get_base_import_chunk_size(self):
+        """
+            Number of rows per chunk when importing large CSV/XLSX files
+            during prepopulate (bounded memory use), None to import each
+            file as a whole (default)
+        """
+        return self.base.get("import_chunk_size", None)
+
+    def get_base_prepopulate_workers(self):
+        """
+            Number of worker processes to run mutually independent
+            prepopulate tasks concurrently (not supported for SQLite),
+            None to run all tasks sequentially (default)
+        """
+        return self.base.get("prepopulate_workers", None)
+
+    def get_base_hierarchy_closure(self):
+        """
+            Maintain a closure table (ancestor, descendant, depth) for
+            self-referencing hierarchies, so that subtree filters can be
+            resolved by a single database join
+            - True for all hierarchies, or a list of table names
+            - False to disable (default)
+        """
+        return self.base.get("hierarchy_closure", False)
+
+    def get_base_bulk_delete(self):
+        """
+            Delete/archive records set-wise in batches (one query per
+            foreign key and batch rather than per record), recommendable
+            for mass deletion/archiving
+            - a batch size, or True for the default batch size
+            - False to process records one by one (default)
+        """
+        return self.base.get("bulk_delete", False)
+
+    def get_base_represent_cache(self):
+        """
+            Cache foreign key representations (S3Represent) across requests
+            - False to disable (default)
+            - True to use a process-local LRU cache with default limits
+            - a dict to configure the cache, e.g.:
+                {"size": 10000,         # max number of entries (local cache)
+                 "ttl": 3600,           # max lifetime of entries (seconds)
+                 "backend": "memcache", # web2py cache backend to use instead
+                 }
+        """
+        return self.base.get("represent_cache", False)
+
+    def get_base_change_journal(self):
+        """
+            Record all changes of records in tables with meta-fields in
+            a change journal (s3_change), so that sync delta exports and
+            cache invalidation can find changed records without scanning
+            the tables by modified_on
+        """
+        return self.base.get("change_journal", False)
+
+    def get_base_xslt_cache(self):
+        """
+            Cache compiled XSLT stylesheets across requests (process-wide)
+            - False to disable
+            - True to use the default size (64 stylesheets)
+            - an integer to set the maximum number of stylesheets
+        """
+        return self.base.get("xslt_cache", True)
+
     def get_base_cdn(self):
         """
             Should we use CDNs (Content Distribution Networks) to serve some common CSS/JS?
@@ -1750,6 +1864,15 @@ class S3Config(Storage):
         """
         return self.gis.get("search_geonames", True)
 
+    def get_gis_tile_cache(self):
+        """
+            Cache map tiles (tile method) on disk, invalidated when
+            records change; True, or a dict with the cache "path"
+            (default uploads/tiles) and the "ttl" of cached tiles
+            in seconds (default 86400)
+        """
+        return self.gis.get("tile_cache", False)
+
     def get_gis_simplify_tolerance(self):
         """
             Default Tolerance for the Simplification of Polygons
@@ -1777,6 +1900,18 @@ class S3Config(Storage):
         else:
             return self.gis.get("spatialdb", False)
 
+    def get_gis_spatial_index(self):
+        """
+            Use an in-memory spatial index (requires Shapely) for bbox,
+            point-in-polygon and intersects-lookups of locations, if
+            the database does not have spatial extensions
+            - holds the bounding boxes of all locations in memory,
+              per process
+        """
+        if self.get_gis_spatialdb():
+            return False
+        return self.gis.get("spatial_index", True)
+
     def get_gis_widget_catalogue_layers(self):
         """
             Should Map Widgets display Catalogue Layers?
@@ -2189,6 +2324,24 @@ class S3Config(Storage):
 
         return self.ui.get("datatables_double_scroll", False)
 
+    def get_ui_datatables_keyset(self):
+        """
+            Use keyset pagination for sequential paging in data tables
+            and data lists (constant effort regardless of page position,
+            for very large tables)
+        """
+
+        return self.ui.get("datatables_keyset", False)
+
+    def get_ui_datatables_count_cache(self):
+        """
+            Cache the total/filtered row counts of data tables for
+            this number of seconds (0 to disable), i.e. the counts
+            shown during pagination may be approximate
+        """
+
+        return self.ui.get("datatables_count_cache", 0)
+
     def get_ui_auto_open_update(self):
         """
             Render "Open" action buttons in datatables without explicit
@@ -2512,6 +2665,23 @@ class S3Config(Storage):
         """
         return self.ui.get("report_timeout", 10000)
 
+    def get_ui_report_db_aggregation(self):
+        """
+            Compute pivot table reports by aggregation in the database
+            rather than by extracting all records, where possible (i.e.
+            for real, non-list axes and facts in the master table or in
+            tables referenced by foreign keys)
+            - False to disable (default)
+            - True to always aggregate in the database where possible
+            - a number of records, to aggregate in the database only if
+              the report contains more records than this
+
+            Note:
+                Reports aggregated in the database do not provide record
+                details for the pivot table cells
+        """
+        return self.ui.get("report_db_aggregation", False)
+
     def get_ui_use_button_icons(self):
         """
             Use icons on action buttons (requires corresponding CSS)
@@ -2685,6 +2855,23 @@ class S3Config(Storage):
 
         return self.msg.get("send_postprocess")
 
+    def get_msg_outbox_workers(self):
+        """
+            Number of messages to send concurrently when processing
+            the outbox (EMAIL and SMS), re-using SMTP/HTTP connections
+            across messages; 1 to send messages one by one
+        """
+        return self.msg.get("outbox_workers", 1)
+
+    def get_msg_outbox_rate_limit(self):
+        """
+            Maximum number of messages per second and channel when
+            sending messages concurrently (see outbox_workers), either
+            a number, or a dict {channel: rate} where channel is the
+            contact method for emails, or the channel_id for SMS
+        """
+        return self.msg.get("outbox_rate_limit")
+
     # -------------------------------------------------------------------------
     # Mail settings
     def get_mail_server(self):
@@ -2821,6 +3008,31 @@ class S3Config(Storage):
 
         return self.sync.get("data_repository", False)
 
+    def get_sync_workers(self):
+        """
+            Maximum number of concurrent network transfers when
+            synchronizing with a repository (1 = run all tasks
+            sequentially)
+        """
+
+        return self.sync.get("workers", 4)
+
+    def get_sync_page_size(self):
+        """
+            Maximum number of records to transfer per request when
+            synchronizing with Eden peers (0/None = all at once)
+        """
+
+        return self.sync.get("page_size", 1000)
+
+    def get_sync_compression(self):
+        """
+            Compress sync payloads (gzip, or zstd if the zstandard
+            module is installed) if supported by the peer
+        """
+
+        return self.sync.get("compression", True)
+
     # =========================================================================
     # Modules
 
@@ -3764,6 +3976,25 @@ class S3Config(Storage):
         """
         return self.dvr.get("event_registration_show_picture", True)
 
+    def get_dvr_event_registration_preload(self):
+        """
+            Checkpoints to evaluate event rules (non-combinable events,
+            max per day, min interval) against an in-memory index of the
+            event types and recent registrations of the organisation
+            (CheckpointRules), which is refreshed incrementally with a
+            single query per scan, rather than querying all registrations
+            of each person (and each family member) separately
+
+            Note:
+                The incremental updates require an index on
+                dvr_case_event.modified_on, which is created during
+                1st_run; when enabling this for an existing database,
+                add it with S3Migration.prep(add_indexes=[("dvr_case_event",
+                "modified_on")]), or manually:
+                CREATE INDEX dvr_case_event_modified_on__idx on dvr_case_event(modified_on);
+        """
+        return self.dvr.get("event_registration_preload", False)
+
     def get_dvr_event_registration_exclude_codes(self):
         """
             List of case event type codes to exclude from
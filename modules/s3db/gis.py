@@ -471,6 +471,12 @@ class GISLocationModel(DataModel):
                                      args = [feature],
                                      )
 
+        # Update the spatial index of this process
+        from ..core.gis.spatialindex import SpatialIndex
+        index = SpatialIndex.get_index()
+        if index:
+            index.update(location_id)
+
     # -------------------------------------------------------------------------
     @staticmethod
     def gis_location_onvalidation(form):
@@ -6255,6 +6255,8 @@ class pr_PersonRepresent(S3Represent):
                             either HRM, Vol or PR controllers
     """
 
+    cacheable = True
+
     def __init__(self,
                  lookup = "pr_person",
                  key = None,
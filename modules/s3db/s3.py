@@ -26,6 +26,7 @@
 """
 
 __all__ = ("S3HierarchyModel",
+           "S3ChangeJournalModel",
            "S3DashboardModel",
            "S3ImportJobModel",
            "S3DynamicTablesModel",
@@ -43,6 +44,7 @@ class S3HierarchyModel(DataModel):
     """ Model for stored object hierarchies """
 
     names = ("s3_hierarchy",
+             "s3_hierarchy_closure",
              )
 
     def model(self):
@@ -57,10 +59,27 @@ class S3HierarchyModel(DataModel):
                                 default = False,
                                 ),
                           Field("hierarchy", "json"),
+                          Field("closure", "boolean",
+                                default = False,
+                                ),
                           *MetaFields.timestamps(),
                           meta = False,
                           )
 
+        # ---------------------------------------------------------------------
+        # Hierarchy Closure
+        # - all ancestor/descendant pairs of nodes in a hierarchy, including
+        #   the node itself as ancestor of depth 0
+        #
+        tablename = "s3_hierarchy_closure"
+        self.define_table(tablename,
+                          Field("tablename", length=64),
+                          Field("ancestor", "integer"),
+                          Field("descendant", "integer"),
+                          Field("depth", "integer"),
+                          meta = False,
+                          )
+
         # ---------------------------------------------------------------------
         # Return global names to s3.*
         #
@@ -72,6 +91,34 @@ class S3HierarchyModel(DataModel):
 
         return None
 
+# =============================================================================
+class S3ChangeJournalModel(DataModel):
+    """ Model for the change journal (see ChangeJournal) """
+
+    names = ("s3_change",
+             )
+
+    def model(self):
+
+        # ---------------------------------------------------------------------
+        # Change Journal
+        # - append-only, the record ID is the sequence number
+        #
+        tablename = "s3_change"
+        self.define_table(tablename,
+                          Field("tablename", length=128),
+                          Field("record_id", "integer"),
+                          Field("uuid", length=128),
+                          Field("operation", length=16),
+                          Field("timestmp", "datetime"),
+                          meta = False,
+                          )
+
+        # ---------------------------------------------------------------------
+        # Pass names back to global scope (s3.*)
+        #
+        return None
+
 # =============================================================================
 class S3DashboardModel(DataModel):
     """ Model for stored dashboard configurations """
@@ -36,6 +36,7 @@ __all__ = ("StatsParameterModel",
            "stats_year",
            "stats_year_options",
            #"stats_SourceRepresent",
+           "stats_DemographicAggregator",
            )
 
 import datetime
@@ -277,10 +278,10 @@ class StatsDemographicModel(DataModel):
     names = ("stats_demographic",
              "stats_demographic_data",
              "stats_demographic_aggregate",
+             "stats_demographic_aggregate_queue",
              "stats_demographic_id",
              "stats_demographic_rebuild_all_aggregates",
              "stats_demographic_update_aggregates",
-             "stats_demographic_update_location_aggregate",
              )
 
     def model(self):
@@ -466,11 +467,11 @@ class StatsDemographicModel(DataModel):
                                             ),
                   filter_widgets = filter_widgets,
                   list_fields = list_fields,
-                  # @ToDo: Wrapper function to call this for the record linked
-                  # to the relevant place depending on whether approval is
-                  # required or not. Disable when auth.override is True.
-                  #onaccept = self.stats_demographic_update_aggregates,
-                  #onapprove = self.stats_demographic_update_aggregates,
+                  # Queue changes for the next aggregates update
+                  # (only approved records will be aggregated)
+                  onaccept = self.stats_demographic_data_onaccept,
+                  onapprove = self.stats_demographic_data_ondelete,
+                  ondelete = self.stats_demographic_data_ondelete,
                   report_options = report_options,
                   # @ToDo: deployment_setting
                   requires_approval = True,
@@ -494,6 +495,10 @@ class StatsDemographicModel(DataModel):
         #       currently this is just the latest value in the time period
         # copy, this is a copy of the previous time aggregation because no
         #       data is currently available for this time period
+        #
+        # Location aggregates keep the contributing values of all immediate
+        # child locations, so that they can be updated incrementally when
+        # the value for one child location changes
 
         aggregate_types = {1 : T("Time"),
                            2 : T("Location"),
@@ -542,18 +547,26 @@ class StatsDemographicModel(DataModel):
                            represent = lambda v: \
                             IS_FLOAT_AMOUNT.represent(v, precision=2),
                            ),
-                     #Field("min", "double",
-                     #      label = T("Minimum"),
-                     #      ),
-                     #Field("max", "double",
-                     #      label = T("Maximum"),
-                     #      ),
-                     #Field("mean", "double",
-                     #      label = T("Mean"),
-                     #      ),
-                     #Field("median", "double",
-                     #      label = T("Median"),
-                     #      ),
+                     Field("min", "double",
+                           label = T("Minimum"),
+                           represent = lambda v: \
+                            IS_FLOAT_AMOUNT.represent(v, precision=2),
+                           ),
+                     Field("max", "double",
+                           label = T("Maximum"),
+                           represent = lambda v: \
+                            IS_FLOAT_AMOUNT.represent(v, precision=2),
+                           ),
+                     Field("mean", "double",
+                           label = T("Mean"),
+                           represent = lambda v: \
+                            IS_FLOAT_AMOUNT.represent(v, precision=2),
+                           ),
+                     Field("median", "double",
+                           label = T("Median"),
+                           represent = lambda v: \
+                            IS_FLOAT_AMOUNT.represent(v, precision=2),
+                           ),
                      #Field("mad", "double",
                      #      label = T("Median Absolute Deviation"),
                      #      default = 0.0,
@@ -567,6 +580,22 @@ class StatsDemographicModel(DataModel):
                      #Field("variance", "double",
                      #      label = T("Variance"),
                      #      ),
+                     # Values of the child locations {location_id: value}
+                     Field("contributions", "json",
+                           readable = False,
+                           writable = False,
+                           ),
+                     )
+
+        # ---------------------------------------------------------------------
+        # Demographic Aggregate Queue
+        # - parameters/locations with changed data, to be processed by
+        #   the next run of stats_demographic_update_aggregates
+        #
+        tablename = "stats_demographic_aggregate_queue"
+        define_table(tablename,
+                     Field("parameter_id", "integer"),
+                     Field("location_id", "integer"),
                      )
 
         # ---------------------------------------------------------------------
@@ -575,7 +604,6 @@ class StatsDemographicModel(DataModel):
         return {"stats_demographic_id": demographic_id,
                 "stats_demographic_rebuild_all_aggregates": self.stats_demographic_rebuild_all_aggregates,
                 "stats_demographic_update_aggregates": self.stats_demographic_update_aggregates,
-                "stats_demographic_update_location_aggregate": self.stats_demographic_update_location_aggregate,
                 }
 
     # -------------------------------------------------------------------------
@@ -585,13 +613,51 @@ class StatsDemographicModel(DataModel):
         return {"stats_demographic_id": FieldTemplate.dummy("parameter_id"),
                 }
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def stats_demographic_data_onaccept(form):
+        """
+            Onaccept of demographic data: queue the parameter/location
+            for the next aggregates update
+
+            Args:
+                form: the FORM
+        """
+
+        record_id = get_form_record_id(form)
+        if not record_id:
+            return
+
+        table = current.s3db.stats_demographic_data
+        row = current.db(table.id == record_id).select(table.parameter_id,
+                                                       table.location_id,
+                                                       limitby = (0, 1),
+                                                       ).first()
+        if row:
+            stats_DemographicAggregator.enqueue([row])
+            stats_DemographicAggregator.trigger()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def stats_demographic_data_ondelete(row):
+        """
+            Ondelete/onapprove of demographic data: queue the
+            parameter/location for the next aggregates update
+
+            Args:
+                row: the stats_demographic_data Row
+        """
+
+        stats_DemographicAggregator.enqueue([row])
+        stats_DemographicAggregator.trigger()
+
     # -------------------------------------------------------------------------
     @staticmethod
     def stats_demographic_rebuild_all_aggregates():
         """
             This will delete all the stats_demographic_aggregate records and
-            then rebuild them by triggering off a request for each
-            stats_demographic_data record.
+            then rebuild them by queuing all parameters/locations with
+            approved stats_demographic_data, and triggering an update.
 
             This function is normally only run during prepop or postpop so we
             don't need to worry about the aggregate data being unavailable for
@@ -617,10 +683,12 @@ class StatsDemographicModel(DataModel):
             db(ttable.id == row.task_id).update(stop_time=now,
                                                 status="STOPPED")
 
-        # Delete the existing aggregates
-        current.s3db.stats_demographic_aggregate.truncate()
+        # Delete the existing aggregates and queue
+        s3db = current.s3db
+        s3db.stats_demographic_aggregate.truncate()
+        s3db.stats_demographic_aggregate_queue.truncate()
 
-        # Read all the approved stats_demographic_data records
+        # Queue all parameters/locations with approved data
         dtable = db.stats_demographic
         ddtable = db.stats_demographic_data
         query = (ddtable.deleted != True) & \
@@ -628,17 +696,16 @@ class StatsDemographicModel(DataModel):
                 (ddtable.approved_by != None)
         # @ToDo: deployment_setting for whether records need to be approved
         #   query &= (ddtable.approved_by != None)
-        records = db(query).select(ddtable.data_id,
-                                   ddtable.parameter_id,
-                                   ddtable.date,
-                                   ddtable.location_id,
-                                   ddtable.value,
-                                   dtable.total_id,
-                                   )
+        rows = db(query).select(ddtable.parameter_id,
+                                ddtable.location_id,
+                                groupby = (ddtable.parameter_id,
+                                           ddtable.location_id,
+                                           ),
+                                )
+        stats_DemographicAggregator.enqueue(rows)
 
         # Fire off a rebuild task
         current.s3task.run_async("stats_demographic_update_aggregates",
-                                 vars = {"records": records.json()},
                                  timeout = 21600 # 6 hours
                                  )
 
@@ -665,15 +732,14 @@ class StatsDemographicModel(DataModel):
     @staticmethod
     def stats_demographic_update_aggregates(records=None):
         """
-            This will calculate the stats_demographic_aggregates for the
-            specified records. Either all (when rebuild_all is invoked) or for
-            the individual parameter(s) at the specified location(s) when run
-            onapprove - which currently happens inside the vulnerability
-            approve_report() controller.
-            @ToDo: onapprove/onaccept wrapper function for other workflows.
+            This will update the stats_demographic_aggregates for all queued
+            parameters/locations (normally run by the scheduler), i.e.:
 
-            This will get the raw data from stats_demographic_data and generate
-            a stats_demographic_aggregate record for the given time period.
+            - the time (or copy) aggregates for each queued location
+              from its approved stats_demographic_data, for every time
+              period from the first data item until the current period
+            - the location aggregates of all its ancestors, applying only
+              the changed values of the respective child location
 
             The reason for doing this is so that all aggregated data can be
             obtained from a single table. So when displaying data for a
@@ -681,520 +747,20 @@ class StatsDemographicModel(DataModel):
             table, and if it's not there then try the data table. Rather just
             look at the aggregate table.
 
-            Once this has run then a complete set of aggregate records should
-            exists for this parameter_id and location for every time period from
-            the first data item until the current time period.
-
-            @ToDo: Add test cases to modules/unit_tests/s3db/stats.py
-        """
-
-        if not records:
-            return
-
-        from dateutil.rrule import rrule, YEARLY
-
-        db = current.db
-        s3db = current.s3db
-        dtable = s3db.stats_demographic_data
-        atable = db.stats_demographic_aggregate
-        gtable = db.gis_location
-
-        # Data Structures used for the OPTIMISATION
-        param_total_dict = {} # the total_id for each parameter
-        param_location_dict = {} # a list of locations for each parameter
-        location_dict = {} # a list of locations
-        loc_level_list = {} # a list of levels for each location
-
-        aggregated_period = StatsDemographicModel.stats_demographic_aggregated_period
-        (last_period, year_end) = aggregated_period(None)
-
-        # Test to see which date format we have based on how we were called
-        if isinstance(records, str):
-            from_json = True
-            from dateutil.parser import parse
-            records = json.loads(records)
-        elif isinstance(records[0]["stats_demographic_data"]["date"],
-                        (datetime.date, datetime.datetime)):
-            from_json = False
-        else:
-            from_json = True
-            from dateutil.parser import parse
-
-        for record in records:
-            total_id = record["stats_demographic"]["total_id"]
-            record = record["stats_demographic_data"]
-            data_id = record["data_id"]
-            location_id = record["location_id"]
-            parameter_id = record["parameter_id"]
-            # Skip if either the location or the parameter is not valid
-            if not location_id or not parameter_id:
-                current.log.warning("Skipping bad stats_demographic_data record with data_id %s " % data_id)
-                continue
-            if total_id and parameter_id not in param_total_dict:
-                param_total_dict[parameter_id] = total_id
-            if from_json:
-                date = parse(record["date"]) # produces a datetime
-                date = date.date()
-            else:
-                date = record["date"]
-            (start_date, end_date) = aggregated_period(date)
-
-            # Get all the approved stats_demographic_data records for this location and parameter
-            query = (dtable.location_id == location_id) & \
-                    (dtable.deleted != True) & \
-                    (dtable.approved_by != None)
-            # @ToDo: deployment_setting for whether records need to be approved
-            #   query &= (dtable.approved_by != None)
-            fields = [dtable.data_id,
-                      dtable.date,
-                      dtable.value,
-                      ]
-            if total_id:
-                # Also get the records for the Total to use to calculate the percentage
-                query &= (dtable.parameter_id.belongs([parameter_id, total_id]))
-                fields.append(dtable.parameter_id)
-            else:
-                percentage = None
-                query &= (dtable.parameter_id == parameter_id)
-            data_rows = db(query).select(*fields)
-
-            if total_id:
-                # Separate out the rows relating to the Totals
-                total_rows = data_rows.exclude(lambda row: row.parameter_id == total_id)
-                # Get each record and store them in a dict keyed on the start date
-                # of the aggregated period. If a record already exists for the
-                # reporting period then the most recent value will be stored.
-                earliest_period = current.request.utcnow.date()
-                end_date = year_end
-                totals = {}
-                for row in total_rows:
-                    row_date = row.date
-                    (start_date, end_date) = aggregated_period(row_date)
-                    if start_date in totals:
-                        if row_date <= totals[start_date]["date"]:
-                            # The indicator in the row is of the same time period as
-                            # another which is already stored in totals but it is earlier
-                            # so ignore this particular record
-                            continue
-                    elif start_date < earliest_period:
-                        earliest_period = start_date
-                    # Store the record from the db in the totals storage
-                    totals[start_date] = Storage(date = row_date,
-                                                 id = row.data_id,
-                                                 value = row.value)
-
-            # Get each record and store them in a dict keyed on the start date
-            # of the aggregated period. If a record already exists for the
-            # reporting period then the most recent value will be stored.
-            earliest_period = start_date
-            end_date = year_end
-            data = {}
-            data[start_date] = Storage(date = date,
-                                       id = data_id,
-                                       value = record["value"])
-            for row in data_rows:
-                if row.data_id == data_id:
-                    # This is the record we started with, so skip
-                    continue
-                row_date = row.date
-                (start_date, end_date) = aggregated_period(row_date)
-                if start_date in data:
-                    if row_date <= data[start_date]["date"]:
-                        # The indicator in the row is of the same time period as
-                        # another which is already stored in data but it is earlier
-                        # so ignore this particular record
-                        continue
-                elif start_date < earliest_period:
-                    earliest_period = start_date
-                # Store the record from the db in the data storage
-                data[start_date] = Storage(date = row_date,
-                                           id = row.data_id,
-                                           value = row.value)
-
-            # Get all the aggregate records for this parameter and location
-            query = (atable.location_id == location_id) & \
-                    (atable.parameter_id == parameter_id)
-            aggr_rows = db(query).select(atable.id,
-                                         atable.agg_type,
-                                         atable.date,
-                                         atable.end_date,
-                                         atable.sum,
-                                         )
-
-            aggr = {}
-            for row in aggr_rows:
-                (start_date, end_date) = aggregated_period(row.date)
-                aggr[start_date] = Storage(id = row.id,
-                                           type = row.agg_type,
-                                           end_date = row.end_date,
-                                           sum = row.sum,
-                                           )
-
-            # Step through each period and check that aggr is correct
-            last_type_agg = False # Whether the type of previous non-copy record was aggr
-            last_data_value = None # The value of the previous aggr record
-            last_total = None # The value of the previous aggr record for the totals param
-            # Keep track of which periods the aggr record has been changed in
-            # the database
-            changed_periods = []
-            for dt in rrule(YEARLY, dtstart=earliest_period, until=last_period):
-                # Calculate the end of the dt period.
-                # - it will be None if this is the last period
-                dt = dt.date()
-                if dt != last_period:
-                    (start_date, end_date) = aggregated_period(dt)
-                else:
-                    start_date = dt
-                    end_date = None
-                if dt in aggr:
-                    # Check that the stored aggr data is correct
-                    agg_type = aggr[dt]["type"]
-                    if agg_type == 2:
-                        # This is built using other location aggregates
-                        # so it can be ignored because only time or copy aggregates
-                        # are being calculated in this function
-                        last_type_agg = True
-                        last_data_value = aggr[dt]["sum"]
-                        continue
-                    # Query to use to update aggr records
-                    query = (atable.id == aggr[dt]["id"])
-                    if agg_type == 3:
-                        # This is a copy aggregate
-                        if dt in data:
-                            # There is data in the data dictionary for this period
-                            # so aggregate record needs to be changed
-                            value = data[dt]["value"]
-                            last_data_value = value
-                            if total_id:
-                                if dt in totals:
-                                    last_total = totals[dt]["value"]
-                                if last_total:
-                                    percentage = 100 * value / last_total
-                                    percentage = round(percentage, 3)
-                            db(query).update(agg_type = 1, # time
-                                             #reported_count = 1, # one record
-                                             #ward_count = 1, # one ward
-                                             end_date = end_date,
-                                             percentage = percentage,
-                                             sum = value,
-                                             #min = value,
-                                             #max = value,
-                                             #mean = value,
-                                             #median = value,
-                                             )
-                            changed_periods.append((start_date, end_date))
-                        elif last_type_agg:
-                            # No data in the data dictionary and the last type was aggr
-                            continue
-                        # Check that the data currently stored is correct
-                        elif aggr[dt]["sum"] != last_data_value:
-                            value = last_data_value
-                            if total_id:
-                                if dt in totals:
-                                    last_total = totals[dt]["value"]
-                                if last_total:
-                                    percentage = 100 * value / last_total
-                                    percentage = round(percentage, 3)
-                            db(query).update(agg_type = 3, # copy
-                                             #reported_count = 1, # one record
-                                             #ward_count = 1, # one ward
-                                             end_date = end_date,
-                                             percentage = percentage,
-                                             sum = value,
-                                             #min = value,
-                                             #max = value,
-                                             #mean = value,
-                                             #median = value,
-                                             )
-                            changed_periods.append((start_date, end_date))
-                    elif agg_type == 1:
-                        # The value in the aggr should match the value in data
-                        if dt in data:
-                            value = data[dt]["value"]
-                            last_data_value = value
-                            if total_id and dt in totals:
-                                last_total = totals[dt]["value"]
-                            if aggr[dt]["sum"] != value:
-                                if total_id and last_total:
-                                    percentage = 100 * value / last_total
-                                    percentage = round(percentage, 3)
-                                db(query).update(agg_type = 1, # time
-                                                 #reported_count = 1, # one record
-                                                 #ward_count = 1, # one ward
-                                                 end_date = end_date,
-                                                 percentage = percentage,
-                                                 sum = value,
-                                                 #min = value,
-                                                 #max = value,
-                                                 #mean = value,
-                                                 #median = value,
-                                                 )
-                                changed_periods.append((start_date, end_date))
-                        else:
-                            # The data is not there so it must have been deleted
-                            # Copy the value from the previous record
-                            value = last_data_value
-                            if total_id:
-                                if dt in totals:
-                                    last_total = totals[dt]["value"]
-                                if last_total:
-                                    percentage = 100 * value / last_total
-                                    percentage = round(percentage, 3)
-                            db(query).update(agg_type = 3, # copy
-                                             #reported_count = 1, # one record
-                                             #ward_count = 1, # one ward
-                                             end_date = end_date,
-                                             percentage = percentage,
-                                             sum = value,
-                                             #min = value,
-                                             #max = value,
-                                             #mean = value,
-                                             #median = value,
-                                             )
-                            changed_periods.append((start_date, end_date))
-                # No aggregate record for this time period exists
-                # So one needs to be inserted
-                else:
-                    if dt in data:
-                        value = data[dt]["value"]
-                        agg_type = 1 # time
-                        last_data_value = value
-                    else:
-                        value = last_data_value
-                        agg_type = 3 # copy
-                    if total_id:
-                        if dt in totals:
-                            last_total = totals[dt]["value"]
-                        if last_total:
-                            percentage = 100 * value / last_total
-                            percentage = round(percentage, 3)
-                    atable.insert(parameter_id = parameter_id,
-                                  location_id = location_id,
-                                  agg_type = agg_type,
-                                  #reported_count = 1, # one record
-                                  #ward_count = 1, # one ward
-                                  date = start_date,
-                                  end_date = end_date,
-                                  percentage = percentage,
-                                  sum = value,
-                                  #min = value,
-                                  #max = value,
-                                  #mean = value,
-                                  #median = value,
-                                  )
-                    changed_periods.append((start_date, end_date))
-            # End of loop through each time period
-
-            if changed_periods == []:
-                continue
-            # The following structures are used in the OPTIMISATION step later
-            location = db(gtable.id == location_id).select(gtable.level,
-                                                           limitby=(0, 1)
-                                                           ).first()
-            loc_level_list[location_id] = location.level
-            if parameter_id not in param_location_dict:
-                param_location_dict[parameter_id] = {location_id : changed_periods}
-            elif location_id not in param_location_dict[parameter_id]:
-                param_location_dict[parameter_id][location_id] = changed_periods
-            else:
-                # Store the older of the changed periods (the end will always be None)
-                # Only need to check the start date of the first period
-                if changed_periods[0][0] < param_location_dict[parameter_id][location_id][0][0]:
-                    param_location_dict[parameter_id][location_id] = changed_periods
-            if location_id not in location_dict:
-                location_dict[location_id] = changed_periods
-            else:
-                # Store the older of the changed periods (the end will always be None)
-                # Only need to check the start date of the first period
-                if changed_periods[0][0] < location_dict[location_id][0][0]:
-                    location_dict[location_id] = changed_periods
-
-        # End of loop through each stats_demographic_data record
-
-        # OPTIMISATION
-        # The following code will get all the locations for which a parameter
-        # has been changed. This will remove duplicates which will occur when
-        # items are being imported for many communes in the same district.
-        # Take an import of 12 communes in the same district, without this the
-        # district will be updated 12 times, the province will be updated 12
-        # times and the country will be updated 12 times that is 33 unnecessary
-        # updates (for each time period) (i.e. 15 updates rather than 48)
-
-        # Get all the parents
-        # @ToDo: Optimise by rewriting as custom routine rather than using this wrapper
-        # - we only need immediate children not descendants, so can use parent not path
-        # - look at disease_stats_update_aggregates()
-        parents = {}
-        get_parents = current.gis.get_parents
-        for loc_id in location_dict.keys():
-            _parents = get_parents(loc_id)
-            if parents:
-                parents[loc_id] = _parents
-        # Expand the list of locations for each parameter
-        parents_data = {}
-        for (param_id, loc_dict) in param_location_dict.items():
-            for (loc_id, periods) in loc_dict.items():
-                if loc_id in parents: # There won't be a parent if this is a L0
-                    for p_loc_row in parents[loc_id]:
-                        p_loc_id = p_loc_row.id
-                        if param_id in parents_data:
-                            if p_loc_id in parents_data[param_id]:
-                                # Store the older of the changed periods (the end will always be None)
-                                # Only need to check the start date of the first period
-                                if periods[0][0] < parents_data[param_id][p_loc_id][0][0][0]:
-                                    parents_data[param_id][p_loc_id][0] = periods
-                            else:
-                                parents_data[param_id][p_loc_id] = [periods,
-                                                                    loc_level_list[loc_id]
-                                                                    ]
-                        else:
-                            parents_data[param_id] = {p_loc_id : [periods,
-                                                                  loc_level_list[loc_id]
-                                                                  ]
-                                                      }
-
-        # Now that the time aggregate types have been set up correctly,
-        # fire off requests for the location aggregates to be calculated
-        run_async = current.s3task.run_async
-        for (param_id, loc_dict) in parents_data.items():
-            total_id = param_total_dict[param_id]
-            for (loc_id, (changed_periods, loc_level)) in loc_dict.items():
-                for (start_date, end_date) in changed_periods:
-                    s, e = str(start_date), str(end_date)
-                    run_async("stats_demographic_update_aggregate_location",
-                              args = [loc_level, loc_id, param_id, total_id, s, e],
-                              timeout = 1800 # 30m
-                              )
-
-    # -------------------------------------------------------------------------
-    @staticmethod
-    def stats_demographic_update_location_aggregate(location_level,
-                                                    location_id,
-                                                    parameter_id,
-                                                    total_id,
-                                                    start_date,
-                                                    end_date
-                                                    ):
-        """
-            Calculates the stats_demographic_aggregate for a specific parameter at a
-            specific location.
-
             Args:
-                location_id: the location record ID
-                parameter_id: the parameter record ID
-                total_id: the parameter record ID for the percentage calculation
-                start_date: the start date of the time period (as string)
-                end_date: the end date of the time period (as string)
-        """
-
-        db = current.db
-        dtable = current.s3db.stats_demographic_data
-        atable = db.stats_demographic_aggregate
-
-        # Get all the child locations (immediate children only, not all descendants)
-        child_locations = current.gis.get_children(location_id, location_level)
-        child_ids = [row.id for row in child_locations]
-
-        # Get the most recent stats_demographic_data record for all child locations
-        query = (dtable.parameter_id == parameter_id) & \
-                (dtable.deleted != True) & \
-                (dtable.location_id.belongs(child_ids)) & \
-                (dtable.approved_by != None)
-        # @ToDo: deployment_setting for whether records need to be approved
-        #   query &= (dtable.approved_by != None)
-        if end_date == "None": # converted to string as async parameter
-            end_date = None
-        else:
-            query &= (dtable.date <= end_date)
-        rows = db(query).select(dtable.value,
-                                dtable.date,
-                                dtable.location_id,
-                                orderby=(dtable.location_id, ~dtable.date),
-                                # groupby avoids duplicate records for the same
-                                # location, but is slightly slower than just
-                                # skipping the duplicates in the loop below
-                                #groupby=(dtable.location_id)
-                                )
+                records: stats_demographic_data Rows (or their JSON) to
+                         queue before updating (legacy)
 
-        # Get the most recent aggregate for this location for the total parameter
-        #if total_id == "None": # converted to string as async parameter
-        #    total_id = None
-        values_total = None
-        if total_id != "None":
-            query = (dtable.parameter_id == total_id)
-            if end_date:
-                query &= (dtable.date <= end_date)
-            total_row = db(query).select(dtable.value,
-                                         limitby = (0, 1),
-                                         orderby = ~dtable.date,
-                                         ).first()
-            if total_row:
-                values_total = total_row.value
-
-        # Collect the values, skip duplicate records for the
-        # same location => use the most recent one, which is
-        # the first row for each location as per the orderby
-        # in the query above
-        last_location = None
-        values = []
-        append = values.append
-        for row in rows:
-            new_location_id = row.location_id
-            if new_location_id != last_location:
-                last_location = new_location_id
-                append(row.value)
-
-        # Aggregate the values
-        values_len = len(values)
-        if not values_len:
-            return
+            Returns:
+                the number of processed queue entries
+        """
 
-        values_sum = sum(values)
-        #values_min = min(values)
-        #values_max = max(values)
-        #values_avg = float(values_sum) / values_len
+        if records:
+            if isinstance(records, str):
+                records = json.loads(records)
+            stats_DemographicAggregator.enqueue(records)
 
-        if values_total:
-            percentage = 100 * values_sum / values_total
-            values_percentage = round(percentage, 3)
-        else:
-            values_percentage = None
-
-        #from numpy import median
-        #values_med = median(values)
-        #values_mad = median([abs(v - values_med) for v in values])
-
-        # Add or update the aggregated values in the database
-
-        # Do we already have a record?
-        query = (atable.location_id == location_id) & \
-                (atable.parameter_id == parameter_id) & \
-                (atable.date == start_date) & \
-                (atable.end_date == end_date)
-        exists = db(query).select(atable.id, limitby=(0, 1)).first()
-
-        attr = {"agg_type": 2, # Location
-                #"reported_count": values_len,
-                #"ward_count": len(child_ids),
-                #"min": values_min,
-                #"max": values_max,
-                #"mean": values_avg,
-                #"median": values_med,
-                #"mad": values_mad,
-                "sum": values_sum,
-                "percentage": values_percentage,
-                }
-        if exists:
-            # Update
-            db(query).update(**attr)
-        else:
-            # Insert new
-            atable.insert(parameter_id = parameter_id,
-                          location_id = location_id,
-                          date = start_date,
-                          end_date = end_date,
-                          **attr
-                          )
+        return stats_DemographicAggregator()()
 
 # =============================================================================
 def stats_demographic_data_controller():
@@ -1844,4 +1410,598 @@ class stats_SourceRepresent(S3Represent):
 
         return s3_str(name)
 
+# =============================================================================
+class stats_DemographicAggregator:
+    """
+        Incremental update of stats_demographic_aggregate for queued
+        changes in stats_demographic_data
+
+        - time/copy aggregates are re-computed per changed location from
+          its own data (few records per location and parameter)
+        - location aggregates keep the values of their immediate child
+          locations (contributions) as basis for sum/min/max/mean/median,
+          so that a changed child value can be applied without re-reading
+          the data of all other child locations
+        - changes are propagated up the location hierarchy level by level,
+          and only aggregates with changed values are written
+    """
+
+    # Number of queue entries to process per batch
+    BATCH_SIZE = 5000
+
+    # Maximum number of location IDs per query
+    CHUNK_SIZE = 500
+
+    # Maximum number of hierarchy levels to propagate changes
+    MAX_DEPTH = 10
+
+    def __init__(self):
+
+        today = current.request.utcnow.date()
+        self.current_period = datetime.date(today.year, 1, 1)
+
+        # Aggregates with changed sum {(parameter_id, location_id, period)}
+        self.changed = set()
+
+    # -------------------------------------------------------------------------
+    def __call__(self):
+        """
+            Process all queued changes, in batches
+
+            Returns:
+                the number of processed queue entries
+        """
+
+        db = current.db
+        qtable = current.s3db.stats_demographic_aggregate_queue
+
+        self.rollover()
+
+        processed = 0
+        while True:
+            rows = db(qtable.id > 0).select(qtable.id,
+                                            qtable.parameter_id,
+                                            qtable.location_id,
+                                            limitby = (0, self.BATCH_SIZE),
+                                            orderby = qtable.id,
+                                            )
+            if not rows:
+                break
+
+            self.update({(row.parameter_id, row.location_id) for row in rows})
+
+            db(qtable.id.belongs([row.id for row in rows])).delete()
+            db.commit()
+
+            processed += len(rows)
+
+        return processed
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def enqueue(rows):
+        """
+            Queue parameters/locations for the next update
+
+            Args:
+                rows: stats_demographic_data Rows (or dicts), can
+                      also be joined with stats_demographic
+        """
+
+        items = set()
+        for row in rows:
+            data = row.get("stats_demographic_data")
+            if data:
+                row = data
+            parameter_id = row.get("parameter_id")
+            location_id = row.get("location_id")
+            if parameter_id and location_id:
+                items.add((parameter_id, location_id))
+
+        if items:
+            table = current.s3db.stats_demographic_aggregate_queue
+            table.bulk_insert([{"parameter_id": parameter_id,
+                                "location_id": location_id,
+                                } for parameter_id, location_id in items])
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def trigger():
+        """
+            Run the update task asynchronously for newly queued changes,
+            unless an update task is already waiting to run (e.g. the
+            periodic task, or triggered by an earlier change)
+
+            Note:
+                - skipped during prepop (aggregates are rebuilt afterwards)
+                - requires a running scheduler worker; the update task
+                  commits, so it must not be run synchronously from
+                  within a request
+        """
+
+        auth = current.auth
+        if auth.override or auth.rollback:
+            return
+
+        s3task = current.s3task
+        if not s3task._is_alive():
+            return
+
+        task = "stats_demographic_update_aggregates"
+
+        ttable = current.db.scheduler_task
+        query = (ttable.task_name == task) & \
+                (ttable.status.belongs(("QUEUED", "ASSIGNED")))
+        if current.db(query).select(ttable.id, limitby=(0, 1)).first():
+            return
+
+        s3task.run_async(task, timeout=3600)
+
+    # -------------------------------------------------------------------------
+    def rollover(self):
+        """
+            Close aggregates of past periods that are still marked as
+            current (i.e. at the beginning of a new period), and queue
+            their locations, so that they get extended into the new period
+        """
+
+        db = current.db
+        table = current.s3db.stats_demographic_aggregate
+
+        query = (table.end_date == None) & \
+                (table.date < self.current_period)
+        rows = db(query).select(table.parameter_id,
+                                table.location_id,
+                                table.date,
+                                )
+        if not rows:
+            return
+
+        for period in {row.date for row in rows}:
+            db(query & (table.date == period)).update(end_date = self.end_date(period))
+
+        self.enqueue(rows)
+
+    # -------------------------------------------------------------------------
+    def update(self, pairs):
+        """
+            Update the aggregates for changed data
+
+            Args:
+                pairs: set of tuples (parameter_id, location_id) with
+                       changed data
+        """
+
+        pairs = {pair for pair in pairs if all(pair)}
+
+        changes = self.update_time_aggregates(pairs)
+
+        depth = 0
+        while changes and depth < self.MAX_DEPTH:
+            changes = self.update_location_aggregates(changes)
+            depth += 1
+
+        self.update_percentages()
+
+    # -------------------------------------------------------------------------
+    def update_time_aggregates(self, pairs):
+        """
+            Update the time/copy aggregates for locations from their
+            own data
+
+            Args:
+                pairs: set of tuples (parameter_id, location_id)
+
+            Returns:
+                the changed values {(parameter_id, location_id): {period: sum}},
+                with sum=None for removed aggregates
+        """
+
+        data = self.load_data(pairs)
+        aggregates = self.load_aggregates(pairs)
+
+        changes = {}
+        for pair in pairs:
+            series = self.series(data.get(pair, ()), self.current_period)
+            rows = aggregates.get(pair, {})
+
+            for period in set(series) | set(rows):
+                row = rows.get(period)
+                if row and row.contributions:
+                    # Location aggregates take precedence
+                    continue
+
+                item = series.get(period)
+                if item:
+                    agg_type, value = item
+                    values = self.statistics([value])
+                else:
+                    agg_type = values = None
+
+                if self.write(pair, period, row, agg_type, values):
+                    changes.setdefault(pair, {})[period] = values["sum"] if values else None
+
+        return changes
+
+    # -------------------------------------------------------------------------
+    def update_location_aggregates(self, changes):
+        """
+            Apply changed values of locations to the location aggregates
+            of their parents
+
+            Args:
+                changes: the changed values {(parameter_id, location_id): {period: sum}}
+
+            Returns:
+                the changed values of the parents (same format)
+        """
+
+        parents = self.load_parents({location_id for _, location_id in changes})
+
+        # Collect the changed child values per parent and period
+        updates = {}
+        for (parameter_id, location_id), periods in changes.items():
+            parent = parents.get(location_id)
+            if not parent:
+                continue
+            items = updates.setdefault((parameter_id, parent), {})
+            for period, value in periods.items():
+                items.setdefault(period, {})[str(location_id)] = value
+        if not updates:
+            return {}
+
+        aggregates = self.load_aggregates(updates)
+
+        # Apply them to the contributions
+        results = {}
+        fallback = set()
+        for pair, periods in updates.items():
+            rows = aggregates.get(pair, {})
+            for period, values in periods.items():
+                row = rows.get(period)
+                contributions = dict(row.contributions or {}) if row else {}
+                for location_id, value in values.items():
+                    if value is None:
+                        contributions.pop(location_id, None)
+                    else:
+                        contributions[location_id] = value
+                results[(pair, period)] = contributions
+                if not contributions:
+                    fallback.add(pair)
+
+        # Locations without (remaining) child values fall back to their own data
+        series = {}
+        if fallback:
+            data = self.load_data(fallback)
+            for pair in fallback:
+                series[pair] = self.series(data.get(pair, ()), self.current_period)
+
+        parent_changes = {}
+        for (pair, period), contributions in results.items():
+            row = aggregates.get(pair, {}).get(period)
+            if contributions:
+                agg_type = 2 # Location
+                values = self.statistics(contributions.values())
+            else:
+                contributions = None
+                item = series[pair].get(period)
+                if item:
+                    agg_type, value = item
+                    values = self.statistics([value])
+                else:
+                    agg_type = values = None
+
+            if self.write(pair, period, row, agg_type, values, contributions):
+                parent_changes.setdefault(pair, {})[period] = values["sum"] if values else None
+
+        return parent_changes
+
+    # -------------------------------------------------------------------------
+    def update_percentages(self):
+        """
+            Update the percentages of all aggregates with changed sums,
+            or with changed sums of their total parameter
+        """
+
+        changed = self.changed
+        if not changed:
+            return
+
+        db = current.db
+        s3db = current.s3db
+
+        # Look up the total parameters
+        dtable = s3db.stats_demographic
+        query = (dtable.total_id != None) & \
+                (dtable.deleted == False)
+        rows = db(query).select(dtable.parameter_id,
+                                dtable.total_id,
+                                )
+        totals = {row.parameter_id: row.total_id for row in rows}
+        if not totals:
+            return
+        dependents = {}
+        for parameter_id, total_id in totals.items():
+            dependents.setdefault(total_id, []).append(parameter_id)
+
+        keys = set()
+        for parameter_id, location_id, period in changed:
+            if parameter_id in totals:
+                keys.add((parameter_id, location_id, period))
+            for dependent in dependents.get(parameter_id, ()):
+                keys.add((dependent, location_id, period))
+        if not keys:
+            return
+
+        pairs = set()
+        for parameter_id, location_id, _ in keys:
+            pairs.add((parameter_id, location_id))
+            pairs.add((totals[parameter_id], location_id))
+        aggregates = self.load_aggregates(pairs)
+
+        table = s3db.stats_demographic_aggregate
+        for parameter_id, location_id, period in keys:
+            row = aggregates.get((parameter_id, location_id), {}).get(period)
+            if not row:
+                continue
+            total = aggregates.get((totals[parameter_id], location_id), {}).get(period)
+            if row.sum is not None and total and total.sum:
+                percentage = round(100 * row.sum / total.sum, 3)
+            else:
+                percentage = None
+            if row.percentage != percentage:
+                db(table.id == row.id).update(percentage = percentage)
+
+    # -------------------------------------------------------------------------
+    def write(self, pair, period, row, agg_type, values, contributions=None):
+        """
+            Write an aggregate to the database
+
+            Args:
+                pair: tuple (parameter_id, location_id)
+                period: the start date of the period
+                row: the existing aggregate Row, if any
+                agg_type: the aggregate type
+                values: the aggregate values (dict), None to remove
+                        the aggregate
+                contributions: the values of the child locations
+
+            Returns:
+                True if the sum has changed, otherwise False
+        """
+
+        db = current.db
+        table = current.s3db.stats_demographic_aggregate
+
+        if values is None:
+            if not row:
+                return False
+            db(table.id == row.id).delete()
+            changed = True
+
+        elif not row:
+            parameter_id, location_id = pair
+            table.insert(parameter_id = parameter_id,
+                         location_id = location_id,
+                         agg_type = agg_type,
+                         date = period,
+                         end_date = self.end_date(period),
+                         contributions = contributions,
+                         **values)
+            changed = True
+
+        else:
+            data = dict(values,
+                        agg_type = agg_type,
+                        end_date = self.end_date(period),
+                        contributions = contributions,
+                        )
+            update = {k: v for k, v in data.items() if row[k] != v}
+            if update:
+                db(table.id == row.id).update(**update)
+            changed = "sum" in update
+
+        if changed:
+            self.changed.add(pair + (period,))
+        return changed
+
+    # -------------------------------------------------------------------------
+    def chunks(self, pairs):
+        """
+            Group (parameter_id, location_id) tuples by parameter, in
+            chunks of location IDs to look up per query
+
+            Args:
+                pairs: iterable of tuples (parameter_id, location_id)
+
+            Yields:
+                tuples (parameter_id, [location_id, ...])
+        """
+
+        locations = {}
+        for parameter_id, location_id in pairs:
+            locations.setdefault(parameter_id, set()).add(location_id)
+
+        size = self.CHUNK_SIZE
+        for parameter_id, location_ids in locations.items():
+            location_ids = list(location_ids)
+            for i in range(0, len(location_ids), size):
+                yield parameter_id, location_ids[i:i + size]
+
+    # -------------------------------------------------------------------------
+    def load_data(self, pairs):
+        """
+            Load the approved data for locations
+
+            Args:
+                pairs: set of tuples (parameter_id, location_id)
+
+            Returns:
+                dict {(parameter_id, location_id): [(date, value), ...]}
+        """
+
+        db = current.db
+        table = current.s3db.stats_demographic_data
+
+        base = (table.deleted == False) & \
+               (table.approved_by != None)
+        # @ToDo: deployment_setting for whether records need to be approved
+
+        data = {}
+        for parameter_id, location_ids in self.chunks(pairs):
+            query = base & (table.parameter_id == parameter_id) & \
+                           (table.location_id.belongs(location_ids))
+            rows = db(query).select(table.location_id,
+                                    table.date,
+                                    table.value,
+                                    )
+            for row in rows:
+                pair = (parameter_id, row.location_id)
+                data.setdefault(pair, []).append((row.date, row.value))
+
+        return data
+
+    # -------------------------------------------------------------------------
+    def load_aggregates(self, pairs):
+        """
+            Load the existing aggregates for locations
+
+            Args:
+                pairs: iterable of tuples (parameter_id, location_id)
+
+            Returns:
+                dict {(parameter_id, location_id): {period: Row}}
+        """
+
+        db = current.db
+        table = current.s3db.stats_demographic_aggregate
+
+        aggregates = {}
+        for parameter_id, location_ids in self.chunks(pairs):
+            query = (table.parameter_id == parameter_id) & \
+                    (table.location_id.belongs(location_ids))
+            rows = db(query).select(table.id,
+                                    table.location_id,
+                                    table.agg_type,
+                                    table.date,
+                                    table.end_date,
+                                    table.sum,
+                                    table.min,
+                                    table.max,
+                                    table.mean,
+                                    table.median,
+                                    table.percentage,
+                                    table.contributions,
+                                    )
+            for row in rows:
+                periods = aggregates.setdefault((parameter_id, row.location_id), {})
+                if row.date not in periods:
+                    periods[row.date] = row
+
+        return aggregates
+
+    # -------------------------------------------------------------------------
+    def load_parents(self, location_ids):
+        """
+            Look up the parents of locations
+
+            Args:
+                location_ids: the location IDs
+
+            Returns:
+                dict {location_id: parent}
+        """
+
+        db = current.db
+        table = current.s3db.gis_location
+
+        location_ids = list(location_ids)
+        size = self.CHUNK_SIZE
+
+        parents = {}
+        for i in range(0, len(location_ids), size):
+            query = (table.id.belongs(location_ids[i:i + size])) & \
+                    (table.parent != None)
+            rows = db(query).select(table.id, table.parent)
+            parents.update((row.id, row.parent) for row in rows)
+
+        return parents
+
+    # -------------------------------------------------------------------------
+    def end_date(self, period):
+        """
+            The end date of a period, None for the current period
+
+            Args:
+                period: the start date of the period
+        """
+
+        if period >= self.current_period:
+            return None
+        return StatsDemographicModel.stats_demographic_aggregated_period(period)[1]
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def series(data, current_period):
+        """
+            Compute the time/copy aggregate values of a location, for every
+            period from the first data item until the current period
+
+            Args:
+                data: the data of the location, iterable of tuples
+                      (date, value)
+                current_period: the start date of the current period
+
+            Returns:
+                dict {period: (agg_type, value)}, with the value being the
+                most recent data item of the period (time aggregate), or
+                of the latest previous period with data (copy aggregate)
+        """
+
+        aggregated_period = StatsDemographicModel.stats_demographic_aggregated_period
+
+        latest = {}
+        for date, value in sorted((item for item in data if item[0] and item[1] is not None),
+                                  key = lambda item: item[0],
+                                  ):
+            latest[aggregated_period(date)[0]] = value
+
+        series = {}
+        if not latest:
+            return series
+
+        value = None
+        for year in range(min(latest).year, current_period.year + 1):
+            period = datetime.date(year, 1, 1)
+            if period in latest:
+                agg_type, value = 1, latest[period] # Time
+            else:
+                agg_type = 3 # Copy
+            series[period] = (agg_type, value)
+
+        return series
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def statistics(values):
+        """
+            Compute the aggregate values
+
+            Args:
+                values: the values to aggregate
+
+            Returns:
+                dict {sum, min, max, mean, median}
+        """
+
+        values = list(values)
+        total = sum(values)
+
+        return {"sum": total,
+                "min": min(values),
+                "max": max(values),
+                "mean": total / len(values),
+                "median": stats_quantile(values, 0.5),
+                }
+
 # END =========================================================================
@@ -888,6 +888,16 @@ class SyncLogModel(DataModel):
                           Field("message", "text",
                                 represent = s3_strip_markup,
                                 ),
+                          # Transfer statistics
+                          Field("records", "integer",
+                                label = T("Records"),
+                                ),
+                          Field("bytes", "integer",
+                                label = T("Bytes Transferred"),
+                                ),
+                          Field("duration", "double",
+                                label = T("Duration (seconds)"),
+                                ),
                           )
 
         # CRUD Strings
@@ -163,6 +163,7 @@ class S3Migration:
                    add_notnulls = None,
                    remove_foreigns = None,
                    remove_uniques = None,
+                   add_indexes = None,
                    ):
         """
             Preparation before migration
@@ -181,6 +182,8 @@ class S3Migration:
             @param remove_foreigns  : List of tuples (tablename, fieldname) to have the foreign keys removed
                                       - if tablename == "all" then all tables are checked
             @param remove_uniques   : List of tuples [(tablename, fieldname)] to have the unique indices removed,
+            @param add_indexes      : List of tuples [(tablename, fieldname)] to add an index to
+                                      (for indexes otherwise created only during 1st_run)
         """
 
         # Backup current database
@@ -205,6 +208,11 @@ class S3Migration:
             for tablename, fieldname in remove_uniques:
                 self.remove_unique(tablename, fieldname)
 
+        if add_indexes:
+            # Add indexes which would be created during 1st_run
+            for tablename, fieldname in add_indexes:
+                self.add_index(tablename, fieldname)
+
         if ondeletes:
             # Modify ondeletes
             for tablename, fieldname, reftable, ondelete in ondeletes:
@@ -754,6 +762,25 @@ class S3Migration:
                         # Rebuild the .table file from this definition
                         fake_migrate=True)
 
+    # -------------------------------------------------------------------------
+    def add_index(self, tablename, fieldname):
+        """
+            Add an index to a field
+            - same name as in 1st_run, so an existing index is not duplicated
+        """
+
+        sql = "CREATE INDEX %(tablename)s_%(fieldname)s__idx on %(tablename)s(%(fieldname)s);" % \
+            {"tablename": tablename,
+             "fieldname": fieldname,
+             }
+
+        try:
+            self.db.executesql(sql)
+        except:
+            # Index already exists
+            import sys
+            sys.stderr.write("%s\n" % sys.exc_info()[1])
+
     # -------------------------------------------------------------------------
     def drop_field(self, tablename, fieldname):
         """
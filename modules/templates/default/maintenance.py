@@ -5,6 +5,8 @@ import time
 from gluon import current
 from gluon.settings import global_settings
 
+from core import ChangeJournal
+
 # =============================================================================
 class Daily():
     """ Daily Maintenance Tasks """
@@ -26,6 +28,11 @@ class Daily():
         table = s3db.sync_log
         db(table.timestmp < month_past).delete()
 
+        # Cleanup Change Journal
+        journal = ChangeJournal.get_journal()
+        if journal:
+            journal.prune(month_past)
+
         # Cleanup Sessions
         osjoin = os.path.join
         osstat = os.stat
@@ -8,7 +8,7 @@ import re
 
 from gluon import *
 from gluon.storage import Storage
-from core import S3Permission, s3_meta_fields
+from core import ACLCache, S3Permission, s3_meta_fields
 
 from unit_tests import run_suite
 
@@ -1439,6 +1439,110 @@ class AccessibleQueryTests(unittest.TestCase):
 
         return False
 
+# =============================================================================
+class ACLCacheTests(unittest.TestCase):
+    """ Test request-spanning cache for permission rules """
+
+    def setUp(self):
+
+        settings = current.deployment_settings
+
+        # Stash security settings
+        self.policy = settings.get_security_policy()
+        self.acl_cache = settings.get_security_acl_cache()
+
+        settings.security.policy = 5
+        settings.security.acl_cache = {"size": 10, "ttl": 600}
+
+        auth = current.auth
+        auth.permission = S3Permission(auth)
+
+        self.group_id = auth.s3_create_role("Test ACL Cache", uid="TESTACLCACHE")
+
+    def tearDown(self):
+
+        auth = current.auth
+        auth.s3_delete_role("TESTACLCACHE")
+
+        settings = current.deployment_settings
+
+        # Restore security settings
+        settings.security.policy = self.policy
+        settings.security.acl_cache = self.acl_cache
+
+        ACLCache.get_cache().clear()
+
+        # Restore permissions service
+        auth.permission = S3Permission(auth)
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testLocalCache(self):
+        """ Test process-local cache: lookup, versioning and size limit """
+
+        cache = ACLCache(size=2, ttl=600)
+
+        assertEqual = self.assertEqual
+
+        cache.set(("a",), {"ANY": {"c": (1, 1)}})
+        assertEqual(cache.get(("a",)), {"ANY": {"c": (1, 1)}})
+        assertEqual(cache.get(("b",)), None)
+
+        # New version invalidates all entries
+        cache.invalidate()
+        assertEqual(cache.get(("a",)), None)
+
+        # Least recently used entries get dropped
+        cache.set(("a",), 1)
+        cache.set(("b",), 2)
+        cache.get(("a",))
+        cache.set(("c",), 3)
+        assertEqual(cache.get(("a",)), 1)
+        assertEqual(cache.get(("b",)), None)
+        assertEqual(cache.get(("c",)), 3)
+
+        stats = cache.stats()
+        assertEqual(stats["entries"], 2)
+
+    # -------------------------------------------------------------------------
+    def testCachedACLs(self):
+        """ Test that cached ACLs are invalidated by ACL updates """
+
+        auth = current.auth
+        permission = auth.permission
+
+        cache = permission.acl_cache
+        self.assertNotEqual(cache, None)
+
+        assertEqual = self.assertEqual
+
+        group_id = self.group_id
+        realms = {group_id: None}
+
+        READ = permission.READ
+        UPDATE = permission.READ | permission.UPDATE
+
+        permission.update_acl(group_id, c="org", f="permission_test", uacl=READ, oacl=READ)
+        acls = permission.applicable_acls(READ, realms=realms, c="org", f="permission_test")
+        assertEqual(acls, {"ANY": (READ, READ)})
+
+        # Second lookup is served from the cache
+        hits = cache.stats()["hits"]
+        acls = permission.applicable_acls(READ, realms=realms, c="org", f="permission_test")
+        assertEqual(acls, {"ANY": (READ, READ)})
+        assertEqual(cache.stats()["hits"], hits + 1)
+
+        # Updating the ACL invalidates the cache
+        permission.update_acl(group_id, c="org", f="permission_test", uacl=UPDATE, oacl=UPDATE)
+        acls = permission.applicable_acls(READ, realms=realms, c="org", f="permission_test")
+        assertEqual(acls, {"ANY": (UPDATE, UPDATE)})
+
+        # Deleting the ACL invalidates the cache
+        permission.delete_acl(group_id, c="org", f="permission_test")
+        acls = permission.applicable_acls(READ, realms=realms, c="org", f="permission_test")
+        assertEqual(acls, {})
+
 # =============================================================================
 if __name__ == "__main__":
 
@@ -1447,6 +1551,7 @@ if __name__ == "__main__":
         ACLManagementTests,
         HasPermissionTests,
         AccessibleQueryTests,
+        ACLCacheTests,
         )
 
 # END ========================================================================
@@ -1,294 +1,714 @@
 # Core Benchmarks
 #
 # To run this script use:
-# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/benchmark.py
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/benchmark.py -A [options]
 #
-# Note:
+# Options:
+#
+#   --size N            number of persons (and inventory items) to generate,
+#                       all other dataset sizes are scaled from this (default 1000)
+#   --repeat N          number of timed runs per benchmark (default 5)
+#   --seed N            seed for the random data generator (default 1)
+#   --only NAME         only run benchmarks with names starting with NAME
+#                       (can be given multiple times)
+#   --output FILE       write the results as JSON to FILE
+#   --baseline FILE     compare the results with a previous run (JSON file)
+#   --threshold X       tolerated slowdown against the baseline, as fraction
+#                       of the baseline median (default 0.25 = 25%)
 #
-# These tests represent the performance of specific server-side core
-# functions of Sahana Eden which are typically called millions of times
-# during normal operation of the site.
+# Example - record a baseline, then compare a later commit against it:
 #
-# The results of these tests depend on many variables (e.g. hardware
-# configuration, software stack etc.), thus, to compare the results
-# in order to optimize code or detect newly introduced bottlenecks the
-# tests must be run on always the same environment.
+#   ... -A --size 5000 --output /tmp/bm-before.json
+#   ... -A --size 5000 --baseline /tmp/bm-before.json --output /tmp/bm-after.json
 #
-# When running these tests in order to optimize the environment, you can
-# use these benchmarks as a rough guideline for what you can expect:
+# When comparing with a baseline, the script exits with status 1 if any
+# benchmark is slower than the baseline by more than the threshold.
 #
-# DataModel.configure = 2.90979003906 µs
-# DataModel.get_config = 2.2715420723 µs
-# DataModel.table(non-table) = 2.13528013229 µs
-# DataModel.get(non-table) = 2.0619969368 µs
-# DataModel.__getattr__(non-table) = 4.12402009964 µs
-# DataModel.__getitem__(non-table) = 4.24327015877 µs
-# DataModel.table = 2.91769790649 µs
-# DataModel.__getattr__ = 4.959856987 µs
-# DataModel.__getitem__ = 5.19830703735 µs
-# CRUDResource.import_xml = 12.0009431839 ms (=83 rec/sec)
-# CRUDResource.export (incl. DB extraction) = 3.75156188011 ms (=266 rec/sec)
-# CRUDResource.export (w/o DB extraction) = 1.7192029953 ms (=581 rec/sec)
-# CRUDResource.__init__ = 2.65161395073 ms
-# CRUDResource.load = 5.55664610863 ms
+# Note:
 #
-# If you cannot achieve approximately these or even better results, then
-# it is recommendable to put effort into the optimization of the environment
-# in order to run Sahana Eden with acceptable performance. Typically you would
-# try to deploy Eden in an enviroment that allows 2-10 times better performance
-# than that.
+# The benchmarks generate a synthetic dataset (locations, organisations,
+# persons, warehouses and inventory) in the configured database, and roll
+# it back when done. They should be run against a scratch SQLite database
+# (e.g. a copy of the test database), as any commit by the code under test
+# would make the synthetic data permanent.
 #
-# If you get FAIL messages, then the overall performance of Sahana Eden in
-# your enviroment is likely to be completely unacceptable.
+# The results depend on many variables (hardware, software stack, database
+# contents), so runs can only be compared if they used the same environment
+# and dataset size - both are recorded in the JSON output.
 #
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
 import sys
-import timeit
-import unittest
+import time
+
+from io import StringIO
 
 from gluon import current
-from gluon.storage import Storage
 
-from unit_tests import run_suite
+from core import DataExporter, FS, S3PivotTable, S3Represent
+from core.methods.report import S3PivotTableFact
+
+#: Version of the JSON result format
+FORMAT_VERSION = 1
 
 def info(msg):
-    sys.stdout.write("%s\n" % msg)
+    sys.stderr.write("%s\n" % msg)
 
 # =============================================================================
-#@unittest.skip("Comment or remove this line in modules/unit_tests/eden/benchmark.py to activate this test")
-class S3PerformanceTests(unittest.TestCase):
+class BenchmarkData:
+    """ Generator for a synthetic dataset """
+
+    #: Prefix for names of generated records
+    PREFIX = "BM"
+
+    def __init__(self, size=1000, seed=1):
+        """
+            Args:
+                size: the number of persons (and inventory items) to
+                      generate, other dataset sizes are scaled from this
+                seed: seed for the random generator
+        """
+
+        self.size = size
+        self.random = random.Random(seed)
+
+        self.location_ids = []
+        self.organisation_ids = []
+        self.person_ids = []
+        self.site_ids = []
+        self.item_ids = []
+        self.inv_item_ids = []
+
+    # -------------------------------------------------------------------------
+    @property
+    def counts(self):
+        """
+            The number of generated records per type
+
+            Returns:
+                dict {type: number}
+        """
+
+        return {"locations": len(self.location_ids),
+                "organisations": len(self.organisation_ids),
+                "persons": len(self.person_ids),
+                "sites": len(self.site_ids),
+                "items": len(self.item_ids),
+                "inventory": len(self.inv_item_ids),
+                }
+
+    # -------------------------------------------------------------------------
+    def generate(self):
+        """
+            Generate the dataset
+        """
+
+        size = self.size
+
+        self.locations(max(size // 5, 10))
+        self.organisations(max(size // 20, 5))
+        self.persons(size)
+        self.inventory(max(size // 50, 5), max(size // 20, 5), size)
+
+    # -------------------------------------------------------------------------
+    def name(self, *args):
+        """
+            Generate a record name
+
+            Args:
+                args: name components
+        """
+
+        return " ".join([self.PREFIX] + [str(arg) for arg in args])
+
+    # -------------------------------------------------------------------------
+    def insert(self, tablename, **data):
+        """
+            Insert a record and update its super-entity links
+
+            Args:
+                tablename: the table name
+                data: the record data
+
+            Returns:
+                the record ID
+        """
+
+        s3db = current.s3db
 
-    def testDBSelect(self):
-        """ DAL query peak performance """
+        table = s3db.table(tablename)
+        record_id = table.insert(**data)
+        s3db.update_super(table, {"id": record_id})
+
+        return record_id
+
+    # -------------------------------------------------------------------------
+    def locations(self, number):
+        """
+            Generate a location hierarchy (L0 > 5 L1 > 25 L2) and a number
+            of point locations within it
+
+            Args:
+                number: the number of point locations
+        """
+
+        rnd = self.random
+        insert = current.s3db.gis_location.insert
+
+        root = insert(name=self.name("Country"), level="L0")
+
+        l2_ids = []
+        for i in range(5):
+            l1_id = insert(name=self.name("Region", i), level="L1", parent=root)
+            for j in range(5):
+                l2_ids.append(insert(name = self.name("District", i, j),
+                                     level = "L2",
+                                     parent = l1_id,
+                                     ))
+
+        location_ids = self.location_ids
+        for i in range(number):
+            location_ids.append(insert(name = self.name("Place", i),
+                                       parent = rnd.choice(l2_ids),
+                                       lat = rnd.uniform(-60.0, 60.0),
+                                       lon = rnd.uniform(-180.0, 180.0),
+                                       ))
+
+        current.gis.rebuild_location_tree(location_ids=[root])
+
+    # -------------------------------------------------------------------------
+    def organisations(self, number):
+        """
+            Generate organisations
+
+            Args:
+                number: the number of organisations
+        """
+
+        insert = self.insert
+
+        self.organisation_ids = [insert("org_organisation",
+                                        name = self.name("Organisation", i),
+                                        acronym = "BM%s" % i,
+                                        )
+                                 for i in range(number)
+                                 ]
+
+    # -------------------------------------------------------------------------
+    def persons(self, number):
+        """
+            Generate persons, each with a human resource record for a
+            random organisation
+
+            Args:
+                number: the number of persons
+        """
+
+        rnd = self.random
+        insert = self.insert
+
+        organisation_ids = self.organisation_ids
+        today = datetime.date.today()
+
+        person_ids = self.person_ids
+        for i in range(number):
+            person_id = insert("pr_person",
+                               first_name = self.name("Person"),
+                               last_name = "No%s" % i,
+                               gender = rnd.choice((2, 3)),
+                               date_of_birth = today - datetime.timedelta(days=rnd.randint(6000, 30000)),
+                               )
+            insert("hrm_human_resource",
+                   person_id = person_id,
+                   organisation_id = rnd.choice(organisation_ids),
+                   type = 1,
+                   )
+            person_ids.append(person_id)
+
+    # -------------------------------------------------------------------------
+    def inventory(self, warehouses, items, number):
+        """
+            Generate warehouses with stock
+
+            Args:
+                warehouses: the number of warehouses
+                items: the number of supply items
+                number: the number of inventory items
+        """
 
         db = current.db
         s3db = current.s3db
 
-        info("")
-        table = s3db.table("pr_person")
-        x = lambda: [(row.first_name, row.last_name)
-                     for row in db(table.id > 0).select(table.id,
-                                                        table.first_name,
-                                                        table.last_name,
-                                                        limitby=(0, 50))]
-        n = len(x())
-        mlt = timeit.Timer(x).timeit(number = int(100/n))
-        info("db.select = %s ms/record (=%s rec/sec)" % (mlt * 10.0, int(100/mlt)))
-
-        x = lambda: [[(row.first_name, row.last_name)
-                      for row in db(table.id < i).select(table.id,
-                                                         table.first_name,
-                                                         table.last_name)]
-                     for i in range(n)]
-        mlt = timeit.Timer(x).timeit(number = 10) * (100/n)
-        info("db.select = %s ms/query (=%s q/sec)" % (mlt, int(1000/mlt)))
-
-    def testDataModelTable(self):
+        rnd = self.random
+        insert = self.insert
+
+        wtable = s3db.inv_warehouse
+        site_ids = self.site_ids
+        for i in range(warehouses):
+            warehouse_id = insert("inv_warehouse",
+                                  name = self.name("Warehouse", i),
+                                  organisation_id = rnd.choice(self.organisation_ids),
+                                  location_id = rnd.choice(self.location_ids),
+                                  )
+            row = db(wtable.id == warehouse_id).select(wtable.site_id,
+                                                       limitby = (0, 1),
+                                                       ).first()
+            site_ids.append(row.site_id)
+
+        packs = {}
+        item_ids = self.item_ids
+        for i in range(items):
+            item_id = insert("supply_item", name=self.name("Item", i), um="piece")
+            packs[item_id] = insert("supply_item_pack",
+                                    item_id = item_id,
+                                    name = "piece",
+                                    quantity = 1,
+                                    )
+            item_ids.append(item_id)
+
+        inv_item_ids = self.inv_item_ids
+        for i in range(number):
+            item_id = rnd.choice(item_ids)
+            inv_item_ids.append(insert("inv_inv_item",
+                                       site_id = rnd.choice(site_ids),
+                                       item_id = item_id,
+                                       item_pack_id = packs[item_id],
+                                       quantity = float(rnd.randint(1, 500)),
+                                       ))
+
+# =============================================================================
+class BenchmarkSuite:
+    """ Benchmarks for the resource layer """
+
+    #: The benchmarks, tuples (name, method name)
+    BENCHMARKS = (("model.resource", "model_resource"),
+                  ("select.person", "select_person"),
+                  ("datatable.person", "datatable_person"),
+                  ("report.inventory", "report_inventory"),
+                  ("export.xml.organisation", "export_xml"),
+                  ("export.csv.person", "export_csv"),
+                  ("import.xml.organisation", "import_xml"),
+                  ("import.csv.organisation", "import_csv"),
+                  ("represent.organisation", "represent_organisation"),
+                  ("represent.location", "represent_location"),
+                  ("accessible_query.person", "accessible_query"),
+                  )
+
+    def __init__(self, data, repeat=5):
+        """
+            Args:
+                data: the (generated) BenchmarkData
+                repeat: the number of timed runs per benchmark
+        """
+
+        self.data = data
+        self.repeat = max(int(repeat), 1)
+
+        # Counter for unique names of imported records
+        self.imports = 0
+
+    # -------------------------------------------------------------------------
+    def run(self, only=None):
+        """
+            Run the benchmarks
+
+            Args:
+                only: list of name prefixes to select benchmarks
+
+            Returns:
+                dict {name: result}, see measure()
+        """
+
+        auth = current.auth
+
+        results = {}
+        for name, method in self.BENCHMARKS:
+
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+
+            auth.override = True
+            try:
+                func, records = getattr(self, method)()
+                results[name] = self.measure(func, records)
+            finally:
+                auth.override = False
+
+            result = results[name]
+            info("%-28s %10.3f ms (%s records)" % (name,
+                                                   result["median"] * 1000,
+                                                   result["records"],
+                                                   ))
+        return results
+
+    # -------------------------------------------------------------------------
+    def measure(self, func, records=None):
+        """
+            Time a function
+
+            Args:
+                func: the function
+                records: the number of records processed per call
+
+            Returns:
+                dict with timing statistics (seconds)
+        """
+
+        # Warm-up
+        func()
+
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        number = len(timings)
+        if number % 2:
+            median = timings[number // 2]
+        else:
+            median = (timings[number // 2 - 1] + timings[number // 2]) / 2.0
+
+        result = {"records": records,
+                  "runs": number,
+                  "min": timings[0],
+                  "max": timings[-1],
+                  "mean": sum(timings) / number,
+                  "median": median,
+                  }
+        if records:
+            result["per_record"] = median / records
+
+        return result
+
+    # -------------------------------------------------------------------------
+    # Benchmarks
+    # -------------------------------------------------------------------------
+    def model_resource(self):
+        """ Instantiation of a resource """
 
         s3db = current.s3db
 
-        info("")
-        table = s3db.table("pr_person")
-        if table is not None:
-            x = lambda: s3db.table("pr_person")
-            mlt = timeit.Timer(x).timeit()
-            info("DataModel.table = %s µs" % mlt)
-            self.assertTrue(mlt<10)
+        return lambda: s3db.resource("pr_person"), None
+
+    # -------------------------------------------------------------------------
+    def select_person(self):
+        """ Extraction of represented data with joins """
+
+        s3db = current.s3db
 
-            x = lambda: s3db.pr_person
-            mlt = timeit.Timer(x).timeit()
-            info("DataModel.__getattr__ = %s µs" % mlt)
-            self.assertTrue(mlt<10)
+        fields = ["first_name",
+                  "last_name",
+                  "gender",
+                  "date_of_birth",
+                  "human_resource.organisation_id",
+                  ]
+        query = FS("first_name").like("%s%%" % BenchmarkData.PREFIX)
 
-            x = lambda: s3db["pr_person"]
-            mlt = timeit.Timer(x).timeit()
-            info("DataModel.__getitem__ = %s µs" % mlt)
-            self.assertTrue(mlt<10)
+        def select():
+            resource = s3db.resource("pr_person", filter=query)
+            return resource.select(fields, represent=True)
 
-    def testDataModelName(self):
+        return select, len(self.data.person_ids)
+
+    # -------------------------------------------------------------------------
+    def datatable_person(self):
+        """ First page of a data table, as JSON """
 
         s3db = current.s3db
 
-        info("")
-        func = s3db.get("pr_person_represent")
-        if func is not None:
-            x = lambda: s3db.table("pr_person_represent")
-            mlt = timeit.Timer(x).timeit()
-            info("DataModel.table(non-table) = %s µs" % mlt)
-            self.assertTrue(mlt<10)
-
-            x = lambda: s3db.get("pr_person_represent")
-            mlt = timeit.Timer(x).timeit()
-            info("DataModel.get(non-table) = %s µs" % mlt)
-            self.assertTrue(mlt<10)
-
-            x = lambda: s3db.pr_person_represent
-            mlt = timeit.Timer(x).timeit()
-            info("DataModel.__getattr__(non-table) = %s µs" % mlt)
-            self.assertTrue(mlt<10)
-
-            x = lambda: s3db["pr_person_represent"]
-            mlt = timeit.Timer(x).timeit()
-            info("DataModel.__getitem__(non-table) = %s µs" % mlt)
-            self.assertTrue(mlt<10)
-
-    def testDataModelConfigure(self):
+        fields = ["id",
+                  "first_name",
+                  "last_name",
+                  "gender",
+                  "human_resource.organisation_id",
+                  ]
+        limit = 50
+
+        def datatable():
+            resource = s3db.resource("pr_person")
+            dt, totalrows = resource.datatable(fields = fields,
+                                               start = 0,
+                                               limit = limit,
+                                               orderby = "pr_person.last_name",
+                                               )
+            return dt.json(totalrows, totalrows, 1)
+
+        return datatable, limit
+
+    # -------------------------------------------------------------------------
+    def report_inventory(self):
+        """ Pivot table of stock quantities by warehouse and item """
 
         s3db = current.s3db
 
-        info("")
-        configure = s3db.configure
-        x = lambda: configure("pr_person", testconfig = "Test")
-        mlt = timeit.Timer(x).timeit()
-        info("DataModel.configure = %s µs" % mlt)
-        self.assertTrue(mlt<10)
+        def report():
+            resource = s3db.resource("inv_inv_item")
+            facts = S3PivotTableFact.parse("sum(quantity),count(id)")
+            pivottable = S3PivotTable(resource, "site_id", "item_id", facts)
+            return pivottable.json()
 
-        get_config = s3db.get_config
-        x = lambda: get_config("pr_person", "testconfig")
-        mlt = timeit.Timer(x).timeit()
-        info("DataModel.get_config = %s µs" % mlt)
-        self.assertTrue(mlt<10)
+        return report, len(self.data.inv_item_ids)
 
-    def testCRUDResourceInit(self):
+    # -------------------------------------------------------------------------
+    def export_xml(self):
+        """ S3XML export of organisations """
 
-        info("")
-        current.auth.override = True
-        current.s3db.resource("pr_person")
-        x = lambda: current.s3db.resource("pr_person")
-        mlt = timeit.Timer(x).timeit(number=1000)
-        info("CRUDResource.__init__ = %s ms" % mlt)
-        self.assertTrue(mlt<10)
-        current.auth.override = False
+        s3db = current.s3db
 
-    def testCRUDResourceLoad(self):
+        def export():
+            resource = s3db.resource("org_organisation")
+            return resource.export_xml()
 
-        info("")
-        current.auth.override = True
-        resource = current.s3db.resource("pr_person")
-        x = lambda: resource.load(limit=1)
-        mlt = timeit.Timer(x).timeit(number=1000)
-        info("CRUDResource.load = %s ms" % mlt)
-        self.assertTrue(mlt<10)
-        current.auth.override = False
+        return export, len(self.data.organisation_ids)
 
-    def testCRUDResourceImportExport(self):
-
-        xmlstr = """
-<s3xml>
-  <resource name="org_organisation" tuid="Philippine Red Cross">
-    <data field="name">Philippine Red Cross</data>
-  </resource>
-  <resource name="hrm_job_title" tuid="Team Leader">
-    <data field="name">Team Leader</data>
-    <reference field="organisation_id" resource="org_organisation" tuid="Philippine Red Cross"/>
-  </resource>
-  <resource name="pr_person">
-    <data field="first_name">Chona</data>
-    <data field="middle_name"/>
-    <data field="last_name">Alinsub</data>
-    <data field="initials"/>
-    <data field="date_of_birth"/>
-    <resource name="pr_person_details">
-      <data field="father_name"/>
-      <data field="mother_name"/>
-      <data field="occupation"/>
-      <data field="company"/>
-      <data field="affiliations"/>
-    </resource>
-    <resource name="pr_contact">
-      <data field="contact_method" value="SMS"/>
-      <data field="value">9463778503</data>
-    </resource>
-    <resource name="pr_address">
-      <reference field="location_id" resource="gis_location" tuid="Location L4: Rizal"/>
-      <data field="type">1</data>
-      <data field="building_name"/>
-      <data field="address"/>
-      <data field="postcode">6600</data>
-      <data field="L0">Philippines</data>
-      <data field="L1">Visayas</data>
-      <data field="L2">Southern Leyte</data>
-      <data field="L3">Maasin City</data>
-      <data field="L4">Rizal</data>
-    </resource>
-    <resource name="hrm_human_resource">
-      <data field="type">2</data>
-      <reference field="job_title_id" resource="hrm_job_title" tuid="Team Leader"/>
-      <reference field="organisation_id" resource="org_organisation" tuid="Philippine Red Cross"/>
-    </resource>
-  </resource>
-  <resource name="gis_location" tuid="Location L1: Visayas">
-    <reference field="parent" resource="gis_location" uuid="urn:iso:std:iso:3166:-1:code:PH"/>
-    <data field="name">Visayas</data>
-    <data field="level">L1</data>
-  </resource>
-  <resource name="gis_location" tuid="Location L2: Southern Leyte">
-    <reference field="parent" resource="gis_location" tuid="Location L1: Visayas"/>
-    <data field="name">Southern Leyte</data>
-    <data field="level">L2</data>
-  </resource>
-  <resource name="gis_location" tuid="Location L3: Maasin City">
-    <reference field="parent" resource="gis_location" tuid="Location L2: Southern Leyte"/>
-    <data field="name">Maasin City</data>
-    <data field="level">L3</data>
-  </resource>
-  <resource name="gis_location" tuid="Location L4: Rizal">
-    <reference field="parent" resource="gis_location" tuid="Location L3: Maasin City"/>
-    <data field="name">Rizal</data>
-    <data field="level">L4</data>
-  </resource>
-</s3xml>"""
-
-        from lxml import etree
-        tree = etree.ElementTree(etree.fromstring(xmlstr))
-
-        current.auth.override = True
-        current.db.rollback()
+    # -------------------------------------------------------------------------
+    def export_csv(self):
+        """ CSV export of persons """
 
-        info("")
-        resource = current.s3db.resource("org_organisation")
-        x = lambda: resource.import_xml(tree)
-        mlt = 0
-        for i in range(100):
-            mlt += timeit.Timer(x).timeit(number=1)
-            current.db.rollback()
-        mlt *= 10
-        info("CRUDResource.import_xml = %s ms (=%s rec/sec)" % (mlt, int(1000/mlt)))
-        self.assertTrue(mlt<30)
-
-        resource = current.s3db.resource("pr_person")
-        from lxml import etree
-        parent = etree.Element("test")
-        rfields, dfields = resource.split_fields()
-        x = lambda: resource._export_record(resource.table[1],
-                                            rfields=rfields,
-                                            dfields=dfields,
-                                            parent=parent,
-                                            export_map=Storage())
-        mlt = timeit.Timer(x).timeit(number=1000)
-        info("CRUDResource.export (incl. DB extraction) = %s ms (=%s rec/sec)" % (mlt, int(1000/mlt)))
-        self.assertTrue(mlt<10)
-
-        resource = current.s3db.resource("pr_person")
-        from lxml import etree
-        parent = etree.Element("test")
-        rfields, dfields = resource.split_fields()
-        record = resource.table[1]
-        x = lambda: resource._export_record(record,
-                                            rfields=rfields,
-                                            dfields=dfields,
-                                            parent=parent,
-                                            export_map=Storage())
-        mlt = timeit.Timer(x).timeit(number=1000)
-        info("CRUDResource.export (w/o DB extraction) = %s ms (=%s rec/sec)" % (mlt, int(1000/mlt)))
-        self.assertTrue(mlt<10)
+        s3db = current.s3db
+
+        def export():
+            resource = s3db.resource("pr_person")
+            return DataExporter.csv(resource)
+
+        return export, len(self.data.person_ids)
+
+    # -------------------------------------------------------------------------
+    def import_xml(self):
+        """ S3XML import of new organisations """
 
+        s3db = current.s3db
+
+        number = 20
+        def source():
+            self.imports += 1
+            resources = ["""<resource name="org_organisation">
+<data field="name">%s</data>
+<data field="acronym">BMX%s</data>
+</resource>""" % (self.data.name("Import", self.imports, i), i)
+                for i in range(number)]
+            return "<s3xml>%s</s3xml>" % "".join(resources)
+
+        def import_xml():
+            resource = s3db.resource("org_organisation")
+            return resource.import_xml(StringIO(source()), ignore_errors=True)
+
+        return import_xml, number
+
+    # -------------------------------------------------------------------------
+    def import_csv(self):
+        """ CSV import of new organisations (with transformation) """
+
+        request = current.request
+        s3db = current.s3db
+
+        stylesheet = os.path.join(request.folder,
+                                  "static", "formats", "s3csv", "org",
+                                  "organisation.xsl",
+                                  )
+
+        number = 20
+        def source():
+            self.imports += 1
+            lines = ["Organisation,Acronym,Comments"]
+            for i in range(number):
+                lines.append("%s,BMC%s,Benchmark" % (self.data.name("Import", self.imports, i), i))
+            return "\n".join(lines)
+
+        def import_csv():
+            resource = s3db.resource("org_organisation")
+            return resource.import_xml(StringIO(source()),
+                                       source_type = "csv",
+                                       stylesheet = stylesheet,
+                                       ignore_errors = True,
+                                       )
+
+        return import_csv, number
+
+    # -------------------------------------------------------------------------
+    def represent_organisation(self):
+        """ Bulk lookup of organisation representations """
+
+        organisation_ids = self.data.organisation_ids
+
+        def represent():
+            renderer = S3Represent(lookup="org_organisation")
+            return renderer.bulk(organisation_ids)
+
+        return represent, len(organisation_ids)
+
+    # -------------------------------------------------------------------------
+    def represent_location(self):
+        """ Bulk lookup of location representations """
+
+        location_ids = self.data.location_ids
+
+        def represent():
+            renderer = S3Represent(lookup="gis_location")
+            return renderer.bulk(location_ids)
+
+        return represent, len(location_ids)
+
+    # -------------------------------------------------------------------------
+    def accessible_query(self):
+        """ Construction of the accessible-query (uncached) """
+
+        auth = current.auth
+        permission = auth.permission
+        table = current.s3db.pr_person
+
+        def accessible_query():
+            override = auth.override
+            auth.override = False
+            try:
+                permission.clear_cache()
+                return auth.s3_accessible_query("read", table)
+            finally:
+                auth.override = override
+
+        return accessible_query, None
+
+# =============================================================================
+def compare(results, baseline, threshold=0.25):
+    """
+        Compare benchmark results with a baseline
+
+        Args:
+            results: the benchmark results (dict from BenchmarkSuite.run)
+            baseline: the baseline results (same format)
+            threshold: the tolerated slowdown, fraction of the baseline median
+
+        Returns:
+            list of tuples (name, baseline median, median, ratio, regression)
+            for all benchmarks contained in both results and baseline
+    """
+
+    comparison = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before = baseline[name]["median"]
+        after = results[name]["median"]
+        ratio = after / before if before else None
+        regression = ratio is not None and ratio > 1 + threshold
+        comparison.append((name, before, after, ratio, regression))
+
+    return comparison
+
+# -----------------------------------------------------------------------------
+def environment():
+    """
+        Describe the environment of this benchmark run
+
+        Returns:
+            a JSON-serializable dict
+    """
+
+    request = current.request
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                         cwd = request.folder,
+                                         stderr = subprocess.DEVNULL,
+                                         ).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": current.db._dbname,
+            }
+
+# -----------------------------------------------------------------------------
+def main(argv):
+
+    parser = argparse.ArgumentParser(prog="benchmark.py",
+                                     description="Resource layer benchmarks",
+                                     )
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", action="append")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    options = parser.parse_args(argv)
+
+    db = current.db
+    env = environment()
+    if env["database"] != "sqlite":
+        info("Warning: benchmarks should run against a scratch SQLite database")
+
+    # Load the baseline first, to fail early if it is not readable
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, "r") as source:
+            baseline = json.load(source)
+        if baseline.get("version") != FORMAT_VERSION:
+            info("Unsupported baseline format")
+            return 2
+
+    # Generate the dataset
+    info("Generating dataset (size=%s)..." % options.size)
+    current.auth.override = True
+    data = BenchmarkData(size=options.size, seed=options.seed)
+    try:
+        data.generate()
+    finally:
         current.auth.override = False
+    info("...done: %s" % ", ".join("%s %s" % (v, k) for k, v in data.counts.items()))
+
+    # Run the benchmarks
+    try:
+        results = BenchmarkSuite(data, repeat=options.repeat).run(only=options.only)
+    finally:
+        db.rollback()
+
+    output = {"version": FORMAT_VERSION,
+              "timestamp": datetime.datetime.utcnow().isoformat(),
+              "environment": env,
+              "size": options.size,
+              "dataset": data.counts,
+              "repeat": options.repeat,
+              "results": results,
+              }
+    if options.output:
+        with open(options.output, "w") as target:
+            json.dump(output, target, indent=2, sort_keys=True)
+
+    # Compare with the baseline
+    status = 0
+    if baseline:
+        if baseline.get("size") != options.size or \
+           baseline.get("environment", {}).get("database") != env["database"]:
+            info("Warning: baseline was recorded with a different size or database")
+
+        info("")
+        info("%-28s %12s %12s %8s" % ("Benchmark", "Baseline ms", "Current ms", "Ratio"))
+        comparison = compare(results, baseline["results"], threshold=options.threshold)
+        for name, before, after, ratio, regression in comparison:
+            info("%-28s %12.3f %12.3f %8s%s" % (name,
+                                                 before * 1000,
+                                                 after * 1000,
+                                                 "%.2f" % ratio if ratio is not None else "-",
+                                                 " REGRESSION" if regression else "",
+                                                 ))
+            if regression:
+                status = 1
+
+    return status
 
 # =============================================================================
 if __name__ == "__main__":
 
-    run_suite(
-        S3PerformanceTests,
-    )
+    sys.exit(main(sys.argv[1:]))
 
 # END ========================================================================
@@ -5,6 +5,7 @@
 #
 import json
 import os
+import tempfile
 import unittest
 
 from io import BytesIO, StringIO
@@ -12,7 +13,7 @@ from lxml import etree
 
 from gluon import *
 
-from core import S3Hierarchy, s3_meta_fields, S3Represent, S3RepresentLazy, S3XMLFormat, IS_ONE_OF
+from core import S3Hierarchy, s3_meta_fields, S3Represent, S3RepresentLazy, S3XMLFormat, IS_ONE_OF, XSLTCache
 
 from unit_tests import run_suite
 
@@ -260,6 +261,178 @@ class XMLFormatTests(unittest.TestCase):
         self.assertEqual(len(root), 0)
         self.assertEqual(root.text, "Test")
 
+# =============================================================================
+class XSLTCacheTests(unittest.TestCase):
+    """ Tests for the cache of compiled XSLT stylesheets """
+
+    stylesheet = """<?xml version="1.0"?>
+<xsl:stylesheet
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+
+    <xsl:output method="xml"/>
+    <xsl:param name="suffix"/>
+
+    <xsl:template match="/">
+        <test><xsl:value-of select="concat('%s', $suffix)"/></test>
+    </xsl:template>
+</xsl:stylesheet>"""
+
+    def setUp(self):
+
+        settings = current.deployment_settings
+        self.setting = settings.get_base_xslt_cache()
+
+        # Use a separate cache instance for this test
+        settings.base.xslt_cache = 7
+        XSLTCache.instances.pop(7, None)
+
+        self.paths = []
+
+    def tearDown(self):
+
+        current.deployment_settings.base.xslt_cache = self.setting
+        XSLTCache.instances.pop(7, None)
+
+        for path in self.paths:
+            os.remove(path)
+
+    # -------------------------------------------------------------------------
+    def write(self, text, path=None, mtime=None):
+        """
+            Write a stylesheet to a temporary file
+
+            Args:
+                text: the text of the test element
+                path: the file path (default: new temporary file)
+                mtime: the modification time to set for the file
+
+            Returns:
+                the file path
+        """
+
+        if path is None:
+            handle, path = tempfile.mkstemp(suffix=".xsl")
+            os.close(handle)
+            self.paths.append(path)
+
+        with open(path, "w") as stylesheet:
+            stylesheet.write(self.stylesheet % text)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+        return path
+
+    # -------------------------------------------------------------------------
+    def testReuse(self):
+        """ Compiled stylesheets are re-used until the file changes """
+
+        assertEqual = self.assertEqual
+
+        xml = current.xml
+        cache = XSLTCache.get_cache()
+
+        tree = etree.ElementTree(etree.fromstring("<s3xml/>"))
+        path = self.write("Before", mtime=1000000000)
+
+        result = xml.transform(tree, path, suffix="1")
+        assertEqual(result.getroot().text, "Before1")
+        stats = cache.stats()
+        assertEqual(stats["compiled"], 1)
+        assertEqual(stats["reused"], 0)
+
+        # Re-used with different parameters
+        result = xml.transform(tree, path, suffix="2")
+        assertEqual(result.getroot().text, "Before2")
+
+        # Re-used by envelope and S3XMLFormat
+        xml.envelope(tree, path)
+        xmlformat = S3XMLFormat(path)
+        result = xmlformat.transform(tree, suffix="3")
+        assertEqual(result.getroot().text, "Before3")
+
+        stats = cache.stats()
+        assertEqual(stats["compiled"], 1)
+        assertEqual(stats["reused"], 3)
+        assertEqual(stats["entries"], 1)
+
+        # Re-compiled after changing the file
+        self.write("After", path=path, mtime=1000000100)
+        result = xml.transform(tree, path, suffix="4")
+        assertEqual(result.getroot().text, "After4")
+        stats = cache.stats()
+        assertEqual(stats["compiled"], 2)
+        assertEqual(stats["entries"], 1)
+
+    # -------------------------------------------------------------------------
+    def testSizeLimit(self):
+        """ The cache holds no more than the configured number of stylesheets """
+
+        assertEqual = self.assertEqual
+
+        cache = XSLTCache(size=2)
+        load = current.xml.parse_and_compile
+
+        paths = [self.write("Test%s" % i) for i in range(3)]
+        for path in paths:
+            cache.get(path, load)
+        assertEqual(len(cache.entries), 2)
+        assertEqual(list(cache.entries.keys()), paths[1:])
+
+        # Least recently used gets evicted first
+        cache.get(paths[1], load)
+        cache.get(paths[0], load)
+        assertEqual(list(cache.entries.keys()), [paths[1], paths[0]])
+        assertEqual(cache.stats()["reused"], 1)
+
+    # -------------------------------------------------------------------------
+    def testInvalidStylesheet(self):
+        """ Invalid stylesheets are not cached """
+
+        xml = current.xml
+        cache = XSLTCache.get_cache()
+
+        handle, path = tempfile.mkstemp(suffix=".xsl")
+        os.close(handle)
+        self.paths.append(path)
+        with open(path, "w") as stylesheet:
+            stylesheet.write("""<?xml version="1.0"?><invalid/>""")
+
+        tree = etree.ElementTree(etree.fromstring("<s3xml/>"))
+        self.assertEqual(xml.transform(tree, path), None)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+# =============================================================================
+class SpreadsheetChunkTests(unittest.TestCase):
+    """ Tests for reading spreadsheet sources in chunks """
+
+    # -------------------------------------------------------------------------
+    def testCSVChunks(self):
+        """ CSV rows are read lazily and grouped into chunks """
+
+        assertEqual = self.assertEqual
+
+        xml = current.xml
+
+        source = b"Name,Type\n#name,#type\nA,X\n,\nB,Y\nC,Z\n"
+
+        # Same rows as in the complete tree
+        tree = xml.csv2tree(BytesIO(source), extra_data={"Org": "O"})
+        rows = list(xml.csv2rows(BytesIO(source), extra_data={"Org": "O"}))
+        assertEqual([etree.tostring(row) for row in rows],
+                     [etree.tostring(row) for row in tree.getroot()])
+
+        # Hashtags detected, empty rows skipped
+        assertEqual(len(rows), 3)
+        assertEqual(rows[0][0].get("hashtag"), "#name")
+
+        # Chunks of limited size
+        chunks = list(xml.chunks(iter(rows), resourcename="test", chunk_size=2))
+        assertEqual([len(chunk.getroot()) for chunk in chunks], [2, 1])
+        for chunk in chunks:
+            root = chunk.getroot()
+            assertEqual(root.tag, "table")
+            assertEqual(root.get("name"), "test")
+
 # =============================================================================
 class GetFieldOptionsTests(unittest.TestCase):
     """ Test field options introspection method """
@@ -1096,6 +1269,8 @@ if __name__ == "__main__":
         TreeBuilderTests,
         JSONMessageTests,
         XMLFormatTests,
+        XSLTCacheTests,
+        SpreadsheetChunkTests,
         GetFieldOptionsTests,
         S3JSONParsingTests,
         LookupListRepresentTests,
@@ -1 +1,3 @@
 from .base import *
+from .spatialindex import *
+from .tiles import *
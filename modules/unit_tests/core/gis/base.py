@@ -362,6 +362,107 @@ class LocationTreeTests(unittest.TestCase):
         # We should have seen all the expected parents.
         self.assertEqual(len(expected_parents), 0)
 
+    # -------------------------------------------------------------------------
+    def testRLT1_rebuild_location_tree(self):
+        """ Test set-based rebuild of the whole location tree """
+
+        table = self.table
+        db = current.db
+
+        # Insert locations without updating the tree
+        L0_lat = 12.0
+        L0_lon = -12.0
+        L0_id = table.insert(level = "L0",
+                             name = "s3gis.testRLT1.L0",
+                             lat = L0_lat,
+                             lon = L0_lon,
+                             )
+        L1_id = table.insert(level = "L1",
+                             name = "s3gis.testRLT1.L1",
+                             parent = L0_id,
+                             )
+        # Skipping over L2
+        L3_id = table.insert(level = "L3",
+                             name = "s3gis.testRLT1.L3",
+                             parent = L1_id,
+                             lat = 14.0,
+                             lon = -14.0,
+                             )
+        specific_id = table.insert(name = "s3gis.testRLT1.specific",
+                                   parent = L3_id,
+                                   )
+
+        current.gis.rebuild_location_tree()
+
+        assertEqual = self.assertEqual
+
+        fields = self.fields
+        L1_record = db(table.id == L1_id).select(*fields, limitby=(0, 1)).first()
+        assertEqual(L1_record.inherited, True)
+        assertEqual(L1_record.path, "%s/%s" % (L0_id, L1_id))
+        assertEqual(L1_record.lat, L0_lat)
+        assertEqual(L1_record.lon, L0_lon)
+        assertEqual(L1_record.L0, "s3gis.testRLT1.L0")
+        assertEqual(L1_record.L1, "s3gis.testRLT1.L1")
+        assertEqual(L1_record.wkt, "POINT (%s %s)" % (L0_lon, L0_lat))
+
+        L3_record = db(table.id == L3_id).select(*fields, limitby=(0, 1)).first()
+        assertEqual(L3_record.inherited, False)
+        assertEqual(L3_record.path, "%s/%s/%s" % (L0_id, L1_id, L3_id))
+        assertEqual(L3_record.lat, 14.0)
+        assertEqual(L3_record.L1, "s3gis.testRLT1.L1")
+        assertEqual(L3_record.L2, None)
+        assertEqual(L3_record.L3, "s3gis.testRLT1.L3")
+
+        specific = db(table.id == specific_id).select(*fields, limitby=(0, 1)).first()
+        assertEqual(specific.inherited, True)
+        assertEqual(specific.path, "%s/%s/%s/%s" % (L0_id, L1_id, L3_id, specific_id))
+        assertEqual(specific.lat, 14.0)
+        assertEqual(specific.lon, -14.0)
+        assertEqual(specific.L0, "s3gis.testRLT1.L0")
+        assertEqual(specific.L3, "s3gis.testRLT1.L3")
+        assertEqual(specific.L4, None)
+
+        # Rebuild is idempotent
+        self.assertEqual(current.gis.rebuild_location_tree(location_ids=[L0_id]), 0)
+
+    # -------------------------------------------------------------------------
+    def testRLT2_rebuild_location_tree_incremental(self):
+        """ Test incremental rebuild of a subtree """
+
+        table = self.table
+        db = current.db
+        gis = current.gis
+
+        L0_id = table.insert(level = "L0",
+                             name = "s3gis.testRLT2.L0",
+                             lat = 20.0,
+                             lon = -20.0,
+                             )
+        L1_id = table.insert(level = "L1",
+                             name = "s3gis.testRLT2.L1",
+                             parent = L0_id,
+                             )
+        specific_id = table.insert(name = "s3gis.testRLT2.specific",
+                                   parent = L1_id,
+                                   )
+        gis.rebuild_location_tree(location_ids=[L0_id])
+
+        # Rename and move the L0
+        db(table.id == L0_id).update(name = "s3gis.testRLT2.L0.renamed",
+                                     lat = 21.0,
+                                     lon = -21.0,
+                                     )
+        updated = gis.rebuild_location_tree(location_ids=[L0_id])
+        self.assertEqual(updated, 3)
+
+        specific = db(table.id == specific_id).select(*self.fields,
+                                                      limitby = (0, 1),
+                                                      ).first()
+        self.assertEqual(specific.L0, "s3gis.testRLT2.L0.renamed")
+        self.assertEqual(specific.lat, 21.0)
+        self.assertEqual(specific.lon, -21.0)
+
     # -------------------------------------------------------------------------
     def _testL0(self, with_level):
         """ Test updating a Country with Polygon """
@@ -0,0 +1,165 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/gis/spatialindex.py
+
+import datetime
+import time
+import unittest
+
+from gluon import *
+
+from core import *
+from core.gis.spatialindex import SpatialIndex
+
+from unit_tests import run_suite
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+
+# =============================================================================
+@unittest.skipIf(shapely is None, "Shapely not installed")
+class SpatialIndexTests(unittest.TestCase):
+    """ Tests for the in-memory spatial index """
+
+    def setUp(self):
+
+        table = current.s3db.gis_location
+
+        self.area = table.insert(name = "SpatialIndexTestArea",
+                                 wkt = "POLYGON ((10 10, 12 10, 12 12, 10 12, 10 10))",
+                                 gis_feature_type = 3,
+                                 lon_min = 10,
+                                 lat_min = 10,
+                                 lon_max = 12,
+                                 lat_max = 12,
+                                 )
+        self.point = table.insert(name = "SpatialIndexTestPoint",
+                                  gis_feature_type = 1,
+                                  lat = 11.5,
+                                  lon = 10.5,
+                                  )
+
+        self.index = SpatialIndex()
+
+    def tearDown(self):
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testLookup(self):
+        """ Bounding box and point-in-polygon lookups """
+
+        assertIn = self.assertIn
+        assertNotIn = self.assertNotIn
+
+        index = self.index
+        area, point = self.area, self.point
+
+        found = index.candidates(10.4, 11.4, 10.6, 11.6)
+        assertIn(area, found)
+        assertIn(point, found)
+
+        found = index.candidates(12.5, 12.5, 13, 13)
+        assertNotIn(area, found)
+        assertNotIn(point, found)
+
+        found = index.containing(11, 11)
+        assertIn(area, found)
+        assertNotIn(point, found)
+
+    # -------------------------------------------------------------------------
+    def testUpdate(self):
+        """ Changed and deleted locations are applied incrementally """
+
+        assertIn = self.assertIn
+        assertNotIn = self.assertNotIn
+
+        db = current.db
+        table = current.s3db.gis_location
+
+        index = self.index
+        area, point = self.area, self.point
+
+        index.sync()
+
+        # Move the point
+        db(table.id == point).update(lat = 20, lon = 20)
+        index.update(point)
+        assertNotIn(point, index.candidates(10, 10, 12, 12))
+        assertIn(point, index.candidates(19, 19, 21, 21))
+
+        # Delete the area
+        db(table.id == area).update(deleted = True)
+        index.update(area)
+        assertNotIn(area, index.containing(11, 11))
+
+        # Changes are also picked up by the next sync
+        db(table.id == point).update(lat = 11, lon = 11)
+        index.sync(force=True)
+        assertIn(point, index.candidates(10, 10, 12, 12))
+
+    # -------------------------------------------------------------------------
+    def testLateCommit(self):
+        """ Changes committed after the last sync are picked up """
+
+        table = current.s3db.gis_location
+
+        index = self.index
+        index.sync()
+
+        # A location with a modified_on before the last sync
+        modified_on = index.synced - datetime.timedelta(seconds=60)
+        late = table.insert(name = "SpatialIndexTestLate",
+                            gis_feature_type = 1,
+                            lat = 11.2,
+                            lon = 11.2,
+                            modified_on = modified_on,
+                            )
+
+        index.sync(force=True)
+        self.assertIn(late, index.candidates(11, 11, 12, 12))
+
+        # Re-reading within the overlap does not grow the delta
+        delta = len(index.delta)
+        index.sync(force=True)
+        self.assertEqual(len(index.delta), delta)
+
+    # -------------------------------------------------------------------------
+    def testExpired(self):
+        """ Tree is rebuilt after TTL or invalidation """
+
+        index = self.index
+        index.sync()
+
+        now = time.time()
+        self.assertFalse(index.expired(now))
+        self.assertTrue(index.expired(now + index.TTL + 1))
+
+        # Invalidation takes effect after the margin
+        SpatialIndex.invalidate()
+        self.assertFalse(index.expired(time.time()))
+        self.assertTrue(index.expired(time.time() + index.MARGIN + 1))
+
+    # -------------------------------------------------------------------------
+    def testLimit(self):
+        """ Lookups with more candidates than the limit are rejected """
+
+        from shapely.geometry import box
+
+        index = self.index
+        shape = box(10, 10, 12, 12)
+
+        self.assertEqual(index.intersecting(shape, limit=1), None)
+        self.assertIn(self.area, index.intersecting(shape, limit=1000))
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        SpatialIndexTests,
+        )
+
+# END ========================================================================
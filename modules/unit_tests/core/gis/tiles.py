@@ -0,0 +1,160 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/gis/tiles.py
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from gluon import *
+
+from core import *
+from core.gis.tiles import MapTile, TileCache
+
+from unit_tests import run_suite
+
+# =============================================================================
+class MapTileTests(unittest.TestCase):
+    """ Tests for tile geometry and point clustering """
+
+    # -------------------------------------------------------------------------
+    def testBounds(self):
+        """ Tile bounds """
+
+        assertEqual = self.assertEqual
+        assertAlmostEqual = self.assertAlmostEqual
+
+        assertEqual(MapTile(0, 0, 0).bounds, (-180.0, -90.0, 180.0, 90.0))
+        assertEqual(MapTile(1, 1, 0).bounds, (0.0, 0.0, 180.0, 90.0))
+
+        lon_min, lat_min, lon_max, lat_max = MapTile(10, 511, 340).bounds
+        assertAlmostEqual(lon_min, -0.3516, 4)
+        assertAlmostEqual(lat_min, 51.3992, 4)
+        assertAlmostEqual(lon_max, 0.0, 4)
+        assertAlmostEqual(lat_max, 51.6180, 4)
+
+    # -------------------------------------------------------------------------
+    def testInvalidTile(self):
+        """ Invalid tile coordinates are rejected """
+
+        for z, x, y in ((1, 2, 0), (-1, 0, 0), (30, 0, 0)):
+            with self.assertRaises(ValueError):
+                MapTile(z, x, y)
+
+    # -------------------------------------------------------------------------
+    def testCluster(self):
+        """ Nearby points are clustered at low zoom levels only """
+
+        assertEqual = self.assertEqual
+
+        points = [(1, 10.0, 10.0),
+                  (2, 10.01, 10.02),
+                  (3, 20.0, 40.0),
+                  ]
+
+        clusters = MapTile(3, 4, 3).cluster(points)
+        clusters = sorted(clusters, key=lambda c: len(c[2]))
+        assertEqual(len(clusters), 2)
+        assertEqual(clusters[0][2], [3])
+        assertEqual(clusters[1][2], [1, 2])
+        self.assertAlmostEqual(clusters[1][0], 10.005)
+
+        clusters = MapTile(18, 0, 0).cluster(points)
+        assertEqual(len(clusters), 3)
+
+# =============================================================================
+class TileCacheTests(unittest.TestCase):
+    """ Tests for the tile disk cache """
+
+    def setUp(self):
+
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # -------------------------------------------------------------------------
+    def testInvalidate(self):
+        """ Cached tiles are invalidated by changes in their tables """
+
+        assertEqual = self.assertEqual
+
+        cache = TileCache(self.path)
+
+        layer = ("org_facility", "test")
+        tile = MapTile(3, 4, 2)
+        tablenames = ["org_facility", "gis_location"]
+
+        assertEqual(cache.get(layer, tile, tablenames), None)
+
+        start = time.time()
+        cache.put(layer, tile, "TILE", start)
+        assertEqual(cache.get(layer, tile, tablenames), "TILE")
+
+        # Invalidation of any involved table invalidates the tile
+        cache.invalidate("gis_location")
+        assertEqual(cache.get(layer, tile, tablenames), None)
+
+        # Tiles built within the margin are not used
+        cache.put(layer, tile, "TILE", time.time())
+        assertEqual(cache.get(layer, tile, tablenames), None)
+
+        # ...but later ones are
+        stamp = start - 10
+        os.utime(cache.stamp("gis_location"), (stamp, stamp))
+        assertEqual(cache.get(layer, tile, tablenames), "TILE")
+
+    # -------------------------------------------------------------------------
+    def testInvalidateRepeated(self):
+        """ Later writes within the margin push the stamp forward """
+
+        cache = TileCache(self.path)
+
+        # Invalidated within the margin, but earlier
+        cache.invalidate("gis_location")
+        path = cache.stamp("gis_location")
+        earlier = time.time() + cache.MARGIN - 30
+        os.utime(path, (earlier, earlier))
+
+        cache.invalidate("gis_location")
+        self.assertTrue(cache.version("gis_location") > earlier)
+
+    # -------------------------------------------------------------------------
+    def testWatch(self):
+        """ Only tables that tiles can be built from are watched """
+
+        db = current.db
+
+        cache = TileCache(self.path)
+
+        hooked = lambda table: any(getattr(hook, "tile_cache", None) == table._tablename
+                                   for hook in table._after_insert)
+
+        located = db.define_table("tile_watch_located",
+                                  Field("name"),
+                                  Field("location_id", "integer"),
+                                  migrate = False,
+                                  )
+        cache.watch(located)
+        self.assertTrue(hooked(located))
+
+        unlocated = db.define_table("tile_watch_unlocated",
+                                    Field("name"),
+                                    migrate = False,
+                                    )
+        cache.watch(unlocated)
+        self.assertFalse(hooked(unlocated))
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        MapTileTests,
+        TileCacheTests,
+        )
+
+# END ========================================================================
@@ -1,3 +1,5 @@
 from .anonymize import *
+from .checkpoint import *
 from .crud import *
 from .grouped import *
+from .report import *
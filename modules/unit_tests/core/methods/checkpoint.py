@@ -0,0 +1,141 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/methods/checkpoint.py
+#
+import unittest
+
+from gluon import current
+
+from core import Checkpoint, CheckpointRules
+
+from unit_tests import run_suite
+
+# =============================================================================
+class CheckpointRulesTests(unittest.TestCase):
+    """ Tests for the preloaded checkpoint event rules """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        s3db = current.s3db
+
+        settings = current.deployment_settings
+        self.setting = settings.dvr.get("event_registration_preload")
+        settings.dvr.event_registration_preload = True
+
+        # Discard rules indexes of previous tests (record IDs can be
+        # reused after rollback)
+        CheckpointRules.instances.clear()
+
+        # Create an organisation
+        otable = s3db.org_organisation
+        organisation = {"name": "Checkpoint Test Organisation"}
+        organisation_id = otable.insert(**organisation)
+        organisation["id"] = organisation_id
+        s3db.update_super(otable, organisation)
+        self.organisation_id = organisation_id
+
+        # Create a person
+        ptable = s3db.pr_person
+        person = {"first_name": "Checkpoint", "last_name": "Tester"}
+        person_id = ptable.insert(**person)
+        person["id"] = person_id
+        s3db.update_super(ptable, person)
+        self.person_id = person_id
+
+        # Create event types
+        ttable = s3db.dvr_case_event_type
+        self.food = ttable.insert(organisation_id = organisation_id,
+                                  event_class = "F",
+                                  code = "FOOD",
+                                  name = "Food",
+                                  max_per_day = 1,
+                                  min_interval = 30,
+                                  )
+        self.snack = ttable.insert(organisation_id = organisation_id,
+                                   event_class = "F",
+                                   code = "SNACK",
+                                   name = "Snack",
+                                   max_per_day = 3,
+                                   )
+        xtable = s3db.dvr_case_event_exclusion
+        xtable.insert(type_id = self.snack,
+                      excluded_by_id = self.food,
+                      )
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+        # Discard the rules indexes of the rolled-back records
+        CheckpointRules.instances.clear()
+
+        current.deployment_settings.dvr.event_registration_preload = self.setting
+
+    # -------------------------------------------------------------------------
+    def testCheck(self):
+        """ Test evaluation of the rules against the index """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        etable = current.s3db.dvr_case_event
+
+        person_id = self.person_id
+        food, snack = self.food, self.snack
+
+        now = current.request.utcnow.replace(microsecond=0)
+        check = {food, snack}
+
+        ttable = current.s3db.dvr_case_event_type
+        query = (ttable.id.belongs(check))
+        event_types = {row.id: row for row in db(query).select()}
+
+        rules = CheckpointRules.get_rules(self.organisation_id, "F")
+        assertEqual(CheckpointRules.get_rules(self.organisation_id, "F"), rules)
+
+        rules.refresh()
+        assertEqual(rules.check(person_id, check, now, event_types), {})
+
+        # Register food => both types blocked for the rest of the day
+        event_id = etable.insert(person_id = person_id,
+                                 type_id = food,
+                                 date = now,
+                                 )
+        rules.refresh()
+        blocked = rules.check(person_id, check, now, event_types)
+        assertEqual(set(blocked), {food, snack})
+
+        # Same result as the database queries
+        expected = Checkpoint.check_max_per_day(person_id,
+                                                {food},
+                                                now.replace(hour=0, minute=0, second=0),
+                                                event_types,
+                                                )
+        assertEqual(blocked[food][1], expected[food][1])
+
+        # Deletion is picked up by the incremental update
+        db(etable.id == event_id).update(deleted = True)
+        rules.refresh()
+        assertEqual(rules.check(person_id, check, now, event_types), {})
+
+    # -------------------------------------------------------------------------
+    def testDisabled(self):
+        """ Test that rules are not preloaded unless enabled """
+
+        current.deployment_settings.dvr.event_registration_preload = False
+        self.assertEqual(CheckpointRules.get_rules(self.organisation_id, "F"), None)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        CheckpointRulesTests,
+    )
+
+# END ========================================================================
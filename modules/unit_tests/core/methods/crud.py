@@ -13,7 +13,7 @@ from gluon.storage import Storage
 
 from unit_tests import run_suite
 
-from core import S3CRUD
+from core import FS, S3CRUD
 
 # =============================================================================
 class ValidateTests(unittest.TestCase):
@@ -188,11 +188,80 @@ class ValidateTests(unittest.TestCase):
         self.assertTrue("value" in role)
         self.assertTrue(isinstance(role["value"], int))
 
+# =============================================================================
+class KeysetSignatureTests(unittest.TestCase):
+    """ Test S3CRUD._keyset_signature """
+
+    # -------------------------------------------------------------------------
+    def signature(self, resource=None, **attr):
+        """
+            Generate the signature for a fake request
+
+            Args:
+                resource: the resource (default: all organisations)
+                attr: request attributes to override
+
+            Returns:
+                the signature
+        """
+
+        if resource is None:
+            resource = current.s3db.resource("org_organisation")
+
+        request = Storage(controller = "org",
+                          function = "organisation",
+                          tablename = resource.tablename,
+                          id = None,
+                          component = None,
+                          get_vars = Storage(),
+                          )
+        request.update(attr)
+
+        crud = S3CRUD()
+        crud.resource = resource
+
+        return crud._keyset_signature(request)
+
+    # -------------------------------------------------------------------------
+    def testSignature(self):
+        """ Test that the signature depends on the result set """
+
+        assertEqual = self.assertEqual
+        assertNotEqual = self.assertNotEqual
+
+        signature = self.signature()
+
+        # Same request, same signature
+        assertEqual(self.signature(), signature)
+
+        # Pagination parameters are ignored
+        assertEqual(self.signature(get_vars=Storage(start="10", draw="2")), signature)
+
+        # Different URL filters
+        assertNotEqual(self.signature(get_vars=Storage(name="A")), signature)
+
+        # Different controller or function
+        assertNotEqual(self.signature(controller="hrm"), signature)
+        assertNotEqual(self.signature(function="index"), signature)
+
+        # Different master record
+        assertNotEqual(self.signature(id=1), self.signature(id=2))
+
+        # Different component
+        office = Storage(alias="office")
+        assertNotEqual(self.signature(component=office), signature)
+
+        # Filter not in GET vars (e.g. s3.filter or default filter)
+        resource = current.s3db.resource("org_organisation")
+        resource.add_filter(FS("name") == "Test")
+        assertNotEqual(self.signature(resource), signature)
+
 # =============================================================================
 if __name__ == "__main__":
 
     run_suite(
         ValidateTests,
+        KeysetSignatureTests,
     )
 
 # END ========================================================================
@@ -0,0 +1,161 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/methods/report.py
+#
+import unittest
+
+from gluon import *
+from core import S3PivotTable, s3_meta_fields
+from core.methods.report import S3PivotTableFact
+
+from unit_tests import run_suite
+
+# =============================================================================
+class PivotTableAggregationTests(unittest.TestCase):
+    """ Tests for database-side aggregation of pivot tables """
+
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+
+        db.define_table("pt_test_category",
+                        Field("name"),
+                        *s3_meta_fields())
+        db.define_table("pt_test_item",
+                        Field("category_id", "reference pt_test_category"),
+                        Field("type"),
+                        Field("value", "integer"),
+                        Field("weight", "double"),
+                        *s3_meta_fields())
+
+        ctable = db.pt_test_category
+        categories = [ctable.insert(name="Category%s" % i) for i in range(3)]
+
+        itable = db.pt_test_item
+        items = (("A", 0, 3, 1.5),
+                 ("A", 0, 4, None),
+                 ("B", 0, None, 2.25),
+                 ("B", 1, 7, 0.5),
+                 ("C", 1, 1, 1.0),
+                 ("C", 2, 5, 3.0),
+                 (None, 2, 2, 4.5),
+                 ("A", None, 6, 1.25),
+                 )
+        for type_, category, value, weight in items:
+            itable.insert(type = type_,
+                          category_id = categories[category] if category is not None else None,
+                          value = value,
+                          weight = weight,
+                          )
+
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.pt_test_item.drop()
+        db.pt_test_category.drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.setting = settings.get_ui_report_db_aggregation()
+
+    def tearDown(self):
+
+        current.deployment_settings.ui.report_db_aggregation = self.setting
+
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def pivot(self, rows, cols, fact, aggregate=False):
+        """
+            Generate a pivot table
+
+            Args:
+                rows: the rows axis selector
+                cols: the cols axis selector
+                fact: the fact expression
+                aggregate: aggregate in the database
+
+            Returns:
+                tuple (pivottable, cells, rows, cols, totals) with values
+                per axis value
+        """
+
+        current.deployment_settings.ui.report_db_aggregation = aggregate
+
+        resource = current.s3db.resource("pt_test_item")
+        facts = S3PivotTableFact.parse(fact)
+        pt = S3PivotTable(resource, rows, cols, facts)
+
+        layers = [f.layer for f in facts]
+
+        cells, rtotals, ctotals = {}, {}, {}
+        for r, row in enumerate(pt.row):
+            rtotals[row.value] = [row[layer] for layer in layers]
+            for c, col in enumerate(pt.col):
+                cells[(row.value, col.value)] = [pt.cell[r][c][layer] for layer in layers]
+        for col in pt.col:
+            ctotals[col.value] = [col[layer] for layer in layers]
+        totals = [pt.totals[layer] for layer in layers]
+
+        return pt, cells, rtotals, ctotals, totals
+
+    # -------------------------------------------------------------------------
+    def testAggregation(self):
+        """ Aggregation in the database gives the same results as in memory """
+
+        assertEqual = self.assertEqual
+
+        fact = "count(id),count(type),sum(value),min(value),max(value),avg(weight)"
+        for rows, cols in (("type", "category_id"),
+                           ("category_id$name", None),
+                           (None, "type"),
+                           ):
+
+            expected = self.pivot(rows, cols, fact)
+            actual = self.pivot(rows, cols, fact, aggregate=True)
+
+            # Verify that the aggregation actually happened in the database
+            assertEqual(actual[0].records, {})
+            assertEqual(len(actual[0]), 8)
+
+            for index in range(1, 5):
+                assertEqual(actual[index], expected[index])
+
+            # JSON output has the same structure
+            output = actual[0].json()
+            assertEqual(len(output["rows"]), len(expected[0].json()["rows"]))
+
+    # -------------------------------------------------------------------------
+    def testFallback(self):
+        """ Reports which cannot be aggregated in the database """
+
+        assertTrue = self.assertTrue
+
+        # List facts require record details
+        pt = self.pivot("type", None, "list(value)", aggregate=True)[0]
+        assertTrue(len(pt.records) > 0)
+
+        # Numeric methods require numeric facts
+        pt = self.pivot("type", None, "max(type)", aggregate=True)[0]
+        assertTrue(len(pt.records) > 0)
+
+        # Threshold not exceeded
+        pt = self.pivot("type", None, "count(id)", aggregate=100)[0]
+        assertTrue(len(pt.records) > 0)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        PivotTableAggregationTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,90 @@
+# Eden unit tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/model/index.py
+#
+import unittest
+
+from gluon import current
+
+from core import *
+
+from unit_tests import run_suite
+
+# =============================================================================
+class ModelIndexTests(unittest.TestCase):
+    """ Tests for the model index """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        s3db = current.s3db
+
+        # Build an index that is not written to disk
+        signature = ModelIndex.get_signature(s3db.module_map)
+        self.index = ModelIndex(signature, s3db.module_map)
+
+    # -------------------------------------------------------------------------
+    def testLocate(self):
+        """ Test lookup of the model defining a name """
+
+        assertEqual = self.assertEqual
+
+        index = self.index
+
+        located = index.locate("org_organisation")
+        self.assertNotEqual(located, None)
+
+        prefix, module, classname = located
+        assertEqual(prefix, "org")
+        assertEqual(classname, "OrgOrganisationModel")
+
+        # Response.s3 names are indexed too
+        located = index.locate("org_organisation_id")
+        assertEqual(located[2], "OrgOrganisationModel")
+
+        # Unknown names
+        assertEqual(index.locate("org_nonexistent"), None)
+        self.assertFalse(index.has("org_nonexistent"))
+        self.assertTrue(index.has("org_organisation"))
+
+    # -------------------------------------------------------------------------
+    def testUpdate(self):
+        """ Test completion of the reference and component maps """
+
+        assertEqual = self.assertEqual
+
+        index = self.index
+
+        # Not available before all models have been loaded
+        self.assertFalse(index.complete)
+        assertEqual(index.referenced_by("org_organisation"), None)
+
+        current.s3db.load_all_models()
+        index.update()
+
+        self.assertTrue(index.complete)
+        self.assertIn("org_office", index.referenced_by("org_organisation"))
+        assertEqual(index.component("org_organisation", "office"), "org_office")
+        assertEqual(index.component("org_organisation", "nonexistent"), None)
+
+    # -------------------------------------------------------------------------
+    def testLoadReport(self):
+        """ Test the report of loaded models """
+
+        current.s3db.table("org_organisation")
+
+        report = DataModel.load_report()
+        names = [item.name for item in report]
+        self.assertIn("OrgOrganisationModel", names)
+        for item in report:
+            self.assertTrue(item.duration >= 0)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        ModelIndexTests,
+    )
+
+# END ========================================================================
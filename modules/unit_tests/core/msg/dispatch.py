@@ -0,0 +1,131 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/msg/dispatch.py
+#
+import time
+import unittest
+
+from gluon import *
+
+from core.msg import dispatch
+from core.msg.dispatch import ConnectionPool, OutboxDispatcher, RateLimiter, TransientError
+
+from unit_tests import run_suite
+
+# =============================================================================
+class OutboxDispatcherTests(unittest.TestCase):
+    """ Tests for concurrent outbox dispatch """
+
+    def setUp(self):
+
+        self.retry_delay = dispatch.RETRY_DELAY
+        dispatch.RETRY_DELAY = 0.001
+
+    def tearDown(self):
+
+        dispatch.RETRY_DELAY = self.retry_delay
+
+    # -------------------------------------------------------------------------
+    def testConnectionPool(self):
+        """ Connections are re-used unless discarded """
+
+        assertEqual = self.assertEqual
+
+        opened, closed = [], []
+
+        def connect():
+            connection = len(opened) + 1
+            opened.append(connection)
+            return connection
+
+        pool = ConnectionPool(connect, closed.append)
+
+        connection = pool.acquire()
+        pool.release(connection)
+        assertEqual(pool.acquire(), connection)
+        assertEqual(len(opened), 1)
+
+        pool.release(connection, discard=True)
+        assertEqual(closed, [connection])
+        assertEqual(pool.acquire(), 2)
+
+        pool.release(2)
+        pool.close()
+        assertEqual(closed, [1, 2])
+
+    # -------------------------------------------------------------------------
+    def testRateLimiter(self):
+        """ Rate limiter spaces out send slots """
+
+        limiter = RateLimiter(50)
+
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.wait()
+        duration = time.monotonic() - start
+
+        self.assertGreaterEqual(duration, 4 / 50.0)
+
+    # -------------------------------------------------------------------------
+    def testDispatch(self):
+        """ Transient failures are retried, permanent failures are not """
+
+        assertEqual = self.assertEqual
+
+        attempts = {}
+
+        def send(recipient):
+            count = attempts[recipient] = attempts.get(recipient, 0) + 1
+            if recipient == "flaky" and count < 3:
+                raise TransientError("temporary failure")
+            elif recipient == "down":
+                raise TransientError("permanently unavailable")
+            elif recipient == "invalid":
+                return False, "rejected"
+            return True, recipient.upper()
+
+        outputs = {}
+        def callback(outbox_id, output):
+            outputs[outbox_id] = output
+            return True
+
+        dispatcher = OutboxDispatcher(4, attempts=3)
+        for outbox_id, recipient in enumerate(("ok", "flaky", "down", "invalid")):
+            dispatcher.jobs.append((outbox_id, None, send, (recipient,), callback))
+
+        sent, failed = dispatcher()
+
+        assertEqual(sorted(sent), [0, 1])
+        assertEqual(sorted(failed), [2, 3])
+        assertEqual(outputs, {0: "OK", 1: "FLAKY"})
+        assertEqual(attempts, {"ok": 1, "flaky": 3, "down": 3, "invalid": 1})
+
+        metrics = dispatcher.metrics
+        assertEqual(metrics.sent, 2)
+        assertEqual(metrics.failed, 2)
+        assertEqual(metrics.retries, 4)
+
+    # -------------------------------------------------------------------------
+    def testComposeEmail(self):
+        """ Email payload composition """
+
+        assertIn = self.assertIn
+
+        payload = OutboxDispatcher.compose_email("test@example.com",
+                                                 "Subject",
+                                                 "<html><body>Test</body></html>",
+                                                 "Sender <sender@example.com>",
+                                                 )
+        assertIn("To: test@example.com", payload)
+        assertIn("From: Sender <sender@example.com>", payload)
+        assertIn("text/html", payload)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        OutboxDispatcherTests,
+    )
+
+# END ========================================================================
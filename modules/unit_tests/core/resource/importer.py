@@ -4,7 +4,10 @@
 # python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/resource/importer.py
 #
 import datetime
+import io
 import json
+import os
+import tempfile
 import unittest
 
 from gluon import *
@@ -556,6 +559,280 @@ class DuplicateDetectionTests(unittest.TestCase):
         with assertRaises(TypeError):
             deduplicate = S3Duplicate(secondary=17)
 
+    # -------------------------------------------------------------------------
+    def testBulkMatch(self):
+        """ Test bulk deduplication of multiple items """
+
+        assertEqual = self.assertEqual
+
+        deduplicate = S3Duplicate(primary=("name",),
+                                  secondary=("secondary",),
+                                  )
+
+        ids = self.ids
+        table = current.db.dedup_test
+
+        data = (Storage(name="Test0"),
+                Storage(name="Test2", secondary="secondaryX"),
+                Storage(name="test4", secondary="secondaryX"),
+                Storage(name="Test"),
+                Storage(name="TEST"),
+                )
+        items = []
+        for values in data:
+            item = ImportItem(self.job)
+            item.table = table
+            item.method = item.METHOD.CREATE
+            item.data = values
+            items.append(item)
+
+        duplicates = deduplicate.bulk(items)
+
+        # Primary match
+        assertEqual(items[0].id, ids["TEST0"])
+        assertEqual(items[0].method, item.METHOD.UPDATE)
+
+        # Primary match + secondary match
+        assertEqual(items[1].id, ids["TEST2"])
+        assertEqual(items[1].method, item.METHOD.UPDATE)
+
+        # Primary match + secondary mismatch
+        assertEqual(items[2].id, None)
+        assertEqual(items[2].method, item.METHOD.CREATE)
+
+        # Primary mismatch
+        assertEqual(items[3].id, None)
+        assertEqual(items[3].method, item.METHOD.CREATE)
+
+        # Duplicate of another new item must be postponed
+        assertEqual(duplicates, [items[4]])
+
+# =============================================================================
+class BulkCommitTests(unittest.TestCase):
+    """ Test bulk commit of import jobs """
+
+    def setUp(self):
+
+        xmlstr = """
+<s3xml>
+    <resource name="org_organisation">
+        <data field="name">BulkImportOrg1</data>
+        <resource name="org_office">
+            <data field="name">BulkImportOffice1</data>
+        </resource>
+    </resource>
+    <resource name="org_organisation">
+        <data field="name">BulkImportOrg2</data>
+    </resource>
+    <resource name="org_organisation">
+        <data field="name">bulkimportorg2</data>
+    </resource>
+</s3xml>"""
+
+        self.tree = etree.ElementTree(etree.fromstring(xmlstr))
+
+        settings = current.deployment_settings
+        self.bulk = settings.base.get("import_bulk_commit")
+        settings.base.import_bulk_commit = True
+
+        current.auth.override = True
+
+    def tearDown(self):
+
+        current.deployment_settings.base.import_bulk_commit = self.bulk
+        current.auth.override = False
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testBulkCommit(self):
+        """ Test bulk commit with components and in-batch duplicates """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        s3db = current.s3db
+
+        resource = s3db.resource("org_organisation")
+        result = resource.import_xml(self.tree)
+        assertEqual(result.error, None)
+
+        table = resource.table
+
+        # Organisations written, in-batch duplicate merged
+        query = (table.name.lower().belongs(("bulkimportorg1", "bulkimportorg2"))) & \
+                (table.deleted == False)
+        rows = db(query).select(table.id, table.name, table.pe_id)
+        assertEqual(len(rows), 2)
+
+        # Post-processed (super-entity links)
+        for row in rows:
+            self.assertNotEqual(row.pe_id, None)
+
+        # Component written with reference to the master
+        org_id = [row.id for row in rows if row.name == "BulkImportOrg1"][0]
+        otable = s3db.org_office
+        query = (otable.name == "BulkImportOffice1") & \
+                (otable.organisation_id == org_id)
+        office = db(query).select(otable.id, otable.site_id, limitby=(0, 1)).first()
+        self.assertNotEqual(office, None)
+        self.assertNotEqual(office.site_id, None)
+
+    # -------------------------------------------------------------------------
+    def testBulkCommitFailure(self):
+        """ Test that failed deferred inserts are reported per item """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        s3db = current.s3db
+
+        xmlstr = """
+<s3xml>
+    <resource name="org_organisation">
+        <data field="name">BulkImportOrg1</data>
+    </resource>
+    <resource name="org_organisation">
+        <data field="name">BulkImportFail</data>
+    </resource>
+    <resource name="org_organisation">
+        <data field="name">BulkImportOrg3</data>
+    </resource>
+</s3xml>"""
+        tree = etree.ElementTree(etree.fromstring(xmlstr))
+
+        resource = s3db.resource("org_organisation")
+        table = resource.table
+
+        # Make the insert of the second organisation fail
+        def fail(fields):
+            if fields.get("name") == "BulkImportFail":
+                raise RuntimeError("Insert failed")
+        table._before_insert.append(fail)
+        try:
+            result = resource.import_xml(tree, ignore_errors=True)
+        finally:
+            table._before_insert.remove(fail)
+
+        # Failed item reported as error
+        assertEqual(result.failed, 1)
+
+        # Other items written and post-processed
+        query = (table.name.belongs(("BulkImportOrg1",
+                                     "BulkImportFail",
+                                     "BulkImportOrg3",
+                                     ))) & \
+                (table.deleted == False)
+        rows = db(query).select(table.id, table.name, table.pe_id)
+        assertEqual(set(row.name for row in rows), {"BulkImportOrg1", "BulkImportOrg3"})
+        for row in rows:
+            self.assertNotEqual(row.pe_id, None)
+
+# =============================================================================
+class ChunkedImportTests(unittest.TestCase):
+    """ Test chunked import of spreadsheet sources """
+
+    STYLESHEET = b"""<?xml version="1.0"?>
+<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+    <xsl:output method="xml"/>
+    <xsl:template match="/">
+        <s3xml>
+            <xsl:apply-templates select="./table/row"/>
+        </s3xml>
+    </xsl:template>
+    <xsl:template match="row">
+        <xsl:variable name="Parent" select="col[@field='Parent']/text()"/>
+        <resource name="import_chunk_test">
+            <xsl:attribute name="tuid">
+                <xsl:value-of select="col[@field='Name']/text()"/>
+            </xsl:attribute>
+            <data field="name"><xsl:value-of select="col[@field='Name']/text()"/></data>
+            <xsl:if test="$Parent!=''">
+                <reference field="parent" resource="import_chunk_test">
+                    <xsl:attribute name="tuid">
+                        <xsl:value-of select="$Parent"/>
+                    </xsl:attribute>
+                </reference>
+            </xsl:if>
+        </resource>
+    </xsl:template>
+</xsl:stylesheet>"""
+
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+        db.define_table("import_chunk_test",
+                        Field("name"),
+                        Field("parent", "reference import_chunk_test"),
+                        *s3_meta_fields())
+
+        stylesheet = tempfile.NamedTemporaryFile(suffix=".xsl", delete=False)
+        stylesheet.write(cls.STYLESHEET)
+        stylesheet.close()
+        cls.stylesheet = stylesheet.name
+
+    @classmethod
+    def tearDownClass(cls):
+
+        os.remove(cls.stylesheet)
+
+        db = current.db
+        db.import_chunk_test.drop()
+        db.commit()
+
+    def setUp(self):
+
+        current.auth.override = True
+
+    def tearDown(self):
+
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testChunkedImport(self):
+        """ Test chunked import with references across chunks """
+
+        assertEqual = self.assertEqual
+
+        source = io.BytesIO(b"Name,Parent\n"
+                            b"Root,\n"
+                            b"Branch1,Root\n"
+                            b"Branch2,Root\n"
+                            b"Leaf,Branch2\n"
+                            )
+        chunks = []
+        def progress(rows, result):
+            chunks.append((rows, result.count))
+
+        resource = current.s3db.resource("import_chunk_test")
+        result = resource.import_xml(source,
+                                     source_type = "csv",
+                                     stylesheet = self.stylesheet,
+                                     chunk_size = 2,
+                                     progress = progress,
+                                     )
+        assertEqual(result.error, None)
+        assertEqual(result.count, 4)
+        assertEqual(len(result.created), 4)
+
+        # Progress reported after each chunk
+        assertEqual(chunks, [(2, 2), (4, 4)])
+
+        # References resolved across chunk boundaries
+        table = resource.table
+        rows = current.db(table.id.belongs(result.created)).select(table.id,
+                                                                   table.name,
+                                                                   table.parent,
+                                                                   )
+        ids = {row.name: row.id for row in rows}
+        parents = {row.name: row.parent for row in rows}
+        assertEqual(parents["Root"], None)
+        assertEqual(parents["Branch1"], ids["Root"])
+        assertEqual(parents["Branch2"], ids["Root"])
+        assertEqual(parents["Leaf"], ids["Branch2"])
+
 # =============================================================================
 class MtimeImportTests(unittest.TestCase):
 
@@ -1179,6 +1456,8 @@ if __name__ == "__main__":
         PostParseTests,
         FailedReferenceTests,
         DuplicateDetectionTests,
+        BulkCommitTests,
+        ChunkedImportTests,
         MtimeImportTests,
         ObjectReferencesTests,
         ObjectReferencesImportTests,
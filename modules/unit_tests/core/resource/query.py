@@ -238,6 +238,45 @@ class FieldSelectorResolutionTests(unittest.TestCase):
 
         assertTrue(distinct)
 
+    # -------------------------------------------------------------------------
+    def testResolutionCache(self):
+        """ Reuse and invalidation of resolved field paths """
+
+        s3db = current.s3db
+
+        assertEqual = self.assertEqual
+        assertIn = self.assertIn
+        assertNotIn = self.assertNotIn
+
+        s3db.clear_fieldpaths()
+        fieldpaths = current.model["fieldpaths"]
+
+        resource = s3db.resource("org_facility")
+        rfield = S3ResourceField(resource, "organisation_id$name")
+        assertEqual(rfield.colname, "org_organisation.name")
+
+        key = ("org_facility", "organisation_id$name", None)
+        assertIn(key, fieldpaths)
+
+        # Resolution against another resource instance reuses the path,
+        # but does not share the joins
+        cached = fieldpaths[key][1]
+        other = S3ResourceField(s3db.resource("org_facility"), "organisation_id$name")
+        assertEqual(other.colname, "org_organisation.name")
+        assertEqual(fieldpaths[key][1], cached)
+        self.assertIsNot(other._joins, rfield._joins)
+
+        # Component selectors depend on the resource instance, but
+        # the tail of the path can be reused
+        rfield = S3ResourceField(resource, "service.name")
+        assertEqual(rfield.colname, "org_service.name")
+        assertNotIn(("org_facility", "service.name", None), fieldpaths)
+        assertIn(("org_service", None, "name"), fieldpaths)
+
+        # Configuring components invalidates the cache
+        s3db.add_components("org_facility")
+        assertNotIn(key, current.model["fieldpaths"])
+
 # =============================================================================
 class FieldCategoryFlagsTests(unittest.TestCase):
     """ Test S3ResourceField type category properties """
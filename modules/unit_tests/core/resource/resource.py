@@ -4,6 +4,7 @@
 # python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/resource/resource.py
 #
 import datetime
+import io
 import json
 import unittest
 
@@ -619,6 +620,106 @@ class ResourceExportTests(unittest.TestCase):
         finally:
             current.db.rollback()
 
+    # -------------------------------------------------------------------------
+    def testExportTreeStream(self):
+        """ Test incremental (chunked) XML export """
+
+        assertEqual = self.assertEqual
+        assertTrue = self.assertTrue
+
+        xmlstr = """
+<s3xml>
+    <resource name="org_office_type" uuid="STRT1">
+        <data field="name">STRT1</data>
+    </resource>
+    <resource name="org_organisation" uuid="STRO1">
+        <data field="name">StreamOrganisation1</data>
+        <resource name="org_office" uuid="STRO1F1">
+            <data field="name">StreamOffice1</data>
+            <reference field="office_type_id" resource="org_office_type" uuid="STRT1"/>
+        </resource>
+    </resource>
+    <resource name="org_organisation" uuid="STRO2">
+        <data field="name">StreamOrganisation2</data>
+        <resource name="org_office" uuid="STRO2F1">
+            <data field="name">StreamOffice2</data>
+            <reference field="office_type_id" resource="org_office_type" uuid="STRT1"/>
+        </resource>
+        <resource name="org_office" uuid="STRO2F2">
+            <data field="name">StreamOffice3</data>
+        </resource>
+    </resource>
+    <resource name="org_organisation" uuid="STRO3">
+        <data field="name">StreamOrganisation3</data>
+    </resource>
+</s3xml>"""
+
+        def contents(root):
+            items = []
+            for element in root.xpath("resource"):
+                items.append((element.get("name"),
+                              element.get("uuid"),
+                              tuple(sorted(c.get("uuid") for c in element.xpath("resource"))),
+                              tuple(sorted(r.get("uuid") for r in element.xpath("reference"))),
+                              ))
+            return sorted(items)
+
+        try:
+            xmltree = etree.ElementTree(etree.fromstring(xmlstr))
+            resource = current.s3db.resource("org_organisation")
+            resource.import_xml(xmltree)
+
+            uids = ["STRO1", "STRO2", "STRO3"]
+
+            resource = current.s3db.resource("org_organisation", uid=uids)
+            tree = S3ResourceTree(resource).build(mcomponents=["office"])
+            expected = tree.getroot()
+
+            resource = current.s3db.resource("org_organisation", uid=uids)
+            output = io.BytesIO()
+            results = S3ResourceTree(resource).stream(output,
+                                                      mcomponents = ["office"],
+                                                      chunk_size = 2,
+                                                      )
+            assertEqual(results, 3)
+            assertEqual(resource.results, 3)
+
+            root = etree.fromstring(output.getvalue())
+            assertEqual(root.tag, current.xml.TAG.root)
+            assertEqual(dict(root.attrib), dict(expected.attrib))
+
+            # Same records and references, each record exported only once
+            assertEqual(contents(root), contents(expected))
+            types = root.xpath("resource[@name='org_office_type']")
+            assertEqual(len(types), 1)
+
+            # Empty export
+            resource = current.s3db.resource("org_organisation", uid="STRO4")
+            output = io.BytesIO()
+            results = S3ResourceTree(resource).stream(output)
+            assertEqual(results, 0)
+
+            root = etree.fromstring(output.getvalue())
+            assertEqual(root.get("success"), "false")
+            assertEqual(len(root), 0)
+
+            # Streaming via export_xml
+            resource = current.s3db.resource("org_organisation", uid=uids)
+            output = resource.export_xml(mcomponents=["office"], stream=2)
+            root = etree.fromstring(b"".join(output))
+            assertEqual(contents(root), contents(expected))
+
+            # Stylesheets require the full tree
+            resource = current.s3db.resource("org_organisation", uid=uids)
+            output = resource.export_xml(mcomponents=["office"],
+                                         as_tree = True,
+                                         stream = True,
+                                         )
+            assertTrue(isinstance(output, etree._ElementTree))
+
+        finally:
+            current.db.rollback()
+
 # =============================================================================
 class ResourceImportTests(unittest.TestCase):
     """ Test XML imports into resources """
@@ -2499,6 +2600,136 @@ class ResourceSelectTests(unittest.TestCase):
         # - returns all matching record ids, however
         assertEqual(len(data.ids), numitems)
 
+    # -------------------------------------------------------------------------
+    def testSelectKeyset(self):
+        """ Test keyset pagination """
+
+        s3db = current.s3db
+
+        assertEqual = self.assertEqual
+        assertTrue = self.assertTrue
+
+        resource = s3db.resource("select_master")
+        orderby = "select_master.status desc"
+
+        # Expected order of all records
+        data = resource.select(["id", "name"],
+                               orderby = ["select_master.status desc",
+                                          "select_master.id",
+                                          ],
+                               )
+        expected = [row["select_master.name"] for row in data.rows]
+
+        # Page through with seek
+        names = []
+        seek = ()
+        while True:
+            data = resource.select(["id", "name"],
+                                   limit = 3,
+                                   orderby = orderby,
+                                   seek = seek,
+                                   )
+            assertTrue(data.keyset is not None)
+            rows = data.rows
+            if not rows:
+                break
+            assertTrue(len(rows) <= 3)
+            names.extend(row["select_master.name"] for row in rows)
+            seek = data.seek
+        assertEqual(names, expected)
+
+    # -------------------------------------------------------------------------
+    def testKeysetToken(self):
+        """ Test encoding/decoding of keyset tokens """
+
+        from core.resource.data import ResourceData
+
+        assertEqual = self.assertEqual
+
+        now = datetime.datetime(2022, 3, 14, 9, 30)
+        token = ResourceData.encode_seek([now, "A", None, 4], "sig")
+
+        # Correct signature
+        seek = ResourceData.decode_seek(token, "sig")
+        assertEqual(seek, [now.isoformat(), "A", None, 4])
+
+        # Wrong signature
+        assertEqual(ResourceData.decode_seek(token, "other"), None)
+
+        # Forged token
+        values = json.dumps([now.isoformat(), "B", None, 4])
+        forged = json.dumps([values, ResourceData.sign_seek(values, "other")])
+        assertEqual(ResourceData.decode_seek(forged, "sig"), None)
+
+        # Invalid token
+        assertEqual(ResourceData.decode_seek("invalid", "sig"), None)
+
+    # -------------------------------------------------------------------------
+    def testSelectChunks(self):
+        """ Test chunked extraction of records """
+
+        s3db = current.s3db
+
+        assertEqual = self.assertEqual
+
+        resource = s3db.resource("select_master")
+        orderby = "select_master.name"
+
+        data = resource.select(["name", "status"], orderby=orderby)
+        expected = [row["select_master.name"] for row in data.rows]
+
+        names = []
+        for chunk in resource.select_chunks(["name", "status"],
+                                            chunk_size = 4,
+                                            orderby = orderby,
+                                            ):
+            names.extend(row["select_master.name"] for row in chunk.rows)
+        assertEqual(names, expected)
+
+    # -------------------------------------------------------------------------
+    def testEncodeXLSXStream(self):
+        """ Test that streamed XLSX export names sheets like the regular export """
+
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            self.skipTest("openpyxl not installed")
+
+        s3db = current.s3db
+        settings = current.deployment_settings
+
+        title_row = settings.base.get("xls_title_row")
+        settings.base.xls_title_row = False
+        try:
+            resource = s3db.resource("select_master")
+            list_fields = ["name", "status"]
+
+            regular = XLSXWriter.encode(resource,
+                                        list_fields = list_fields,
+                                        as_stream = True,
+                                        )
+            streamed = XLSXWriter.encode(resource,
+                                         list_fields = list_fields,
+                                         as_stream = True,
+                                         stream = True,
+                                         chunk_size = 4,
+                                         )
+            expected = load_workbook(regular)
+            workbook = load_workbook(streamed)
+            self.assertEqual(workbook.sheetnames, expected.sheetnames)
+            self.assertEqual(workbook.active.max_row, expected.active.max_row)
+
+            # Callable title rows require cell access => not streamed
+            settings.base.xls_title_row = lambda sheet: 0 if sheet is None else None
+            output = XLSXWriter.encode(resource,
+                                       list_fields = list_fields,
+                                       as_stream = True,
+                                       stream = True,
+                                       )
+            self.assertTrue(isinstance(output, io.BytesIO))
+        finally:
+            settings.base.xls_title_row = title_row
+
 # =============================================================================
 class ResourceLazyVirtualFieldsSupportTests(unittest.TestCase):
     """ Test support for lazy virtual fields """
@@ -3444,6 +3675,79 @@ class ResourceDeleteTests(unittest.TestCase):
             component.drop()
             del current.model["components"]["del_super"]["component"]
 
+    # -------------------------------------------------------------------------
+    def testArchiveBulk(self):
+        """
+            Test bulk-archiving of super-entity instance records
+            where the super-records are referenced by other records
+            with CASCADE constraint
+        """
+
+        from core.resource.delete import DeleteProcess
+
+        assertEqual = self.assertEqual
+        assertTrue = self.assertTrue
+
+        s3db = current.s3db
+
+        # Create another master record
+        table = s3db.del_master
+        master_ids = [self.master_id, table.insert()]
+        s3db.update_super(table, {"id": master_ids[1]})
+
+        # Define component table
+        s3db.define_table("del_component",
+                          s3db.super_link("del_super_id",
+                                          "del_super",
+                                          ondelete="CASCADE"),
+                          )
+        component = s3db["del_component"]
+        s3db.add_components("del_super",
+                            del_component="del_super_id")
+
+        try:
+            # Create a component record for each master record
+            super_ids, component_ids = [], []
+            for master_id in master_ids:
+                super_id = table[master_id]["del_super_id"]
+                super_ids.append(super_id)
+                component_ids.append(component.insert(del_super_id=super_id))
+            current.db.commit()
+
+            # Delete the master records in bulk mode
+            resource = s3db.resource("del_master", id=master_ids)
+            delete = DeleteProcess(resource, archive=True, bulk=2)
+            success = delete()
+            assertEqual(success, 2)
+            assertEqual(resource.error, None)
+
+            for master_id, super_id, component_id in zip(master_ids,
+                                                         super_ids,
+                                                         component_ids,
+                                                         ):
+                # Master record is deleted
+                record = table[master_id]
+                assertTrue(record.deleted)
+                assertEqual(record.del_super_id, None)
+
+                # Super-record is deleted
+                srecord = s3db.del_super[super_id]
+                assertTrue(srecord.deleted)
+
+                # Component record is deleted
+                crecord = component[component_id]
+                assertTrue(crecord.deleted)
+                assertEqual(crecord.del_super_id, None)
+
+            # Check callbacks
+            assertTrue(self.master_deleted in master_ids)
+            assertTrue(self.super_deleted in super_ids)
+            assertTrue(self.component_deleted in component_ids)
+
+        finally:
+            component.drop()
+            del current.model["components"]["del_super"]["component"]
+
     # -------------------------------------------------------------------------
     def testArchiveSuperSetNull(self):
         """
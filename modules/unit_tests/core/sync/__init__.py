@@ -1 +1,5 @@
 from .base import *
+from .eden import *
+from .filesync import *
+from .runner import *
+from .transport import *
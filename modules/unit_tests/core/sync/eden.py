@@ -0,0 +1,251 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/sync/eden.py
+#
+import datetime
+import unittest
+
+from lxml import etree
+from urllib.parse import parse_qs, urlsplit
+
+from gluon import current
+from gluon.storage import Storage
+
+from core.sync.adapters.eden import S3SyncAdapter
+from core.sync.base import S3SyncRepository
+from core.tools import s3_decode_iso_datetime, s3_encode_iso_datetime
+
+from unit_tests import run_suite
+
+# =============================================================================
+class PagingTestAdapter(S3SyncAdapter):
+    """
+        Eden adapter talking to a simulated peer, which serves pages
+        of a fixed set of records in the same order as a Sahana-Eden
+        peer would, and records the pages sent to it
+    """
+
+    def __init__(self, repository, records=None):
+
+        super().__init__(repository)
+
+        # The records at the peer, list of tuples (uuid, name, mtime)
+        self.records = records or []
+
+        # The pages sent to the peer
+        self.sent = []
+
+    # -------------------------------------------------------------------------
+    def _request(self, opener, url, data=None):
+
+        def request():
+
+            if data is not None:
+                self.sent.append(data)
+                output = b""
+            else:
+                output = self.page(url)
+
+            return Storage(data = output,
+                           headers = None,
+                           size = len(output),
+                           error = None,
+                           code = None,
+                           message = None,
+                           )
+        return request
+
+    # -------------------------------------------------------------------------
+    def page(self, url):
+        """
+            Produce the S3XML page requested by a pull URL
+
+            Args:
+                url: the URL
+
+            Returns:
+                the S3XML (bytes)
+        """
+
+        get_vars = parse_qs(urlsplit(url).query)
+
+        records = list(enumerate(self.records))
+
+        msince = get_vars.get("msince")
+        if msince:
+            # Order by mtime, then by ID
+            msince = s3_decode_iso_datetime(msince[0]).replace(tzinfo=None)
+            records = [r for r in records if r[1][2] >= msince]
+            records.sort(key=lambda r: (r[1][2], r[0]))
+
+        start = int(get_vars.get("start", [0])[0])
+        limit = get_vars.get("limit")
+        if limit:
+            records = records[start:start + int(limit[0])]
+        else:
+            records = records[start:]
+
+        root = etree.Element("s3xml", results=str(len(records)))
+        for _, (uuid, name, mtime) in records:
+            element = etree.SubElement(root, "resource",
+                                       name = "org_organisation",
+                                       uuid = uuid,
+                                       modified_on = s3_encode_iso_datetime(mtime),
+                                       )
+            data = etree.SubElement(element, "data", field="name")
+            data.text = name
+
+        return etree.tostring(root)
+
+# =============================================================================
+class SyncPagingTests(unittest.TestCase):
+    """ Tests for paged pull/push with Eden peers """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        db = current.db
+        s3db = current.s3db
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.page_size = settings.sync.get("page_size")
+        settings.sync.page_size = 2
+
+        # Create a repository
+        table = s3db.sync_repository
+        repository_id = table.insert(name = "SyncPagingTest",
+                                     apitype = "eden",
+                                     url = "http://peer.example.com/eden",
+                                     )
+        row = db(table.id == repository_id).select(limitby=(0, 1)).first()
+        self.repository = S3SyncRepository(row)
+
+        # Create a task
+        table = s3db.sync_task
+        task_id = table.insert(repository_id = repository_id,
+                               resource_name = "org_organisation",
+                               mode = 3,
+                               update_policy = "NEWER",
+                               conflict_policy = "NEWER",
+                               )
+        self.task_id = task_id
+
+        # Restrict the task to the test records
+        s3db.sync_resource_filter.insert(task_id = task_id,
+                                         tablename = "org_organisation",
+                                         filter_string = "~.name__like=SyncPagingTest*",
+                                         )
+
+        # Test records, modified in reverse order of their creation
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        self.records = [("urn:uuid:syncpagingtest-%s" % i,
+                         "SyncPagingTest%s" % i,
+                         now - datetime.timedelta(hours=i),
+                         ) for i in range(5)]
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+        current.deployment_settings.sync.page_size = self.page_size
+
+    # -------------------------------------------------------------------------
+    def get_task(self):
+        """ Reload the task record """
+
+        table = current.s3db.sync_task
+        query = (table.id == self.task_id)
+        return current.db(query).select(limitby=(0, 1)).first()
+
+    # -------------------------------------------------------------------------
+    def imported(self):
+        """ Get the names of the test records in the local database """
+
+        table = current.s3db.org_organisation
+        query = table.uuid.belongs([r[0] for r in self.records])
+        rows = current.db(query).select(table.name)
+        return sorted(row.name for row in rows)
+
+    # -------------------------------------------------------------------------
+    def testPushInitial(self):
+        """ Initial push of more records than fit into one page """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.org_organisation
+        for uuid, name, mtime in self.records:
+            organisation = {"uuid": uuid, "name": name}
+            organisation["id"] = table.insert(**organisation)
+            s3db.update_super(table, organisation)
+            db(table.id == organisation["id"]).update(modified_on=mtime)
+
+        adapter = PagingTestAdapter(self.repository)
+        error, mtime = adapter.run_steps(adapter.push_steps(self.get_task()))
+        assertEqual(error, None)
+        assertEqual(mtime, self.records[0][2])
+
+        # All records have been sent, each of them exactly once
+        assertEqual(len(adapter.sent), 3)
+        uuids = []
+        for data in adapter.sent:
+            tree = etree.fromstring(data)
+            uuids.extend(tree.xpath("resource[@name='org_organisation']/@uuid"))
+        assertEqual(sorted(uuids), [r[0] for r in self.records])
+
+        # No checkpoint for pages ordered by record ID
+        assertEqual(self.get_task().last_push, None)
+
+    # -------------------------------------------------------------------------
+    def testPullInitial(self):
+        """ Initial pull of more records than fit into one page """
+
+        assertEqual = self.assertEqual
+
+        adapter = PagingTestAdapter(self.repository, self.records)
+        error, mtime = adapter.run_steps(adapter.pull_steps(self.get_task()))
+        assertEqual(error, None)
+
+        # All records have been imported
+        assertEqual(self.imported(), [r[1] for r in self.records])
+
+        # No checkpoint for pages ordered by record ID
+        assertEqual(self.get_task().last_pull, None)
+
+    # -------------------------------------------------------------------------
+    def testPullIncremental(self):
+        """ Incremental pull of more records than fit into one page """
+
+        assertEqual = self.assertEqual
+
+        records = self.records
+        last_pull = records[-1][2] - datetime.timedelta(hours=1)
+
+        task = self.get_task()
+        task.update_record(last_pull=last_pull)
+
+        adapter = PagingTestAdapter(self.repository, records)
+        error, mtime = adapter.run_steps(adapter.pull_steps(task))
+        assertEqual(error, None)
+
+        # All records have been imported
+        assertEqual(self.imported(), [r[1] for r in records])
+
+        # Checkpoint after the last full page
+        assertEqual(self.get_task().last_pull, records[0][2])
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        SyncPagingTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,101 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/sync/filesync.py
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from gluon import current
+from gluon.storage import Storage
+
+from core.sync.base import S3SyncRepository
+
+from unit_tests import run_suite
+
+# =============================================================================
+class FileSyncPushTests(unittest.TestCase):
+    """ Tests for FileSync push (export into files) """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        db = current.db
+        s3db = current.s3db
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.stream_export = settings.base.get("stream_export")
+
+        self.path = tempfile.mkdtemp()
+
+        # Create a repository
+        table = s3db.sync_repository
+        repository_id = table.insert(name = "FileSyncPushTest",
+                                     apitype = "filesync",
+                                     backend = "eden",
+                                     path = self.path,
+                                     )
+        row = db(table.id == repository_id).select(limitby=(0, 1)).first()
+        self.repository = S3SyncRepository(row)
+
+        # Create an organisation to export
+        otable = s3db.org_organisation
+        organisation = {"name": "FileSyncPushTestOrg"}
+        organisation["id"] = otable.insert(**organisation)
+        s3db.update_super(otable, organisation)
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+        current.deployment_settings.base.stream_export = self.stream_export
+
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # -------------------------------------------------------------------------
+    def testPush(self):
+        """ Push with and without streaming export """
+
+        assertEqual = self.assertEqual
+
+        settings = current.deployment_settings
+
+        for stream in (False, True):
+
+            settings.base.stream_export = stream
+
+            pattern = "push_%s.xml" % ("streamed" if stream else "plain")
+            task = Storage(id = None,
+                           resource_name = "org_organisation",
+                           update_policy = "NEWER",
+                           last_push = None,
+                           human_readable = False,
+                           outfile_pattern = pattern,
+                           )
+
+            error, mtime = self.repository.push(task)
+            assertEqual(error, None)
+
+            # Verify the output file
+            outfile = os.path.join(self.path, pattern)
+            self.assertTrue(os.path.exists(outfile))
+            tree = etree.parse(outfile)
+            names = tree.xpath("resource[@name='org_organisation']/data[@field='name']/text()")
+            self.assertIn("FileSyncPushTestOrg", names)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        FileSyncPushTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,90 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/sync/runner.py
+#
+import datetime
+import threading
+import unittest
+
+from gluon.storage import Storage
+
+from core.sync.runner import SyncTaskRunner
+
+from unit_tests import run_suite
+
+# =============================================================================
+class SyncTaskRunnerTests(unittest.TestCase):
+    """ Tests for concurrent sync task processing """
+
+    # -------------------------------------------------------------------------
+    def testDependencies(self):
+        """ Dependencies between tasks """
+
+        dependencies = SyncTaskRunner.dependencies
+
+        tablenames = ["org_office", "org_organisation", "gis_location"]
+        result = dependencies(tablenames)
+
+        self.assertEqual(result, [[1, 2], [], []])
+
+    # -------------------------------------------------------------------------
+    def testOrder(self):
+        """ Tasks are processed in dependency order """
+
+        assertEqual = self.assertEqual
+
+        main = threading.current_thread()
+        events = []
+
+        class Task(Storage):
+            def update_record(self, **attr):
+                self.update(attr)
+
+        class Connector:
+            def steps(self, task, mode):
+                for page in range(2):
+                    def request():
+                        return threading.current_thread() is main
+                    in_main = yield request
+                    # Network steps run in worker threads,
+                    # but the generator continues in the main thread
+                    assertEqual(threading.current_thread(), main)
+                    events.append((mode, task.resource_name, in_main))
+                return (None, datetime.datetime(2022, 1, 1))
+            def pull_steps(self, task, onconflict=None):
+                return self.steps(task, "pull")
+            def push_steps(self, task):
+                return self.steps(task, "push")
+
+        tasks = [Task(resource_name="org_office", mode=3),
+                 Task(resource_name="org_organisation", mode=3),
+                 Task(resource_name="gis_location", mode=1),
+                 ]
+        runner = SyncTaskRunner(Connector(), tasks, workers=4)
+        self.assertTrue(runner())
+
+        # All network steps have run in worker threads
+        assertEqual([e for e in events if e[2]], [])
+
+        # Dependencies have been respected
+        index = lambda event: events.index(event + (False,))
+        self.assertTrue(index(("pull", "org_organisation")) < index(("pull", "org_office")))
+        self.assertTrue(index(("pull", "gis_location")) < index(("pull", "org_office")))
+        self.assertTrue(index(("pull", "org_office")) < index(("push", "org_office")))
+        self.assertTrue(index(("push", "org_organisation")) < index(("push", "org_office")))
+
+        # Tasks have been updated
+        last_pull = datetime.datetime(2022, 1, 1, 0, 0, 1)
+        for task in tasks:
+            assertEqual(task.last_pull, last_pull)
+        assertEqual(tasks[2].last_push, None)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        SyncTaskRunnerTests,
+        )
+
+# END ========================================================================
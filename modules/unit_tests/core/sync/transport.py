@@ -0,0 +1,75 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/sync/transport.py
+#
+import unittest
+
+from core.sync.transport import SyncCompression
+
+from unit_tests import run_suite
+
+# =============================================================================
+class SyncCompressionTests(unittest.TestCase):
+    """ Tests for compression of sync payloads """
+
+    # -------------------------------------------------------------------------
+    def testNegotiate(self):
+        """ Content coding negotiation """
+
+        assertEqual = self.assertEqual
+
+        negotiate = SyncCompression.negotiate
+
+        assertEqual(negotiate(None), None)
+        assertEqual(negotiate("br"), None)
+        assertEqual(negotiate("gzip;q=0"), None)
+        assertEqual(negotiate("br, GZIP;q=0.5"), "gzip")
+
+        # Preferred coding
+        encodings = SyncCompression.encodings()
+        assertEqual(negotiate("gzip, zstd"), encodings[0])
+
+    # -------------------------------------------------------------------------
+    def testCompress(self):
+        """ Compression and decompression """
+
+        assertEqual = self.assertEqual
+
+        data = b"<s3xml>%s</s3xml>" % (b"<resource/>" * 1000)
+
+        for encoding in SyncCompression.encodings():
+
+            compressed = SyncCompression.compress(data, encoding)
+            self.assertTrue(len(compressed) < len(data))
+            assertEqual(SyncCompression.decompress(compressed, encoding), data)
+
+            chunks = [data[:100], data[100:].decode("utf-8")]
+            compressed = b"".join(SyncCompression.compress_stream(chunks, encoding))
+            assertEqual(SyncCompression.decompress(compressed, encoding), data)
+
+        # Uncompressed
+        assertEqual(SyncCompression.decompress(data, None), data)
+        assertEqual(SyncCompression.decompress(data, "identity"), data)
+
+    # -------------------------------------------------------------------------
+    def testInvalid(self):
+        """ Unsupported codings and invalid data are rejected """
+
+        assertRaises = self.assertRaises
+
+        with assertRaises(ValueError):
+            SyncCompression.compress(b"data", "br")
+        with assertRaises(ValueError):
+            SyncCompression.decompress(b"data", "br")
+        with assertRaises(ValueError):
+            SyncCompression.decompress(b"data", "gzip")
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        SyncCompressionTests,
+        )
+
+# END ========================================================================
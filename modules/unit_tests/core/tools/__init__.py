@@ -1,6 +1,9 @@
+from .bi import *
 from .calendar import *
 from .convert import *
 from .hierarchy import *
+from .journal import *
+from .profiling import *
 from .represent import *
 from .timeseries import *
 from .utils import *
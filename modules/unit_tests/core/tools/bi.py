@@ -0,0 +1,150 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/tools/bi.py
+#
+import unittest
+
+from gluon import *
+from core import BulkImporter, s3_meta_fields
+
+from unit_tests import run_suite
+
+# =============================================================================
+class TaskDependencyTests(unittest.TestCase):
+    """ Tests for the dependency graph of prepopulate tasks """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+
+        db.define_table("bi_test_category",
+                        Field("name"),
+                        *s3_meta_fields())
+        db.define_table("bi_test_item",
+                        Field("category_id", "reference bi_test_category"),
+                        Field("name"),
+                        *s3_meta_fields())
+        db.define_table("bi_test_other",
+                        Field("name"),
+                        *s3_meta_fields())
+
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.bi_test_item.drop()
+        db.bi_test_category.drop()
+        db.bi_test_other.drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def testFootprint(self):
+        """ Footprint of a table includes referenced tables, but not meta-fields """
+
+        assertEqual = self.assertEqual
+
+        footprint = BulkImporter.footprint("bi_test_item")
+        assertEqual(footprint, {"bi_test_item", "bi_test_category"})
+
+        footprint = BulkImporter.footprint("bi_test_category")
+        assertEqual(footprint, {"bi_test_category"})
+
+        self.assertIsNone(BulkImporter.footprint("bi_test_nonexistent"))
+
+    # -------------------------------------------------------------------------
+    def testDependencies(self):
+        """ Dependencies between tasks """
+
+        tasks = [(1, "bi", "test_category", "category.csv", "category.xsl", None),
+                 (1, "bi", "test_other", "other.csv", "other.xsl", None),
+                 (1, "bi", "test_item", "item.csv", "item.xsl", None),
+                 (2, "import_xml", "other.xml", "bi", "test_other"),
+                 (2, "import_roles", "auth_roles.csv"),
+                 (1, "bi", "test_other", "other.csv", "other.xsl", None),
+                 ]
+
+        dependencies = BulkImporter.task_dependencies(tasks)
+
+        self.assertEqual(dependencies, [set(),
+                                        set(),
+                                        {0},
+                                        {1},
+                                        {0, 1, 2, 3},
+                                        {1, 3, 4},
+                                        ])
+
+# =============================================================================
+class ParallelImportTests(unittest.TestCase):
+    """ Tests for concurrent execution of prepopulate tasks """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+
+        db.define_table("bi_test_parallel",
+                        Field("name"),
+                        *s3_meta_fields())
+        db.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.bi_test_parallel.drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        settings = current.deployment_settings
+        self.handlers = settings.base.get("import_handlers")
+
+        def insert(name):
+            # Runs in the worker process, using the worker's connection
+            current.db.bi_test_parallel.insert(name=name)
+
+        settings.base.import_handlers = {"bi_test_insert": insert}
+
+    def tearDown(self):
+
+        current.deployment_settings.base.import_handlers = self.handlers
+
+    # -------------------------------------------------------------------------
+    def testPerformParallel(self):
+        """ Tasks are run in worker processes with their own connections """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        table = db.bi_test_parallel
+
+        names = ["Parallel%s" % i for i in range(4)]
+        tasks = [(2, "bi_test_insert", name) for name in names]
+
+        results = BulkImporter().perform_parallel(tasks, 2)
+
+        assertEqual(len(results), len(tasks))
+        for errors, msg, duration in results:
+            assertEqual(errors, [])
+            assertEqual(msg, "bi_test_insert completed")
+
+        # Records committed by the workers are visible, and the
+        # connection of the parent process is still usable
+        db.commit()
+        query = table.name.belongs(names)
+        assertEqual(db(query).count(), len(names))
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        TaskDependencyTests,
+        ParallelImportTests,
+    )
+
+# END ========================================================================
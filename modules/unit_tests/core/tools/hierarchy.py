@@ -2083,6 +2083,128 @@ class TypeOfTests(unittest.TestCase):
         self.assertTrue(self.equivalent(query, expected_query),
                         msg = "%s != %s" % (query, expected_query))
 
+# =============================================================================
+class ClosureTableTests(unittest.TestCase):
+    """ Tests for hierarchies with closure table """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        settings = current.deployment_settings
+        cls.setting = settings.get_base_hierarchy_closure()
+        settings.base.hierarchy_closure = ["closure_hierarchy"]
+
+        s3db = current.s3db
+        s3db.define_table("closure_hierarchy",
+                          Field("name"),
+                          Field("parent", "reference closure_hierarchy"),
+                          *s3_meta_fields())
+        s3db.configure("closure_hierarchy", hierarchy="parent")
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        s3db = current.s3db
+
+        ctable = s3db.s3_hierarchy_closure
+        db(ctable.tablename == "closure_hierarchy").delete()
+        htable = s3db.s3_hierarchy
+        db(htable.tablename == "closure_hierarchy").delete()
+
+        db.closure_hierarchy.drop(mode="cascade")
+        db.commit()
+
+        current.deployment_settings.base.hierarchy_closure = cls.setting
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def descendants(self, node_id):
+        """
+            Look up the descendants of a node in the closure table
+
+            Args:
+                node_id: the node ID
+
+            Returns:
+                dict {descendant: depth}
+        """
+
+        ctable = current.s3db.s3_hierarchy_closure
+        query = (ctable.tablename == "closure_hierarchy") & \
+                (ctable.ancestor == node_id)
+        rows = current.db(query).select(ctable.descendant, ctable.depth)
+        return {row.descendant: row.depth for row in rows}
+
+    # -------------------------------------------------------------------------
+    def testMaintenance(self):
+        """ Closure table is maintained when nodes are added, moved or removed """
+
+        assertEqual = self.assertEqual
+
+        table = current.db.closure_hierarchy
+
+        a = table.insert(name="A")
+        a1 = table.insert(name="A1", parent=a)
+        a11 = table.insert(name="A1-1", parent=a1)
+        b = table.insert(name="B")
+
+        assertEqual(self.descendants(a), {a: 0, a1: 1, a11: 2})
+        assertEqual(self.descendants(a1), {a1: 0, a11: 1})
+        assertEqual(self.descendants(b), {b: 0})
+
+        # Move a branch
+        table[a1].update_record(parent=b)
+        assertEqual(self.descendants(a), {a: 0})
+        assertEqual(self.descendants(b), {b: 0, a1: 1, a11: 2})
+
+        # Remove a node
+        table[a11].update_record(deleted=True)
+        assertEqual(self.descendants(b), {b: 0, a1: 1})
+
+        # Make a node a root node
+        table[a1].update_record(parent=None)
+        assertEqual(self.descendants(b), {b: 0})
+        assertEqual(self.descendants(a1), {a1: 0})
+
+    # -------------------------------------------------------------------------
+    def testTypeOf(self):
+        """ Typeof queries use the closure table """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        table = db.closure_hierarchy
+
+        a = table.insert(name="A")
+        a1 = table.insert(name="A1", parent=a)
+        a11 = table.insert(name="A1-1", parent=a1)
+        b = table.insert(name="B")
+
+        h = S3Hierarchy("closure_hierarchy")
+        self.assertTrue(h.closure)
+
+        query = FS("id").typeof(a1).query(current.s3db.resource("closure_hierarchy"))
+        self.assertIn("s3_hierarchy_closure", str(query))
+
+        rows = db(query).select(table.id)
+        assertEqual({row.id for row in rows}, {a1, a11})
+
+        query = FS("id").typeof([a, b]).query(current.s3db.resource("closure_hierarchy"))
+        rows = db(query).select(table.id)
+        assertEqual({row.id for row in rows}, {a, a1, a11, b})
+
 # =============================================================================
 if __name__ == "__main__":
 
@@ -2090,6 +2212,7 @@ if __name__ == "__main__":
         SimpleHierarchyTests,
         LinkedHierarchyTests,
         TypeOfTests,
+        ClosureTableTests,
     )
 
 # END ========================================================================
@@ -0,0 +1,119 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/tools/journal.py
+#
+import datetime
+import unittest
+
+from gluon import current
+
+from core import *
+
+from unit_tests import run_suite
+
+# =============================================================================
+class ChangeJournalTests(unittest.TestCase):
+    """ Tests for the change journal """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.setting = settings.base.get("change_journal")
+        settings.base.change_journal = True
+
+        self.journal = journal = ChangeJournal.get_journal()
+        journal.watch(current.s3db.org_organisation)
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+        current.deployment_settings.base.change_journal = self.setting
+
+    # -------------------------------------------------------------------------
+    def testChanges(self):
+        """ Test recording and reading of changes """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        journal = self.journal
+        otable = current.s3db.org_organisation
+
+        since = journal.latest()
+
+        record_id = otable.insert(name="Change Journal Test Org")
+        db(otable.id == record_id).update(acronym="CJTO")
+        db(otable.id == record_id).update(deleted=True)
+
+        changes, sequence = journal.changes(since, tablenames=["org_organisation"])
+        assertEqual(len(changes), 3)
+        assertEqual(sequence, journal.latest())
+        assertEqual([change.operation for change in changes],
+                    [journal.CREATE, journal.UPDATE, journal.DELETE],
+                    )
+        for change in changes:
+            assertEqual(change.record_id, record_id)
+
+        # Nothing new since the last sequence
+        changes, sequence_ = journal.changes(sequence)
+        assertEqual(changes, [])
+        assertEqual(sequence_, sequence)
+
+        # Hard delete is recorded too
+        db(otable.id == record_id).delete()
+        changes = journal.changes(sequence)[0]
+        assertEqual(len(changes), 1)
+        assertEqual(changes[0].operation, journal.DELETE)
+
+    # -------------------------------------------------------------------------
+    def testChanged(self):
+        """ Test lookup of changed records since a point in time """
+
+        assertEqual = self.assertEqual
+
+        journal = self.journal
+        otable = current.s3db.org_organisation
+
+        # Journal must cover the period
+        past = datetime.datetime(1970, 1, 1)
+        assertEqual(journal.changed("org_organisation", past), None)
+
+        otable.insert(name="Change Journal Test Org1")
+        msince = datetime.datetime.utcnow()
+        record_id = otable.insert(name="Change Journal Test Org2")
+
+        changed = journal.changed("org_organisation", msince)
+        assertEqual(changed, {record_id})
+
+    # -------------------------------------------------------------------------
+    def testCursor(self):
+        """ Test polling of changed tables """
+
+        assertEqual = self.assertEqual
+
+        otable = current.s3db.org_organisation
+
+        cursor = JournalCursor(interval=0)
+
+        # First poll starts from the latest entry
+        assertEqual(cursor.poll(), set())
+
+        otable.insert(name="Change Journal Test Org")
+        assertEqual(cursor.poll(), {"org_organisation"})
+        assertEqual(cursor.poll(), set())
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        ChangeJournalTests,
+    )
+
+# END ========================================================================
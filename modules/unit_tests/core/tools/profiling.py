@@ -0,0 +1,198 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/tools/profiling.py
+#
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from collections import deque
+
+from gluon import current
+
+from core import *
+
+from unit_tests import run_suite
+
+# =============================================================================
+class RequestProfileTests(unittest.TestCase):
+    """ Tests for per-request profiling """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        self.profile = getattr(current, "profile", None)
+        current.profile = RequestProfile()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.profile = self.profile
+
+    # -------------------------------------------------------------------------
+    def testRecord(self):
+        """ Test recording of operations """
+
+        assertEqual = self.assertEqual
+
+        profile = current.profile
+
+        RequestProfile.record("db", "org_organisation", 0.5)
+        RequestProfile.record("db", "org_organisation", 0.25)
+        RequestProfile.record("db", "pr_person", 0.25)
+
+        assertEqual(profile.stats["db"]["org_organisation"], [2, 0.75])
+        assertEqual(profile.totals()["db"], (3, 1.0))
+
+        timing = profile.server_timing()
+        self.assertTrue(timing.startswith('db;dur=1000.0;desc="3"'))
+        self.assertIn("total;dur=", timing)
+
+    # -------------------------------------------------------------------------
+    def testTimed(self):
+        """ Test the timing decorator """
+
+        assertEqual = self.assertEqual
+
+        @RequestProfile.timed("xslt", lambda value: "test.xsl")
+        def transform(value):
+            return value * 2
+
+        assertEqual(transform(2), 4)
+        assertEqual(current.profile.stats["xslt"]["test.xsl"][0], 1)
+
+        # Without profile
+        current.profile = None
+        assertEqual(transform(3), 6)
+
+    # -------------------------------------------------------------------------
+    def testWrapTasks(self):
+        """ Test wrapping of scheduler tasks """
+
+        assertEqual = self.assertEqual
+
+        def task(value):
+            return value + 1
+        tasks = {"test_task": task}
+
+        RequestProfile.wrap_tasks(tasks)
+        wrapped = tasks["test_task"]
+
+        # Wrapped only once
+        RequestProfile.wrap_tasks(tasks)
+        self.assertIs(tasks["test_task"], wrapped)
+
+        assertEqual(wrapped(1), 2)
+        assertEqual(current.profile.stats["task"]["test_task"][0], 1)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def isolated(folder):
+        """
+            Returns a RequestProfile subclass with separate process
+            statistics, which are written to a temporary folder
+
+            Args:
+                folder: the folder for the aggregated statistics
+
+            Returns:
+                the RequestProfile subclass
+        """
+
+        class TestProfile(RequestProfile):
+
+            recent = deque(maxlen=RequestProfile.RECENT)
+            pending = {}
+            pending_requests = [0, 0.0]
+            last_flush = 0
+            lock = threading.Lock()
+
+            @staticmethod
+            def folder():
+                return folder
+
+        return TestProfile
+
+    # -------------------------------------------------------------------------
+    def testCommit(self):
+        """ Test commit and completion via web2py's close_all_instances """
+
+        from pydal import DAL, Field
+        from pydal.connection import ConnectionPool
+
+        assertEqual = self.assertEqual
+
+        folder = tempfile.mkdtemp()
+        try:
+            profile = self.isolated(folder)()
+            request = current.request
+            uri = "sqlite://%s" % os.path.join(folder, "profile.db")
+
+            errors = []
+            def run():
+                # Separate thread => only this DAL instance gets closed
+                current.request = request
+                db = DAL(uri, folder=folder)
+                db.define_table("profile_test", Field("name"))
+                db.profile_test.insert(name="Committed")
+                try:
+                    ConnectionPool.close_all_instances(profile.commit)
+                except Exception as e:
+                    errors.append(e)
+
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+
+            assertEqual(errors, [])
+            self.assertTrue(profile.finished)
+            assertEqual(len(profile.report()["recent"]), 1)
+
+            # Verify that the transaction has been committed
+            db = DAL(uri, folder=folder, auto_import=True)
+            assertEqual(db(db.profile_test.id > 0).count(), 1)
+            db.close()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    # -------------------------------------------------------------------------
+    def testMetrics(self):
+        """ Test flushing and export of aggregated statistics """
+
+        assertIn = self.assertIn
+
+        folder = tempfile.mkdtemp()
+        try:
+            TestProfile = self.isolated(folder)
+            profile = current.profile = TestProfile()
+
+            TestProfile.record("db", "org_organisation", 0.5)
+            profile.finish()
+
+            # Finishing again must not count the request twice
+            profile.finish()
+
+            metrics = TestProfile.metrics()
+            process = TestProfile.process()
+
+            assertIn('eden_requests_total{process="%s"} 1\n' % process, metrics)
+            assertIn('eden_operations_total{process="%s",category="db",key="org_organisation"} 1\n' % process,
+                     metrics,
+                     )
+            assertIn('eden_operation_seconds_total{process="%s",category="db",key="org_organisation"} 0.500000\n' % process,
+                     metrics,
+                     )
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        RequestProfileTests,
+    )
+
+# END ========================================================================
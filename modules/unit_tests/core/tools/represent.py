@@ -1041,6 +1041,110 @@ class ExportLazyFKRepresentationTests(unittest.TestCase):
         except:
             pass
 
+# =============================================================================
+class RepresentCacheTests(unittest.TestCase):
+    """ Tests for the cross-request representation cache """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.setting = settings.base.get("represent_cache")
+        settings.base.represent_cache = {"size": 2, "ttl": 60}
+
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        ids = []
+        for name in ("Represent Cache Test Org1", "Represent Cache Test Org2"):
+            org = Storage(name=name)
+            org["id"] = otable.insert(**org)
+            s3db.update_super(otable, org)
+            ids.append(org["id"])
+        self.ids = ids
+
+        self.cache = RepresentCache.get_cache()
+        self.cache.clear()
+        self.cache.watch(otable)
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+        current.deployment_settings.base.represent_cache = self.setting
+
+    # -------------------------------------------------------------------------
+    def testCacheReuse(self):
+        """ Test re-use of cached representations across renderer instances """
+
+        assertEqual = self.assertEqual
+
+        id1, id2 = self.ids
+        cache = self.cache
+
+        renderer = S3Represent(lookup="org_organisation")
+        result = renderer.bulk([id1, id2], show_link=False)
+        assertEqual(result[id1], "Represent Cache Test Org1")
+        assertEqual(renderer.queries, 1)
+
+        stats = cache.stats()
+        assertEqual(stats["hits"], 0)
+        assertEqual(stats["misses"], 2)
+        assertEqual(stats["entries"], 2)
+
+        # Another instance with the same parameters uses the cache
+        renderer = S3Represent(lookup="org_organisation")
+        result = renderer.bulk([id1, id2], show_link=False)
+        assertEqual(result[id2], "Represent Cache Test Org2")
+        assertEqual(renderer.queries, 0)
+        assertEqual(cache.stats()["hits"], 2)
+
+        # Different parameters => different cache entries
+        renderer = S3Represent(lookup="org_organisation", fields=["acronym", "name"])
+        renderer.bulk([id1], show_link=False)
+        assertEqual(renderer.queries, 1)
+
+        # Size limit applies
+        assertEqual(cache.stats()["entries"], 2)
+
+    # -------------------------------------------------------------------------
+    def testInvalidation(self):
+        """ Test invalidation of cached representations upon update """
+
+        assertEqual = self.assertEqual
+
+        id1 = self.ids[0]
+
+        renderer = S3Represent(lookup="org_organisation")
+        assertEqual(renderer(id1), "Represent Cache Test Org1")
+
+        otable = current.s3db.org_organisation
+        current.db(otable.id == id1).update(name="Represent Cache Test Org3")
+
+        renderer = S3Represent(lookup="org_organisation")
+        assertEqual(renderer(id1), "Represent Cache Test Org3")
+        assertEqual(renderer.queries, 1)
+
+    # -------------------------------------------------------------------------
+    def testNotCacheable(self):
+        """ Test that renderers with custom lookups or labels skip the cache """
+
+        r = S3Represent(lookup="org_organisation", labels=lambda row: row.name)
+        r._setup()
+        self.assertEqual(r.rcache, None)
+
+        r = S3Represent(options={1: "Test1"})
+        r._setup()
+        self.assertEqual(r.rcache, None)
+
+        r = S3Represent(lookup="org_organisation", labels="%(name)s")
+        r._setup()
+        self.assertNotEqual(r.rcache, None)
+
 # =============================================================================
 if __name__ == "__main__":
 
@@ -1048,6 +1152,7 @@ if __name__ == "__main__":
         BulkRepresentTests,
         ExtractLazyFKRepresentationTests,
         ExportLazyFKRepresentationTests,
+        RepresentCacheTests,
     )
 
 # END ========================================================================
@@ -238,6 +238,25 @@ class PeriodTests(unittest.TestCase):
                              msg = "Incorrect result for duration of event %s: %s != %s." %
                                    (index + 1, duration, expected_duration))
 
+    # -------------------------------------------------------------------------
+    def testIntervals(self):
+        """ Test counting of fixed-length intervals against recurrence rule """
+
+        assertEqual = self.assertEqual
+
+        start = tp_datetime(2013, 3, 8, 10, 30, 15)
+        ends = (tp_datetime(2013, 3, 8, 10, 30, 15),
+                tp_datetime(2013, 3, 8, 13, 0, 0),
+                tp_datetime(2013, 4, 2, 0, 0, 0),
+                tp_datetime(2013, 8, 5, 10, 30, 15),
+                )
+        intervals = TimeSeriesPeriod.intervals
+        for interval in ("hours", "6 hours", "days", "3 days", "weeks", "2 weeks"):
+            for end in ends:
+                rule = TimeSeriesPeriod.get_rule(start, end, interval)
+                expected = rule.count() if start < end else 0
+                assertEqual(intervals(start, end, interval), expected)
+
     # -------------------------------------------------------------------------
     def testGrouping(self):
         """ Test grouping of period events """
@@ -1124,6 +1143,125 @@ class EventFrameTests(unittest.TestCase):
                                        ])
             assertEqual(result, expected_result)
 
+    # -------------------------------------------------------------------------
+    def testAggregate(self):
+        """ Test aggregation of all periods in the event frame at once """
+
+        assertEqual = self.assertEqual
+
+        rows = ("A", "B", None)
+        cols = (1, 2)
+
+        # Assign axis values to events
+        events = []
+        for index, event in enumerate(self.events):
+            events.append(TimeSeriesEvent(event.event_id,
+                                          start = event.start,
+                                          end = event.end,
+                                          values = event.values,
+                                          row = rows[index % 3],
+                                          col = cols[index % 2],
+                                          ))
+
+        facts = [TimeSeriesFact("count", "test"),
+                 TimeSeriesFact("sum", "test"),
+                 TimeSeriesFact("min", "test"),
+                 TimeSeriesFact("max", "test"),
+                 TimeSeriesFact("avg", "test"),
+                 TimeSeriesFact("cumulate", None, slope="test", interval="weeks"),
+                 ]
+
+        for slots in ("3 months", "weeks", "days"):
+
+            ef = TimeSeriesEventFrame(tp_datetime(2012,1,1),
+                                      tp_datetime(2012,12,15),
+                                      slots = slots,
+                                      )
+            ef.extend(events)
+
+            # Aggregate the frame
+            result = [period.as_dict(rows=rows, cols=cols)
+                      for period in ef.aggregate(facts)
+                      ]
+
+            # Must give the same results as aggregating each period
+            for index, period in enumerate(ef):
+                period.aggregate(facts)
+                assertEqual(result[index], period.as_dict(rows=rows, cols=cols))
+
+    # -------------------------------------------------------------------------
+    def testAggregateTypes(self):
+        """ Test aggregation of all periods with non-integer values """
+
+        assertEqual = self.assertEqual
+
+        def assertIdentical(a, b):
+            # Same values of the same types (0 != 0.0)
+            if isinstance(a, dict):
+                assertEqual(set(a.keys()), set(b.keys()))
+                for key in a:
+                    assertIdentical(a[key], b[key])
+            elif isinstance(a, (list, tuple)):
+                assertEqual(len(a), len(b))
+                for x, y in zip(a, b):
+                    assertIdentical(x, y)
+            else:
+                assertEqual(a, b)
+                assertEqual(type(a), type(b))
+
+        rows = ("A", "B", None)
+        cols = (1, 2)
+
+        numbers = (0.1, 0.2, 0.7, 0.3, 1.1, 0.6, 2.2, 0.5, 0.4)
+
+        # Skip events that are current in all periods, so that
+        # some periods have no events
+        events = []
+        for index, event in enumerate(self.events[3:]):
+            values = {"number": numbers[index],
+                      "date": datetime.date(2012, 1, 1 + index),
+                      "name": "Event %s" % event.event_id,
+                      }
+            events.append(TimeSeriesEvent(event.event_id,
+                                          start = event.start,
+                                          end = event.end,
+                                          values = values,
+                                          row = rows[index % 3],
+                                          col = cols[index % 2],
+                                          ))
+
+        facts = [TimeSeriesFact("count", "number"),
+                 TimeSeriesFact("sum", "number"),
+                 TimeSeriesFact("avg", "number"),
+                 TimeSeriesFact("min", "number"),
+                 TimeSeriesFact("max", "number"),
+                 TimeSeriesFact("min", "date"),
+                 TimeSeriesFact("max", "date"),
+                 TimeSeriesFact("sum", "date"),
+                 TimeSeriesFact("sum", "name"),
+                 TimeSeriesFact("avg", "name"),
+                 TimeSeriesFact("cumulate", "number"),
+                 TimeSeriesFact("cumulate", "name"),
+                 ]
+
+        for slots in ("3 months", "weeks", "days"):
+
+            ef = TimeSeriesEventFrame(tp_datetime(2012,1,1),
+                                      tp_datetime(2012,12,15),
+                                      slots = slots,
+                                      )
+            ef.extend(events)
+
+            # Aggregate the frame
+            result = [period.as_dict(rows=rows, cols=cols)
+                      for period in ef.aggregate(facts)
+                      ]
+
+            # Must give identical results as aggregating each period
+            for index, period in enumerate(ef):
+                period.aggregate(facts)
+                assertIdentical(result[index], period.as_dict(rows=rows, cols=cols))
+
     # -------------------------------------------------------------------------
     def testPeriodsDays(self):
         """ Test iteration over periods (days) """
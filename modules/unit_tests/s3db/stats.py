@@ -0,0 +1,144 @@
+# Stats Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3db/stats.py
+#
+import datetime
+import unittest
+
+from gluon import *
+
+from unit_tests import run_suite
+
+# =============================================================================
+@unittest.skipIf(not current.deployment_settings.has_module("stats"), "stats module disabled")
+class DemographicAggregatorTests(unittest.TestCase):
+    """ Tests for incremental update of demographic aggregates """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def testSeries(self):
+        """ Time and copy aggregates from location data """
+
+        assertEqual = self.assertEqual
+
+        series = current.s3db.stats_DemographicAggregator.series
+
+        date = datetime.date
+        data = [(date(2018, 5, 1), 10.0),
+                (date(2018, 9, 1), 12.0),
+                (date(2020, 3, 1), 15.0),
+                (date(2023, 1, 1), 20.0),
+                ]
+
+        result = series(data, date(2021, 1, 1))
+        assertEqual(result, {date(2018, 1, 1): (1, 12.0),
+                             date(2019, 1, 1): (3, 12.0),
+                             date(2020, 1, 1): (1, 15.0),
+                             date(2021, 1, 1): (3, 15.0),
+                             })
+
+        assertEqual(series([], date(2021, 1, 1)), {})
+
+    # -------------------------------------------------------------------------
+    def testStatistics(self):
+        """ Aggregate values """
+
+        statistics = current.s3db.stats_DemographicAggregator.statistics
+
+        self.assertEqual(statistics([4.0, 1.0, 3.0, 8.0]),
+                         {"sum": 16.0,
+                          "min": 1.0,
+                          "max": 8.0,
+                          "mean": 4.0,
+                          "median": 3.5,
+                          })
+
+    # -------------------------------------------------------------------------
+    def testUpdate(self):
+        """ Changes in child locations are applied to parent aggregates """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        s3db = current.s3db
+
+        # Locations
+        gtable = s3db.gis_location
+        parent = gtable.insert(name = "StatsTestL1", level = "L1")
+        child1 = gtable.insert(name = "StatsTestL2A", level = "L2", parent = parent)
+        child2 = gtable.insert(name = "StatsTestL2B", level = "L2", parent = parent)
+
+        # Demographic
+        dtable = s3db.stats_demographic
+        demographic = {"id": dtable.insert(name = "StatsTestDemographic")}
+        s3db.update_super(dtable, demographic)
+        parameter_id = demographic["parameter_id"]
+
+        # Data
+        ddtable = s3db.stats_demographic_data
+        date = current.request.utcnow.date()
+        record1 = ddtable.insert(parameter_id = parameter_id,
+                                 location_id = child1,
+                                 value = 100.0,
+                                 date = date,
+                                 approved_by = 0,
+                                 )
+        ddtable.insert(parameter_id = parameter_id,
+                       location_id = child2,
+                       value = 50.0,
+                       date = date,
+                       approved_by = 0,
+                       )
+
+        atable = s3db.stats_demographic_aggregate
+        query = (atable.parameter_id == parameter_id) & \
+                (atable.location_id == parent) & \
+                (atable.end_date == None)
+
+        aggregator = s3db.stats_DemographicAggregator()
+        aggregator.update({(parameter_id, child1), (parameter_id, child2)})
+
+        row = db(query).select(atable.ALL).first()
+        assertEqual(row.agg_type, 2)
+        assertEqual(row.sum, 150.0)
+        assertEqual(row.min, 50.0)
+        assertEqual(row.max, 100.0)
+        assertEqual(row.median, 75.0)
+
+        # Change the value for one child location
+        db(ddtable.id == record1).update(value = 120.0)
+        aggregator = s3db.stats_DemographicAggregator()
+        aggregator.update({(parameter_id, child1)})
+
+        row = db(query).select(atable.ALL).first()
+        assertEqual(row.sum, 170.0)
+        assertEqual(row.contributions, {str(child1): 120.0, str(child2): 50.0})
+
+        # Remove the data for the other child location
+        db(ddtable.location_id == child2).update(deleted = True)
+        aggregator = s3db.stats_DemographicAggregator()
+        aggregator.update({(parameter_id, child2)})
+
+        row = db(query).select(atable.ALL).first()
+        assertEqual(row.sum, 120.0)
+        assertEqual(row.mean, 120.0)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        DemographicAggregatorTests,
+    )
+
+# END ========================================================================
@@ -657,6 +657,14 @@
                         sendData.push({'name': 'start',
                                        'value': requestStart
                                        });
+                        // Send the keyset token if the server has issued
+                        // one for this page (=keyset pagination)
+                        var seek = cacheLastJson ? cacheLastJson.seek : null;
+                        if (seek && seek.start == requestStart) {
+                            sendData.push({'name': 'seek',
+                                           'value': seek.key
+                                           });
+                        }
                     }
                     if (request.search && request.search.value) {
                         sendData.push({'name': 'sSearch',
@@ -251,7 +251,7 @@ ordering:!0,pageLength:m.pageLength,pagingType:m.pagingType,processing:t,searchD
 r).children().length;for(var n=0;n<r;n++)m[n]=null;0<w.rowActions.length&&(m[w.actionCol]={sTitle:" ",bSortable:!1});w.bulkActions&&(m[w.bulkCol]={sTitle:'<div class="bulk-select-options"><input class="bulk-select-all" type="checkbox">'+i18n.selectAll+"</input></div>",bSortable:!1});if(w.colWidths){var t;r=w.colWidths;for(t in r)null!=m[t]?m[t].sWidth=r[t]:m[t]={sWidth:r[t]}}this.columnConfigs=m;return w}},_pipeline:function(r){var w=g.extend({cache:{},pages:2,data:null,method:"GET"},r);r=w.cache;
 var m=r.cacheLastRequest||null,n=r.cacheLastJson||null,t=r.cacheLower;t===M&&(t=-1);var v=new X;n&&-1!=t&&v.store(t,n.data,n.recordsFiltered||n.recordsTotal);var x=this;return function(A,B,y){if(this.hasOwnProperty("nTable")){if(A=y.sAjaxSource)x.ajaxUrl=A,y.sAjaxSource=null;m=n=null;t=-1;v.clear();B({})}else{var H=!1,G=A.start,N=A.start,L=A.length,P=A.recordsTotal,O=P;n&&(n.recordsTotal!==M&&(P=n.recordsTotal),O=n.recordsFiltered!==M?n.recordsFiltered:P);x.totalRecords=P;-1==L&&(G=0,O!==M?L=O:H=
 !0);if(!H)if(P=G+L,y.clearCache)v.clear(),y.clearCache=!1,H=!0;else if(!m||JSON.stringify(A.order)===JSON.stringify(m.order)&&JSON.stringify(A.columns)===JSON.stringify(m.columns)&&JSON.stringify(A.search)===JSON.stringify(m.search)){var Z=v.retrieve(G,P-G);null===Z&&(H=!0)}else v.clear(),H=!0;m=g.extend(!0,{},A);if(H){G<t&&(G-=L*(w.pages-1),0>G&&(G=0));t=G;A.start=G;A.length=L*w.pages;g.isFunction(w.data)?(Z=w.data(A))&&g.extend(A,Z):g.isPlainObject(w.data)&&g.extend(A,w.data);Z=[{name:"draw",value:A.draw},
-{name:"limit",value:-1==L?"none":A.length}];0!=G&&Z.push({name:"start",value:G});A.search&&A.search.value&&(Z.push({name:"sSearch",value:A.search.value}),Z.push({name:"iColumns",value:A.columns.length}));if(H=A.order.length){Z.push({name:"iSortingCols",value:H});O=x.columnConfigs;var fa;for(P=0;P<O.length;P++)(fa=O[P])&&!fa.bSortable&&Z.push({name:"bSortable_"+P,value:"false"});for(P=0;P<H;P++)O=A.order[P],Z.push({name:"iSortCol_"+P,value:O.column}),Z.push({name:"sSortDir_"+P,value:O.dir})}A=g.ajaxS3;
+{name:"limit",value:-1==L?"none":A.length}];0!=G&&(Z.push({name:"start",value:G}),(H=n?n.seek:null)&&H.start==G&&Z.push({name:"seek",value:H.key}));A.search&&A.search.value&&(Z.push({name:"sSearch",value:A.search.value}),Z.push({name:"iColumns",value:A.columns.length}));if(H=A.order.length){Z.push({name:"iSortingCols",value:H});O=x.columnConfigs;var fa;for(P=0;P<O.length;P++)(fa=O[P])&&!fa.bSortable&&Z.push({name:"bSortable_"+P,value:"false"});for(P=0;P<H;P++)O=A.order[P],Z.push({name:"iSortCol_"+P,value:O.column}),Z.push({name:"sSortDir_"+P,value:O.dir})}A=g.ajaxS3;
 g.searchS3!==M&&(A=g.searchS3);y.jqXHR=A({type:w.method,url:x.ajaxUrl,data:Z,dataType:"json",cache:!1,success:function(qa){var Ca=x.totalRecords;qa.recordsFiltered!==M&&(Ca=qa.recordsFiltered);v.store(G,qa.data,Ca);n=g.extend(!0,{},qa);G!=N&&qa.data.splice(0,N-G);-1!=L&&qa.data.splice(L,qa.data.length);B(qa)}})}else y=g.extend(!0,{},n,{draw:A.draw}),y.data=Z,B(y)}}},_initCache:function(){var r=g(this.selector+"_dataTable_cache");return this.pipelineCache=r=0<r.length?JSON.parse(r.val()):{}},_headerCallback:function(){},
 _rowCallback:function(){var r=this;return function(w,m){var n=r.tableConfig,t=n.actionCol,v=/>(.*)</i.exec(m[t]);v=null===v?m[t]:v[1];var x=n.rowActions;if(x.length||n.bulkActions){for(var A=[],B=0;B<x.length;B++)A.push(r._renderActionButton(v,x[B]));g("td:eq("+t+")",w).addClass("actions").html(A.join(""))}n.bulkActions&&r._bulkSelect(w,pa(v,r.selectedRows));if(n=n.rowStyles){t=g(w);for(var y in n)-1!=pa(v,n[y])&&t.addClass(y)}r._truncateCellContents(w,m);return w}},_drawCallback:function(){var r=
 this;return function(w){var m=g(r.element),n=r.selector,t=m.closest(".dt-wrapper"),v=r.ajaxUrl;v&&t.find("a.permalink").each(function(){var G=g(this);G.attr("href",ba(G.attr("href"),v))});var x=w.fnRecordsDisplay();1<Math.ceil(x/w._iDisplayLength)?g(n+"_paginate").show():g(n+"_paginate").hide();0===x?t.find(".dt-export-options").hide():t.find(".dt-export-options").show();g(n+" .s3_modal").length&&S3.addModals();n=m.closest(".dt-contents");n.length&&(0<x?n.find(".empty").hide().siblings(".dt-wrapper").show():